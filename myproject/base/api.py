@@ -0,0 +1,338 @@
+"""
+Read-only JSON API (v1) for the mobile app.
+
+Every resource is a flat mapping of public field names to ORM paths and is
+serialized straight from values_list(), so a response never builds model
+instances. Clients can ask for a subset with ?fields=a,b,c, page with the
+opaque ?cursor= returned as `next` (keyset on id, newest first), and poll
+with If-None-Match: the ETag is a fingerprint of the scoped rows (count,
+max id, max updated_at), computed with one aggregate query before any
+row is serialized.
+
+/api/v1/bootstrap/ returns everything the app needs on launch in one
+response (see BOOTSTRAP_SECTIONS): one query per section, encoded with
+orjson when it is installed.
+"""
+import hashlib
+import json
+from functools import wraps
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from django.db.models import Count, Max, Q
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import (
+    Appointment, AvailabilitySlot, HomeExerciseReminder, Notification, Payment, ProgressTracking, TreatmentPlan,
+)
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is used instead
+    orjson = None
+
+API_VERSION = 'v1'
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def is_admin(user):
+    return user.role == 'Admin' or user.is_superuser
+
+
+class Resource:
+    """
+    fields: {public name: ORM path}. scope: callable(user) -> Q, or None
+    when the user may not list this resource at all. updated_field: the
+    auto_now column the ETag fingerprint is built from.
+    """
+
+    def __init__(self, name, model, fields, scope, updated_field='updated_at'):
+        self.name = name
+        self.model = model
+        self.fields = fields
+        self.scope = scope
+        self.updated_field = updated_field
+
+    def get_queryset(self, user):
+        condition = self.scope(user)
+        if condition is None:
+            raise ApiError("You don't have access to this resource.", status=403)
+        return self.model._default_manager.filter(condition)
+
+    def select_fields(self, raw):
+        if not raw:
+            return list(self.fields)
+        names = [name.strip() for name in raw.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ApiError(f"Unknown field(s) for {self.name}: {', '.join(unknown)}.")
+        return names
+
+    def serialize(self, queryset, names):
+        paths = [self.fields[name] for name in names]
+        return [dict(zip(names, row)) for row in queryset.values_list(*paths)]
+
+    def page(self, queryset, names, cursor=None, limit=DEFAULT_LIMIT):
+        """One keyset page, newest first. Returns (rows, next cursor or None)."""
+        if cursor is not None:
+            queryset = queryset.filter(id__lt=cursor)
+        paths = [self.fields[name] for name in names]
+        # id rides along for the cursor even when it wasn't requested
+        rows = list(queryset.order_by('-id').values_list('id', *paths)[:limit + 1])
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return [dict(zip(names, row[1:])) for row in rows[:limit]], next_cursor
+
+
+def _appointment_scope(user):
+    if is_admin(user):
+        return Q()
+    if user.role == 'Therapist':
+        return Q(therapist=user)
+    if user.role == 'Patient':
+        return Q(patient=user)
+    return None
+
+
+def _slot_scope(user):
+    # Everyone may browse slots; therapists only manage their own
+    return Q(therapist=user) if user.role == 'Therapist' else Q()
+
+
+def _treatment_plan_scope(user):
+    if is_admin(user):
+        return Q()
+    if user.role == 'Therapist':
+        return Q(prescribed_by=user)
+    if user.role == 'Patient':
+        return Q(appointment__patient=user)
+    return None
+
+
+def _notification_scope(user):
+    return Q() if is_admin(user) else Q(user=user)
+
+
+def _own_rows_scope(user):
+    return Q() if is_admin(user) else Q(patient=user)
+
+
+def _payment_scope(user):
+    if is_admin(user) or user.is_staff:
+        return Q()
+    if user.role == 'Therapist':
+        return Q(appointment__therapist=user)
+    if user.role == 'Patient':
+        return Q(appointment__patient=user)
+    return None
+
+
+RESOURCES = {resource.name: resource for resource in [
+    Resource('appointments', Appointment, {
+        'id': 'id',
+        'patient_id': 'patient_id',
+        'patient': 'patient__username',
+        'therapist_id': 'therapist_id',
+        'therapist': 'therapist__username',
+        'service_id': 'service_id',
+        'service': 'service__name',
+        'scheduled_date': 'scheduled_date',
+        'scheduled_time': 'scheduled_time',
+        'booking_status': 'booking_status',
+        'payment_status': 'payment_status',
+        'created_at': 'created_at',
+        'updated_at': 'updated_at',
+    }, _appointment_scope),
+    Resource('slots', AvailabilitySlot, {
+        'id': 'id',
+        'therapist_id': 'therapist_id',
+        'therapist': 'therapist__username',
+        'date': 'date',
+        'start_time': 'start_time',
+        'end_time': 'end_time',
+        'is_booked': 'is_booked',
+        'updated_at': 'updated_at',
+    }, _slot_scope),
+    Resource('treatment-plans', TreatmentPlan, {
+        'id': 'id',
+        'appointment_id': 'appointment_id',
+        'patient': 'appointment__patient__username',
+        'prescribed_by_id': 'prescribed_by_id',
+        'prescribed_by': 'prescribed_by__username',
+        'exercises_list': 'exercises_list',
+        'follow_up_required': 'follow_up_required',
+        'status': 'status',
+        'instructions': 'instructions',
+        'created_at': 'created_at',
+        'updated_at': 'updated_at',
+    }, _treatment_plan_scope),
+    Resource('notifications', Notification, {
+        'id': 'id',
+        'user_id': 'user_id',
+        'title': 'title',
+        'message': 'message',
+        'category': 'category',
+        'is_read': 'is_read',
+        'created_at': 'created_at',
+        'updated_at': 'updated_at',
+    }, _notification_scope),
+    Resource('payments', Payment, {
+        'id': 'id',
+        'appointment_id': 'appointment_id',
+        'amount': 'amount',
+        'mode': 'mode',
+        'payment_status': 'payment_status',
+        'transaction_id': 'transaction_id',
+        'timestamp': 'timestamp',
+        'updated_at': 'updated_at',
+    }, _payment_scope),
+    Resource('reminders', HomeExerciseReminder, {
+        'id': 'id',
+        'patient_id': 'patient_id',
+        'exercise_id': 'exercise_id',
+        'exercise': 'exercise__name',
+        'reminder_time': 'reminder_time',
+        'sent_via': 'sent_via',
+        'is_completed': 'is_completed',
+        'updated_at': 'updated_at',
+    }, _own_rows_scope),
+    Resource('progress', ProgressTracking, {
+        'id': 'id',
+        'patient_id': 'patient_id',
+        'exercise_id': 'exercise_id',
+        'exercise': 'exercise__name',
+        'completion_percentage': 'completion_percentage',
+        'feedback_notes': 'feedback_notes',
+        'last_updated': 'last_updated',
+    }, _own_rows_scope, updated_field='last_updated'),
+]}
+
+
+def get_resource(name):
+    try:
+        return RESOURCES[name]
+    except KeyError:
+        raise ApiError(f"Unknown resource '{name}'.", status=404)
+
+
+# -------------------------
+# REQUEST PARSING
+# -------------------------
+def parse_limit(raw):
+    try:
+        return max(1, min(int(raw or DEFAULT_LIMIT), MAX_LIMIT))
+    except ValueError:
+        raise ApiError("limit must be an integer.")
+
+
+def parse_cursor(raw):
+    if not raw:
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        raise ApiError("Invalid cursor.")
+
+
+def apply_filters(resource, queryset, params):
+    """?updated_since=<ISO datetime> lets pollers fetch only changed rows."""
+    raw = params.get('updated_since')
+    if raw:
+        since = parse_datetime(raw)
+        if since is None:
+            raise ApiError("updated_since must be an ISO 8601 datetime.")
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        queryset = queryset.filter(**{f'{resource.updated_field}__gt': since})
+    return queryset
+
+
+# -------------------------
+# ETAGS
+# -------------------------
+def make_etag(*parts):
+    return 'W/"%s"' % hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def list_fingerprint(resource, queryset):
+    state = queryset.order_by().aggregate(count=Count('id'), max_id=Max('id'), last=Max(resource.updated_field))
+    return state['count'], state['max_id'], state['last']
+
+
+def etag_matches(request, etag):
+    header = request.headers.get('If-None-Match', '')
+    return etag in {tag.strip() for tag in header.split(',')} or header.strip() == '*'
+
+
+def not_modified(etag):
+    response = HttpResponse(status=304)
+    response['ETag'] = etag
+    return response
+
+
+def api_login_required(view):
+    """Like login_required, but answers 401 JSON instead of redirecting."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Authentication required.'}, status=401)
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as exc:
+            return JsonResponse({'error': str(exc)}, status=exc.status)
+    return wrapper
+
+
+# -------------------------
+# BOOTSTRAP
+# -------------------------
+BOOTSTRAP_LIMIT = 50
+
+# key: (resource, extra filter(now, user), ordering). Sections always read
+# the caller's own rows, whatever their role would allow in the list API.
+BOOTSTRAP_SECTIONS = {
+    'appointments': (RESOURCES['appointments'], lambda now, user: Q(patient=user) | Q(therapist=user),
+                     ('-scheduled_date', '-scheduled_time')),
+    'treatment_plans': (RESOURCES['treatment-plans'],
+                        lambda now, user: Q(status='active') & (Q(appointment__patient=user) | Q(prescribed_by=user)),
+                        ('-created_at',)),
+    'notifications': (RESOURCES['notifications'], lambda now, user: Q(user=user, is_read=False), ('-created_at',)),
+    'reminders': (RESOURCES['reminders'], lambda now, user: Q(patient=user, is_completed=False, reminder_time__gte=now),
+                  ('reminder_time',)),
+    'progress': (RESOURCES['progress'], lambda now, user: Q(patient=user), ('-last_updated',)),
+}
+
+
+def bootstrap(user, limit=BOOTSTRAP_LIMIT):
+    """{section: rows} for the launch screen - exactly one query per section."""
+    now = timezone.now()
+    payload = {}
+    for key, (resource, condition, ordering) in BOOTSTRAP_SECTIONS.items():
+        queryset = resource.model._default_manager.filter(condition(now, user)).order_by(*ordering)
+        payload[key] = resource.serialize(queryset[:limit], list(resource.fields))
+    return payload
+
+
+def _orjson_default(value):
+    # Decimal (payment amounts) and lazy strings
+    return str(value)
+
+
+def dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload, default=_orjson_default, option=orjson.OPT_UTC_Z)
+    return json.dumps(payload, cls=DjangoJSONEncoder).encode()
+
+
+class FastJsonResponse(HttpResponse):
+    def __init__(self, payload, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(dumps(payload), **kwargs)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class BaseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'base'
+
+    def ready(self):
+        # Connects the search / autocomplete / choice cache / calendar snapshot / ledger / coupon / subscription signal handlers
+        from . import autocomplete, choices, coupons, ledger, schedule, search, subscriptions  # noqa: F401
@@ -0,0 +1,210 @@
+"""
+In-memory typeahead indexes for the patient, therapist, exercise and
+appointment pickers.
+
+Each index is a pair of sorted arrays (token, id) built from a single
+values_list() query and searched with bisect, so a lookup costs
+O(log n + matches) and never touches the database. Saving or deleting a
+User, Exercise or Appointment bumps a version number in the cache; every
+process rebuilds its copy of the affected index on the next lookup.
+"""
+import re
+import threading
+from bisect import bisect_left
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from .models import Appointment, Exercise, User
+
+VERSION_KEY = 'autocomplete:version:{}'
+
+
+def tokenize(*values):
+    tokens = set()
+    for value in values:
+        if value:
+            tokens.update(re.findall(r'\w+', str(value).lower()))
+    return tokens
+
+
+def person_label(username, first_name, last_name):
+    full_name = f"{first_name or ''} {last_name or ''}".strip()
+    return f"{full_name} ({username})" if full_name else username
+
+
+class PrefixIndex:
+    """
+    entries: iterable of (id, label, tokens, scope). `scope` is whatever the
+    role filter for this kind needs (e.g. the appointment's patient and
+    therapist ids).
+    """
+
+    def __init__(self, entries):
+        pairs = []
+        self.labels = {}
+        self.tokens = {}
+        self.scopes = {}
+        for obj_id, label, tokens, scope in entries:
+            self.labels[obj_id] = label
+            self.tokens[obj_id] = tokens
+            self.scopes[obj_id] = scope
+            pairs.extend((token, obj_id) for token in tokens)
+        pairs.sort()
+        self.keys = [token for token, _ in pairs]
+        self.ids = [obj_id for _, obj_id in pairs]
+
+    def search(self, query, limit=10, allow=None):
+        words = sorted(tokenize(query), key=len, reverse=True)
+        if not words:
+            return []
+        # Walk the longest word's prefix range (already in token order); the
+        # other words must prefix-match one of the entry's tokens too
+        head, rest = words[0], words[1:]
+        seen = set()
+        results = []
+        position = bisect_left(self.keys, head)
+        while position < len(self.keys) and self.keys[position].startswith(head):
+            obj_id = self.ids[position]
+            position += 1
+            if obj_id in seen:
+                continue
+            seen.add(obj_id)
+            if rest and not all(any(t.startswith(w) for t in self.tokens[obj_id]) for w in rest):
+                continue
+            if allow is not None and not allow(self.scopes[obj_id]):
+                continue
+            results.append({'id': obj_id, 'text': self.labels[obj_id]})
+            if len(results) >= limit:
+                break
+        return results
+
+
+# -------------------------
+# INDEX LOADERS
+# -------------------------
+def _load_people(role):
+    rows = (
+        User.objects.filter(role=role, is_active=True)
+        .values_list('id', 'username', 'first_name', 'last_name', 'email')
+    )
+    for user_id, username, first_name, last_name, email in rows.iterator(chunk_size=5000):
+        yield user_id, person_label(username, first_name, last_name), \
+            tokenize(username, first_name, last_name, email), user_id
+
+
+def _load_exercises():
+    rows = Exercise.objects.values_list('id', 'name', 'focus_area')
+    for exercise_id, name, focus_area in rows.iterator(chunk_size=5000):
+        yield exercise_id, name, tokenize(name, focus_area), None
+
+
+def _load_appointments():
+    since = timezone.localdate() - timedelta(days=getattr(settings, 'AUTOCOMPLETE_APPOINTMENT_DAYS', 365))
+    rows = (
+        Appointment.objects.filter(scheduled_date__gte=since)
+        .values_list('id', 'scheduled_date', 'patient_id', 'therapist_id',
+                     'patient__username', 'patient__first_name', 'patient__last_name',
+                     'therapist__username', 'therapist__first_name', 'therapist__last_name')
+    )
+    for (appointment_id, day, patient_id, therapist_id,
+         p_username, p_first, p_last, t_username, t_first, t_last) in rows.iterator(chunk_size=5000):
+        # Same text as Appointment.__str__, without loading both users per row
+        label = f"{p_username} → {t_username} ({day})"
+        tokens = tokenize(p_username, p_first, p_last, t_username, t_first, t_last, day.isoformat())
+        yield appointment_id, label, tokens, (patient_id, therapist_id)
+
+
+LOADERS = {
+    'patient': lambda: _load_people('Patient'),
+    'therapist': lambda: _load_people('Therapist'),
+    'exercise': _load_exercises,
+    'appointment': _load_appointments,
+}
+
+# Which indexes go stale when a model changes
+DEPENDENTS = {
+    User: ('patient', 'therapist', 'appointment'),
+    Exercise: ('exercise',),
+    Appointment: ('appointment',),
+}
+
+
+# -------------------------
+# ROLE SCOPING
+# -------------------------
+def scope_for(kind, user):
+    """
+    Returns (allowed, predicate). `predicate` is None when every entry of the
+    index may be shown to this user.
+    """
+    role = user.role
+    if role == 'Admin' or user.is_superuser:
+        return True, None
+    if kind == 'appointment':
+        if role == 'Therapist':
+            return True, lambda scope: scope[1] == user.id
+        if role == 'Patient':
+            return True, lambda scope: scope[0] == user.id
+        return False, None
+    if kind == 'patient' and role == 'Patient':
+        # Patients can only pick themselves
+        return True, lambda scope: scope == user.id
+    return True, None
+
+
+# -------------------------
+# INDEX REGISTRY
+# -------------------------
+_indexes = {}
+_versions = {}
+_lock = threading.Lock()
+
+
+def get_index(kind):
+    version = cache.get(VERSION_KEY.format(kind), 0)
+    with _lock:
+        if kind not in _indexes or _versions.get(kind) != version:
+            _indexes[kind] = PrefixIndex(LOADERS[kind]())
+            _versions[kind] = version
+        return _indexes[kind]
+
+
+def lookup(kind, query, user, limit=10):
+    allowed, predicate = scope_for(kind, user)
+    if not allowed:
+        return []
+    return get_index(kind).search(query, limit=limit, allow=predicate)
+
+
+def label_for(kind, obj_id):
+    """Label of an indexed object (used to render the selected value), or None."""
+    try:
+        return get_index(kind).labels.get(int(obj_id))
+    except (TypeError, ValueError):
+        return None
+
+
+# User fields that appear in labels or tokens; saves touching only other
+# fields (e.g. last_login on every login) leave the indexes alone.
+INDEXED_USER_FIELDS = {'username', 'first_name', 'last_name', 'email', 'role', 'is_active'}
+
+
+def invalidate(sender, update_fields=None, **kwargs):
+    if sender is User and update_fields and not INDEXED_USER_FIELDS.intersection(update_fields):
+        return
+    for kind in DEPENDENTS[sender]:
+        key = VERSION_KEY.format(kind)
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+for _model in DEPENDENTS:
+    post_save.connect(invalidate, sender=_model, dispatch_uid=f'autocomplete_save_{_model.__name__}')
+    post_delete.connect(invalidate, sender=_model, dispatch_uid=f'autocomplete_delete_{_model.__name__}')
@@ -0,0 +1,157 @@
+"""
+Deferred, set-based versions of the per-row model signal handlers.
+
+Inside `with batched_signals():` the create_profiles,
+send_notification_on_appointment, update_therapist_rating, ledger and
+subscription receivers only record what happened. When the outermost block
+exits, the recorded work runs once: one bulk_create of missing profiles for
+all new users, one bulk_create of appointment notifications, one rating
+recompute (a single UPDATE) per set of affected therapists, one ledger sync
+for the touched payments and transactions and one subscription sync for the
+users of those transactions.
+
+bulk_create() sends no signals at all, so rows written that way can be fed
+in with `batch.add(instances, created=True)` to get the same side effects.
+"""
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connection, transaction
+from django.db.models import Avg, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('signal_batch', default=None)
+
+
+def current_batch():
+    return _current.get()
+
+
+class SignalBatch:
+    def __init__(self):
+        self.new_users = {}            # user id -> role
+        self.appointments = {}         # appointment id -> created (first save wins)
+        self.rated_therapists = set()
+        self.payments = set()
+        self.transactions = set()
+        self.subscribers = set()       # users whose subscription row needs a sync
+
+    def add(self, instances, created=False):
+        """Record rows the handlers would have seen (e.g. the result of bulk_create)."""
+        from .models import Appointment, Feedback, Payment, Transaction, User
+
+        for instance in instances:
+            if isinstance(instance, User):
+                if created:
+                    self.new_users[instance.pk] = instance.role
+            elif isinstance(instance, Appointment):
+                self.appointments.setdefault(instance.pk, created)
+            elif isinstance(instance, Feedback):
+                self.rated_therapists.add(instance.therapist_id)
+            elif isinstance(instance, Payment):
+                self.payments.add(instance.pk)
+            elif isinstance(instance, Transaction):
+                self.transactions.add(instance.pk)
+                self.subscribers.add(instance.user_id)
+
+    def flush(self):
+        new_users, self.new_users = self.new_users, {}
+        appointments, self.appointments = self.appointments, {}
+        therapists, self.rated_therapists = self.rated_therapists, set()
+        payments, self.payments = self.payments, set()
+        transactions, self.transactions = self.transactions, set()
+        subscribers, self.subscribers = self.subscribers, set()
+        create_missing_profiles(new_users)
+        notify_appointments(appointments)
+        recompute_ratings(therapists)
+        if payments or transactions:
+            from .ledger import sync
+            sync(payments=sorted(payments), transactions=sorted(transactions))
+        if subscribers:
+            from .subscriptions import sync as sync_subscriptions
+            sync_subscriptions(subscribers)
+
+
+@contextmanager
+def batched_signals():
+    """Defer the per-row handlers until the outermost block exits. Nested blocks join the outer batch."""
+    if _current.get() is not None:
+        yield _current.get()
+        return
+
+    batch = SignalBatch()
+    token = _current.set(batch)
+    try:
+        yield batch
+    except BaseException:
+        _current.reset(token)
+        # Rows saved before the error keep their side effects, unless the transaction is already doomed.
+        # Rows an inner atomic() rolled back are skipped by the handlers; anything else that goes wrong
+        # is logged so the flush never replaces the original error.
+        if not connection.needs_rollback:
+            try:
+                with transaction.atomic():
+                    batch.flush()
+            except Exception:
+                logger.exception("Deferred signal handlers failed while unwinding an error")
+        raise
+    else:
+        _current.reset(token)
+        batch.flush()
+
+
+# -------------------------
+# SET-BASED HANDLERS
+# -------------------------
+def create_missing_profiles(users):
+    """
+    users: {user id: role}. One bulk insert per profile model, skipping users
+    that already have one or no longer exist (e.g. rolled back).
+    """
+    from .models import PatientProfile, TherapistProfile, User
+    from .recurrence import bulk_insert
+
+    for model, role in ((TherapistProfile, 'Therapist'), (PatientProfile, 'Patient')):
+        ids = {user_id for user_id, user_role in users.items() if user_role == role}
+        if ids:
+            ids = set(User.objects.filter(id__in=ids).values_list('id', flat=True))
+            ids -= set(model.objects.filter(user_id__in=ids).values_list('user_id', flat=True))
+            bulk_insert(model, (model(user_id=user_id) for user_id in sorted(ids)))
+
+
+def notify_appointments(appointments):
+    """appointments: {appointment id: created}. One notification per appointment for its therapist."""
+    from .models import Appointment, Notification
+    from .recurrence import bulk_insert
+
+    if not appointments:
+        return
+    rows = (
+        Appointment.objects.filter(id__in=appointments, therapist__isnull=False)
+        .order_by('id').values_list('id', 'therapist_id', 'booking_status', 'patient__username')
+    )
+    bulk_insert(Notification, (
+        Notification(
+            user_id=therapist_id,
+            title="New Appointment Scheduled" if appointments[appointment_id] else "Appointment Updated",
+            message=f"Status: {status} | Patient: {patient}",
+            category='Appointment',
+        )
+        for appointment_id, therapist_id, status, patient in rows.iterator(chunk_size=2000)
+    ))
+
+
+def recompute_ratings(therapist_ids):
+    """Set ratings_average from Feedback for the given therapists in one UPDATE."""
+    from .models import Feedback, User
+
+    if not therapist_ids:
+        return
+    average = (
+        Feedback.objects.filter(therapist=OuterRef('pk'))
+        .values('therapist').annotate(avg=Avg('rating')).values('avg')
+    )
+    User.objects.filter(id__in=therapist_ids).update(ratings_average=Coalesce(Subquery(average), Value(0.0)))
@@ -0,0 +1,231 @@
+"""
+Lightweight choice lists for ModelForm foreign-key fields.
+
+A plain ModelChoiceField loads every full row and calls __str__ on it to
+build an <option> (for Appointment that dereferences patient and therapist,
+an N+1 per render). Fields declared in a form's `light_choices` instead read
+(pk, label columns) through one values_list() query with the joins done in
+SQL, and the rendered <option> list is cached per choice source and role
+scope. Saving or deleting a row of the source model bumps a cache version,
+which invalidates every cached list built from it.
+"""
+from html import escape
+
+from django import forms
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.forms.models import ModelChoiceIterator
+from django.forms.utils import flatatt
+from django.utils.safestring import mark_safe
+
+from .models import Appointment, Exercise, Service, SubscriptionPlan, User
+
+VERSION_KEY = 'choices:version:{}'
+CACHE_TIMEOUT = 60 * 60
+
+
+def model_version(model):
+    return cache.get(VERSION_KEY.format(model._meta.label_lower), 0)
+
+
+def bump_version(model):
+    key = VERSION_KEY.format(model._meta.label_lower)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+class ChoiceSource:
+    """
+    Where a field's options come from.
+
+    label: str.format() template over `label_fields` (joined fields such as
+    'patient__username' are fine). depends_on: models whose changes must
+    invalidate cached lists. scopes: {role: callable(user) -> filter kwargs}
+    for roles that only see part of the list. select_related / only: what
+    to load when an instance is needed (validating the submitted pk).
+    """
+
+    def __init__(self, key, model, label_fields, label, filters=None, order_by=None,
+                 depends_on=(), scopes=None, select_related=(), only=()):
+        self.key = key
+        self.model = model
+        self.label_fields = label_fields
+        self.label = label
+        self.filters = filters or {}
+        self.order_by = order_by
+        self.depends_on = (model,) + tuple(depends_on)
+        self.scopes = scopes or {}
+        self.select_related = select_related
+        self.only = only
+
+        for dependency in self.depends_on:
+            post_save.connect(_invalidate, sender=dependency, dispatch_uid=f'choices_save_{dependency._meta.label_lower}')
+            post_delete.connect(_invalidate, sender=dependency, dispatch_uid=f'choices_delete_{dependency._meta.label_lower}')
+
+    def get_queryset(self, user=None):
+        queryset = self.model._default_manager.filter(**self.filters)
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.only:
+            queryset = queryset.only(*self.only)
+        scope = self.scopes.get(getattr(user, 'role', None))
+        if scope is not None:
+            queryset = queryset.filter(**scope(user))
+        return queryset
+
+    def scope_key(self, user=None):
+        role = getattr(user, 'role', None)
+        if role in self.scopes:
+            return f'{role}:{user.pk}'
+        return 'all'
+
+    def cache_key(self, user=None):
+        versions = '.'.join(str(model_version(model)) for model in self.depends_on)
+        return f'choices:{self.key}:{self.scope_key(user)}:{versions}'
+
+    def build(self, queryset):
+        """(pk, label) pairs straight from SQL - no model instances."""
+        rows = queryset.values_list('pk', *self.label_fields)
+        if self.order_by:
+            rows = rows.order_by(*self.order_by)
+        names = ('pk',) + tuple(self.label_fields)
+        return [(row[0], self.label.format(**dict(zip(names, row)))) for row in rows.iterator(chunk_size=2000)]
+
+
+# User fields that appear in labels; saves touching only other fields
+# (e.g. last_login on every login) keep the cached lists.
+LABEL_USER_FIELDS = {'username', 'role', 'first_name', 'last_name', 'is_active'}
+
+
+def _invalidate(sender, update_fields=None, **kwargs):
+    if sender is User and update_fields and not LABEL_USER_FIELDS.intersection(update_fields):
+        return
+    bump_version(sender)
+
+
+class LightChoiceIterator(ModelChoiceIterator):
+    """Yields cached (pk, label) pairs instead of model instances."""
+
+    def __init__(self, field):
+        super().__init__(field)
+        self.source = field.choice_source
+
+    @property
+    def cacheable(self):
+        # Fall back to an uncached list if a view replaced the queryset
+        return self.queryset is getattr(self.field, 'light_queryset', None)
+
+    def pairs(self):
+        if not self.cacheable:
+            return self.source.build(self.queryset)
+        key = self.field.choice_cache_key + ':pairs'
+        pairs = cache.get(key)
+        if pairs is None:
+            pairs = self.source.build(self.queryset)
+            cache.set(key, pairs, CACHE_TIMEOUT)
+        return pairs
+
+    def options_html(self):
+        """All <option> tags (nothing selected), rendered once per cache version."""
+        key = self.field.choice_cache_key + ':html'
+        html = cache.get(key) if self.cacheable else None
+        if html is None:
+            html = ''.join(f'<option value="{escape(str(pk))}">{escape(label)}</option>' for pk, label in self)
+            if self.cacheable:
+                cache.set(key, html, CACHE_TIMEOUT)
+        return html
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        yield from self.pairs()
+
+    def __len__(self):
+        return len(self.pairs()) + (1 if self.field.empty_label is not None else 0)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.pairs())
+
+
+class CachedSelect(forms.Select):
+    """Select that pastes the cached option list and marks the current value."""
+
+    def render(self, name, value, attrs=None, renderer=None):
+        if not isinstance(self.choices, LightChoiceIterator):
+            return super().render(name, value, attrs, renderer)
+        final_attrs = self.build_attrs(self.attrs, attrs)
+        final_attrs['name'] = name
+        options = self.choices.options_html()
+        for selected in self.format_value(value):
+            if selected:
+                needle = f'value="{escape(selected)}"'
+                options = options.replace(needle, f'{needle} selected', 1)
+        return mark_safe(f'<select{flatatt(final_attrs)}>{options}</select>')
+
+
+class LightweightChoicesMixin:
+    """
+    ModelForm mixin. Declare `light_choices = {'field_name': ChoiceSource}`;
+    pass `user=request.user` to the form when a source has role scopes.
+    Fields rendered by a Select get the cached option list; other widgets
+    (e.g. autocomplete) only get the narrowed queryset for validation.
+    """
+    light_choices = {}
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = user
+        for name, source in self.light_choices.items():
+            field = self.fields.get(name)
+            if field is None:
+                continue
+            if not isinstance(field.widget, forms.Select) or field.widget.allow_multiple_selected:
+                field.queryset = source.get_queryset(user)
+                continue
+            field.choice_source = source
+            field.choice_cache_key = source.cache_key(user)
+            field.iterator = LightChoiceIterator
+            field.widget = CachedSelect(attrs=field.widget.attrs)
+            # Setting the queryset refreshes widget.choices with the new iterator
+            field.queryset = source.get_queryset(user)
+            field.light_queryset = field.queryset
+
+
+# -------------------------
+# SHARED SOURCES
+# -------------------------
+# Labels match each model's __str__.
+USER_FIELDS = ('id', 'username', 'role')
+
+USER_CHOICES = ChoiceSource('users', User, ('username', 'role'), '{username} ({role})',
+                            only=USER_FIELDS)
+PATIENT_CHOICES = ChoiceSource('patients', User, ('username', 'role'), '{username} ({role})',
+                               filters={'role': 'Patient'}, only=USER_FIELDS)
+THERAPIST_CHOICES = ChoiceSource('therapists', User, ('username', 'role'), '{username} ({role})',
+                                 filters={'role': 'Therapist'}, only=USER_FIELDS)
+# Patients a reminder rule may be set up for (permissions.REMINDER_RULES)
+TREATED_PATIENT_CHOICES = ChoiceSource(
+    'treated_patients', User, ('username', 'role'), '{username} ({role})',
+    filters={'role': 'Patient'}, only=USER_FIELDS, depends_on=(Appointment,),
+    scopes={
+        'Therapist': lambda user: {'pk__in': Appointment.objects.filter(therapist=user).values('patient_id')},
+        'Patient': lambda user: {'pk': user.pk},
+    },
+)
+SERVICE_CHOICES = ChoiceSource('services', Service, ('name',), '{name}')
+PLAN_CHOICES = ChoiceSource('plans', SubscriptionPlan, ('plan_name',), '{plan_name}')
+EXERCISE_CHOICES = ChoiceSource('exercises', Exercise, ('name',), '{name}', order_by=('name',))
+APPOINTMENT_CHOICES = ChoiceSource(
+    'appointments', Appointment,
+    ('patient__username', 'therapist__username', 'scheduled_date'),
+    '{patient__username} → {therapist__username} ({scheduled_date})',
+    depends_on=(User,),
+    select_related=('patient', 'therapist'),
+    scopes={
+        'Therapist': lambda user: {'therapist': user},
+        'Patient': lambda user: {'patient': user},
+    },
+)
@@ -0,0 +1,357 @@
+"""
+Patient retention and cohort analytics.
+
+Appointment history is kept as a columnar snapshot under COHORTS['DIR']: one
+.npy file per column (id, patient, therapist, service, date as days since
+1970-01-01, status code) plus meta.json holding the id watermark. refresh()
+reads only appointments above the watermark and rows updated since the last
+run, patches and appends them, and swaps the new files in atomically, so a
+nightly run touches just the new history. Deleted appointments are only
+dropped by refresh(rebuild=True).
+
+The metrics are vectorized NumPy over the loaded arrays:
+
+- retention_curve(): share of each first-visit month's patients who visit
+  again 0..n months later;
+- group_metrics(): per therapist, service or branch - patients, visits,
+  repeat-visit rate, retention (came back within RETENTION_DAYS of their
+  first visit) and churn (no visit in the last CHURN_DAYS).
+
+A "visit" is any appointment that was not cancelled and is not in the future.
+"""
+import json
+import os
+import shutil
+import tempfile
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import AnalyticsReport, Appointment, ClinicBranch, Service, TherapistProfile, User
+
+COLUMNS = {
+    'id': np.int64, 'patient': np.int64, 'therapist': np.int64,
+    'service': np.int64, 'date': np.int32, 'status': np.int8,
+}
+FIELDS = ('id', 'patient_id', 'therapist_id', 'service_id', 'scheduled_date', 'booking_status')
+STATUSES = [status for status, _ in Appointment.BOOKING_STATUS]
+CANCELLED = STATUSES.index('Cancelled')
+EPOCH = date(1970, 1, 1)
+DIMENSIONS = ('therapist', 'service', 'branch')
+
+
+def cohort_settings():
+    return {
+        'DIR': Path(settings.BASE_DIR) / 'snapshots' / 'appointments',
+        'BATCH_SIZE': 10000,
+        'RETENTION_DAYS': 90,
+        'CHURN_DAYS': 90,
+        'CURVE_MONTHS': 12,
+        **getattr(settings, 'COHORTS', {}),
+    }
+
+
+def day_number(day):
+    return (day - EPOCH).days
+
+
+# -------------------------
+# SNAPSHOT
+# -------------------------
+class Snapshot:
+    def __init__(self, columns, meta):
+        self.columns = columns
+        self.meta = meta
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @property
+    def watermark(self):
+        return self.meta.get('watermark', 0)
+
+
+def empty_columns():
+    return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+
+
+def load(directory=None):
+    """The stored snapshot, memory-mapped (empty when there is none yet)."""
+    directory = Path(directory or cohort_settings()['DIR'])
+    try:
+        meta = json.loads((directory / 'meta.json').read_text())
+    except FileNotFoundError:
+        return Snapshot(empty_columns(), {})
+    columns = {name: np.load(directory / f'{name}.npy', mmap_mode='r') for name in COLUMNS}
+    return Snapshot(columns, meta)
+
+
+def _save(directory, columns, meta):
+    """Write all columns to a staging dir and swap it in, so readers never see a half-written snapshot."""
+    directory = Path(directory)
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix=f'.{directory.name}-', dir=directory.parent))
+    try:
+        for name, dtype in COLUMNS.items():
+            np.save(staging / f'{name}.npy', np.ascontiguousarray(columns[name], dtype=dtype))
+        (staging / 'meta.json').write_text(json.dumps(meta, indent=2))
+        previous = None
+        if directory.exists():
+            previous = directory.with_name(f'.{directory.name}-old')
+            shutil.rmtree(previous, ignore_errors=True)
+            os.replace(directory, previous)
+        os.replace(staging, directory)
+        if previous:
+            shutil.rmtree(previous, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+def _fetch(queryset, batch_size):
+    """Appointment rows as column arrays, read in chunks with .iterator()."""
+    status_code = {status: code for code, status in enumerate(STATUSES)}
+    parts, buffer = [], []
+
+    def flush():
+        if buffer:
+            ids, patients, therapists, services, days, statuses = zip(*buffer)
+            parts.append({
+                'id': np.array(ids, dtype=np.int64),
+                'patient': np.array(patients, dtype=np.int64),
+                'therapist': np.array(therapists, dtype=np.int64),
+                'service': np.array(services, dtype=np.int64),
+                'date': np.array([day_number(day) for day in days], dtype=np.int32),
+                'status': np.array([status_code.get(status, -1) for status in statuses], dtype=np.int8),
+            })
+            buffer.clear()
+
+    for row in queryset.order_by('id').values_list(*FIELDS).iterator(chunk_size=batch_size):
+        buffer.append(row)
+        if len(buffer) == batch_size:
+            flush()
+    flush()
+    if not parts:
+        return empty_columns()
+    return {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+
+
+def refresh(rebuild=False, directory=None, batch_size=None):
+    """
+    Bring the snapshot up to date. Returns (appended, updated, total rows).
+    Only appointments with id above the watermark, or updated since the last
+    run, are read from the database.
+    """
+    options = cohort_settings()
+    directory = directory or options['DIR']
+    batch_size = batch_size or options['BATCH_SIZE']
+    started = timezone.now()
+    snapshot = Snapshot(empty_columns(), {}) if rebuild else load(directory)
+
+    with transaction.atomic():  # one consistent view of the table on databases with snapshot reads
+        high = Appointment.objects.aggregate(high=Max('id'))['high'] or 0
+        new = _fetch(Appointment.objects.filter(id__gt=snapshot.watermark, id__lte=high), batch_size)
+        changed = empty_columns()
+        if snapshot.meta.get('synced_at'):
+            changed = _fetch(
+                Appointment.objects.filter(id__lte=snapshot.watermark, updated_at__gte=snapshot.meta['synced_at']),
+                batch_size,
+            )
+
+    columns = {name: np.array(snapshot[name]) for name in COLUMNS}
+    updated = 0
+    if len(changed['id']):
+        at = np.searchsorted(columns['id'], changed['id'])
+        at = np.minimum(at, max(len(columns['id']) - 1, 0))
+        hit = columns['id'][at] == changed['id'] if len(columns['id']) else np.zeros(0, dtype=bool)
+        for name in COLUMNS:
+            columns[name][at[hit]] = changed[name][hit]
+        updated = int(hit.sum())
+    columns = {name: np.concatenate([columns[name], new[name]]) for name in COLUMNS}
+
+    meta = {
+        'watermark': int(max(high, snapshot.watermark)),
+        'synced_at': started.isoformat(),
+        'rows': len(columns['id']),
+        'built_at': snapshot.meta.get('built_at') if not rebuild and snapshot.meta else started.isoformat(),
+    }
+    _save(directory, columns, meta)
+    return len(new['id']), updated, meta['rows']
+
+
+# -------------------------
+# METRICS
+# -------------------------
+def visit_mask(snapshot, as_of):
+    return (snapshot['status'] != CANCELLED) & (snapshot['date'] <= day_number(as_of))
+
+
+def branch_keys(snapshot):
+    """Per-row branch id (-1 when the therapist has no branch), looked up from the therapists' profiles."""
+    pairs = np.array(
+        list(TherapistProfile.objects.filter(branch__isnull=False).values_list('user_id', 'branch_id')),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    keys = np.full(len(snapshot), -1, dtype=np.int64)
+    if len(pairs) and len(snapshot):
+        pairs = pairs[np.argsort(pairs[:, 0])]
+        at = np.minimum(np.searchsorted(pairs[:, 0], snapshot['therapist']), len(pairs) - 1)
+        found = pairs[at, 0] == snapshot['therapist']
+        keys[found] = pairs[at[found], 1]
+    return keys
+
+
+def dimension_keys(snapshot, dimension):
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Unknown dimension {dimension!r}; use one of {', '.join(DIMENSIONS)}.")
+    return branch_keys(snapshot) if dimension == 'branch' else np.asarray(snapshot[dimension])
+
+
+def _months(days):
+    return days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+
+
+def retention_curve(snapshot, as_of=None, months=None):
+    """
+    Cohorts by first-visit month (the last `months`+1 of them): size and, for
+    each month offset 0..months, the share of the cohort with a visit that
+    month. Offsets that have not happened yet are None.
+    """
+    as_of = as_of or timezone.localdate()
+    months = months if months is not None else cohort_settings()['CURVE_MONTHS']
+    mask = visit_mask(snapshot, as_of)
+    patients = np.asarray(snapshot['patient'])[mask]
+    month = _months(np.asarray(snapshot['date'])[mask])
+    current = _months(np.array([day_number(as_of)]))[0]
+    if not len(patients):
+        return {'cohorts': [], 'sizes': [], 'rates': []}
+
+    unique_patients, patient_index = np.unique(patients, return_inverse=True)
+    first = np.full(len(unique_patients), np.iinfo(np.int64).max)
+    np.minimum.at(first, patient_index, month)
+    offset = month - first[patient_index]
+
+    keep = first >= current - months
+    cohort_months, cohort_of_patient = np.unique(first, return_inverse=True)
+    sizes = np.bincount(cohort_of_patient, weights=keep, minlength=len(cohort_months))
+
+    in_window = keep[patient_index] & (offset <= months)
+    pair = np.unique(patient_index[in_window] * (months + 1) + offset[in_window])
+    pair_patient, pair_offset = pair // (months + 1), pair % (months + 1)
+    counts = np.zeros((len(cohort_months), months + 1))
+    np.add.at(counts, (cohort_of_patient[pair_patient], pair_offset), 1)
+
+    rows = np.flatnonzero(sizes)
+    rates = []
+    for row in rows:
+        observable = current - cohort_months[row]
+        rates.append([
+            round(float(counts[row, k] / sizes[row]), 4) if k <= observable else None for k in range(months + 1)
+        ])
+    labels = [str(np.datetime64(int(m), 'M')) for m in cohort_months[rows]]
+    return {'cohorts': labels, 'sizes': [int(size) for size in sizes[rows]], 'rates': rates}
+
+
+def group_metrics(snapshot, keys, as_of=None):
+    """
+    Per-group patient metrics for per-row group `keys` (rows with a negative
+    key are ignored). Returns parallel arrays keyed by name.
+    """
+    options = cohort_settings()
+    as_of = as_of or timezone.localdate()
+    today = day_number(as_of)
+    mask = visit_mask(snapshot, as_of) & (keys >= 0)
+    groups, patients, days = keys[mask], np.asarray(snapshot['patient'])[mask], np.asarray(snapshot['date'])[mask]
+    if not len(groups):
+        return {name: np.empty(0) for name in
+                ('group', 'patients', 'visits', 'repeat_rate', 'retention_rate', 'churn_rate')}
+
+    order = np.lexsort((days, patients, groups))
+    groups, patients, days = groups[order], patients[order], days[order]
+    starts = np.flatnonzero(np.r_[True, (groups[1:] != groups[:-1]) | (patients[1:] != patients[:-1])])
+    ends = np.r_[starts[1:], len(groups)]
+    visits = ends - starts
+    first, last = days[starts], days[ends - 1]
+    second = np.where(visits > 1, days[np.minimum(starts + 1, len(days) - 1)], np.iinfo(np.int32).max)
+
+    group_ids, group_index = np.unique(groups[starts], return_inverse=True)
+    n = len(group_ids)
+    patient_count = np.bincount(group_index, minlength=n)
+    eligible = first <= today - options['RETENTION_DAYS']  # old enough for a return to be observable
+    retained = eligible & (second - first <= options['RETENTION_DAYS'])
+    eligible_count = np.bincount(group_index, weights=eligible, minlength=n)
+
+    def rate(weights, denominator):
+        totals = np.bincount(group_index, weights=weights, minlength=n)
+        return np.divide(totals, denominator, out=np.full(n, np.nan), where=denominator > 0)
+
+    return {
+        'group': group_ids,
+        'patients': patient_count,
+        'visits': np.bincount(group_index, weights=visits, minlength=n).astype(np.int64),
+        'repeat_rate': rate(visits > 1, patient_count),
+        'retention_rate': rate(retained, eligible_count),
+        'churn_rate': rate(last < today - options['CHURN_DAYS'], patient_count),
+    }
+
+
+def group_labels(dimension, ids):
+    ids = [int(pk) for pk in ids]
+    if dimension == 'therapist':
+        return dict(User.objects.filter(pk__in=ids).values_list('pk', 'username'))
+    model = Service if dimension == 'service' else ClinicBranch
+    return dict(model.objects.filter(pk__in=ids).values_list('pk', 'name'))
+
+
+def summary(dimension, as_of=None, limit=50, snapshot=None):
+    """The `limit` largest groups of a dimension as dicts, for views and the API."""
+    snapshot = snapshot if snapshot is not None else load()
+    metrics = group_metrics(snapshot, dimension_keys(snapshot, dimension), as_of)
+    top = np.argsort(-metrics['patients'], kind='stable')[:limit]
+    labels = group_labels(dimension, metrics['group'][top])
+
+    def percent(value):
+        return None if np.isnan(value) else round(float(value) * 100, 1)
+
+    return [
+        {
+            'id': int(metrics['group'][i]),
+            'name': labels.get(int(metrics['group'][i]), '-'),
+            'patients': int(metrics['patients'][i]),
+            'visits': int(metrics['visits'][i]),
+            'repeat_rate': percent(metrics['repeat_rate'][i]),
+            'retention_rate': percent(metrics['retention_rate'][i]),
+            'churn_rate': percent(metrics['churn_rate'][i]),
+        }
+        for i in top
+    ]
+
+
+def update_reports(as_of=None, snapshot=None):
+    """Set patient_retention_rate (percent) on each therapist's latest AnalyticsReport. Returns the count."""
+    snapshot = snapshot if snapshot is not None else load()
+    metrics = group_metrics(snapshot, np.asarray(snapshot['therapist']), as_of)
+    rates = {
+        int(group): round(float(rate) * 100, 2)
+        for group, rate in zip(metrics['group'], metrics['retention_rate']) if not np.isnan(rate)
+    }
+    latest = (
+        AnalyticsReport.objects.filter(therapist_id__in=list(rates))
+        .order_by('therapist_id', '-created_at', '-id')
+        .values_list('therapist_id', 'id')
+    )
+    reports, seen = [], set()
+    for therapist_id, pk in latest.iterator(chunk_size=2000):
+        if therapist_id not in seen:
+            seen.add(therapist_id)
+            reports.append(AnalyticsReport(pk=pk, patient_retention_rate=rates[therapist_id]))
+    AnalyticsReport.objects.bulk_update(reports, ['patient_retention_rate'], batch_size=1000)
+    return len(reports)
@@ -0,0 +1,221 @@
+"""
+Coupon redemption.
+
+redeem() is the only code path that discounts a payment. Inside one
+transaction its first statement claims a use of the coupon with a single
+guarded UPDATE
+
+    UPDATE ... SET usage_count = usage_count + 1
+     WHERE id = %s AND is_active AND valid_from <= today <= valid_to
+       AND usage_count < max_usage
+
+so the database, not a read-then-write in Python, decides who gets the last
+use: of any number of concurrent requests at most max_usage see a row
+updated. (Claiming first also takes SQLite's write lock before anything is
+read.) The payment is then checked, discounted and linked to a
+CouponRedemption; any failure after the claim rolls the claim back with it.
+release() undoes a redemption whose payment will not be made (the order
+could not be created, verification failed, or checkout was abandoned -
+`manage.py release_coupons`), giving the use back to the coupon.
+
+Codes are resolved through lookup() against an in-process index of the
+coupons valid today, built from one query. It is rebuilt at the next date on
+which any coupon starts or lapses, after a coupon is saved or deleted (a
+cache version bumped on commit) and at least every INDEX_MAX_AGE seconds, so
+checkout-time validation (validate()) needs no query. `manage.py stress_coupons` fires
+concurrent redemptions at one coupon and checks it is never over-redeemed.
+"""
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from .ledger import is_settled
+from .models import CouponRedemption, DiscountCoupon, Payment
+
+VERSION_KEY = 'coupons:version'
+INDEX_MAX_AGE = 5 * 60  # backstop for caches not shared between processes
+CENT = Decimal('0.01')
+MIN_CHARGE = Decimal('1.00')  # smallest amount Razorpay can charge
+
+ActiveCoupon = namedtuple('ActiveCoupon', 'id code discount_percentage min_amount valid_from valid_to')
+
+
+class CouponError(Exception):
+    """A coupon cannot be applied; the message is meant for the user."""
+
+
+def normalise(code):
+    return (code or '').strip().upper()
+
+
+# -------------------------
+# ACTIVE INDEX
+# -------------------------
+_index = None   # (cache version, built at, expires on, {code: ActiveCoupon})
+_lock = threading.Lock()
+
+
+def _version():
+    return cache.get(VERSION_KEY, 0)
+
+
+def bump_version():
+    cache.add(VERSION_KEY, 0, timeout=None)
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, timeout=None)
+
+
+def build_index(today):
+    """
+    ({code: ActiveCoupon} valid on `today`, first later date on which that set
+    changes) from one query. Coupons that start later only contribute their
+    start date; the set also changes the day after any valid_to.
+    """
+    coupons, boundaries = {}, []
+    rows = (
+        DiscountCoupon.objects.filter(is_active=True, valid_to__gte=today)
+        .order_by('pk').values_list(*ActiveCoupon._fields)
+    )
+    for row in rows:
+        coupon = ActiveCoupon(*row)
+        if coupon.valid_from > today:
+            boundaries.append(coupon.valid_from)
+        else:
+            coupons.setdefault(normalise(coupon.code), coupon)
+            boundaries.append(coupon.valid_to + timedelta(days=1))
+    return coupons, min(boundaries, default=None)
+
+
+def active_index():
+    """The process-wide {code: ActiveCoupon} for today, rebuilt at date boundaries and after coupon changes."""
+    global _index
+    today, now, version = timezone.localdate(), time.monotonic(), _version()
+
+    def fresh(index):
+        return (index is not None and index[0] == version and now - index[1] < INDEX_MAX_AGE
+                and (index[2] is None or today < index[2]))
+
+    index = _index
+    if not fresh(index):
+        with _lock:
+            index = _index
+            if not fresh(index):
+                coupons, expires_on = build_index(today)
+                index = _index = (version, now, expires_on, coupons)
+    return index[3]
+
+
+def lookup(code):
+    """The active coupon for `code` valid today, or None. No query unless the index is being rebuilt."""
+    return active_index().get(normalise(code))
+
+
+def validate(code, amount):
+    """(coupon, discount) for `code` on `amount`, checked against the index only; raises CouponError."""
+    coupon = lookup(code)
+    if coupon is None:
+        raise CouponError("This coupon code is invalid or has expired.")
+    if amount is not None and amount < coupon.min_amount:
+        raise CouponError(f"This coupon needs a minimum amount of ₹{coupon.min_amount}.")
+    discount = discount_for(coupon, amount or Decimal('0'))
+    if amount is not None and amount - discount < MIN_CHARGE:
+        raise CouponError(f"Payment amount must be at least ₹{MIN_CHARGE} after the discount.")
+    return coupon, discount
+
+
+def discount_for(coupon, amount):
+    return (amount * coupon.discount_percentage / 100).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+# -------------------------
+# REDEMPTION
+# -------------------------
+def redeem(code, payment_id, user=None):
+    """Apply coupon `code` to a pending payment. Returns the CouponRedemption or raises CouponError."""
+    coupon = lookup(code)
+    if coupon is None:
+        raise CouponError("This coupon code is invalid or has expired.")
+    today = timezone.localdate()
+    try:
+        with transaction.atomic():
+            claimed = DiscountCoupon.objects.filter(
+                pk=coupon.id, is_active=True, valid_from__lte=today, valid_to__gte=today,
+                usage_count__lt=F('max_usage'),
+            ).update(usage_count=F('usage_count') + 1)
+            if not claimed:
+                raise CouponError("This coupon has reached its usage limit.")
+
+            payment = Payment.objects.select_for_update().filter(pk=payment_id).first()
+            if payment is None:
+                raise CouponError("Payment not found.")
+            if is_settled(payment.payment_status):
+                raise CouponError("This payment has already been made.")
+            if CouponRedemption.objects.filter(payment=payment).exists():
+                raise CouponError("A coupon has already been applied to this payment.")
+            if payment.amount < coupon.min_amount:
+                raise CouponError(f"This coupon needs a minimum amount of ₹{coupon.min_amount}.")
+
+            discount = discount_for(coupon, payment.amount)
+            if payment.amount - discount < MIN_CHARGE:
+                # Razorpay cannot charge less; raising here also gives the claimed use back
+                raise CouponError(f"Payment amount must be at least ₹{MIN_CHARGE} after the discount.")
+            redemption = CouponRedemption.objects.create(
+                coupon_id=coupon.id, payment=payment, user=user,
+                original_amount=payment.amount, discount_amount=discount,
+            )
+            payment.amount -= discount
+            payment.save(update_fields=['amount', 'updated_at'])
+    except IntegrityError:
+        # a concurrent redemption for the same payment won the one-to-one
+        raise CouponError("A coupon has already been applied to this payment.")
+    return redemption
+
+
+def release(payment_id):
+    """Undo the redemption on an unsettled payment and restore its amount. Returns True if one was released."""
+    with transaction.atomic():
+        payment = Payment.objects.select_for_update().filter(pk=payment_id).first()
+        if payment is None or is_settled(payment.payment_status):
+            return False
+        redemption = CouponRedemption.objects.filter(payment=payment).first()
+        if redemption is None:
+            return False
+        DiscountCoupon.objects.filter(pk=redemption.coupon_id, usage_count__gt=0).update(
+            usage_count=F('usage_count') - 1
+        )
+        redemption.delete()
+        payment.amount = redemption.original_amount
+        payment.save(update_fields=['amount', 'updated_at'])
+    return True
+
+
+def release_abandoned(older_than):
+    """release() pending payments with a coupon untouched for `older_than` (a timedelta). Returns the count."""
+    stale = (
+        Payment.objects.filter(coupon_redemption__isnull=False, payment_status='Pending',
+                               updated_at__lt=timezone.now() - older_than)
+        .values_list('pk', flat=True)
+    )
+    return sum(release(pk) for pk in list(stale))
+
+
+# -------------------------
+# SIGNALS
+# -------------------------
+def _invalidate(sender, raw=False, **kwargs):
+    # after commit, so no other thread rebuilds from rows about to change
+    transaction.on_commit(bump_version)
+
+
+post_save.connect(_invalidate, sender=DiscountCoupon, dispatch_uid='coupons_save')
+post_delete.connect(_invalidate, sender=DiscountCoupon, dispatch_uid='coupons_delete')
@@ -1,15 +1,58 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
-from .models import User, Appointment, Service, Exercise, Feedback, TreatmentPlan, Notification, AvailabilitySlot, LocationCoverage, SubscriptionPlan, Transaction, Payment, DiscountCoupon, EmergencyRequest, ChatMessage, SupportTicket, TherapistLeave, HomeExerciseReminder, BlogArticle, FAQ, ClinicBranch, AnalyticsReport, RecoveryPredictor
+from .models import User, Appointment, Service, Exercise, Feedback, TreatmentPlan, Notification, AvailabilitySlot, LocationCoverage, SubscriptionPlan, Transaction, Payment, DiscountCoupon, EmergencyRequest, ChatMessage, SupportTicket, TherapistLeave, HomeExerciseReminder, BlogArticle, FAQ, ClinicBranch, AnalyticsReport, RecoveryPredictor, AvailabilityRule, ReminderRule, RecurrenceRule
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
 from django.utils.text import slugify
+from django.urls import reverse
+from . import autocomplete
+from . import coupons
+from .choices import (
+    LightweightChoicesMixin, USER_CHOICES, PATIENT_CHOICES, THERAPIST_CHOICES, SERVICE_CHOICES,
+    PLAN_CHOICES, EXERCISE_CHOICES, APPOINTMENT_CHOICES, TREATED_PATIENT_CHOICES,
+)
 
 
 
 
 
+# -------------------------
+# AUTOCOMPLETE WIDGET
+# -------------------------
+class AutocompleteWidget(forms.Widget):
+    """
+    Replaces a <select> that would embed every row as an <option>. Renders a
+    hidden input holding the selected id plus a text box that queries the
+    `autocomplete` endpoint as the user types (static/autocomplete.js).
+    """
+    input_type = 'autocomplete'
+    template_name = 'widgets/autocomplete.html'
+
+    def __init__(self, kind, attrs=None):
+        super().__init__(attrs)
+        self.kind = kind
+
+    def selected_label(self, value):
+        if value in (None, ''):
+            return ''
+        label = autocomplete.label_for(self.kind, value)
+        if label is None:
+            # Not in the in-memory index (e.g. an old appointment)
+            choices = getattr(self, 'choices', None)
+            obj = choices.queryset.filter(pk=value).first() if choices is not None else None
+            label = str(obj) if obj else ''
+        return label
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget'].update({
+            'url': reverse('autocomplete', args=[self.kind]),
+            'label': self.selected_label(value),
+        })
+        return context
+
+
 # -------------------------
 # USER REGISTRATION FORM
 # -------------------------
@@ -74,7 +117,7 @@ class ServiceForm(forms.ModelForm):
 # -------------------------
 # APPOINTMENT BOOKING FORM
 # -------------------------
-class AppointmentForm(forms.ModelForm):
+class AppointmentForm(LightweightChoicesMixin, forms.ModelForm):
     scheduled_date = forms.DateField(widget=forms.DateInput(
         attrs={'type': 'date', 'class': 'form-control'}
     ))
@@ -87,14 +130,12 @@ class AppointmentForm(forms.ModelForm):
         fields = ['therapist', 'service', 'scheduled_date', 'scheduled_time']
 
         widgets = {
-            'therapist': forms.Select(attrs={'class': 'form-select'}),
+            'therapist': AutocompleteWidget('therapist', attrs={'class': 'form-control'}),
             'service': forms.Select(attrs={'class': 'form-select'}),
         }
 
-    # ✅ Only show Therapists in dropdown
-    def __init__(self, *args, **kwargs):
-        super(AppointmentForm, self).__init__(*args, **kwargs)
-        self.fields['therapist'].queryset = User.objects.filter(role="Therapist")
+    # ✅ Only Therapists, loaded without the heavy profile columns
+    light_choices = {'therapist': THERAPIST_CHOICES, 'service': SERVICE_CHOICES}
 
 
 # -------------------------
@@ -117,7 +158,9 @@ class ExerciseForm(forms.ModelForm):
 # -------------------------
 # TREATMENT PLAN FORM
 # -------------------------
-class TreatmentPlanForm(forms.ModelForm):
+class TreatmentPlanForm(LightweightChoicesMixin, forms.ModelForm):
+    light_choices = {'appointment': APPOINTMENT_CHOICES, 'prescribed_by': USER_CHOICES}
+
     class Meta:
         model = TreatmentPlan
         fields = [
@@ -129,18 +172,18 @@ class TreatmentPlanForm(forms.ModelForm):
             'instructions'
         ]
         widgets = {
-            'appointment': forms.Select(attrs={
-                'class': 'form-select',
-                'placeholder': 'Select Appointment'
+            'appointment': AutocompleteWidget('appointment', attrs={
+                'class': 'form-control',
+                'placeholder': 'Search appointment by patient, therapist or date'
             }),
             'exercises_list': forms.Textarea(attrs={
                 'class': 'form-control',
                 'placeholder': 'Enter one exercise per line...',
                 'rows': 5
             }),
-            'prescribed_by': forms.Select(attrs={
-                'class': 'form-select',
-                'placeholder': 'Select Prescribing Therapist'
+            'prescribed_by': AutocompleteWidget('therapist', attrs={
+                'class': 'form-control',
+                'placeholder': 'Search prescribing therapist'
             }),
             'follow_up_required': forms.CheckboxInput(attrs={
                 'class': 'form-check-input'
@@ -193,7 +236,8 @@ class FeedbackForm(forms.ModelForm):
 # NotificationForm
 # -------------------------
 
-class NotificationForm(forms.ModelForm):
+class NotificationForm(LightweightChoicesMixin, forms.ModelForm):
+    light_choices = {'user': USER_CHOICES}
 
     class Meta:
         model = Notification
@@ -321,14 +365,16 @@ class LocationCoverageForm(forms.ModelForm):
 # ---------------------------------------
 # Payment Form
 # ---------------------------------------
-class PaymentForm(forms.ModelForm):
+class PaymentForm(LightweightChoicesMixin, forms.ModelForm):
+    light_choices = {'appointment': APPOINTMENT_CHOICES}
+
     class Meta:
         model = Payment
         fields = ['appointment', 'amount', 'mode', 'payment_status', 'transaction_id']
 
         widgets = {
-            'appointment': forms.Select(
-                attrs={'class': 'form-select'}
+            'appointment': AutocompleteWidget(
+                'appointment', attrs={'class': 'form-control'}
             ),
             'amount': forms.NumberInput(
                 attrs={'class': 'form-control', 'step': '0.01'}
@@ -352,6 +398,23 @@ class PaymentForm(forms.ModelForm):
             'transaction_id': 'Transaction ID',
         }
 
+    # ✅ Optional coupon, redeemed by coupons.redeem() once the payment is saved
+    coupon_code = forms.CharField(
+        max_length=20, required=False, label='Coupon Code',
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Optional coupon code'}),
+    )
+
+    # ✅ Checked against the in-memory active-coupon index: no query
+    def clean(self):
+        cleaned_data = super().clean()
+        code = cleaned_data.get('coupon_code')
+        if code:
+            try:
+                coupons.validate(code, cleaned_data.get('amount'))
+            except coupons.CouponError as exc:
+                self.add_error('coupon_code', str(exc))
+        return cleaned_data
+
 
 # ---------------------------------------
 # DiscountCoupon Form
@@ -395,13 +458,19 @@ class DiscountCouponForm(forms.ModelForm):
 
         if valid_from and valid_to and valid_from > valid_to:
             self.add_error('valid_to', "Valid To date must be after Valid From date.")
+
+        max_usage = cleaned_data.get('max_usage')
+        if max_usage is not None and max_usage < self.instance.usage_count:
+            self.add_error('max_usage', f"This coupon has already been used {self.instance.usage_count} times.")
         return cleaned_data
 
 
 # ---------------------------------------
 # EmergencyRequest Form
 # ---------------------------------------
-class EmergencyRequestForm(forms.ModelForm):
+class EmergencyRequestForm(LightweightChoicesMixin, forms.ModelForm):
+    light_choices = {'patient': USER_CHOICES, 'assigned_therapist': USER_CHOICES}
+
     class Meta:
         model = EmergencyRequest
         fields = ['patient', 'condition_description', 'assigned_therapist', 'status']
@@ -437,7 +506,9 @@ class EmergencyRequestForm(forms.ModelForm):
 # ---------------------------------------
 # ChatMessage Form
 # ---------------------------------------
-class ChatMessageForm(forms.ModelForm):
+class ChatMessageForm(LightweightChoicesMixin, forms.ModelForm):
+    light_choices = {'sender': USER_CHOICES, 'receiver': USER_CHOICES}
+
     class Meta:
         model = ChatMessage
         fields = ['sender', 'receiver', 'message_text', 'attachment']
@@ -464,7 +535,9 @@ class ChatMessageForm(forms.ModelForm):
 # ---------------------------------------
 # SupportTicket Form
 # ---------------------------------------
-class SupportTicketForm(forms.ModelForm):
+class SupportTicketForm(LightweightChoicesMixin, forms.ModelForm):
+    light_choices = {'user': USER_CHOICES}
+
     class Meta:
         model = SupportTicket
         fields = ['user', 'issue_category', 'description', 'status', 'response_message']
@@ -489,7 +562,9 @@ class SupportTicketForm(forms.ModelForm):
 # ---------------------------------------
 # TherapistLeave Form
 # ---------------------------------------
-class TherapistLeaveForm(forms.ModelForm):
+class TherapistLeaveForm(LightweightChoicesMixin, forms.ModelForm):
+    light_choices = {'therapist': USER_CHOICES, 'approved_by': USER_CHOICES}
+
     class Meta:
         model = TherapistLeave
         fields = ['therapist', 'from_date', 'to_date', 'reason', 'approved_by', 'is_approved']
@@ -525,14 +600,16 @@ class TherapistLeaveForm(forms.ModelForm):
 # ---------------------------------------
 # HomeExerciseReminder Form
 # ---------------------------------------
-class HomeExerciseReminderForm(forms.ModelForm):
+class HomeExerciseReminderForm(LightweightChoicesMixin, forms.ModelForm):
+    light_choices = {'patient': USER_CHOICES, 'exercise': EXERCISE_CHOICES}
+
     class Meta:
         model = HomeExerciseReminder
         fields = ['patient', 'exercise', 'reminder_time', 'is_completed', 'sent_via']
 
         widgets = {
-            'patient': forms.Select(attrs={'class': 'form-select'}),
-            'exercise': forms.Select(attrs={'class': 'form-select'}),
+            'patient': AutocompleteWidget('patient', attrs={'class': 'form-control'}),
+            'exercise': AutocompleteWidget('exercise', attrs={'class': 'form-control'}),
             'reminder_time': forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'}),
             'is_completed': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
             'sent_via': forms.Select(attrs={'class': 'form-select'}),
@@ -546,10 +623,81 @@ class HomeExerciseReminderForm(forms.ModelForm):
             'sent_via': 'Sent Via',
         }
 
+# ---------------------------------------
+# Recurrence Rule Forms
+# ---------------------------------------
+class RecurrenceRuleForm(forms.ModelForm):
+    # ✅ Stored as "0,1,2" on the model, edited as checkboxes
+    weekdays = forms.TypedMultipleChoiceField(
+        choices=RecurrenceRule.WEEKDAY_CHOICES,
+        coerce=int,
+        widget=forms.CheckboxSelectMultiple,
+        initial=[0, 1, 2, 3, 4],
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.initial['weekdays'] = sorted(self.instance.get_weekdays())
+
+    def clean_weekdays(self):
+        return ','.join(str(day) for day in sorted(self.cleaned_data['weekdays']))
+
+
+class AvailabilityRuleForm(LightweightChoicesMixin, RecurrenceRuleForm):
+    light_choices = {'therapist': THERAPIST_CHOICES}
+
+    class Meta:
+        model = AvailabilityRule
+        fields = ['therapist', 'weekdays', 'start_time', 'end_time', 'slot_minutes', 'start_date', 'end_date', 'is_active']
+
+        widgets = {
+            'therapist': forms.Select(attrs={'class': 'form-select'}),
+            'start_time': forms.TimeInput(attrs={'class': 'form-control', 'type': 'time'}),
+            'end_time': forms.TimeInput(attrs={'class': 'form-control', 'type': 'time'}),
+            'slot_minutes': forms.NumberInput(attrs={'class': 'form-control', 'min': 5}),
+            'start_date': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+            'end_date': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+            'is_active': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+        }
+
+        labels = {
+            'slot_minutes': 'Slot Length (minutes)',
+            'end_date': 'End Date (optional)',
+        }
+
+
+
+class ReminderRuleForm(LightweightChoicesMixin, RecurrenceRuleForm):
+    light_choices = {'patient': TREATED_PATIENT_CHOICES, 'exercise': EXERCISE_CHOICES}
+
+    class Meta:
+        model = ReminderRule
+        fields = ['patient', 'exercise', 'time_of_day', 'weekdays', 'sent_via', 'start_date', 'end_date', 'is_active']
+
+        widgets = {
+            'patient': forms.Select(attrs={'class': 'form-select'}),
+            'exercise': forms.Select(attrs={'class': 'form-select'}),
+            'time_of_day': forms.TimeInput(attrs={'class': 'form-control', 'type': 'time'}),
+            'sent_via': forms.Select(attrs={'class': 'form-select'}),
+            'start_date': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+            'end_date': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+            'is_active': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+        }
+
+        labels = {
+            'time_of_day': 'Reminder Time',
+            'end_date': 'End Date (optional)',
+        }
+
+
+
 # ---------------------------------------
 # BlogArticle Form
 # ---------------------------------------
-class BlogArticleForm(forms.ModelForm):
+class BlogArticleForm(LightweightChoicesMixin, forms.ModelForm):
+    light_choices = {'author': USER_CHOICES}
+
     class Meta:
         model = BlogArticle
         fields = ['author', 'title', 'slug', 'content', 'category', 'cover_image', 'tags', 'is_published']
@@ -668,10 +816,12 @@ class SubscriptionPlanForm(forms.ModelForm):
 # ---------------------------------------
 # Transaction Form
 # ---------------------------------------
-class TransactionForm(forms.ModelForm):
+class TransactionForm(LightweightChoicesMixin, forms.ModelForm):
+    light_choices = {'user': USER_CHOICES, 'plan': PLAN_CHOICES}
+
     class Meta:
         model = Transaction
-        fields = ['user', 'plan', 'amount', 'payment_mode', 'transaction_id', 'expires_at']
+        fields = ['user', 'plan', 'amount', 'payment_mode', 'transaction_id', 'status']
 
         widgets = {
             'user': forms.Select(attrs={'class': 'form-select'}),
@@ -679,7 +829,7 @@ class TransactionForm(forms.ModelForm):
             'amount': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01', 'min': '0'}),
             'payment_mode': forms.Select(attrs={'class': 'form-select'}),
             'transaction_id': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Unique transaction ID'}),
-            'expires_at': forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'}),
+            'status': forms.Select(attrs={'class': 'form-select'}),
         }
 
         labels = {
@@ -688,9 +838,15 @@ class TransactionForm(forms.ModelForm):
             'amount': 'Amount',
             'payment_mode': 'Payment Mode',
             'transaction_id': 'Transaction ID',
-            'expires_at': 'Expiry Date/Time',
+            'status': 'Status',
         }
 
+    # ✅ expires_at is computed from the plan (subscriptions.start_period)
+    auto_renew = forms.BooleanField(
+        required=False, label='Renew automatically',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+    )
+
     def clean_amount(self):
         amount = self.cleaned_data.get('amount')
         if amount <= 0:
@@ -700,7 +856,9 @@ class TransactionForm(forms.ModelForm):
 # -------------------------
 # AnalyticsReportForm
 # -------------------------
-class AnalyticsReportForm(forms.ModelForm):
+class AnalyticsReportForm(LightweightChoicesMixin, forms.ModelForm):
+    light_choices = {'therapist': USER_CHOICES}
+
     class Meta:
         model = AnalyticsReport
         fields = [
@@ -740,6 +898,7 @@ class RecoveryPredictorForm(forms.ModelForm):
     class Meta:
         model = RecoveryPredictor
         fields = [
+            'patient',
             'model_version',
             'input_features',
             'predicted_recovery_days',
@@ -747,6 +906,7 @@ class RecoveryPredictorForm(forms.ModelForm):
         ]
 
         widgets = {
+            'patient': AutocompleteWidget('patient', attrs={'class': 'form-control'}),
             'model_version': forms.TextInput(attrs={'class': 'form-control'}),
             'input_features': forms.Textarea(attrs={'class': 'form-control', 'rows': 4, 'placeholder': 'Enter input features '}),
             'predicted_recovery_days': forms.NumberInput(attrs={'class': 'form-control', 'step': 0.1, 'min': 0}),
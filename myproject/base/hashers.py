@@ -0,0 +1,37 @@
+"""
+Password hasher profile.
+
+settings.PASSWORD_HASHERS puts TunedArgon2PasswordHasher first when argon2-cffi
+is installed and TunedPBKDF2PasswordHasher otherwise. Their cost parameters
+come from settings.PASSWORD_PROFILE. Both keep Django's algorithm names, so
+existing hashes still verify, and Django's check_password() rehashes a
+password with the preferred hasher/parameters on the user's next successful
+login - no migration needed.
+"""
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, PBKDF2PasswordHasher
+
+
+def password_settings():
+    return {
+        # OWASP minimums: Argon2id m=19 MiB, t=2, p=1; PBKDF2-HMAC-SHA256 600k iterations
+        'ARGON2_TIME_COST': 2,
+        'ARGON2_MEMORY_COST': 19456,    # KiB
+        'ARGON2_PARALLELISM': 1,
+        'PBKDF2_ITERATIONS': 600000,
+        **getattr(settings, 'PASSWORD_PROFILE', {}),
+    }
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """Argon2id with PASSWORD_PROFILE's costs instead of Django's 100 MiB / 8 lanes."""
+
+    time_cost = password_settings()['ARGON2_TIME_COST']
+    memory_cost = password_settings()['ARGON2_MEMORY_COST']
+    parallelism = password_settings()['ARGON2_PARALLELISM']
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 with PASSWORD_PROFILE['PBKDF2_ITERATIONS']."""
+
+    iterations = password_settings()['PBKDF2_ITERATIONS']
@@ -0,0 +1,230 @@
+"""
+Revenue ledger and daily rollups.
+
+Every change to a Payment or Transaction is reconciled into LedgerEntry rows
+by sync(): the revenue the source should carry right now (its amount when
+settled, else nothing) is compared with what the ledger already holds for it,
+and only the difference is posted, as a balanced cash/revenue journal. The
+ledger is never updated in place, so refunds, amount corrections, deletions
+and payments re-saved after their appointment changed therapist or service
+all show up as new reversing journals on the day they happen.
+
+Each posting also bumps RevenueRollup, one row per (date, therapist,
+service, mode), so finance reports sum a few hundred rollup rows instead of
+scanning payments and transactions. `manage.py rollup_revenue` backfills the
+ledger for rows written without signals (bulk imports, data from before the
+ledger) and rebuilds rollups from it in date chunks.
+"""
+import re
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from .batching import current_batch
+from .models import LedgerEntry, Payment, RevenueRollup, Transaction
+
+PAYMENT = 'payment'
+SUBSCRIPTION = 'subscription'
+SETTLED = {'completed', 'paid', 'success', 'captured'}
+ZERO = Decimal('0.00')
+
+
+def is_settled(status):
+    """Payment statuses come in several spellings ("Completed", "Completed ✅", ...)."""
+    return re.sub(r'[^a-z]', '', (status or '').lower()) in SETTLED
+
+
+def _day(moment):
+    return timezone.localdate(moment) if moment else timezone.localdate()
+
+
+# -------------------------
+# POSITIONS
+# -------------------------
+def _desired(source, ids):
+    """
+    {(source id, therapist, service, mode): (amount, source date)} the sources
+    should carry now. The source date is when the payment was made (timestamp),
+    not updated_at, which migration 0005 set to the same moment for every
+    existing payment.
+    """
+    if source == PAYMENT:
+        rows = Payment.objects.filter(id__in=ids).values_list(
+            'id', 'appointment__therapist_id', 'appointment__service_id', 'mode',
+            'amount', 'payment_status', 'timestamp',
+        )
+        return {
+            (pk, therapist, service, mode or ''): (amount, _day(made))
+            for pk, therapist, service, mode, amount, status, made in rows
+            if is_settled(status) and amount
+        }
+    # pending auto-renewals have not been charged yet; they post once marked completed
+    rows = (
+        Transaction.objects.filter(id__in=ids, status=Transaction.COMPLETED)
+        .values_list('id', 'payment_mode', 'amount', 'started_at')
+    )
+    return {(pk, None, None, mode or ''): (amount, _day(started)) for pk, mode, amount, started in rows if amount}
+
+
+def _current(source, ids):
+    """{(source id, therapist, service, mode): revenue} already in the ledger."""
+    rows = (
+        LedgerEntry.objects.filter(account='revenue', source=source, source_id__in=ids)
+        .values('source_id', 'therapist_id', 'service_id', 'mode')
+        .annotate(total=Sum('amount'))
+    )
+    return {
+        (row['source_id'], row['therapist_id'], row['service_id'], row['mode']): -row['total']
+        for row in rows if row['total']
+    }
+
+
+def _journal(source, key, amount, day):
+    source_id, therapist_id, service_id, mode = key
+    journal = uuid.uuid4()
+    common = dict(journal=journal, source=source, source_id=source_id, date=day,
+                  therapist_id=therapist_id, service_id=service_id, mode=mode)
+    return [LedgerEntry(account='cash', amount=amount, **common),
+            LedgerEntry(account='revenue', amount=-amount, **common)]
+
+
+def sync(payments=(), transactions=(), backdate=False, rollup=True):
+    """
+    Post whatever journals bring the ledger in line with these payments and
+    transactions (ids; rows that no longer exist are reversed). Postings are
+    dated today, or with `backdate` on the source's own date. Returns the
+    number of journals written.
+    """
+    today = timezone.localdate()
+    entries = []
+    for source, ids in ((PAYMENT, payments), (SUBSCRIPTION, transactions)):
+        ids = list(ids)
+        if not ids:
+            continue
+        desired, current = _desired(source, ids), _current(source, ids)
+        for key in desired.keys() | current.keys():
+            amount, day = desired.get(key, (ZERO, today))
+            difference = amount - current.get(key, ZERO)
+            if difference:
+                entries += _journal(source, key, difference, day if backdate else today)
+    if entries:
+        with transaction.atomic():
+            LedgerEntry.objects.bulk_create(entries, batch_size=1000)
+            if rollup:
+                bump_rollups(entries)
+    return len(entries) // 2
+
+
+def bump_rollups(entries):
+    """Add the revenue lines of freshly posted entries to their rollup rows."""
+    totals = defaultdict(lambda: [ZERO, 0])
+    for entry in entries:
+        if entry.account == 'revenue':
+            total = totals[(entry.date, entry.therapist_id, entry.service_id, entry.mode)]
+            total[0] -= entry.amount
+            total[1] += 1
+    for (day, therapist_id, service_id, mode), (amount, count) in totals.items():
+        key = dict(date=day, therapist_id=therapist_id, service_id=service_id, mode=mode)
+        # A concurrent first posting for the same key may create a second row;
+        # reports sum rollups per key, and rebuild_rollups() merges them.
+        if not RevenueRollup.objects.filter(**key).update(amount=F('amount') + amount, entries=F('entries') + count):
+            RevenueRollup.objects.create(amount=amount, entries=count, **key)
+
+
+# -------------------------
+# BACKFILL
+# -------------------------
+def backfill(chunk_size=2000, report=None):
+    """Reconcile every payment and transaction in id chunks, back-dated, without touching rollups."""
+    journals = 0
+    for model, argument in ((Payment, 'payments'), (Transaction, 'transactions')):
+        ids = model.objects.order_by('id').values_list('id', flat=True)
+        chunk = []
+        for pk in ids.iterator(chunk_size=chunk_size):
+            chunk.append(pk)
+            if len(chunk) == chunk_size:
+                journals += sync(backdate=True, rollup=False, **{argument: chunk})
+                chunk = []
+                if report:
+                    report(model.__name__, pk, journals)
+        if chunk:
+            journals += sync(backdate=True, rollup=False, **{argument: chunk})
+    return journals
+
+
+def rebuild_rollups(first=None, last=None, days_per_chunk=31, report=None):
+    """Recompute RevenueRollup from the ledger for [first, last] (default: all of it), a date chunk at a time."""
+    bounds = LedgerEntry.objects.aggregate(first=Min('date'), last=Max('date'))
+    first, last = first or bounds['first'], last or bounds['last']
+    if first is None or last is None:
+        return 0
+    written = 0
+    start = first
+    while start <= last:
+        stop = min(start + timedelta(days=days_per_chunk - 1), last)
+        totals = (
+            LedgerEntry.objects.filter(account='revenue', date__range=(start, stop))
+            .values('date', 'therapist_id', 'service_id', 'mode')
+            .annotate(total=Sum('amount'), count=Count('id'))
+            .order_by()
+        )
+        rows = [
+            RevenueRollup(date=row['date'], therapist_id=row['therapist_id'], service_id=row['service_id'],
+                          mode=row['mode'], amount=-row['total'], entries=row['count'])
+            for row in totals if row['total'] or row['count']
+        ]
+        with transaction.atomic():
+            RevenueRollup.objects.filter(date__range=(start, stop)).delete()
+            RevenueRollup.objects.bulk_create(rows, batch_size=1000)
+        written += len(rows)
+        if report:
+            report(stop, written)
+        start = stop + timedelta(days=1)
+    return written
+
+
+# -------------------------
+# REPORTS
+# -------------------------
+REPORT_GROUPS = {
+    'date': 'date',
+    'therapist': 'therapist__username',
+    'service': 'service__name',
+    'mode': 'mode',
+}
+
+
+def revenue(first, last, by='date'):
+    """Revenue and posting count per `by` (a REPORT_GROUPS key) between two dates, from the rollups."""
+    field = REPORT_GROUPS[by]
+    return list(
+        RevenueRollup.objects.filter(date__range=(first, last))
+        .values(field)
+        .annotate(amount=Sum('amount'), entries=Sum('entries'))
+        .order_by('-amount' if by != 'date' else field)
+        .values_list(field, 'amount', 'entries')
+    )
+
+
+# -------------------------
+# SIGNALS
+# -------------------------
+def source_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    batch = current_batch()
+    if batch is not None:
+        batch.add([instance])
+        return
+    sync(**{'payments' if sender is Payment else 'transactions': [instance.pk]})
+
+
+for _model in (Payment, Transaction):
+    post_save.connect(source_changed, sender=_model, dispatch_uid=f'ledger_save_{_model.__name__}')
+    post_delete.connect(source_changed, sender=_model, dispatch_uid=f'ledger_delete_{_model.__name__}')
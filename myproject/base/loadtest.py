@@ -0,0 +1,172 @@
+"""
+Scripted patient journey for the booking-to-payment benchmark.
+
+Each journey is one patient going through login -> dashboard ->
+book_appointment -> payment_create -> give_feedback with Django's test
+client. The Razorpay client in views is swapped for FakeGateway while the
+benchmark runs, so no network calls are made. Results are compared against a
+stored baseline (JSON) to catch regressions.
+"""
+import itertools
+import json
+import os
+import statistics
+from contextlib import contextmanager
+from datetime import date, timedelta
+from time import perf_counter
+
+from django.test import Client
+
+from . import views
+from .models import Appointment
+
+STEPS = ('login', 'dashboard', 'book_appointment', 'payment_create', 'give_feedback')
+
+
+class FakeGateway:
+    """Stands in for razorpay.Client: orders get sequential ids, signatures always verify."""
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self.order = self
+        self.utility = self
+
+    def create(self, data):
+        return {'id': f"order_fake_{next(self._ids)}", 'amount': data['amount'], 'status': 'created'}
+
+    def verify_payment_signature(self, params):
+        return True
+
+
+@contextmanager
+def fake_payment_gateway():
+    original = views.client
+    views.client = FakeGateway()
+    try:
+        yield views.client
+    finally:
+        views.client = original
+
+
+class JourneyError(Exception):
+    pass
+
+
+def _check(response, step, expected=(200, 302)):
+    if response.status_code not in expected:
+        raise JourneyError(f"{step} returned HTTP {response.status_code}")
+    return response
+
+
+def run_journey(username, password, therapist_id, service_id, day, timings):
+    """One patient journey; appends per-step seconds to timings[step]."""
+    client = Client(SERVER_NAME='localhost')
+
+    def timed(step, call, expected=(200, 302)):
+        started = perf_counter()
+        response = call()
+        timings[step].append(perf_counter() - started)
+        return _check(response, step, expected)
+
+    timed('login', lambda: client.post('/login/', {'username': username, 'password': password}))
+    if '_auth_user_id' not in client.session:
+        raise JourneyError(f"login failed for {username}")
+    timed('dashboard', lambda: client.get('/dashboard/'), expected=(200,))
+    last_id = Appointment.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    # Form views re-render with 200 on invalid input, so only a redirect counts as success
+    timed('book_appointment', lambda: client.post('/appointments/book/', {
+        'therapist': therapist_id, 'service': service_id,
+        'scheduled_date': day.isoformat(), 'scheduled_time': '10:00',
+    }), expected=(302,))
+
+    appointment = (
+        Appointment.objects.filter(patient__username=username, id__gt=last_id).order_by('-id').values('id', 'service__base_fee').first()
+    )
+    if appointment is None:
+        raise JourneyError(f"book_appointment did not create an appointment for {username}")
+
+    timed('payment_create', lambda: client.post('/payments/create/', {
+        'appointment': appointment['id'], 'amount': appointment['service__base_fee'], 'mode': 'UPI',
+        'payment_status': 'Pending', 'transaction_id': f"journey_{appointment['id']}",
+    }), expected=(200,))
+    timed('give_feedback', lambda: client.post(f"/feedback/{appointment['id']}/", {
+        'rating': 5, 'comments': 'Benchmark journey',
+    }), expected=(302,))
+
+
+def run_journeys(patients, therapist_ids, service_ids, password):
+    """Run one journey per patient username. Returns (timings by step, wall seconds, errors)."""
+    timings = {step: [] for step in STEPS}
+    errors = []
+    day = date.today() + timedelta(days=7)
+    started = perf_counter()
+    with fake_payment_gateway():
+        for n, username in enumerate(patients):
+            try:
+                run_journey(username, password, therapist_ids[n % len(therapist_ids)],
+                            service_ids[n % len(service_ids)], day, timings)
+            except JourneyError as exc:
+                errors.append(str(exc))
+    return timings, perf_counter() - started, errors
+
+
+# -------------------------
+# REPORTING
+# -------------------------
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(timings, elapsed, journeys):
+    steps = {}
+    for step, values in timings.items():
+        ms = [value * 1000 for value in values]
+        steps[step] = {
+            'count': len(ms),
+            'p50_ms': round(statistics.median(ms), 2) if ms else 0.0,
+            'p95_ms': round(percentile(ms, 95), 2),
+            'p99_ms': round(percentile(ms, 99), 2),
+        }
+    return {
+        'journeys': journeys,
+        'journeys_per_second': round(journeys / elapsed, 2) if elapsed else 0.0,
+        'requests_per_second': round(sum(len(v) for v in timings.values()) / elapsed, 2) if elapsed else 0.0,
+        'steps': steps,
+    }
+
+
+def compare(result, baseline, tolerance, slack_ms=0.0):
+    """
+    Regressions (as messages) where result is more than `tolerance` percent
+    worse than baseline. A step's p95 must also be more than `slack_ms` over
+    its allowance, so millisecond-sized steps do not trip on scheduler noise.
+    """
+    limit = 1 + tolerance / 100
+    regressions = []
+    if result['journeys_per_second'] * limit < baseline['journeys_per_second']:
+        regressions.append(
+            f"throughput {result['journeys_per_second']} journeys/s vs baseline {baseline['journeys_per_second']}"
+        )
+    for step, stats in result['steps'].items():
+        base = baseline['steps'].get(step)
+        if base and stats['p95_ms'] > base['p95_ms'] * limit + slack_ms:
+            regressions.append(f"{step} p95 {stats['p95_ms']} ms vs baseline {base['p95_ms']} ms")
+    return regressions
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as handle:
+        return json.load(handle)
+
+
+def save_baseline(path, baselines):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as handle:
+        json.dump(baselines, handle, indent=2, sort_keys=True)
+        handle.write('\n')
@@ -0,0 +1,57 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from base.querylog import querylog_settings
+
+
+class Command(BaseCommand):
+    help = "Summarize the slow / repeated query log into a top-N report."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help="Log file (default: QUERY_LOG['PATH']); rotated backups are read too.")
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument('--type', choices=['slow', 'repeated'], dest='event_type')
+        parser.add_argument('--view', help="Only events from this view name.")
+
+    def handle(self, *args, **options):
+        path = str(options['path'] or querylog_settings()['PATH'])
+        files = [f'{path}.{n}' for n in range(querylog_settings()['BACKUP_COUNT'], 0, -1)] + [path]
+        files = [name for name in files if os.path.exists(name)]
+        if not files:
+            raise CommandError(f"No query log found at {path}.")
+
+        groups = {}
+        events = 0
+        for name in files:
+            with open(name, encoding='utf-8') as handle:
+                for line in handle:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        continue
+                    if options['event_type'] and event['type'] != options['event_type']:
+                        continue
+                    if options['view'] and event.get('view') != options['view']:
+                        continue
+                    events += 1
+                    key = (event['type'], event.get('origin'), event['sql'])
+                    group = groups.setdefault(key, {'events': 0, 'ms': 0.0, 'max_ms': 0.0, 'queries': 0,
+                                                    'views': set()})
+                    group['events'] += 1
+                    group['ms'] += event['ms']
+                    group['max_ms'] = max(group['max_ms'], event['ms'])
+                    group['queries'] += event.get('count', 1)
+                    group['views'].add(event.get('view') or '?')
+
+        self.stdout.write(f"{events} events from {len(files)} file(s), {len(groups)} distinct statements.\n")
+        ranked = sorted(groups.items(), key=lambda item: item[1]['ms'], reverse=True)[:options['top']]
+        for rank, ((event_type, origin, sql), group) in enumerate(ranked, start=1):
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"#{rank} [{event_type}] {group['ms']:.1f} ms total, {group['events']} events, "
+                f"{group['queries']} queries, worst {group['max_ms']:.1f} ms"
+            ))
+            self.stdout.write(f"   origin: {origin or 'unknown'}")
+            self.stdout.write(f"   views:  {', '.join(sorted(group['views']))}")
+            self.stdout.write(f"   sql:    {sql[:300]}{'…' if len(sql) > 300 else ''}\n")
@@ -0,0 +1,92 @@
+import statistics
+import time
+from datetime import date, time as clock, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.utils import timezone
+
+from base.api import orjson
+from base.models import (
+    Appointment, Exercise, HomeExerciseReminder, Notification, ProgressTracking, Service, TreatmentPlan, User,
+)
+
+# The list calls a client would otherwise make on launch
+SEQUENTIAL_URLS = [
+    '/api/v1/appointments/',
+    '/api/v1/treatment-plans/',
+    '/api/v1/notifications/',
+    '/api/v1/reminders/',
+    '/api/v1/progress/',
+]
+
+
+class Command(BaseCommand):
+    help = ("Compare /api/v1/bootstrap/ latency with the equivalent sequential list calls. "
+            "Test data is created inside a transaction and rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50, help="Rows per section for the benchmark patient.")
+        parser.add_argument('--requests', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            patient = self.seed(options['rows'])
+            client = Client(HTTP_ACCEPT_ENCODING='gzip', SERVER_NAME='localhost')
+            client.force_login(patient)
+
+            self.stdout.write(f"Encoder: {'orjson' if orjson else 'json (stdlib)'}; "
+                              f"{options['rows']} rows per section, {options['requests']} requests.")
+            self.report('bootstrap (1 call)', client, ['/api/v1/bootstrap/'], options['requests'])
+            self.report(f'sequential ({len(SEQUENTIAL_URLS)} calls)', client, SEQUENTIAL_URLS, options['requests'])
+
+            transaction.set_rollback(True)
+
+    def seed(self, rows):
+        patient = User.objects.create(username='bench_bootstrap_patient', role='Patient')
+        therapist = User.objects.create(username='bench_bootstrap_therapist', role='Therapist')
+        service = Service.objects.create(name='Benchmark', description='', duration_minutes=45, base_fee=500)
+        exercises = Exercise.objects.bulk_create(Exercise(name=f'Bench exercise {i}') for i in range(rows))
+        appointments = Appointment.objects.bulk_create(
+            Appointment(patient=patient, therapist=therapist, service=service,
+                        scheduled_date=date.today() + timedelta(days=i), scheduled_time=clock(9))
+            for i in range(rows)
+        )
+        TreatmentPlan.objects.bulk_create(
+            TreatmentPlan(appointment=appointment, prescribed_by=therapist, exercises_list='Quad sets')
+            for appointment in appointments
+        )
+        Notification.objects.bulk_create(
+            Notification(user=patient, title=f'Notice {i}', message='Benchmark', category='Update')
+            for i in range(rows)
+        )
+        now = timezone.now()
+        HomeExerciseReminder.objects.bulk_create(
+            HomeExerciseReminder(patient=patient, exercise=exercise, reminder_time=now + timedelta(hours=i + 1))
+            for i, exercise in enumerate(exercises)
+        )
+        ProgressTracking.objects.bulk_create(
+            ProgressTracking(patient=patient, exercise=exercise, completion_percentage=50)
+            for exercise in exercises
+        )
+        return patient
+
+    def report(self, label, client, urls, requests):
+        timings = []
+        queries = 0
+        size = 0
+        for _ in range(requests):
+            executed = []
+            started = time.perf_counter()
+            with connection.execute_wrapper(lambda execute, *args: executed.append(1) or execute(*args)):
+                responses = [client.get(url) for url in urls]
+            timings.append((time.perf_counter() - started) * 1000)
+            queries = len(executed)
+            size = sum(len(response.content) for response in responses)
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f"{label:<24} p50 {statistics.median(timings):7.2f} ms  p95 {p95:7.2f} ms  "
+            f"queries {queries:3d}  bytes {size}"
+        )
@@ -0,0 +1,85 @@
+import time
+from datetime import date, time as clock, timedelta
+
+from django import forms
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from base.choices import APPOINTMENT_CHOICES, LightweightChoicesMixin, bump_version
+from base.models import Appointment, Service, User
+
+
+class LegacyAppointmentForm(forms.Form):
+    """What a plain <select> over every appointment costs: full rows + __str__ per option."""
+    appointment = forms.ModelChoiceField(Appointment.objects.all(), widget=forms.Select)
+
+
+class LightAppointmentForm(LightweightChoicesMixin, forms.Form):
+    appointment = forms.ModelChoiceField(Appointment.objects.all(), widget=forms.Select)
+    light_choices = {'appointment': APPOINTMENT_CHOICES}
+
+
+class Command(BaseCommand):
+    help = ("Time rendering an appointment choice field over a large table. "
+            "Test data is created inside a transaction and rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--appointments', type=int, default=50000)
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options['appointments'], options['users'])
+            self.stdout.write(f"Seeded {options['appointments']} appointments.")
+
+            bump_version(Appointment)
+            self.measure('legacy ModelChoiceField', LegacyAppointmentForm, options['repeat'])
+            self.measure('lightweight (cold cache)', LightAppointmentForm, 1)
+            self.measure('lightweight (warm cache)', LightAppointmentForm, options['repeat'])
+
+            transaction.set_rollback(True)
+
+    def seed(self, appointments, users):
+        patients = User.objects.bulk_create(
+            User(username=f'bench_patient_{i}', password='!', role='Patient', address='x' * 200)
+            for i in range(users)
+        )
+        therapists = User.objects.bulk_create(
+            User(username=f'bench_therapist_{i}', password='!', role='Therapist', address='x' * 200)
+            for i in range(max(users // 10, 1))
+        )
+        service = Service.objects.create(name='Benchmark', description='', duration_minutes=45, base_fee=0)
+        start = date.today()
+        Appointment.objects.bulk_create(
+            (
+                Appointment(
+                    patient=patients[i % len(patients)],
+                    therapist=therapists[i % len(therapists)],
+                    service=service,
+                    scheduled_date=start - timedelta(days=i % 730),
+                    scheduled_time=clock(9 + i % 8),
+                )
+                for i in range(appointments)
+            ),
+            batch_size=2000,
+        )
+
+    def measure(self, label, form_class, repeat):
+        timings = []
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        for _ in range(repeat):
+            queries.clear()
+            with connection.execute_wrapper(count):
+                started = time.perf_counter()
+                html = str(form_class()['appointment'])
+                timings.append(time.perf_counter() - started)
+        self.stdout.write(
+            f"{label:<28} best {min(timings) * 1000:9.1f} ms  "
+            f"queries {len(queries):6d}  html {len(html) // 1024} KiB"
+        )
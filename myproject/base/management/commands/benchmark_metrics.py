@@ -0,0 +1,80 @@
+import statistics
+import time
+from datetime import date, time as clock, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+
+from base.models import Appointment, Notification, Service, User
+
+METRICS_MIDDLEWARE = 'base.middleware.MetricsMiddleware'
+URLS = ['/api/v1/appointments/', '/notifications/']
+
+
+class Command(BaseCommand):
+    help = ("Measure MetricsMiddleware overhead by timing the same requests with and without it. "
+            "Test data is created inside a transaction and rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--max-overhead', type=float, default=2.0,
+                            help="Fail when the median overhead exceeds this percentage.")
+
+    def handle(self, *args, **options):
+        if METRICS_MIDDLEWARE not in settings.MIDDLEWARE:
+            raise CommandError(f"{METRICS_MIDDLEWARE} is not in MIDDLEWARE.")
+
+        with transaction.atomic():
+            user = self.seed()
+            enabled = self.client_for(user, settings.MIDDLEWARE)
+            disabled = self.client_for(user, [m for m in settings.MIDDLEWARE if m != METRICS_MIDDLEWARE])
+
+            worst = 0.0
+            for url in URLS:
+                on, off = [], []
+                # Interleave so drift (caches, GC) hits both sides equally
+                for _ in range(options['requests']):
+                    off.append(self.time_request(disabled, url))
+                    on.append(self.time_request(enabled, url))
+                overhead = (statistics.median(on) / statistics.median(off) - 1) * 100
+                worst = max(worst, overhead)
+                self.stdout.write(
+                    f"{url:<28} without {statistics.median(off):7.3f} ms  "
+                    f"with {statistics.median(on):7.3f} ms  overhead {overhead:+.2f}%"
+                )
+            transaction.set_rollback(True)
+
+        if worst > options['max_overhead']:
+            raise CommandError(f"Metrics overhead {worst:.2f}% exceeds {options['max_overhead']}%.")
+        self.stdout.write(self.style.SUCCESS(f"Overhead within {options['max_overhead']}%."))
+
+    def seed(self):
+        patient = User.objects.create(username='bench_metrics_patient', role='Patient')
+        therapist = User.objects.create(username='bench_metrics_therapist', role='Therapist')
+        service = Service.objects.create(name='Benchmark', description='', duration_minutes=45, base_fee=500)
+        Appointment.objects.bulk_create(
+            Appointment(patient=patient, therapist=therapist, service=service,
+                        scheduled_date=date.today() + timedelta(days=i), scheduled_time=clock(9))
+            for i in range(50)
+        )
+        Notification.objects.bulk_create(
+            Notification(user=patient, title=f'Notice {i}', message='Benchmark', category='Update')
+            for i in range(50)
+        )
+        return patient
+
+    def client_for(self, user, middleware):
+        # The handler builds its middleware chain on the first request
+        with override_settings(MIDDLEWARE=middleware):
+            client = Client(SERVER_NAME='localhost')
+            client.force_login(user)
+            for url in URLS:
+                client.get(url)
+        return client
+
+    def time_request(self, client, url):
+        started = time.perf_counter()
+        client.get(url)
+        return (time.perf_counter() - started) * 1000
@@ -0,0 +1,88 @@
+import statistics
+import time
+from datetime import date, time as clock, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+
+from base.models import Appointment, Notification, Service, User
+
+ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+URLS = ['/dashboard/', '/notifications/']
+
+
+class Command(BaseCommand):
+    help = ("Measure authenticated request throughput and django_session queries per request for each "
+            "session engine. Test data is created inside a transaction and rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help="Requests per URL per engine.")
+        parser.add_argument('--engines', nargs='+', choices=sorted(ENGINES), default=list(ENGINES))
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"SESSION_ENGINE is {settings.SESSION_ENGINE}")
+        with transaction.atomic():
+            user = self.seed()
+            clients = {name: self.client_for(user, ENGINES[name]) for name in options['engines']}
+
+            for url in URLS:
+                timings = {name: [] for name in clients}
+                session_queries = dict.fromkeys(clients, 0)
+                # Interleave so drift (caches, GC) hits every engine equally
+                for _ in range(options['requests']):
+                    for name, client in clients.items():
+                        elapsed, queries = self.time_request(client, url)
+                        timings[name].append(elapsed)
+                        session_queries[name] += queries
+                self.stdout.write(self.style.MIGRATE_HEADING(url))
+                for name, values in timings.items():
+                    self.stdout.write(
+                        f"  {name:<15} {1000 / statistics.median(values):8.1f} req/s  "
+                        f"p50 {statistics.median(values):7.3f} ms  "
+                        f"session queries/request {session_queries[name] / len(values):.2f}"
+                    )
+            transaction.set_rollback(True)
+
+    def seed(self):
+        patient = User.objects.create(username='bench_sessions_patient', role='Patient')
+        therapist = User.objects.create(username='bench_sessions_therapist', role='Therapist')
+        service = Service.objects.create(name='Benchmark', description='', duration_minutes=45, base_fee=500)
+        Appointment.objects.bulk_create(
+            Appointment(patient=patient, therapist=therapist, service=service,
+                        scheduled_date=date.today() + timedelta(days=i), scheduled_time=clock(9))
+            for i in range(20)
+        )
+        Notification.objects.bulk_create(
+            Notification(user=patient, title=f'Notice {i}', message='Benchmark', category='Update')
+            for i in range(20)
+        )
+        return patient
+
+    def client_for(self, user, engine):
+        # SessionMiddleware picks its SessionStore when the handler builds the chain on the first request
+        with override_settings(SESSION_ENGINE=engine):
+            client = Client(SERVER_NAME='localhost')
+            client.force_login(user)
+            for url in URLS:
+                client.get(url)
+        return client
+
+    def time_request(self, client, url):
+        session_queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal session_queries
+            session_queries += 'django_session' in sql
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            started = time.perf_counter()
+            client.get(url)
+            elapsed = (time.perf_counter() - started) * 1000
+        return elapsed, session_queries
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from base.recurrence import expand_all, horizon_end
+
+
+class Command(BaseCommand):
+    help = "Expand recurring availability and reminder rules up to the rolling horizon."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help="Horizon in days from today (defaults to RECURRENCE_HORIZON_DAYS).")
+
+    def handle(self, *args, **options):
+        if options['days'] is not None:
+            until = timezone.localdate() + timedelta(days=options['days'])
+        else:
+            until = horizon_end()
+
+        totals = expand_all(until)
+        self.stdout.write(self.style.SUCCESS(
+            f"Expanded rules up to {until}: {totals['slots']} slots, {totals['reminders']} reminders."
+        ))
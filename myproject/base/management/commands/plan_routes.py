@@ -0,0 +1,27 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from base import routing
+
+
+class Command(BaseCommand):
+    help = "Plan home-visit routes for every therapist with confirmed appointments (default: tomorrow)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="YYYY-MM-DD (default: tomorrow).")
+        parser.add_argument('--workers', type=int, help="Solver processes (default: one per CPU).")
+        parser.add_argument('--geocode', action='store_true',
+                            help="First fill missing user coordinates from their addresses.")
+
+    def handle(self, *args, **options):
+        try:
+            day = date.fromisoformat(options['date']) if options['date'] else timezone.localdate() + timedelta(days=1)
+        except ValueError:
+            raise CommandError("--date must be YYYY-MM-DD.")
+
+        if options['geocode']:
+            self.stdout.write(f"Geocoded {routing.geocode_missing()} user(s).")
+        count = routing.plan_fleet(day, workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(f"Planned {count} route(s) for {day}."))
@@ -0,0 +1,42 @@
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = ("Delete expired sessions in batches (one short transaction each) instead of clearsessions' "
+            "single DELETE over the whole table.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help="Seconds to sleep between batches, to leave room for concurrent writers.")
+
+    def handle(self, *args, **options):
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        if not hasattr(store, 'get_model_class'):
+            self.stdout.write(f"{settings.SESSION_ENGINE} keeps no session rows; nothing to purge.")
+            return
+
+        model = store.get_model_class()
+        now = timezone.now()
+        started = time.perf_counter()
+        deleted = 0
+        while True:
+            keys = list(
+                model.objects.filter(expire_date__lt=now).order_by('expire_date')
+                .values_list('session_key', flat=True)[:options['batch_size']]
+            )
+            if not keys:
+                break
+            deleted += model.objects.filter(session_key__in=keys).delete()[0]
+            self.stdout.write(f"  {deleted:,} expired sessions deleted", ending='\r')
+            if options['pause']:
+                time.sleep(options['pause'])
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted:,} expired session(s) in {time.perf_counter() - started:.2f}s."
+        ))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from base.search import DOCUMENT_TYPES, rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', choices=sorted(DOCUMENT_TYPES), action='append', dest='doc_types',
+                            help="Only rebuild this document type (repeatable).")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for doc_type in options['doc_types'] or sorted(DOCUMENT_TYPES):
+            count = rebuild(doc_type, chunk_size=options['chunk_size'])
+            self.stdout.write(f"Indexed {count} {doc_type} documents.")
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from base import cohorts
+
+
+class Command(BaseCommand):
+    help = "Append new and changed appointments to the cohort analytics snapshot (run nightly)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Re-read every appointment (also drops deleted ones).")
+        parser.add_argument('--update-reports', action='store_true',
+                            help="Write each therapist's retention rate to their latest AnalyticsReport.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        appended, updated, total = cohorts.refresh(rebuild=options['rebuild'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Snapshot has {total:,} appointments ({appended:,} appended, {updated:,} updated) "
+            f"in {time.perf_counter() - started:.1f}s."
+        ))
+        if options['update_reports']:
+            count = cohorts.update_reports()
+            self.stdout.write(self.style.SUCCESS(f"Updated retention on {count} analytics report(s)."))
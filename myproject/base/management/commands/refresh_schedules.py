@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from base import schedule
+
+
+class Command(BaseCommand):
+    help = "Rebuild every therapist's calendar snapshot and roll the window forward."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--therapist', type=int, help="Only rebuild this therapist (user id).")
+
+    def handle(self, *args, **options):
+        first, last = schedule.window()
+        if options['therapist']:
+            schedule.refresh(options['therapist'])
+            count = 1
+        else:
+            count = schedule.refresh_all()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} calendar(s) for {first} to {last}."))
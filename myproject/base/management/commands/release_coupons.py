@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from base import coupons
+
+
+class Command(BaseCommand):
+    help = ("Give back the coupon uses held by pending payments whose checkout was abandoned "
+            "(run it hourly).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24,
+                            help="Release payments left pending for longer than this.")
+
+    def handle(self, *args, **options):
+        released = coupons.release_abandoned(timedelta(hours=options['hours']))
+        self.stdout.write(self.style.SUCCESS(f"Released {released:,} coupon redemption(s)."))
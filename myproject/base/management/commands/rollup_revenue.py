@@ -0,0 +1,44 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from base import ledger
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily revenue rollups from the ledger, optionally backfilling the ledger first."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backfill', action='store_true',
+                            help="First post ledger journals for payments/transactions that have none "
+                                 "(bulk imports, rows from before the ledger).")
+        parser.add_argument('--since', help="First date to rebuild, YYYY-MM-DD (default: earliest ledger date).")
+        parser.add_argument('--until', help="Last date to rebuild, YYYY-MM-DD (default: latest ledger date).")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Source rows per backfill chunk.")
+        parser.add_argument('--days-per-chunk', type=int, default=31, help="Days rebuilt per transaction.")
+
+    def handle(self, *args, **options):
+        try:
+            since = date.fromisoformat(options['since']) if options['since'] else None
+            until = date.fromisoformat(options['until']) if options['until'] else None
+        except ValueError:
+            raise CommandError("--since and --until must be YYYY-MM-DD.")
+        started = time.perf_counter()
+
+        if options['backfill']:
+            def report_backfill(model, last_id, journals):
+                self.stdout.write(f"  {model} up to id {last_id}: {journals:,} journals", ending='\r')
+
+            journals = ledger.backfill(options['chunk_size'], report=report_backfill)
+            self.stdout.write('')
+            self.stdout.write(f"Posted {journals:,} backfill journal(s).")
+
+        def report_rollup(day, rows):
+            self.stdout.write(f"  through {day}: {rows:,} rollup rows", ending='\r')
+
+        rows = ledger.rebuild_rollups(since, until, options['days_per_chunk'], report=report_rollup)
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {rows:,} rollup row(s) in {time.perf_counter() - started:.1f}s."
+        ))
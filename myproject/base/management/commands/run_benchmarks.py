@@ -0,0 +1,82 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from base import loadtest, synthetic
+from base.models import User
+
+
+class Command(BaseCommand):
+    help = ("Generate a synthetic dataset, run scripted patient journeys (login -> dashboard -> book -> pay -> "
+            "feedback) against it and compare throughput / p95 latency with the stored baseline. "
+            "All data is created inside a transaction and rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(synthetic.SCALES), default='small')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--journeys', type=int, default=50)
+        parser.add_argument('--baseline', default=os.path.join(settings.BASE_DIR, 'benchmarks', 'baseline.json'))
+        parser.add_argument('--save-baseline', action='store_true',
+                            help="Store this run as the baseline for --scale instead of comparing.")
+        parser.add_argument('--tolerance', type=float, default=25.0,
+                            help="Allowed slowdown in percent before a step counts as a regression.")
+        parser.add_argument('--slack-ms', type=float, default=0.0,
+                            help="Extra p95 milliseconds a step may lose on top of --tolerance (absorbs noise on "
+                                 "steps that take a few ms).")
+        parser.add_argument('--report-only', action='store_true',
+                            help="Print regressions as warnings instead of failing (for a quick local look).")
+
+    def handle(self, *args, **options):
+        scale = options['scale']
+        if options['journeys'] > synthetic.SCALES[scale]['patients']:
+            raise CommandError(f"--journeys must not exceed the {synthetic.SCALES[scale]['patients']} "
+                               f"patients of the '{scale}' scale.")
+
+        with transaction.atomic():
+            prefix = f"bench{options['seed']}"
+            written = synthetic.generate(scale, seed=options['seed'], prefix=prefix)
+            self.stdout.write("Generated: " + ", ".join(f"{name} {count}" for name, count in written.items()))
+
+            patients = list(
+                User.objects.filter(username__startswith=f"{prefix}_patient_")
+                .order_by('id').values_list('username', flat=True)[:options['journeys']]
+            )
+            ids = synthetic.context(prefix)
+            therapist_ids = ids['therapists']
+            service_ids = [service_id for service_id, _ in ids['services']]
+
+            timings, elapsed, errors = loadtest.run_journeys(patients, therapist_ids, service_ids, synthetic.PASSWORD)
+            transaction.set_rollback(True)
+
+        if errors:
+            raise CommandError(f"{len(errors)} journey(s) failed, first: {errors[0]}")
+
+        result = loadtest.summarize(timings, elapsed, len(patients))
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{scale}: {result['journeys']} journeys, {result['journeys_per_second']} journeys/s, "
+            f"{result['requests_per_second']} requests/s"
+        ))
+        for step, stats in result['steps'].items():
+            self.stdout.write(f"  {step:<18} p50 {stats['p50_ms']:8.2f} ms  p95 {stats['p95_ms']:8.2f} ms  "
+                              f"p99 {stats['p99_ms']:8.2f} ms")
+
+        baselines = loadtest.load_baseline(options['baseline'])
+        if options['save_baseline']:
+            baselines[scale] = result
+            loadtest.save_baseline(options['baseline'], baselines)
+            self.stdout.write(self.style.SUCCESS(f"Baseline for '{scale}' saved to {options['baseline']}."))
+            return
+
+        if scale not in baselines:
+            self.stdout.write(self.style.WARNING(f"No '{scale}' baseline in {options['baseline']}; nothing to compare."))
+            return
+        regressions = loadtest.compare(result, baselines[scale], options['tolerance'], options['slack_ms'])
+        if regressions:
+            message = "Performance regression:\n  " + "\n  ".join(regressions)
+            if not options['report_only']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Within {options['tolerance']:g}% of the '{scale}' baseline."))
@@ -0,0 +1,46 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from base.reminders import ReminderScheduler
+
+
+class Command(BaseCommand):
+    help = "Deliver due home exercise reminders through their configured channels."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="Deliver everything currently due and exit.")
+        parser.add_argument('--batch-size', type=int, help="Reminders claimed per batch.")
+        parser.add_argument('--workers', type=int, help="Channel dispatch threads.")
+        parser.add_argument('--lookahead', type=int, help="Seconds of upcoming reminders kept in the heap.")
+        parser.add_argument('--poll-interval', type=float, help="Max seconds between database polls.")
+
+    def handle(self, *args, **options):
+        scheduler = ReminderScheduler(
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            lookahead=options['lookahead'],
+            poll_interval=options['poll_interval'],
+        )
+        try:
+            if options['once']:
+                processed = scheduler.run_once()
+                self.stdout.write(self.style.SUCCESS(
+                    f"Processed {processed} reminders "
+                    f"(sent {scheduler.stats['sent']}, retrying {scheduler.stats['retried']}, "
+                    f"failed {scheduler.stats['failed']})."
+                ))
+                return
+
+            stop = threading.Event()
+            signal.signal(signal.SIGTERM, lambda *_: stop.set())
+            self.stdout.write("Reminder scheduler started. Press Ctrl+C to stop.")
+            try:
+                scheduler.run_forever(stop)
+            except KeyboardInterrupt:
+                pass
+            self.stdout.write(self.style.SUCCESS(f"Reminder scheduler stopped: {scheduler.stats}"))
+        finally:
+            scheduler.close()
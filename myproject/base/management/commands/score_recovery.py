@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from base import recovery
+
+
+class Command(BaseCommand):
+    help = "Score every active patient with the recovery model and store RecoveryPredictor rows (run nightly)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model-version', help="Artifact version (default: RECOVERY_MODEL['VERSION'] or LATEST).")
+        parser.add_argument('--batch-size', type=int, help="Patients per feature query and bulk insert.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            model = recovery.load_model(options['model_version'])
+        except recovery.ModelUnavailable as exc:
+            raise CommandError(str(exc))
+
+        def report(count):
+            self.stdout.write(f"  {count:,} patients scored", ending='\r')
+
+        count = recovery.score_all(model.version, options['batch_size'], report=report)
+        self.stdout.write('')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Scored {count:,} active patient(s) with model {model.version} in {elapsed:.1f}s."
+        ))
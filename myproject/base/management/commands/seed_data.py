@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from base import synthetic
+from base.models import User
+
+
+class Command(BaseCommand):
+    help = ("Fill the database with deterministic synthetic data for every model "
+            "(users by role with profiles, appointments with feedback / payments / plans, and the rest), "
+            "then derive coupon redemptions, subscriptions, the ledger, revenue rollups and route plans. "
+            "Rows are written with chunked bulk_create; --workers spreads each model's chunks over processes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(synthetic.SCALES), default='small')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='synthetic',
+                            help="Tag for usernames / names so several datasets can share a database.")
+        parser.add_argument('--models', nargs='+', metavar='MODEL',
+                            help="Only seed these models (by name), e.g. --models User PatientProfile Appointment.")
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--chunk-size', type=int, default=synthetic.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f"{prefix}_").exists():
+            raise CommandError(f"Users with the prefix '{prefix}_' already exist; pick another --prefix.")
+
+        models = None
+        if options['models']:
+            by_name = {model.__name__.lower(): model for model in synthetic.ALL_MODELS}
+            unknown = [name for name in options['models'] if name.lower() not in by_name]
+            if unknown:
+                raise CommandError(f"Unknown model(s): {', '.join(unknown)}. "
+                                   f"Choose from {', '.join(model.__name__ for model in synthetic.ALL_MODELS)}.")
+            models = [by_name[name.lower()] for name in options['models']]
+
+        started = time.perf_counter()
+        totals = {}
+
+        def report(name, count):
+            totals[name] = totals.get(name, 0) + count
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"  {name:<22} {totals[name]:>10,} rows  ({elapsed:7.1f}s)")
+
+        self.stdout.write(f"Seeding '{options['scale']}' with seed {options['seed']}, prefix '{prefix}', "
+                          f"{options['workers']} worker(s).")
+        written = synthetic.seed_dataset(
+            options['scale'], seed=options['seed'], prefix=prefix, models=models, workers=options['workers'],
+            chunk_size=options['chunk_size'], report=report,
+        )
+        elapsed = time.perf_counter() - started
+        total = sum(written.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {total:,} rows across {len(written)} models in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)."
+        ))
@@ -0,0 +1,113 @@
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from base import coupons
+from base.batching import batched_signals
+from base.models import Appointment, CouponRedemption, DiscountCoupon, Payment, Service, User
+
+
+class Command(BaseCommand):
+    help = ("Fire concurrent redemptions of one coupon at separate pending payments and check "
+            "the coupon is never redeemed more than max_usage times.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help="Concurrent redemption attempts.")
+        parser.add_argument('--limit', type=int, default=50, help="max_usage of the test coupon.")
+        parser.add_argument('--keep', action='store_true', help="Keep the test coupon, users and payments.")
+
+    def handle(self, *args, **options):
+        requests, limit = options['requests'], options['limit']
+        if requests < 1 or limit < 1:
+            raise CommandError("--requests and --limit must be at least 1.")
+
+        tag = uuid.uuid4().hex[:8]
+        coupon, users, service, payment_ids = self.setup(tag, requests, limit)
+        try:
+            outcomes, elapsed = self.fire(coupon.code, payment_ids)
+            self.verify(coupon, payment_ids, outcomes, limit, elapsed)
+        finally:
+            if not options['keep']:
+                with batched_signals():
+                    User.objects.filter(pk__in=[user.pk for user in users]).delete()
+                    service.delete()
+                    coupon.delete()
+
+    def setup(self, tag, requests, limit):
+        today = timezone.localdate()
+        with batched_signals():
+            patient = User.objects.create_user(f'stress-patient-{tag}', role='Patient')
+            therapist = User.objects.create_user(f'stress-therapist-{tag}', role='Therapist')
+            service = Service.objects.create(name=f'Stress {tag}', description='stress_coupons fixture',
+                                             duration_minutes=30, base_fee=Decimal('1000.00'))
+            appointment = Appointment.objects.create(patient=patient, therapist=therapist, service=service,
+                                                     scheduled_date=today, scheduled_time='09:00')
+            coupon = DiscountCoupon.objects.create(
+                code=f'STRESS{tag}'.upper(), description='stress_coupons fixture', discount_percentage=10,
+                valid_from=today - timedelta(days=1), valid_to=today + timedelta(days=1),
+                min_amount=Decimal('0.00'), max_usage=limit,
+            )
+            payments = Payment.objects.bulk_create([
+                Payment(appointment=appointment, amount=Decimal('1000.00'), mode='Online',
+                        payment_status='Pending', transaction_id=f'stress-{tag}-{i}')
+                for i in range(requests)
+            ], batch_size=500)
+        return coupon, (patient, therapist), service, [payment.pk for payment in payments]
+
+    def fire(self, code, payment_ids):
+        barrier = threading.Barrier(len(payment_ids))
+        outcomes = Counter()
+        lock = threading.Lock()
+
+        def attempt(payment_id):
+            try:
+                barrier.wait()
+                coupons.redeem(code, payment_id)
+                outcome = 'redeemed'
+            except coupons.CouponError:
+                outcome = 'rejected'
+            except Exception as exc:  # e.g. "database is locked" past the SQLite busy timeout
+                outcome = f'error: {type(exc).__name__}: {exc}'
+            finally:
+                connections.close_all()
+            with lock:
+                outcomes[outcome] += 1
+
+        coupons.lookup(code)  # warm the cache so every thread goes straight to the claim
+        threads = [threading.Thread(target=attempt, args=(pk,)) for pk in payment_ids]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes, time.perf_counter() - started
+
+    def verify(self, coupon, payment_ids, outcomes, limit, elapsed):
+        coupon.refresh_from_db(fields=['usage_count'])
+        redemptions = CouponRedemption.objects.filter(coupon=coupon).count()
+        discounted = Payment.objects.filter(pk__in=payment_ids, amount__lt=Decimal('1000.00')).count()
+        redeemed = outcomes['redeemed']
+
+        self.stdout.write(f"{len(payment_ids)} attempts in {elapsed:.2f}s, max_usage {limit}:")
+        for outcome, count in sorted(outcomes.items()):
+            self.stdout.write(f"  {outcome}: {count}")
+        self.stdout.write(f"  usage_count {coupon.usage_count}, redemptions {redemptions}, "
+                          f"discounted payments {discounted}")
+
+        if not redeemed == coupon.usage_count == redemptions == discounted:
+            raise CommandError("Redemption bookkeeping disagrees: a claimed use was lost or double-counted.")
+        if redeemed > limit:
+            raise CommandError(f"Coupon over-redeemed: {redeemed} uses of {limit}.")
+        if redeemed < min(limit, len(payment_ids)):
+            self.stdout.write(self.style.WARNING(
+                f"Only {redeemed} of {min(limit, len(payment_ids))} available uses were redeemed "
+                f"(attempts failed with errors)."
+            ))
+        self.stdout.write(self.style.SUCCESS(f"OK: {redeemed} redemption(s), never more than {limit}."))
@@ -0,0 +1,49 @@
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from base import subscriptions
+
+
+class Command(BaseCommand):
+    help = "Renew or expire subscriptions whose period has ended (run it every few minutes, or with --interval)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help="Subscriptions handled per transaction.")
+        parser.add_argument('--rebuild', action='store_true',
+                            help="First rebuild every user's subscription row from their transactions "
+                                 "(bulk imports, data from before subscriptions were tracked).")
+        parser.add_argument('--interval', type=float,
+                            help="Keep running, sweeping every this many seconds.")
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            def report_rebuild(synced):
+                self.stdout.write(f"  {synced:,} subscriptions synced", ending='\r')
+
+            synced = subscriptions.rebuild(report=report_rebuild)
+            self.stdout.write('')
+            self.stdout.write(f"Rebuilt {synced:,} subscription row(s).")
+
+        if not options['interval']:
+            self.sweep(options['batch_size'])
+            return
+
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        self.stdout.write(f"Sweeping every {options['interval']:g}s. Press Ctrl+C to stop.")
+        try:
+            while not stop.is_set():
+                self.sweep(options['batch_size'])
+                stop.wait(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+    def sweep(self, batch_size):
+        started = time.perf_counter()
+        renewed, expired = subscriptions.sweep(batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f"Renewed {renewed:,} and expired {expired:,} subscription(s) in {time.perf_counter() - started:.2f}s."
+        ))
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from base import training
+
+
+class Command(BaseCommand):
+    help = "Train the recovery-day regression from historical data and save it as a new model version."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model-version', help="Version to write (default: recovery-<timestamp>).")
+        parser.add_argument('--format', choices=['auto', 'parquet', 'npy'], default='auto',
+                            help="Feature store: Parquet when pyarrow is installed (auto), else .npy memmaps.")
+        parser.add_argument('--batch-size', type=int, help="Patients per feature query and store write.")
+        parser.add_argument('--ridge', type=float, default=1.0, help="L2 penalty on the standardized weights.")
+        parser.add_argument('--work-dir', help="Keep the feature store here instead of a deleted temp dir.")
+        parser.add_argument('--no-activate', action='store_true',
+                            help="Don't point LATEST at the new version (score it explicitly first).")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def report(stage, rows):
+            self.stdout.write(f"  {stage}: {rows:,} rows", ending='\r')
+
+        try:
+            version, metrics = training.train(
+                version=options['model_version'], format=options['format'], batch_size=options['batch_size'],
+                ridge=options['ridge'], work_dir=options['work_dir'], activate=not options['no_activate'],
+                report=report,
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write('')
+        self.stdout.write(
+            f"Train rows {metrics['train_rows']:,}, holdout {metrics['holdout_rows']:,}, "
+            f"R^2 {metrics['r2']} (train {metrics['train_r2']}), RMSE {metrics['rmse_days']} days"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Saved recovery model {version} in {time.perf_counter() - started:.1f}s."
+        ))
@@ -0,0 +1,231 @@
+"""
+Per-view request metrics, exposed in Prometheus text format at /metrics.
+
+MetricsMiddleware (base.middleware) opens a RequestStats for every request;
+a connection.execute_wrapper counts queries and DB time into it and a
+wrapper around the Django template backend adds template render time. When
+the response leaves, the numbers are folded into fixed-bucket histograms
+keyed by the resolved URL name. Everything lives in process memory, so each
+worker exposes its own series (scrape every worker, or sum them in
+Prometheus).
+"""
+import hmac
+import threading
+from bisect import bisect_left
+from contextlib import ExitStack
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# name: (help text, buckets, RequestStats attribute)
+HISTOGRAMS = {
+    'request_duration_seconds': ("Wall time per request.", DURATION_BUCKETS, 'duration'),
+    'db_queries': ("Database queries per request.", QUERY_BUCKETS, 'queries'),
+    'db_duration_seconds': ("Time spent in database queries per request.", DURATION_BUCKETS, 'db_time'),
+    'template_duration_seconds': ("Time spent rendering templates per request.", DURATION_BUCKETS, 'template_time'),
+    'response_size_bytes': ("Response body size.", SIZE_BUCKETS, 'size'),
+}
+
+
+def view_name(match):
+    """URL name of a ResolverMatch, or the view's dotted path for unnamed routes."""
+    if match is None:
+        return None
+    return match.view_name or f'{match.func.__module__}.{match.func.__qualname__}'
+
+
+def metrics_settings():
+    return {
+        'ENABLED': True,
+        'NAMESPACE': 'physio',
+        'ALLOWED_IPS': (),
+        'TOKEN': '',
+        **getattr(settings, 'METRICS', {}),
+    }
+
+
+def may_scrape(request):
+    """
+    True for staff, a bearer of METRICS['TOKEN'], or a client in
+    METRICS['ALLOWED_IPS']. The IP check trusts REMOTE_ADDR, which is the
+    proxy's address behind a reverse proxy - use the token there.
+    """
+    options = metrics_settings()
+    if request.user.is_staff:
+        return True
+    token = options['TOKEN']
+    header = request.headers.get('Authorization', '')
+    if token and hmac.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+        return True
+    return request.META.get('REMOTE_ADDR') in options['ALLOWED_IPS']
+
+
+class RequestStats:
+    __slots__ = ('started', 'duration', 'queries', 'db_time', 'template_time', 'template_depth', 'size')
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.duration = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.size = 0
+
+
+_current = ContextVar('request_metrics', default=None)
+
+
+def current_stats():
+    return _current.get()
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}      # view -> {histogram name: Histogram}
+        self.responses = {}  # (view, status) -> count
+
+    def record(self, view, stats, status):
+        with self.lock:
+            histograms = self.views.get(view)
+            if histograms is None:
+                histograms = self.views[view] = {
+                    name: Histogram(buckets) for name, (_, buckets, _) in HISTOGRAMS.items()
+                }
+            for name, (_, _, attribute) in HISTOGRAMS.items():
+                histograms[name].observe(getattr(stats, attribute))
+            self.responses[view, status] = self.responses.get((view, status), 0) + 1
+
+    def reset(self):
+        with self.lock:
+            self.views.clear()
+            self.responses.clear()
+
+
+registry = Registry()
+
+
+# -------------------------
+# COLLECTION
+# -------------------------
+def _count_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time += perf_counter() - started
+
+
+class track_request:
+    """Context manager: collect stats for everything run inside it."""
+
+    def __enter__(self):
+        self.stats = RequestStats()
+        self.token = _current.set(self.stats)
+        self.stack = ExitStack()
+        for alias in settings.DATABASES:
+            self.stack.enter_context(connections[alias].execute_wrapper(_count_query))
+        return self.stats
+
+    def __exit__(self, *exc_info):
+        self.stack.close()
+        _current.reset(self.token)
+        self.stats.duration = perf_counter() - self.stats.started
+        return False
+
+
+_template_timer_installed = False
+
+
+def install_template_timer():
+    """Time top-level renders of the Django template backend (nested renders are not double counted)."""
+    global _template_timer_installed
+    if _template_timer_installed:
+        return
+    from django.template.backends.django import Template
+
+    original = Template.render
+
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return original(self, context, request)
+        stats.template_depth += 1
+        started = perf_counter()
+        try:
+            return original(self, context, request)
+        finally:
+            stats.template_depth -= 1
+            if stats.template_depth == 0:
+                stats.template_time += perf_counter() - started
+
+    Template.render = render
+    _template_timer_installed = True
+
+
+# -------------------------
+# EXPORT
+# -------------------------
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(namespace=None):
+    namespace = namespace or metrics_settings()['NAMESPACE']
+    with registry.lock:
+        views = {view: {name: (list(h.counts), h.sum, h.count) for name, h in histograms.items()}
+                 for view, histograms in registry.views.items()}
+        responses = dict(registry.responses)
+
+    lines = []
+    for name, (help_text, bounds, _) in HISTOGRAMS.items():
+        metric = f'{namespace}_{name}'
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} histogram')
+        for view in sorted(views):
+            counts, total, count = views[view][name]
+            view_label = _label(view)
+            cumulative = 0
+            for bound, bucket in zip(bounds, counts):
+                cumulative += bucket
+                lines.append(f'{metric}_bucket{{view="{view_label}",le="{_number(bound)}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{view="{view_label}",le="+Inf"}} {count}')
+            lines.append(f'{metric}_sum{{view="{view_label}"}} {_number(total)}')
+            lines.append(f'{metric}_count{{view="{view_label}"}} {count}')
+
+    metric = f'{namespace}_responses_total'
+    lines.append(f'# HELP {metric} Responses by view and status code.')
+    lines.append(f'# TYPE {metric} counter')
+    for (view, status), count in sorted(responses.items()):
+        lines.append(f'{metric}{{view="{_label(view)}",status="{status}"}} {count}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,57 @@
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metrics, querylog
+
+
+class MetricsMiddleware:
+    """
+    Records wall time, query count, DB time, template time and response size
+    per view into base.metrics. Put it first in MIDDLEWARE so the timings
+    cover the rest of the stack.
+    """
+
+    def __init__(self, get_response):
+        if not metrics.metrics_settings()['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        metrics.install_template_timer()
+
+    def __call__(self, request):
+        with metrics.track_request() as stats:
+            response = self.get_response(request)
+
+        if response.streaming:
+            stats.size = int(response.get('Content-Length') or 0)
+        else:
+            stats.size = len(response.content)
+        view = metrics.view_name(request.resolver_match) or 'unresolved'
+        metrics.registry.record(view, stats, response.status_code)
+        return response
+
+
+class QueryLogMiddleware:
+    """
+    Writes slow and repeated (N+1) queries to the QUERY_LOG JSONL file.
+    Off unless QUERY_LOG['ENABLED'] is set.
+    """
+
+    def __init__(self, get_response):
+        options = querylog.querylog_settings()
+        if not options['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_ms = options['SLOW_MS']
+        self.repeat_threshold = options['REPEAT_THRESHOLD']
+
+    def __call__(self, request):
+        log = querylog.RequestQueryLog(request, self.slow_ms, self.repeat_threshold)
+        with ExitStack() as stack:
+            for alias in settings.DATABASES:
+                stack.enter_context(connections[alias].execute_wrapper(log))
+            response = self.get_response(request)
+        log.flush()
+        return response
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='homeexercisereminder',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='homeexercisereminder',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='homeexercisereminder',
+            name='delivery_status',
+            field=models.CharField(choices=[('Pending', 'Pending'), ('Claimed', 'Claimed'), ('Sent', 'Sent'), ('Failed', 'Failed')], default='Pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='homeexercisereminder',
+            name='last_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='homeexercisereminder',
+            name='sent_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='homeexercisereminder',
+            index=models.Index(fields=['delivery_status', 'reminder_time'], name='reminder_due_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+from django.db import migrations
+
+
+SQLITE_CREATE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS base_search_index USING fts5(
+    doc_type UNINDEXED,
+    object_id UNINDEXED,
+    title,
+    body,
+    tokenize = 'porter unicode61 remove_diacritics 2'
+)
+"""
+
+POSTGRES_CREATE = [
+    """
+    CREATE TABLE IF NOT EXISTS base_search_index (
+        id bigserial PRIMARY KEY,
+        doc_type varchar(20) NOT NULL,
+        object_id bigint NOT NULL,
+        title text NOT NULL,
+        body text NOT NULL,
+        document tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(body, '')), 'B')
+        ) STORED,
+        UNIQUE (doc_type, object_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS base_search_index_document_gin ON base_search_index USING GIN (document)",
+]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(SQLITE_CREATE)
+    elif vendor == 'postgresql':
+        for statement in POSTGRES_CREATE:
+            schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute("DROP TABLE IF EXISTS base_search_index")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0003_recurrence_rules'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
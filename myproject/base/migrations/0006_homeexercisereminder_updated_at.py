@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0005_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='homeexercisereminder',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0006_homeexercisereminder_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'scheduled_date', 'scheduled_time'], name='appointment_timeline_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emergencyrequest',
+            index=models.Index(fields=['patient', 'requested_at'], name='emergency_timeline_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['patient', 'created_at'], name='feedback_timeline_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='homeexercisereminder',
+            index=models.Index(fields=['patient', 'reminder_time'], name='reminder_timeline_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='progresstracking',
+            index=models.Index(fields=['patient', 'last_updated'], name='progress_timeline_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0007_timeline_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='RoutePlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('stops', models.JSONField(default=list)),
+                ('unlocated', models.JSONField(default=list)),
+                ('total_km', models.FloatField(default=0)),
+                ('total_minutes', models.FloatField(default=0)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('therapist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='route_plans', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['date'],
+                'unique_together': {('therapist', 'date')},
+            },
+        ),
+    ]
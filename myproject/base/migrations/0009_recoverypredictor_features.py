@@ -0,0 +1,77 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def parse_features(text):
+    """Old free-text input_features ("age=45, injury=knee") as a dict; anything else is kept under 'raw'."""
+    features = {}
+    for part in (text or '').replace(';', ',').split(','):
+        name, sep, value = part.partition('=')
+        if not sep or not name.strip():
+            return {'raw': text} if text else {}
+        try:
+            features[name.strip()] = float(value)
+        except ValueError:
+            features[name.strip()] = value.strip()
+    return features
+
+
+def copy_features(apps, schema_editor):
+    RecoveryPredictor = apps.get_model('base', 'RecoveryPredictor')
+    rows = []
+    for row in RecoveryPredictor.objects.only('id', 'input_features').iterator(chunk_size=2000):
+        row.features = parse_features(row.input_features)
+        rows.append(row)
+        if len(rows) == 2000:
+            RecoveryPredictor.objects.bulk_update(rows, ['features'])
+            rows = []
+    RecoveryPredictor.objects.bulk_update(rows, ['features'])
+
+
+def copy_features_back(apps, schema_editor):
+    RecoveryPredictor = apps.get_model('base', 'RecoveryPredictor')
+    rows = []
+    for row in RecoveryPredictor.objects.only('id', 'features').iterator(chunk_size=2000):
+        row.input_features = ', '.join(f'{name}={value}' for name, value in row.features.items())[:20]
+        rows.append(row)
+    RecoveryPredictor.objects.bulk_update(rows, ['input_features'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0008_route_plans'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recoverypredictor',
+            name='patient',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='recovery_predictions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='recoverypredictor',
+            name='features',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(  # gives the column a default so the migration can be reversed
+            model_name='recoverypredictor',
+            name='input_features',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.RunPython(copy_features, copy_features_back),
+        migrations.RemoveField(
+            model_name='recoverypredictor',
+            name='input_features',
+        ),
+        migrations.RenameField(
+            model_name='recoverypredictor',
+            old_name='features',
+            new_name='input_features',
+        ),
+        migrations.AddIndex(
+            model_name='recoverypredictor',
+            index=models.Index(fields=['patient', 'created_at'], name='recovery_patient_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0009_recoverypredictor_features'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='therapistprofile',
+            name='branch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='therapists', to='base.clinicbranch'),
+        ),
+    ]
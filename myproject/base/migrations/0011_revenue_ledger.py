@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0010_therapist_branch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('journal', models.UUIDField(db_index=True)),
+                ('account', models.CharField(choices=[('cash', 'Cash'), ('revenue', 'Revenue')], max_length=10)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('source', models.CharField(choices=[('payment', 'Appointment Payment'), ('subscription', 'Subscription Transaction')], max_length=20)),
+                ('source_id', models.PositiveBigIntegerField()),
+                ('date', models.DateField()),
+                ('mode', models.CharField(blank=True, max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('service', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='base.service')),
+                ('therapist', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['source', 'source_id'], name='ledger_source_idx'), models.Index(fields=['date'], name='ledger_date_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RevenueRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('mode', models.CharField(blank=True, max_length=50)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('entries', models.IntegerField(default=0)),
+                ('service', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='base.service')),
+                ('therapist', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='revenue_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['date'],
+                'indexes': [models.Index(fields=['date', 'therapist'], name='rollup_date_therapist_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0011_revenue_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CouponRedemption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_amount', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('discount_amount', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('redeemed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='discountcoupon',
+            name='usage_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='discountcoupon',
+            constraint=models.CheckConstraint(condition=models.Q(('usage_count__lte', models.F('max_usage'))), name='coupon_usage_within_max'),
+        ),
+        migrations.AddField(
+            model_name='couponredemption',
+            name='coupon',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='redemptions', to='base.discountcoupon'),
+        ),
+        migrations.AddField(
+            model_name='couponredemption',
+            name='payment',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='coupon_redemption', to='base.payment'),
+        ),
+        migrations.AddField(
+            model_name='couponredemption',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='coupon_redemptions', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
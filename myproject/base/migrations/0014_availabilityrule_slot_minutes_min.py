@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:00
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0013_subscriptions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='availabilityrule',
+            name='slot_minutes',
+            field=models.PositiveIntegerField(default=45, validators=[django.core.validators.MinValueValidator(5)]),
+        ),
+    ]
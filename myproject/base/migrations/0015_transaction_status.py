@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:08
+
+from django.db import migrations, models
+
+
+def mark_renewals_pending(apps, schema_editor):
+    # sweep() never charged the renewals it created; `manage.py rollup_revenue --backfill` reverses their postings
+    Transaction = apps.get_model('base', 'Transaction')
+    Transaction.objects.filter(transaction_id__startswith='renew-').update(status='pending')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0014_availabilityrule_slot_minutes_min'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed')], default='completed', max_length=10),
+        ),
+        migrations.RunPython(mark_renewals_pending, migrations.RunPython.noop),
+    ]
@@ -5,12 +5,14 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from datetime import datetime
+from datetime import datetime, timedelta
 from django.contrib.auth.models import User  # ✅ Correct User import
 from django.utils.text import slugify
 from django.utils import timezone
 from django.db.models.signals import post_save
 
+from .batching import current_batch  # ✅ Lets bulk imports defer the per-row signal handlers
+
 # -------------------------
 # USER MODEL
 # -------------------------
@@ -33,6 +35,9 @@ class User(AbstractUser):
     gender = models.CharField(max_length=10, choices=GENDER_CHOICES, blank=True, null=True)
     date_of_birth = models.DateField(blank=True, null=True)
     address = models.TextField(blank=True, null=True)
+    # ✅ Geocoded from address; used to plan home-visit routes
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
     profile_picture = models.ImageField(upload_to='profiles/', blank=True, null=True)
 
     specialization = models.CharField(max_length=255, blank=True, null=True)
@@ -75,6 +80,8 @@ class TherapistProfile(models.Model):
     consultation_fee = models.DecimalField(max_digits=8, decimal_places=2, default=0.0)
     total_patients_treated = models.PositiveIntegerField(default=0)
     daily_schedule = models.JSONField(default=dict)
+    branch = models.ForeignKey('ClinicBranch', on_delete=models.SET_NULL, blank=True, null=True,
+                               related_name='therapists')  # ✅ Home branch, for per-branch analytics
 
     def __str__(self):
         return f"TherapistProfile of {self.user.username}"
@@ -137,6 +144,13 @@ class Appointment(models.Model):
     booking_status = models.CharField(max_length=20, choices=BOOKING_STATUS, default='Pending')
     payment_status = models.CharField(max_length=20, default='Pending')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # ✅ Drives API ETags
+
+    class Meta:
+        indexes = [
+            # ✅ Keyset scans for the patient timeline
+            models.Index(fields=['patient', 'scheduled_date', 'scheduled_time'], name='appointment_timeline_idx'),
+        ]
 
     def calculate_total_fee(self):
         return self.service.base_fee
@@ -184,6 +198,7 @@ class TreatmentPlan(models.Model):
         related_name='prescribed_treatment_plans'
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     follow_up_required = models.BooleanField(default=False)
     status = models.CharField(
         max_length=20,
@@ -224,6 +239,9 @@ class ProgressTracking(models.Model):
     feedback_notes = models.TextField(blank=True, null=True)
     last_updated = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['patient', 'last_updated'], name='progress_timeline_idx')]
+
 
 # -------------------------
 # FEEDBACK
@@ -238,6 +256,9 @@ class Feedback(models.Model):
     comments = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['patient', 'created_at'], name='feedback_timeline_idx')]
+
 
 # -------------------------
 # SIGNALS
@@ -245,6 +266,10 @@ class Feedback(models.Model):
 @receiver(post_save, sender=User)
 def create_profiles(sender, instance, created, **kwargs):
     if created:
+        batch = current_batch()
+        if batch is not None:
+            batch.add([instance], created=True)
+            return
         if instance.role == 'Therapist':
             TherapistProfile.objects.create(user=instance)
         elif instance.role == 'Patient':
@@ -253,6 +278,10 @@ def create_profiles(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=Feedback)
 def update_therapist_rating(sender, instance, **kwargs):
+    batch = current_batch()
+    if batch is not None:
+        batch.add([instance])
+        return
     therapist = instance.therapist
     feedbacks = Feedback.objects.filter(therapist=therapist)
     avg_rating = feedbacks.aggregate(models.Avg('rating'))['rating__avg'] or 0
@@ -280,6 +309,7 @@ class Notification(models.Model):
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES)
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']  # ✅ Latest notification first
@@ -301,6 +331,14 @@ class AvailabilitySlot(models.Model):
     start_time = models.TimeField()
     end_time = models.TimeField()
     is_booked = models.BooleanField(default=False)
+    rule = models.ForeignKey(
+        'AvailabilityRule',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='slots'
+    )  # ✅ Set when the slot was expanded from a recurring rule
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['date', 'start_time']  # ✅ Show slots in chronological order
@@ -359,6 +397,7 @@ class Payment(models.Model):
     payment_status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
     transaction_id = models.CharField(max_length=100, unique=True)
     timestamp = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Payment for Appointment {self.appointment.id}"
@@ -391,18 +430,47 @@ class DiscountCoupon(models.Model):
     
     # ✅ Number of times this coupon can be used by a single user or overall
     max_usage = models.PositiveIntegerField(default=1)
+
+    # ✅ Redemptions so far; only coupons.redeem() increments it (guarded by usage_count < max_usage)
+    usage_count = models.PositiveIntegerField(default=0)
     
     # ✅ Active / Deactivated coupon visibility
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        constraints = [
+            models.CheckConstraint(condition=models.Q(usage_count__lte=models.F('max_usage')),
+                                   name='coupon_usage_within_max'),
+        ]
+
     def __str__(self):
         return f"{self.code} - {self.discount_percentage}% OFF"
 
+    def save(self, *args, **kwargs):
+        # ✅ usage_count only changes through coupons.redeem()'s guarded UPDATE;
+        # re-saving a stale instance (e.g. the edit form) must not write it back
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name != 'usage_count']
+        super().save(*args, **kwargs)
+
     def is_valid(self):
-        """Check if coupon is active and within date range"""
-        from datetime import date
-        today = date.today()
-        return self.is_active and self.valid_from <= today <= self.valid_to
+        """Check if coupon is active, within date range and has uses left"""
+        today = timezone.localdate()
+        return self.is_active and self.valid_from <= today <= self.valid_to and self.usage_count < self.max_usage
+
+
+class CouponRedemption(models.Model):
+    coupon = models.ForeignKey(DiscountCoupon, on_delete=models.CASCADE, related_name='redemptions')
+    payment = models.OneToOneField(Payment, on_delete=models.CASCADE, related_name='coupon_redemption')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True,
+                             related_name='coupon_redemptions')
+    original_amount = models.DecimalField(max_digits=8, decimal_places=2)
+    discount_amount = models.DecimalField(max_digits=8, decimal_places=2)
+    redeemed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.coupon.code} on Payment {self.payment_id}"
 
 
 # -------------------------
@@ -442,6 +510,9 @@ class EmergencyRequest(models.Model):
         default='Open'
     )
 
+    class Meta:
+        indexes = [models.Index(fields=['patient', 'requested_at'], name='emergency_timeline_idx')]
+
     def __str__(self):
         return f"Emergency - {self.patient.username} ({self.status})"
 
@@ -574,6 +645,14 @@ class HomeExerciseReminder(models.Model):
 
     reminder_time = models.DateTimeField()
     is_completed = models.BooleanField(default=False)
+    rule = models.ForeignKey(
+        'ReminderRule',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='reminders'
+    )  # ✅ Set when the reminder was expanded from a recurring rule
+    updated_at = models.DateTimeField(auto_now=True)
 
     sent_via = models.CharField(
         max_length=20,
@@ -581,11 +660,122 @@ class HomeExerciseReminder(models.Model):
         default='WhatsApp'  # ✅ Default option added
     )
 
+    DELIVERY_STATUS = [
+        ('Pending', 'Pending'),
+        ('Claimed', 'Claimed'),
+        ('Sent', 'Sent'),
+        ('Failed', 'Failed'),
+    ]
+
+    # ✅ Delivery state maintained by the reminder scheduler
+    delivery_status = models.CharField(max_length=20, choices=DELIVERY_STATUS, default='Pending')
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+
     def __str__(self):
         return f"{self.patient.username} - {self.exercise.name} Reminder"
 
     class Meta:
         ordering = ['-reminder_time']  # ✅ Latest reminders at top
+        indexes = [
+            # ✅ Lets the scheduler range-scan due reminders
+            models.Index(fields=['delivery_status', 'reminder_time'], name='reminder_due_idx'),
+            models.Index(fields=['patient', 'reminder_time'], name='reminder_timeline_idx'),
+        ]
+
+# -------------------------
+# Recurrence Rules
+# -------------------------
+
+class RecurrenceRule(models.Model):
+    """
+    Shared recurrence fields: the rule repeats on `weekdays` between
+    `start_date` and `end_date` (open-ended when empty). Concrete rows are
+    generated up to a rolling horizon by base.recurrence; `expanded_until`
+    is the last date already generated.
+    """
+    WEEKDAY_CHOICES = [
+        (0, 'Mon'), (1, 'Tue'), (2, 'Wed'), (3, 'Thu'),
+        (4, 'Fri'), (5, 'Sat'), (6, 'Sun'),
+    ]
+
+    weekdays = models.CharField(
+        max_length=20,
+        default='0,1,2,3,4,5,6',
+        help_text="Comma separated weekday numbers, Monday = 0"
+    )
+    start_date = models.DateField()
+    end_date = models.DateField(blank=True, null=True)
+    is_active = models.BooleanField(default=True)
+    expanded_until = models.DateField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        abstract = True
+
+    def get_weekdays(self):
+        return {int(day) for day in self.weekdays.split(',') if day.strip() != ''}
+
+    def get_weekdays_display(self):
+        days = self.get_weekdays()
+        if days == {0, 1, 2, 3, 4, 5, 6}:
+            return "Daily"
+        if days == {0, 1, 2, 3, 4}:
+            return "Weekdays"
+        return ", ".join(label for value, label in self.WEEKDAY_CHOICES if value in days)
+
+    def clean(self):
+        if self.end_date and self.start_date and self.start_date > self.end_date:
+            raise ValidationError("Start date cannot be later than end date.")
+        if not self.get_weekdays():
+            raise ValidationError("Select at least one weekday.")
+
+
+class AvailabilityRule(RecurrenceRule):
+    """e.g. weekdays 09:00-17:00 in 45-minute slots."""
+    therapist = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='availability_rules'
+    )
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    slot_minutes = models.PositiveIntegerField(default=45, validators=[MinValueValidator(5)])
+
+    def __str__(self):
+        return (f"{self.therapist.username} | {self.get_weekdays_display()} "
+                f"{self.start_time:%H:%M}-{self.end_time:%H:%M} ({self.slot_minutes} min)")
+
+    def clean(self):
+        super().clean()
+        if self.start_time and self.end_time and self.end_time <= self.start_time:
+            raise ValidationError("End time must be greater than start time.")
+
+
+class ReminderRule(RecurrenceRule):
+    """e.g. daily at 08:00 for 6 weeks."""
+    patient = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='reminder_rules'
+    )
+    exercise = models.ForeignKey(
+        Exercise,
+        on_delete=models.CASCADE,
+        related_name='reminder_rules'
+    )
+    time_of_day = models.TimeField()
+    sent_via = models.CharField(
+        max_length=20,
+        choices=HomeExerciseReminder.SENT_VIA,
+        default='WhatsApp'
+    )
+
+    def __str__(self):
+        return f"{self.patient.username} - {self.exercise.name} {self.get_weekdays_display()} at {self.time_of_day:%H:%M}"
+
 
 # -------------------------
 # BlogArticle
@@ -704,6 +894,13 @@ class Transaction(models.Model):
         ('Cash', 'Cash'),
         ('Wallet', 'Wallet'),
     ]
+    # ✅ Auto-renewals are created pending; only completed transactions are revenue (ledger.py)
+    PENDING = 'pending'
+    COMPLETED = 'completed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (COMPLETED, 'Completed'),
+    ]
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='transactions')
     plan = models.ForeignKey('SubscriptionPlan', on_delete=models.CASCADE, related_name='transactions')  # ✅ Refer by string
@@ -711,12 +908,114 @@ class Transaction(models.Model):
     amount = models.DecimalField(max_digits=8, decimal_places=2)
     payment_mode = models.CharField(max_length=50, choices=PAYMENT_MODES)
     transaction_id = models.CharField(max_length=100, unique=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=COMPLETED)
     started_at = models.DateTimeField(auto_now_add=True)
+    # ✅ Set by subscriptions.start_period() (or from plan.duration_days on first save)
     expires_at = models.DateTimeField()
 
+    class Meta:
+        indexes = [
+            # ✅ Latest period per user (subscriptions.sync)
+            models.Index(fields=['user', 'expires_at'], name='transaction_user_expiry_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.expires_at is None:
+            self.expires_at = (self.started_at or timezone.now()) + timedelta(days=self.plan.duration_days)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.user.username} - {self.transaction_id}"
 
+
+# -------------------------
+# Subscription (see subscriptions.py)
+# -------------------------
+class Subscription(models.Model):
+    """Each user's current subscription period, kept in sync with their transactions."""
+    ACTIVE = 'active'
+    EXPIRED = 'expired'
+    STATUS_CHOICES = [
+        (ACTIVE, 'Active'),
+        (EXPIRED, 'Expired'),
+    ]
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='subscription')
+    plan = models.ForeignKey(SubscriptionPlan, on_delete=models.CASCADE, related_name='subscriptions')
+    transaction = models.ForeignKey(Transaction, on_delete=models.SET_NULL, blank=True, null=True,
+                                    related_name='+')
+    started_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=ACTIVE)
+    auto_renew = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # ✅ Expiry sweeps range-scan active rows by expires_at
+            models.Index(fields=['status', 'expires_at'], name='subscription_sweep_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.plan.plan_name} ({self.status})"
+
+# -------------------------
+# Ledger (see ledger.py)
+# -------------------------
+class LedgerEntry(models.Model):
+    """
+    Append-only, double-entry: each posting is a journal of two lines that sum
+    to zero - a debit (positive) to cash and a credit (negative) to revenue.
+    """
+    ACCOUNT_CHOICES = [
+        ('cash', 'Cash'),
+        ('revenue', 'Revenue'),
+    ]
+    SOURCE_CHOICES = [
+        ('payment', 'Appointment Payment'),
+        ('subscription', 'Subscription Transaction'),
+    ]
+
+    journal = models.UUIDField(db_index=True)
+    account = models.CharField(max_length=10, choices=ACCOUNT_CHOICES)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    source_id = models.PositiveBigIntegerField()
+    date = models.DateField()
+    therapist = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True,
+                                  related_name='ledger_entries')
+    service = models.ForeignKey(Service, on_delete=models.SET_NULL, blank=True, null=True)
+    mode = models.CharField(max_length=50, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['source', 'source_id'], name='ledger_source_idx'),
+            models.Index(fields=['date'], name='ledger_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.account} {self.amount} ({self.source} #{self.source_id})"
+
+
+class RevenueRollup(models.Model):
+    """Revenue per (date, therapist, service, mode), summed from the ledger's revenue lines."""
+    date = models.DateField()
+    therapist = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True,
+                                  related_name='revenue_rollups')
+    service = models.ForeignKey(Service, on_delete=models.SET_NULL, blank=True, null=True)
+    mode = models.CharField(max_length=50, blank=True)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    entries = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['date']
+        indexes = [models.Index(fields=['date', 'therapist'], name='rollup_date_therapist_idx')]
+
+    def __str__(self):
+        return f"{self.date} {self.therapist_id}/{self.service_id}/{self.mode}: {self.amount}"
+
+
 # -------------------------
 # AnalyticsReport
 # -------------------------
@@ -733,18 +1032,48 @@ class AnalyticsReport(models.Model):
     def __str__(self):
         return f"Analytics for {self.therapist.username} - {self.created_at.date()}"
 
+# -------------------------
+# RoutePlan
+# -------------------------
+
+class RoutePlan(models.Model):
+    """A therapist's visit order for one day, computed by base.routing."""
+    therapist = models.ForeignKey(User, on_delete=models.CASCADE, related_name='route_plans')
+    date = models.DateField()
+    # [{"appointment": id, "patient": username, "travel_km": 3.2, "travel_minutes": 9.6,
+    #   "booked": "09:15", "eta": "09:15", "wait_minutes": 5.4, "late_minutes": 0}, ...]
+    stops = models.JSONField(default=list)
+    unlocated = models.JSONField(default=list)  # appointment ids whose patient has no coordinates
+    total_km = models.FloatField(default=0)
+    total_minutes = models.FloatField(default=0)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('therapist', 'date')
+        ordering = ['date']
+
+    def __str__(self):
+        return f"Route for {self.therapist.username} on {self.date} ({len(self.stops)} stops)"
+
+
 # -------------------------
 # RecoveryPredictor
 # -------------------------
 
 class RecoveryPredictor(models.Model):
+    patient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recovery_predictions',
+                                blank=True, null=True)
     model_version = models.CharField(max_length=50)
-    input_features = models.CharField(max_length=20)  # Stores ML model inputs (age, injury type, etc.)
+    # ✅ Changed: CharField(20) → JSONField ({feature name: value} the model scored)
+    input_features = models.JSONField(default=dict, blank=True)
     predicted_recovery_days = models.FloatField()  # ML predicted duration
     confidence_score = models.FloatField(default=0.0)  # Prediction confidence level
 
     created_at = models.DateTimeField(auto_now_add=True)  # ✅ Track prediction time
 
+    class Meta:
+        indexes = [models.Index(fields=['patient', 'created_at'], name='recovery_patient_idx')]
+
     def __str__(self):
         return f"Recovery Model v{self.model_version} - {self.predicted_recovery_days} days"
 
@@ -754,7 +1083,12 @@ class RecoveryPredictor(models.Model):
 
 @receiver(post_save, sender=Appointment)
 def send_notification_on_appointment(sender, instance, created, **kwargs):
-    if not instance.therapist:  # Safety check
+    if not instance.therapist_id:  # Safety check
+        return
+
+    batch = current_batch()
+    if batch is not None:
+        batch.add([instance], created=created)
         return
 
     title = "New Appointment Scheduled" if created else "Appointment Updated"
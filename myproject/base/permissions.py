@@ -0,0 +1,140 @@
+"""
+Declarative role-based access for views.
+
+    @login_required
+    @role_required(ADMIN, THERAPIST, message="...", redirect_to='exercise_list')
+    def exercise_create(request): ...
+
+Role names are canonicalised against User.ROLE_CHOICES when the decorator
+runs - at import - so a mis-cased role ('patient', 'admin') matches the
+stored value and an unknown one fails on startup instead of silently never
+matching. Each request's roles are worked out once and cached on the request
+(superusers count as Admin).
+
+Row ownership is a RowPolicy: {role: ALL | callable(user) -> Q}. scope()
+adds the filter for the requesting user's roles to a queryset, so rows they
+may not see are never fetched; roles without a rule see nothing, and
+get_object_or_404() turns someone else's row into a 404.
+"""
+from functools import wraps
+
+from django.contrib import messages
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q
+from django.shortcuts import get_object_or_404, redirect
+
+from .models import Appointment, User
+
+ROLES = {value.lower(): value for value, _ in User.ROLE_CHOICES}
+PATIENT, THERAPIST, ADMIN, SUPPORT = 'Patient', 'Therapist', 'Admin', 'SupportStaff'
+ALL = object()
+
+
+def canonical(role):
+    try:
+        return ROLES[role.lower()]
+    except (AttributeError, KeyError):
+        raise ImproperlyConfigured(f"Unknown role {role!r}; expected one of {sorted(ROLES.values())}.")
+
+
+def roles(*names):
+    """A precompiled role set, e.g. EDITORS = roles(ADMIN, THERAPIST)."""
+    return frozenset(canonical(name) for name in names)
+
+
+EDITORS = roles(ADMIN, THERAPIST)
+
+
+def user_roles(request):
+    """The requesting user's roles, computed once per request."""
+    cached = getattr(request, '_access_roles', None)
+    if cached is None:
+        user = request.user
+        found = set()
+        if user.is_authenticated:
+            role = ROLES.get((getattr(user, 'role', '') or '').lower())
+            if role:
+                found.add(role)
+            if user.is_superuser:
+                found.add(ADMIN)
+        cached = request._access_roles = frozenset(found)
+    return cached
+
+
+def has_role(request, allowed):
+    """True if the user holds any role in `allowed` (a roles() set or a single role name)."""
+    if isinstance(allowed, str):
+        allowed = roles(allowed)
+    return not user_roles(request).isdisjoint(allowed)
+
+
+def role_required(*names, message="You don't have permission to do that.", redirect_to='dashboard'):
+    """View decorator: users without one of `names` get `message` and a redirect to `redirect_to`."""
+    allowed = roles(*names)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if user_roles(request).isdisjoint(allowed):
+                messages.error(request, message)
+                return redirect(redirect_to)
+            return view(request, *args, **kwargs)
+        wrapper.allowed_roles = allowed
+        return wrapper
+    return decorator
+
+
+# -------------------------
+# ROW POLICIES
+# -------------------------
+class RowPolicy:
+    def __init__(self, rules):
+        self.rules = {canonical(role): rule for role, rule in rules.items()}
+
+    def condition(self, request):
+        """ALL, None (nothing) or the Q of rows this request may see."""
+        condition = None
+        for role in user_roles(request):
+            rule = self.rules.get(role)
+            if rule is ALL:
+                return ALL
+            if rule is not None:
+                q = rule(request.user)
+                condition = q if condition is None else condition | q
+        return condition
+
+    def scope(self, request, queryset):
+        condition = self.condition(request)
+        if condition is ALL:
+            return queryset
+        if condition is None:
+            return queryset.none()
+        return queryset.filter(condition)
+
+    def get_object_or_404(self, request, queryset, **lookup):
+        return get_object_or_404(self.scope(request, queryset), **lookup)
+
+
+TREATMENT_PLANS = RowPolicy({
+    ADMIN: ALL,
+    THERAPIST: lambda user: Q(prescribed_by=user),
+    PATIENT: lambda user: Q(appointment__patient=user),
+})
+
+THERAPIST_OWNED = RowPolicy({  # availability slots and rules
+    ADMIN: ALL,
+    THERAPIST: lambda user: Q(therapist=user),
+})
+
+REMINDER_RULES = RowPolicy({  # therapists manage the rules of patients they have seen
+    ADMIN: ALL,
+    THERAPIST: lambda user: Q(patient__in=Appointment.objects.filter(therapist=user).values('patient_id')),
+    PATIENT: lambda user: Q(patient=user),
+})
+
+NOTIFICATIONS = RowPolicy({
+    ADMIN: ALL,
+    THERAPIST: lambda user: Q(user=user),
+    PATIENT: lambda user: Q(user=user),
+    SUPPORT: lambda user: Q(user=user),
+})
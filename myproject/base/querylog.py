@@ -0,0 +1,158 @@
+"""
+Slow query log and repeated-query (N+1) detector.
+
+QueryLogMiddleware installs a connection.execute_wrapper for each request.
+Queries slower than QUERY_LOG['SLOW_MS'] are logged straight away; at the end
+of the request every SQL statement that ran QUERY_LOG['REPEAT_THRESHOLD']
+times or more is logged once with its count. Each event carries the project
+source line that issued the query (the views.py frame when there is one),
+found by walking the stack on the first run of each distinct statement only.
+
+Events are JSON lines in a size-rotated file; `manage.py analyze_queries`
+summarizes them.
+"""
+import json
+import logging
+import os
+import re
+import sys
+import threading
+from logging.handlers import RotatingFileHandler
+from time import perf_counter
+
+from django.conf import settings
+from django.utils import timezone
+
+from .metrics import view_name
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+SKIP_FILES = {os.path.join(APP_ROOT, name) for name in ('querylog.py', 'middleware.py', 'metrics.py')}
+
+IN_LIST = re.compile(r'\((?:%s, )+%s\)')
+
+logger = logging.getLogger('base.querylog')
+_handler_lock = threading.Lock()
+
+
+def querylog_settings():
+    return {
+        'ENABLED': False,
+        'SLOW_MS': 200,
+        'REPEAT_THRESHOLD': 10,
+        'PATH': os.path.join(settings.BASE_DIR, 'logs', 'queries.jsonl'),
+        'MAX_BYTES': 10 * 1024 * 1024,
+        'BACKUP_COUNT': 5,
+        **getattr(settings, 'QUERY_LOG', {}),
+    }
+
+
+def normalize(sql):
+    """Collapse IN (%s, %s, ...) lists so the same statement groups together."""
+    return IN_LIST.sub('(%s, ...)', sql)
+
+
+def find_origin():
+    """'base/views.py:123 in payment_list' for the innermost project frame, preferring views.py."""
+    frame = sys._getframe(2)
+    first = None
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_ROOT) and filename not in SKIP_FILES:
+            location = (filename, frame.f_lineno, frame.f_code.co_name)
+            if filename.endswith('views.py'):
+                first = location
+                break
+            first = first or location
+        frame = frame.f_back
+    if first is None:
+        return None
+    filename, line, function = first
+    return f"{os.path.relpath(filename, os.path.dirname(APP_ROOT))}:{line} in {function}"
+
+
+def get_logger():
+    """The JSONL logger, with its rotating file handler attached on first use."""
+    if not logger.handlers:
+        with _handler_lock:
+            if not logger.handlers:
+                options = querylog_settings()
+                os.makedirs(os.path.dirname(options['PATH']), exist_ok=True)
+                handler = RotatingFileHandler(
+                    options['PATH'], maxBytes=options['MAX_BYTES'], backupCount=options['BACKUP_COUNT'],
+                    encoding='utf-8',
+                )
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                logger.addHandler(handler)
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+    return logger
+
+
+def write_event(event):
+    event['ts'] = timezone.now().isoformat()
+    get_logger().info(json.dumps(event, default=str))
+
+
+class QueryStats:
+    __slots__ = ('count', 'total', 'params', 'origin')
+
+    def __init__(self, origin):
+        self.count = 0
+        self.total = 0.0
+        self.params = set()
+        self.origin = origin
+
+
+class RequestQueryLog:
+    """execute_wrapper for one request."""
+    MAX_DISTINCT_PARAMS = 1000
+
+    def __init__(self, request, slow_ms, repeat_threshold):
+        self.request = request
+        self.slow_seconds = slow_ms / 1000
+        self.repeat_threshold = repeat_threshold
+        self.statements = {}
+
+    @property
+    def view(self):
+        return view_name(self.request.resolver_match)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = perf_counter() - started
+            stats = self.statements.get(sql)
+            if stats is None:
+                stats = self.statements[sql] = QueryStats(find_origin())
+            elif stats.count == 1 and stats.origin is None:
+                # First run came from middleware (e.g. loading request.user); try the next caller
+                stats.origin = find_origin()
+            stats.count += 1
+            stats.total += elapsed
+            if len(stats.params) < self.MAX_DISTINCT_PARAMS:
+                stats.params.add(repr(params))
+            if elapsed >= self.slow_seconds:
+                write_event({
+                    'type': 'slow',
+                    'view': self.view,
+                    'path': self.request.path,
+                    'ms': round(elapsed * 1000, 2),
+                    'sql': normalize(sql),
+                    'origin': find_origin() if stats.count > 1 else stats.origin,
+                })
+
+    def flush(self):
+        for sql, stats in self.statements.items():
+            if stats.count >= self.repeat_threshold:
+                write_event({
+                    'type': 'repeated',
+                    'view': self.view,
+                    'path': self.request.path,
+                    'count': stats.count,
+                    'distinct_params': len(stats.params),
+                    'ms': round(stats.total * 1000, 2),
+                    'sql': normalize(sql),
+                    'origin': stats.origin,
+                })
@@ -0,0 +1,329 @@
+"""
+Recovery-time predictions.
+
+A model is a versioned artifact directory under RECOVERY_MODEL['DIR']:
+
+    <DIR>/<version>/model.json    feature names, condition vocabulary, fit statistics
+    <DIR>/<version>/weights.npy   [intercept, coef, ...] over standardized features
+    <DIR>/<version>/mean.npy      per-feature mean (also used to impute missing values)
+    <DIR>/<version>/scale.npy     per-feature standard deviation
+    <DIR>/LATEST                  version used when RECOVERY_MODEL['VERSION'] is None
+
+load_model() reads a version once per process, with the arrays memory-mapped,
+and keeps it. extract() builds the feature matrix for a batch of patients with
+three aggregate queries and Model.predict() scores the whole batch in one
+matrix product. `manage.py score_recovery` stores a RecoveryPredictor row for
+every active patient (run it nightly); predict_patient() serves the on-demand
+endpoint through a small in-process LRU cache.
+"""
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Avg, Count, Exists, Max, Min, OuterRef, Q
+from django.utils import timezone
+
+from .models import ProgressTracking, RecoveryPredictor, TreatmentPlan, User
+
+VERSION_PATTERN = re.compile(r'^[\w.-]{1,50}$')  # fits RecoveryPredictor.model_version
+ARRAYS = ('weights', 'mean', 'scale')
+BASE_FEATURES = [
+    'age_years', 'gender_male', 'gender_female', 'condition_count',
+    'plans_total', 'plans_active', 'plans_completed', 'days_in_treatment',
+    'progress_records', 'progress_mean', 'progress_max', 'days_since_progress',
+]
+# Features that are NaN when the data behind them is missing; the share that
+# is present scales the confidence score.
+OBSERVED = ['age_years', 'condition_count', 'plans_total', 'progress_records']
+
+_models = {}
+_models_lock = threading.Lock()
+_predictions = OrderedDict()
+_predictions_lock = threading.Lock()
+
+
+class ModelUnavailable(Exception):
+    pass
+
+
+def recovery_settings():
+    return {
+        'DIR': Path(settings.BASE_DIR) / 'ml_models' / 'recovery',
+        'VERSION': None,
+        'ACTIVE_DAYS': 90,
+        'BATCH_SIZE': 2000,
+        'CACHE_SIZE': 1024,
+        'CACHE_SECONDS': 300,
+        **getattr(settings, 'RECOVERY_MODEL', {}),
+    }
+
+
+# -------------------------
+# ARTIFACTS
+# -------------------------
+def save_artifact(version, meta, weights, mean, scale, directory=None, make_latest=True):
+    """
+    Write a model version atomically (staged in a temp dir, then renamed) and
+    optionally point LATEST at it. Returns the artifact path.
+    """
+    if not VERSION_PATTERN.match(version):
+        raise ValueError(f"Invalid model version {version!r}: use up to 50 letters, digits, '.', '_' or '-'.")
+    root = Path(directory or recovery_settings()['DIR'])
+    root.mkdir(parents=True, exist_ok=True)
+    target = root / version
+    if target.exists():
+        raise ValueError(f"Model version {version!r} already exists in {root}.")
+
+    staging = Path(tempfile.mkdtemp(prefix=f'.{version}-', dir=root))
+    try:
+        for name, array in zip(ARRAYS, (weights, mean, scale)):
+            np.save(staging / f'{name}.npy', np.ascontiguousarray(array, dtype=np.float64))
+        (staging / 'model.json').write_text(json.dumps({**meta, 'version': version}, indent=2))
+        os.replace(staging, target)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    if make_latest:
+        pointer = root / 'LATEST.tmp'
+        pointer.write_text(version)
+        os.replace(pointer, root / 'LATEST')
+    return target
+
+
+def resolve_version(version=None):
+    options = recovery_settings()
+    version = version or options['VERSION']
+    if version:
+        return version
+    try:
+        return (Path(options['DIR']) / 'LATEST').read_text().strip()
+    except FileNotFoundError:
+        raise ModelUnavailable(f"No recovery model has been trained yet (nothing in {options['DIR']}).")
+
+
+def load_model(version=None):
+    """The Model for `version` (default: configured or LATEST), loaded once per process."""
+    version = resolve_version(version)
+    model = _models.get(version)
+    if model is not None:
+        return model
+    with _models_lock:
+        if version not in _models:
+            path = Path(recovery_settings()['DIR']) / version
+            if not (path / 'model.json').exists():
+                raise ModelUnavailable(f"Recovery model {version!r} not found in {path.parent}.")
+            meta = json.loads((path / 'model.json').read_text())
+            arrays = [np.load(path / f'{name}.npy', mmap_mode='r') for name in ARRAYS]
+            _models[version] = Model(version, meta, *arrays)
+        return _models[version]
+
+
+class Model:
+    def __init__(self, version, meta, weights, mean, scale):
+        self.version = version
+        self.meta = meta
+        self.features = meta['features']
+        self.conditions = meta.get('conditions', [])
+        self.weights, self.mean, self.scale = weights, mean, scale
+        if not (len(self.features) + 1 == len(weights) == len(mean) + 1 == len(scale) + 1):
+            raise ModelUnavailable(f"Recovery model {version!r} has inconsistent array shapes.")
+        self._observed = [self.features.index(name) for name in OBSERVED if name in self.features]
+
+    def predict(self, X):
+        """(days, confidence) arrays for an (n, features) matrix; NaN marks a missing value."""
+        X = np.asarray(X, dtype=np.float64)
+        coverage = (
+            (~np.isnan(X[:, self._observed])).mean(axis=1) if self._observed else np.ones(len(X))
+        )
+        Z = (np.where(np.isnan(X), self.mean, X) - self.mean) / self.scale
+        days = self.weights[0] + Z @ self.weights[1:]
+        days = np.clip(days, self.meta.get('min_days', 1.0), self.meta.get('max_days', 365.0))
+        fit = min(max(self.meta.get('r2', 0.5), 0.0), 1.0)
+        confidence = fit * (0.5 + 0.5 * coverage)
+        return days, confidence
+
+
+# -------------------------
+# FEATURES
+# -------------------------
+def feature_names(conditions):
+    return BASE_FEATURES + [f'condition:{name}' for name in conditions]
+
+
+def patient_conditions(medical_history, ongoing_conditions):
+    """Normalised condition names from PatientProfile.medical_history (or ongoing_conditions)."""
+    history = medical_history if isinstance(medical_history, dict) else {}
+    names = history.get('conditions')
+    if isinstance(names, str):
+        names = names.split(',')
+    if not names and ongoing_conditions:
+        names = ongoing_conditions.split(',')
+    return sorted({str(name).strip().lower() for name in names or [] if str(name).strip()})
+
+
+def extract(patient_ids, conditions=(), today=None):
+    """
+    Feature matrix for `patient_ids` (rows in the same order) with columns
+    feature_names(conditions). Missing values are NaN. Three queries.
+    """
+    today = today or timezone.localdate()
+    now = timezone.now()
+    patient_ids = list(patient_ids)
+    row_of = {pk: row for row, pk in enumerate(patient_ids)}
+    column = {name: i for i, name in enumerate(feature_names(conditions))}
+    X = np.full((len(patient_ids), len(column)), np.nan)
+    X[:, column['plans_total']:column['plans_completed'] + 1] = 0
+    X[:, column['progress_records']] = 0
+    for name in conditions:
+        X[:, column[f'condition:{name}']] = 0
+
+    users = User.objects.filter(pk__in=patient_ids).values_list(
+        'pk', 'date_of_birth', 'gender', 'patient_profile__medical_history', 'patient_profile__ongoing_conditions'
+    )
+    for pk, born, gender, history, ongoing in users:
+        row = row_of[pk]
+        if born:
+            X[row, column['age_years']] = (today - born).days / 365.25
+        X[row, column['gender_male']] = gender == 'Male'
+        X[row, column['gender_female']] = gender == 'Female'
+        if history is not None or ongoing:
+            names = patient_conditions(history, ongoing)
+            X[row, column['condition_count']] = len(names)
+            for name in names:
+                if f'condition:{name}' in column:
+                    X[row, column[f'condition:{name}']] = 1
+
+    plans = (
+        TreatmentPlan.objects.filter(appointment__patient_id__in=patient_ids)
+        .values('appointment__patient_id')
+        .annotate(total=Count('id'), active=Count('id', filter=Q(status='active')),
+                  completed=Count('id', filter=Q(status='completed')), first=Min('created_at'))
+    )
+    for plan in plans:
+        row = row_of[plan['appointment__patient_id']]
+        X[row, column['plans_total']] = plan['total']
+        X[row, column['plans_active']] = plan['active']
+        X[row, column['plans_completed']] = plan['completed']
+        X[row, column['days_in_treatment']] = (now - plan['first']).total_seconds() / 86400
+
+    progress = (
+        ProgressTracking.objects.filter(patient_id__in=patient_ids)
+        .values('patient_id')
+        .annotate(records=Count('id'), average=Avg('completion_percentage'),
+                  best=Max('completion_percentage'), last=Max('last_updated'))
+    )
+    for record in progress:
+        row = row_of[record['patient_id']]
+        X[row, column['progress_records']] = record['records']
+        X[row, column['progress_mean']] = record['average']
+        X[row, column['progress_max']] = record['best']
+        X[row, column['days_since_progress']] = (now - record['last']).total_seconds() / 86400
+    return X
+
+
+def describe(names, row):
+    """A feature row as {name: value} for RecoveryPredictor.input_features (zero one-hots dropped)."""
+    return {
+        name: round(float(value), 3) for name, value in zip(names, row)
+        if not np.isnan(value) and (value or not name.startswith('condition:'))
+    }
+
+
+# -------------------------
+# SCORING
+# -------------------------
+def active_patient_ids(now=None):
+    """Patients with an active treatment plan or progress logged in the last ACTIVE_DAYS, by id."""
+    since = (now or timezone.now()) - timedelta(days=recovery_settings()['ACTIVE_DAYS'])
+    active_plan = TreatmentPlan.objects.filter(appointment__patient_id=OuterRef('pk'), status='active')
+    recent_progress = ProgressTracking.objects.filter(patient_id=OuterRef('pk'), last_updated__gte=since)
+    return (
+        User.objects.filter(role='Patient', is_active=True)
+        .filter(Exists(active_plan) | Exists(recent_progress))
+        .order_by('pk').values_list('pk', flat=True)
+    )
+
+
+def _batches(ids, size):
+    batch = []
+    for pk in ids:
+        batch.append(pk)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def score_batch(model, patient_ids, today=None):
+    """Unsaved RecoveryPredictor rows for one batch."""
+    X = extract(patient_ids, model.conditions, today)
+    days, confidence = model.predict(X)
+    return [
+        RecoveryPredictor(patient_id=pk, model_version=model.version, input_features=describe(model.features, row),
+                          predicted_recovery_days=round(float(d), 1), confidence_score=round(float(c), 3))
+        for pk, row, d, c in zip(patient_ids, X, days, confidence)
+    ]
+
+
+def score_all(version=None, batch_size=None, report=None):
+    """
+    Score every active patient and store the predictions. Re-running on the
+    same day replaces that day's rows for the model version. Returns the count.
+    """
+    model = load_model(version)
+    batch_size = batch_size or recovery_settings()['BATCH_SIZE']
+    today = timezone.localdate()
+    ids = active_patient_ids().iterator(chunk_size=batch_size)
+    count = 0
+    for batch in _batches(ids, batch_size):
+        rows = score_batch(model, batch, today)
+        RecoveryPredictor.objects.filter(
+            patient_id__in=batch, model_version=model.version, created_at__date=today
+        ).delete()
+        RecoveryPredictor.objects.bulk_create(rows, batch_size=batch_size)
+        count += len(rows)
+        if report:
+            report(count)
+    return count
+
+
+def predict_patient(patient_id, version=None):
+    """
+    On-demand prediction for one patient, cached per (model version, patient)
+    for CACHE_SECONDS in a CACHE_SIZE-entry LRU.
+    """
+    options = recovery_settings()
+    model = load_model(version)
+    key = (model.version, patient_id)
+    with _predictions_lock:
+        hit = _predictions.get(key)
+        if hit and hit[0] > time.monotonic():
+            _predictions.move_to_end(key)
+            return hit[1]
+
+    X = extract([patient_id], model.conditions)
+    days, confidence = model.predict(X)
+    result = {
+        'patient': patient_id,
+        'model_version': model.version,
+        'predicted_recovery_days': round(float(days[0]), 1),
+        'confidence_score': round(float(confidence[0]), 3),
+        'input_features': describe(model.features, X[0]),
+        'computed_at': timezone.now().isoformat(),
+    }
+    with _predictions_lock:
+        _predictions[key] = (time.monotonic() + options['CACHE_SECONDS'], result)
+        _predictions.move_to_end(key)
+        while len(_predictions) > options['CACHE_SIZE']:
+            _predictions.popitem(last=False)
+    return result
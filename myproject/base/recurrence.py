@@ -0,0 +1,139 @@
+"""
+Expansion of AvailabilityRule / ReminderRule into concrete rows.
+
+Every expander is a generator, so a rule is turned into AvailabilitySlot or
+HomeExerciseReminder instances one day at a time and written with chunked
+bulk_create(); a long-running rule never sits in memory as a whole. Each rule
+remembers the last date it was expanded to (`expanded_until`), so repeated
+runs only generate the newly uncovered part of the rolling horizon.
+"""
+from datetime import datetime, timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import schedule
+from .models import (
+    AvailabilityRule, AvailabilitySlot, HomeExerciseReminder, ReminderRule, TherapistLeave,
+)
+
+BATCH_SIZE = 1000
+
+
+def horizon_end(today=None):
+    """Last date covered by the rolling expansion window."""
+    today = today or timezone.localdate()
+    return today + timedelta(days=getattr(settings, 'RECURRENCE_HORIZON_DAYS', 28))
+
+
+def iter_rule_dates(rule, until, today=None):
+    """Yield each date the rule occurs on after `expanded_until` and from today on, up to `until` inclusive."""
+    # a back-dated rule must not produce a burst of slots or reminders that are already due
+    day = max(rule.start_date, today or timezone.localdate())
+    if rule.expanded_until and rule.expanded_until >= day:
+        day = rule.expanded_until + timedelta(days=1)
+    if rule.end_date and rule.end_date < until:
+        until = rule.end_date
+
+    weekdays = rule.get_weekdays()
+    while day <= until:
+        if day.weekday() in weekdays:
+            yield day
+        day += timedelta(days=1)
+
+
+def iter_availability_slots(rule, until):
+    """Yield unsaved AvailabilitySlot rows for a rule, skipping approved leave days."""
+    leaves = list(
+        TherapistLeave.objects
+        .filter(therapist_id=rule.therapist_id, is_approved=True, to_date__gte=rule.start_date)
+        .values_list('from_date', 'to_date')
+    )
+    step = timedelta(minutes=rule.slot_minutes)
+    if step <= timedelta(0):
+        raise ValueError(f"AvailabilityRule {rule.pk} has a non-positive slot length ({rule.slot_minutes} min).")
+
+    for day in iter_rule_dates(rule, until):
+        if any(start <= day <= end for start, end in leaves):
+            continue
+        slot_start = datetime.combine(day, rule.start_time)
+        day_end = datetime.combine(day, rule.end_time)
+        while slot_start + step <= day_end:
+            yield AvailabilitySlot(
+                therapist_id=rule.therapist_id,
+                date=day,
+                start_time=slot_start.time(),
+                end_time=(slot_start + step).time(),
+                rule=rule,
+            )
+            slot_start += step
+
+
+def iter_reminders(rule, until):
+    """Yield unsaved HomeExerciseReminder rows for a rule."""
+    tz = timezone.get_current_timezone()
+    for day in iter_rule_dates(rule, until):
+        yield HomeExerciseReminder(
+            patient_id=rule.patient_id,
+            exercise_id=rule.exercise_id,
+            reminder_time=timezone.make_aware(datetime.combine(day, rule.time_of_day), tz),
+            sent_via=rule.sent_via,
+            rule=rule,
+        )
+
+
+def bulk_insert(model, rows, ignore_conflicts=False, batch_size=BATCH_SIZE):
+    """Write an iterable of unsaved rows in chunks. Returns the number of rows handed to the DB."""
+    rows = iter(rows)
+    total = 0
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if not chunk:
+            return total
+        model.objects.bulk_create(chunk, batch_size=batch_size, ignore_conflicts=ignore_conflicts)
+        total += len(chunk)
+
+
+def expand_rule(rule, until=None):
+    """Generate rows for one rule up to `until` (default: the rolling horizon)."""
+    until = until or horizon_end()
+    if rule.end_date and rule.end_date < until:
+        until = rule.end_date
+    if until < rule.start_date or (rule.expanded_until and rule.expanded_until >= until):
+        return 0
+
+    with transaction.atomic():
+        if isinstance(rule, AvailabilityRule):
+            # unique_together on slots makes overlapping manual slots a no-op, so
+            # bulk_insert() overcounts; count the rule's own rows instead
+            before = rule.slots.count()
+            bulk_insert(AvailabilitySlot, iter_availability_slots(rule, until), ignore_conflicts=True)
+            created = rule.slots.count() - before
+            # bulk_create sends no signals; refresh the calendar snapshot for the new days
+            schedule.mark_range(rule.therapist_id, rule.start_date, until)
+        else:
+            created = bulk_insert(HomeExerciseReminder, iter_reminders(rule, until))
+        type(rule).objects.filter(pk=rule.pk).update(expanded_until=until)
+    rule.expanded_until = until
+    return created
+
+
+def expand_all(until=None):
+    """Expand every active rule whose horizon has moved. Returns {'slots': n, 'reminders': n}."""
+    until = until or horizon_end()
+    totals = {'slots': 0, 'reminders': 0}
+    for key, model in (('slots', AvailabilityRule), ('reminders', ReminderRule)):
+        pending = (
+            model.objects
+            .filter(is_active=True, start_date__lte=until)
+            .exclude(expanded_until__gte=until)
+            # Finished rules that already reached their end date
+            .exclude(end_date__isnull=False, expanded_until__isnull=False, end_date__lte=F('expanded_until'))
+            .order_by('pk')
+        )
+        for rule in pending.iterator(chunk_size=200):
+            totals[key] += expand_rule(rule, until)
+    return totals
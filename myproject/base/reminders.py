@@ -0,0 +1,318 @@
+"""
+Home exercise reminder delivery.
+
+`ReminderScheduler` keeps a min-heap of upcoming (reminder_time, id) pairs,
+claims due reminders from the database in batches and hands them to the
+channel backend configured for their `sent_via` value in
+settings.REMINDER_CHANNELS. Channel sends run on a thread pool; all database
+work stays on the scheduler thread.
+"""
+import heapq
+import json
+import logging
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import HomeExerciseReminder
+
+logger = logging.getLogger(__name__)
+
+# Columns read for every claimed reminder - enough to build the message
+# without loading full User / Exercise rows.
+MESSAGE_FIELDS = (
+    'id', 'sent_via', 'reminder_time', 'attempts',
+    'patient__username', 'patient__first_name', 'patient__email',
+    'patient__phone_number', 'exercise__name',
+)
+
+
+def build_message(row):
+    """Plain text body for a reminder row (a dict of MESSAGE_FIELDS)."""
+    name = row['patient__first_name'] or row['patient__username']
+    return f"Hi {name}, it's time for your {row['exercise__name']} exercise."
+
+
+# -------------------------
+# CHANNEL BACKENDS
+# -------------------------
+class BaseChannel:
+    """
+    A delivery channel. Subclasses implement send_batch(), which receives a
+    list of reminder rows and returns {reminder_id: error}, where an empty
+    error string means the reminder was delivered.
+    """
+
+    def __init__(self, name, **options):
+        self.name = name
+        self.options = options
+
+    def send_batch(self, rows):
+        raise NotImplementedError
+
+
+class ConsoleChannel(BaseChannel):
+    """Writes reminders to stdout. Local stand-in for SMS / WhatsApp gateways."""
+
+    _lock = threading.Lock()
+
+    def send_batch(self, rows):
+        lines = [
+            f"[{self.name}] to={row['patient__phone_number'] or row['patient__email'] or row['patient__username']} "
+            f"{build_message(row)}\n"
+            for row in rows
+        ]
+        stream = self.options.get('stream', sys.stdout)
+        with self._lock:
+            stream.write(''.join(lines))
+            stream.flush()
+        return {row['id']: '' for row in rows}
+
+
+class FileChannel(BaseChannel):
+    """Appends reminders as JSON lines to OPTIONS['path']."""
+
+    _lock = threading.Lock()
+
+    def send_batch(self, rows):
+        payload = ''.join(
+            json.dumps({
+                'reminder_id': row['id'],
+                'channel': self.name,
+                'to': row['patient__phone_number'] or row['patient__email'],
+                'message': build_message(row),
+                'reminder_time': row['reminder_time'].isoformat(),
+            }) + '\n'
+            for row in rows
+        )
+        with self._lock:
+            with open(self.options['path'], 'a', encoding='utf-8') as fh:
+                fh.write(payload)
+        return {row['id']: '' for row in rows}
+
+
+class EmailChannel(BaseChannel):
+    """Sends reminders through Django's configured EMAIL_BACKEND, one connection per batch."""
+
+    def send_batch(self, rows):
+        results = {}
+        emails = []
+        for row in rows:
+            if not row['patient__email']:
+                results[row['id']] = 'Patient has no email address.'
+                continue
+            emails.append((row['id'], EmailMessage(
+                subject=self.options.get('subject', 'Exercise Reminder'),
+                body=build_message(row),
+                to=[row['patient__email']],
+            )))
+
+        if emails:
+            connection = get_connection(fail_silently=False)
+            with connection:
+                for reminder_id, email in emails:
+                    try:
+                        connection.send_messages([email])
+                        results[reminder_id] = ''
+                    except Exception as exc:
+                        results[reminder_id] = str(exc) or exc.__class__.__name__
+        return results
+
+
+_channels = {}
+_channels_lock = threading.Lock()
+
+
+def get_channel(name):
+    """Return the (cached) backend instance configured for a `sent_via` value, or None."""
+    with _channels_lock:
+        if name not in _channels:
+            config = getattr(settings, 'REMINDER_CHANNELS', {}).get(name)
+            if config is None:
+                _channels[name] = None
+            else:
+                backend = import_string(config['BACKEND'])
+                _channels[name] = backend(name, **config.get('OPTIONS', {}))
+        return _channels[name]
+
+
+# -------------------------
+# SCHEDULER
+# -------------------------
+class ReminderScheduler:
+    def __init__(self, batch_size=None, workers=None, lookahead=None,
+                 poll_interval=None, max_attempts=None, claim_timeout=None):
+        conf = getattr(settings, 'REMINDER_SCHEDULER', {})
+        self.batch_size = batch_size or conf.get('BATCH_SIZE', 1000)
+        self.workers = workers or conf.get('WORKERS', 8)
+        self.lookahead = timedelta(seconds=lookahead or conf.get('LOOKAHEAD_SECONDS', 300))
+        self.poll_interval = poll_interval or conf.get('POLL_SECONDS', 5)
+        self.max_attempts = max_attempts or conf.get('MAX_ATTEMPTS', 3)
+        self.claim_timeout = timedelta(seconds=claim_timeout or conf.get('CLAIM_TIMEOUT_SECONDS', 300))
+        self.retry_delay = timedelta(seconds=conf.get('RETRY_SECONDS', 60))
+        # Cap the heap so a huge backlog is paged in rather than loaded at once
+        self.max_queued = self.batch_size * 50
+
+        self.heap = []
+        self.queued = set()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='reminder')
+        self.stats = {'sent': 0, 'failed': 0, 'retried': 0}
+
+    # ---------- heap maintenance ----------
+    def refill(self, now):
+        """Push Pending reminders due before now + lookahead that are not queued yet."""
+        room = self.max_queued - len(self.heap)
+        if room <= 0:
+            return
+        upcoming = (
+            HomeExerciseReminder.objects
+            .filter(delivery_status='Pending', reminder_time__lte=now + self.lookahead)
+            # Reminders that failed recently wait out the retry delay
+            .exclude(claimed_at__gt=now - self.retry_delay)
+            .order_by('reminder_time')
+            .values_list('reminder_time', 'id')[:room + len(self.queued)]
+        )
+        for entry in upcoming.iterator(chunk_size=self.batch_size):
+            if entry[1] not in self.queued:
+                self.queued.add(entry[1])
+                heapq.heappush(self.heap, entry)
+
+    def pop_due(self, now):
+        ids = []
+        while self.heap and self.heap[0][0] <= now and len(ids) < self.batch_size:
+            _, reminder_id = heapq.heappop(self.heap)
+            self.queued.discard(reminder_id)
+            ids.append(reminder_id)
+        return ids
+
+    def next_due_in(self, now):
+        if not self.heap:
+            return self.poll_interval
+        return max(0.0, min(self.poll_interval, (self.heap[0][0] - now).total_seconds()))
+
+    # ---------- database state ----------
+    def release_stale_claims(self, now):
+        """Return reminders claimed by a scheduler that died mid-batch to the queue."""
+        return HomeExerciseReminder.objects.filter(
+            delivery_status='Claimed', claimed_at__lt=now - self.claim_timeout
+        ).update(delivery_status='Pending', claimed_at=None)
+
+    def claim(self, ids, now):
+        """
+        Mark a batch of reminders as Claimed and return their message rows.
+        Rows already locked or claimed by another scheduler are skipped.
+        """
+        with transaction.atomic():
+            locked = list(
+                HomeExerciseReminder.objects
+                .select_for_update(skip_locked=True)
+                .filter(id__in=ids, delivery_status='Pending', reminder_time__lte=now)
+                .values_list('id', flat=True)
+            )
+            if not locked:
+                return []
+            HomeExerciseReminder.objects.filter(id__in=locked, delivery_status='Pending').update(
+                delivery_status='Claimed', claimed_at=now, attempts=F('attempts') + 1
+            )
+        return list(
+            HomeExerciseReminder.objects
+            .filter(id__in=locked, delivery_status='Claimed', claimed_at=now)
+            .values(*MESSAGE_FIELDS)
+        )
+
+    def record(self, rows, results):
+        now = timezone.now()
+        sent = [row['id'] for row in rows if results.get(row['id']) == '']
+        if sent:
+            HomeExerciseReminder.objects.filter(id__in=sent).update(
+                delivery_status='Sent', sent_at=now, claimed_at=None, last_error=''
+            )
+            self.stats['sent'] += len(sent)
+
+        failures = []
+        for row in rows:
+            error = results.get(row['id'], 'No result returned by channel.')
+            if error == '':
+                continue
+            # claim() already counted this delivery in row['attempts']
+            retry = row['attempts'] < self.max_attempts
+            failures.append(HomeExerciseReminder(
+                id=row['id'],
+                delivery_status='Pending' if retry else 'Failed',
+                # Kept on retries so refill() can apply the retry delay
+                claimed_at=now if retry else None,
+                last_error=error[:1000],
+            ))
+            self.stats['retried' if retry else 'failed'] += 1
+        if failures:
+            HomeExerciseReminder.objects.bulk_update(
+                failures, ['delivery_status', 'claimed_at', 'last_error'], batch_size=self.batch_size
+            )
+
+    # ---------- dispatch ----------
+    def dispatch(self, rows):
+        """Send rows through their channels on the thread pool and wait for the results."""
+        by_channel = {}
+        for row in rows:
+            by_channel.setdefault(row['sent_via'], []).append(row)
+
+        results = {}
+        futures = []
+        for name, channel_rows in by_channel.items():
+            channel = get_channel(name)
+            if channel is None:
+                results.update({row['id']: f'No channel configured for {name}.' for row in channel_rows})
+                continue
+            chunk = max(1, len(channel_rows) // self.workers + 1)
+            for start in range(0, len(channel_rows), chunk):
+                futures.append((channel, channel_rows[start:start + chunk],
+                                self.executor.submit(channel.send_batch, channel_rows[start:start + chunk])))
+
+        for channel, chunk_rows, future in futures:
+            try:
+                results.update(future.result())
+            except Exception as exc:
+                logger.exception("Reminder channel %s failed", channel.name)
+                results.update({row['id']: str(exc) or exc.__class__.__name__ for row in chunk_rows})
+        return results
+
+    # ---------- main loop ----------
+    def run_once(self):
+        """Deliver everything that is due right now. Returns the number of reminders processed."""
+        now = timezone.now()
+        self.release_stale_claims(now)
+        self.refill(now)
+
+        processed = 0
+        while True:
+            ids = self.pop_due(now)
+            if not ids:
+                break
+            rows = self.claim(ids, now)
+            if rows:
+                self.record(rows, self.dispatch(rows))
+                processed += len(rows)
+            if not self.heap or self.heap[0][0] > now:
+                # Page in due reminders that did not fit in the heap
+                self.refill(now)
+        return processed
+
+    def run_forever(self, stop_event=None):
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            processed = self.run_once()
+            if processed:
+                logger.info("Delivered reminders: %s", self.stats)
+                continue
+            stop_event.wait(self.next_due_in(timezone.now()))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,276 @@
+"""
+Home-visit route planning.
+
+For one therapist and day, the confirmed appointments are visited in booked
+time order; visits booked for the same time are ordered to keep driving short:
+a great-circle distance matrix is built with NumPy (scaled by
+ROUTING['ROAD_FACTOR'] to approximate roads), and a nearest-neighbour tour from
+the previous stop (or the therapist's own coordinates) is improved with 2-opt.
+Each leg gets a travel time at ROUTING['AVERAGE_SPEED_KMH']; a visit starts at
+its booked time, or on arrival when the therapist is running late. Results are
+stored as RoutePlan rows.
+
+plan_fleet() does the whole fleet for a day: the appointments are read in
+one query, the pure-NumPy solving is spread over a process pool (workers
+never touch the database) and the plans are written back in bulk.
+`manage.py plan_routes` runs it for tomorrow.
+"""
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils.module_loading import import_string
+
+from .models import Appointment, RoutePlan, User
+
+EARTH_RADIUS_KM = 6371.0
+COORDINATES = re.compile(r'(-?\d{1,2}(?:\.\d+)?)\s*,\s*(-?\d{1,3}(?:\.\d+)?)')
+
+
+def routing_settings():
+    return {
+        'AVERAGE_SPEED_KMH': 25,
+        'ROAD_FACTOR': 1.3,
+        'DAY_START': '09:00',
+        'GEOCODER': None,
+        **getattr(settings, 'ROUTING', {}),
+    }
+
+
+# -------------------------
+# GEOCODING
+# -------------------------
+def parse_coordinates(address):
+    """(lat, lng) written into an address as "12.97,77.59", else None."""
+    match = COORDINATES.search(address or '')
+    if not match:
+        return None
+    lat, lng = float(match.group(1)), float(match.group(2))
+    return (lat, lng) if -90 <= lat <= 90 and -180 <= lng <= 180 else None
+
+
+def geocode(address):
+    """ROUTING['GEOCODER'] (a dotted path to callable(address) -> (lat, lng) or None), else parse_coordinates."""
+    geocoder = routing_settings()['GEOCODER']
+    return (import_string(geocoder) if geocoder else parse_coordinates)(address)
+
+
+def geocode_missing(users=None):
+    """Fill latitude/longitude for users that have an address but no coordinates. Returns the count."""
+    users = users if users is not None else User.objects.all()
+    pending = users.filter(latitude__isnull=True).exclude(address__isnull=True).exclude(address='')
+    located = []
+    for user in pending.only('id', 'address').iterator(chunk_size=1000):
+        point = geocode(user.address)
+        if point:
+            user.latitude, user.longitude = point
+            located.append(user)
+    User.objects.bulk_update(located, ['latitude', 'longitude'], batch_size=1000)
+    return len(located)
+
+
+# -------------------------
+# SOLVER (pure NumPy; safe to run in worker processes)
+# -------------------------
+def distance_matrix(points, road_factor=1.0):
+    """Pairwise haversine distances in km for an (n, 2) array of (lat, lng) degrees."""
+    radians = np.radians(np.asarray(points, dtype=float))
+    lat, lng = radians[:, 0:1], radians[:, 1:2]
+    half_dlat = (lat - lat.T) / 2
+    half_dlng = (lng - lng.T) / 2
+    a = np.sin(half_dlat) ** 2 + np.cos(lat) * np.cos(lat.T) * np.sin(half_dlng) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1))) * road_factor
+
+
+def nearest_neighbour(dist):
+    """Open tour from node 0, always moving to the closest unvisited node."""
+    n = len(dist)
+    visited = np.zeros(n, dtype=bool)
+    visited[0] = True
+    order = [0]
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, dist[order[-1]])
+        nxt = int(np.argmin(row))
+        visited[nxt] = True
+        order.append(nxt)
+    return order
+
+
+def two_opt(order, dist):
+    """
+    Improve an open tour that starts at order[0]. A zero-cost dummy end node
+    turns it into a closed tour, so each pass scores every reversal
+    order[i..j] for a given i in one vectorized expression.
+    """
+    n = len(dist)
+    if n < 4:
+        return list(order)
+    padded = np.zeros((n + 1, n + 1))
+    padded[:n, :n] = dist
+    route = np.array(list(order) + [n])
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(route) - 2):
+            a, b = route[i - 1], route[i]
+            c, d = route[i + 1:-1], route[i + 2:]
+            delta = padded[a, c] + padded[b, d] - padded[a, b] - padded[c, d]
+            j = int(np.argmin(delta))
+            if delta[j] < -1e-9:
+                route[i:i + j + 2] = route[i:i + j + 2][::-1].copy()
+                improved = True
+    return [int(node) for node in route[:-1]]
+
+
+def solve(depot, stops, road_factor=1.0):
+    """
+    depot: (lat, lng) or None; stops: [(key, lat, lng)]. Returns [(key, leg km)]
+    in visiting order. Without a depot the tour starts at the first stop.
+    """
+    if not stops:
+        return []
+    points = [(lat, lng) for _, lat, lng in stops]
+    offset = 1 if depot else 0
+    if depot:
+        points.insert(0, depot)
+    dist = distance_matrix(points, road_factor)
+    order = two_opt(nearest_neighbour(dist), dist)
+    legs = []
+    for previous, node in zip([None] + order[:-1], order):
+        if node < offset:
+            continue
+        legs.append((stops[node - offset][0], float(dist[previous, node]) if previous is not None else 0.0))
+    return legs
+
+
+def solve_windows(depot, groups, road_factor=1.0):
+    """
+    groups: lists of stops (as for solve()) in booked time order. Each group is
+    solved from where the previous one ended. Returns [(key, leg km)].
+    """
+    legs, position = [], depot
+    for stops in groups:
+        group_legs = solve(position, stops, road_factor)
+        legs += group_legs
+        last = group_legs[-1][0]
+        position = next((lat, lng) for key, lat, lng in stops if key == last)
+    return legs
+
+
+def _solve_task(task):
+    therapist_id, depot, groups, road_factor = task
+    return therapist_id, solve_windows(depot, groups, road_factor)
+
+
+# -------------------------
+# PLANS
+# -------------------------
+def day_appointments(day, therapist_id=None):
+    """Confirmed appointments for a day as {therapist id: [row, ...]} in scheduled order."""
+    queryset = Appointment.objects.filter(scheduled_date=day, booking_status='Confirmed')
+    if therapist_id is not None:
+        queryset = queryset.filter(therapist_id=therapist_id)
+    rows = queryset.order_by('therapist_id', 'scheduled_time').values(
+        'id', 'therapist_id', 'scheduled_time', 'therapist__latitude', 'therapist__longitude',
+        'patient__username', 'patient__latitude', 'patient__longitude', 'service__duration_minutes',
+    )
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row['therapist_id'], []).append(row)
+    return grouped
+
+
+def _task(therapist_id, rows, road_factor):
+    first = rows[0]
+    depot = None
+    if first['therapist__latitude'] is not None and first['therapist__longitude'] is not None:
+        depot = (first['therapist__latitude'], first['therapist__longitude'])
+    groups = {}  # booked time -> stops; rows arrive in scheduled order
+    for row in rows:
+        if row['patient__latitude'] is not None and row['patient__longitude'] is not None:
+            groups.setdefault(row['scheduled_time'], []).append(
+                (row['id'], row['patient__latitude'], row['patient__longitude'])
+            )
+    return therapist_id, depot, list(groups.values()), road_factor
+
+
+def build_plan(therapist_id, day, rows, legs, options):
+    """
+    Unsaved RoutePlan with ETAs. The therapist leaves DAY_START at the earliest
+    (later if that still makes the first booking), waits for each booked time
+    and stays the service's duration; late_minutes flags visits that cannot be
+    reached on time.
+    """
+    by_id = {row['id']: row for row in rows}
+    clock = datetime.combine(day, datetime.strptime(options['DAY_START'], '%H:%M').time())
+    stops, total_km, total_minutes = [], 0.0, 0.0
+    for appointment_id, km in legs:
+        row = by_id[appointment_id]
+        minutes = km / options['AVERAGE_SPEED_KMH'] * 60
+        travel = timedelta(minutes=minutes)
+        booked = datetime.combine(day, row['scheduled_time'])
+        if not stops:
+            clock = max(clock, booked - travel)
+        arrival = clock + travel
+        start = max(arrival, booked)
+        stops.append({
+            'appointment': appointment_id,
+            'patient': row['patient__username'],
+            'travel_km': round(km, 2),
+            'travel_minutes': round(minutes, 1),
+            'booked': f'{booked:%H:%M}',
+            'eta': f'{start:%H:%M}',
+            'wait_minutes': round((start - arrival).total_seconds() / 60, 1),
+            'late_minutes': round(max(0.0, (arrival - booked).total_seconds() / 60), 1),
+        })
+        clock = start + timedelta(minutes=row['service__duration_minutes'] or 0)
+        total_km += km
+        total_minutes += minutes
+    routed = {appointment_id for appointment_id, _ in legs}
+    return RoutePlan(therapist_id=therapist_id, date=day, stops=stops,
+                     unlocated=[row['id'] for row in rows if row['id'] not in routed],
+                     total_km=round(total_km, 2), total_minutes=round(total_minutes, 1))
+
+
+def save_plans(day, plans, therapist_ids):
+    """Replace the day's plans for these therapists in one transaction."""
+    with transaction.atomic():
+        RoutePlan.objects.filter(date=day, therapist_id__in=therapist_ids).delete()
+        RoutePlan.objects.bulk_create(plans, batch_size=500)
+
+
+def plan_day(therapist_id, day, save=True):
+    """
+    Compute one therapist's route for `day`. Returns the RoutePlan (or None
+    without visits); with save=False it is only a preview and nothing is written.
+    """
+    options = routing_settings()
+    rows = day_appointments(day, therapist_id).get(therapist_id)
+    if not rows:
+        if save:
+            RoutePlan.objects.filter(therapist_id=therapist_id, date=day).delete()
+        return None
+    _, legs = _solve_task(_task(therapist_id, rows, options['ROAD_FACTOR']))
+    plan = build_plan(therapist_id, day, rows, legs, options)
+    if save:
+        save_plans(day, [plan], [therapist_id])
+    return plan
+
+
+def plan_fleet(day, workers=None):
+    """Plan every therapist with confirmed visits on `day`. Returns the number of plans written."""
+    options = routing_settings()
+    grouped = day_appointments(day)
+    tasks = [_task(therapist_id, rows, options['ROAD_FACTOR']) for therapist_id, rows in grouped.items()]
+    if workers == 1 or len(tasks) < 2:
+        solved = map(_solve_task, tasks)
+    else:
+        connections.close_all()  # forked workers must not inherit open connections
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            solved = list(pool.map(_solve_task, tasks, chunksize=max(1, len(tasks) // 32)))
+    plans = [build_plan(therapist_id, day, grouped[therapist_id], legs, options) for therapist_id, legs in solved]
+    save_plans(day, plans, list(grouped))
+    return len(plans)
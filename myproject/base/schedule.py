@@ -0,0 +1,219 @@
+"""
+Materialized therapist calendars.
+
+Each therapist's slots, appointments and leave for a rolling window
+(SCHEDULE_PAST_DAYS back, SCHEDULE_FUTURE_DAYS ahead) are stored as compact
+JSON in TherapistProfile.daily_schedule, one entry per date:
+
+    {"version": 1, "days": {"2026-10-19": {
+        "slots": [["09:00", "09:45", true, 12], ...],          # start, end, booked, id
+        "appointments": [["10:00", 7, "asha", "Back Pain Therapy", "Confirmed"], ...],
+        "leave": {"reason": "...", "approved": true} | null}}}
+
+so the day and week views are a single read of the profile row. Saving or
+deleting a slot, appointment or leave marks only the affected
+(therapist, date) pairs dirty; they are rebuilt once when the transaction
+commits, with three range queries per therapist. Dates outside the window
+are built on the fly. `manage.py refresh_schedules` rebuilds everything and
+rolls the window forward (run it nightly).
+"""
+import threading
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.utils import timezone
+
+from .models import Appointment, AvailabilitySlot, TherapistLeave, TherapistProfile, User
+
+SNAPSHOT_VERSION = 1
+
+_pending = threading.local()
+
+
+def window(today=None):
+    """(first, last) date kept in the snapshots."""
+    today = today or timezone.localdate()
+    return (today - timedelta(days=getattr(settings, 'SCHEDULE_PAST_DAYS', 7)),
+            today + timedelta(days=getattr(settings, 'SCHEDULE_FUTURE_DAYS', 56)))
+
+
+def _days(first, last):
+    day = first
+    while day <= last:
+        yield day
+        day += timedelta(days=1)
+
+
+def build_days(therapist_id, first, last):
+    """{iso date: day entry} for every date in [first, last] - three queries."""
+    days = {day.isoformat(): {'slots': [], 'appointments': [], 'leave': None} for day in _days(first, last)}
+
+    slots = (
+        AvailabilitySlot.objects
+        .filter(therapist_id=therapist_id, date__range=(first, last))
+        .order_by('date', 'start_time')
+        .values_list('date', 'start_time', 'end_time', 'is_booked', 'id')
+    )
+    for day, start, end, booked, pk in slots:
+        days[day.isoformat()]['slots'].append([f'{start:%H:%M}', f'{end:%H:%M}', booked, pk])
+
+    appointments = (
+        Appointment.objects
+        .filter(therapist_id=therapist_id, scheduled_date__range=(first, last))
+        .exclude(booking_status='Cancelled')
+        .order_by('scheduled_date', 'scheduled_time')
+        .values_list('scheduled_date', 'scheduled_time', 'id', 'patient__username', 'service__name', 'booking_status')
+    )
+    for day, at, pk, patient, service, status in appointments:
+        days[day.isoformat()]['appointments'].append([f'{at:%H:%M}', pk, patient, service, status])
+
+    leaves = (
+        TherapistLeave.objects
+        .filter(therapist_id=therapist_id, from_date__lte=last, to_date__gte=first)
+        .order_by('is_approved', 'from_date')  # approved leave wins when ranges overlap
+        .values_list('from_date', 'to_date', 'reason', 'is_approved')
+    )
+    for start, end, reason, approved in leaves:
+        for day in _days(max(start, first), min(end, last)):
+            days[day.isoformat()]['leave'] = {'reason': reason, 'approved': approved}
+    return days
+
+
+def refresh(therapist_id, dates=None, today=None):
+    """
+    Rebuild the snapshot days in `dates` (all of the window when None) for one
+    therapist and drop days that fell out of the window.
+    """
+    first, last = window(today)
+    if dates is not None:
+        dates = [day for day in dates if first <= day <= last]
+        if not dates:
+            return
+    with transaction.atomic():
+        if not User.objects.filter(pk=therapist_id).exists():
+            return  # deleted along with the rows that queued the refresh
+        profile, _ = TherapistProfile.objects.select_for_update().get_or_create(user_id=therapist_id)
+        snapshot = profile.daily_schedule if profile.daily_schedule.get('version') == SNAPSHOT_VERSION else {}
+        if not snapshot:
+            dates = None  # nothing to patch yet; build the whole window
+        days = {} if dates is None else dict(snapshot.get('days', {}))
+        days.update(build_days(therapist_id, min(dates or [first]), max(dates or [last])))
+        profile.daily_schedule = {
+            'version': SNAPSHOT_VERSION,
+            'built_at': timezone.now().isoformat(),
+            'days': {key: value for key, value in sorted(days.items())
+                     if first.isoformat() <= key <= last.isoformat()},
+        }
+        TherapistProfile.objects.filter(pk=profile.pk).update(daily_schedule=profile.daily_schedule)
+
+
+def refresh_all(today=None):
+    therapists = User.objects.filter(role='Therapist').order_by('pk').values_list('pk', flat=True)
+    count = 0
+    for therapist_id in therapists.iterator(chunk_size=500):
+        refresh(therapist_id, today=today)
+        count += 1
+    return count
+
+
+def get_days(therapist_id, first, last):
+    """Day entries for [first, last]: from the snapshot, built on the fly for anything outside it."""
+    snapshot = (
+        TherapistProfile.objects.filter(user_id=therapist_id).values_list('daily_schedule', flat=True).first() or {}
+    )
+    stored = snapshot.get('days', {}) if snapshot.get('version') == SNAPSHOT_VERSION else {}
+    keys = [day.isoformat() for day in _days(first, last)]
+    if all(key in stored for key in keys):
+        return {key: stored[key] for key in keys}
+    return build_days(therapist_id, first, last)
+
+
+def expand(days):
+    """Snapshot entries as a list of dicts, for templates."""
+    return [
+        {
+            'date': date.fromisoformat(key),
+            'slots': [{'start': start, 'end': end, 'is_booked': booked, 'id': pk}
+                      for start, end, booked, pk in entry['slots']],
+            'appointments': [{'time': at, 'id': pk, 'patient': patient, 'service': service, 'status': status}
+                             for at, pk, patient, service, status in entry['appointments']],
+            'leave': entry['leave'],
+        }
+        for key, entry in days.items()
+    ]
+
+
+# -------------------------
+# INCREMENTAL REFRESH
+# -------------------------
+def mark_dirty(therapist_id, dates):
+    """
+    Queue (therapist, dates) for a rebuild once the current transaction
+    commits. Every call registers a flush, but the first one to run takes
+    everything queued so far and the rest find nothing to do.
+    """
+    if not therapist_id or not dates:
+        return
+    pending = _pending.__dict__.setdefault('days', defaultdict(set))
+    pending[therapist_id].update(dates)
+    transaction.on_commit(flush)
+
+
+def mark_range(therapist_id, first, last):
+    """mark_dirty() for a date range, clipped to the snapshot window."""
+    start, end = window()
+    mark_dirty(therapist_id, list(_days(max(first, start), min(last, end))))
+
+
+def flush():
+    pending = _pending.__dict__.pop('days', None) or {}
+    for therapist_id, dates in pending.items():
+        refresh(therapist_id, dates)
+
+
+# the fields that place a row on a calendar: therapist id, then its date(s)
+CALENDAR_FIELDS = {
+    AvailabilitySlot: ('therapist_id', 'date'),
+    Appointment: ('therapist_id', 'scheduled_date'),
+    TherapistLeave: ('therapist_id', 'from_date', 'to_date'),
+}
+
+
+def _placement(sender, instance):
+    # read __dict__ so a deferred field is reported as None instead of being fetched
+    return tuple(instance.__dict__.get(field) for field in CALENDAR_FIELDS[sender])
+
+
+def _row_dates(placement):
+    """(therapist id, dates) for a placement tuple."""
+    therapist_id, *dates = placement
+    if len(dates) == 1:
+        return therapist_id, dates
+    first, last = window()
+    return therapist_id, list(_days(max(dates[0], first), min(dates[1], last)))
+
+
+def remember_loaded(sender, instance, **kwargs):
+    """Keep where a loaded row sat, so a save that moves it clears its previous day too (no extra query)."""
+    if instance.pk is not None:
+        instance._schedule_loaded = _placement(sender, instance)
+
+
+def schedule_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    current = _placement(sender, instance)
+    previous = getattr(instance, '_schedule_loaded', None)
+    if previous and previous != current and None not in previous:
+        mark_dirty(*_row_dates(previous))
+    mark_dirty(*_row_dates(current))
+    instance._schedule_loaded = current
+
+
+for _model in (AvailabilitySlot, Appointment, TherapistLeave):
+    post_init.connect(remember_loaded, sender=_model, dispatch_uid=f'schedule_loaded_{_model.__name__}')
+    post_save.connect(schedule_changed, sender=_model, dispatch_uid=f'schedule_save_{_model.__name__}')
+    post_delete.connect(schedule_changed, sender=_model, dispatch_uid=f'schedule_delete_{_model.__name__}')
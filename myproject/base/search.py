@@ -0,0 +1,329 @@
+"""
+Full-text search over blog articles, FAQs, exercises and services.
+
+Searchable rows are copied into a single `base_search_index` table that is
+kept in sync by post_save / post_delete signals and rebuilt with
+`manage.py rebuild_search_index`. The table is an FTS5 virtual table on
+SQLite and a tsvector table with a GIN index on PostgreSQL (both created by
+migration 0004); the backend is picked from settings.SEARCH_BACKEND. On any
+other database 'auto' falls back to ModelSearchBackend, which keeps no index
+and answers with icontains lookups on the source tables.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.urls import reverse
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+
+from .models import FAQ, BlogArticle, Exercise, Service
+
+TABLE = 'base_search_index'
+
+# Markers wrapped around matches by the database; swapped for <mark> after
+# the surrounding text has been HTML-escaped.
+MARK_START, MARK_END = '\x02', '\x03'
+
+
+# -------------------------
+# SEARCHABLE DOCUMENTS
+# -------------------------
+def _blog_document(blog):
+    return blog.title, f"{blog.content}\n{blog.category}\n{blog.tags}"
+
+
+def _faq_document(faq):
+    return faq.question, f"{faq.answer}\n{faq.category}"
+
+
+def _exercise_document(exercise):
+    return exercise.name, f"{exercise.description or ''}\n{exercise.focus_area or ''}\n{exercise.difficulty_level or ''}"
+
+
+def _service_document(service):
+    return service.name, f"{service.description}\n{service.required_equipment}"
+
+
+# doc_type: (model, document builder, filter for rows that may be shown, url name, url kwarg)
+DOCUMENT_TYPES = {
+    'blog': (BlogArticle, _blog_document, {'is_published': True}, 'blog_list', None),
+    'faq': (FAQ, _faq_document, {'is_active': True}, 'faq_list', None),
+    'exercise': (Exercise, _exercise_document, {}, 'exercise_detail', 'exercise_id'),
+    'service': (Service, _service_document, {'is_active': True}, 'service_list', None),
+}
+
+MODEL_DOC_TYPES = {model: doc_type for doc_type, (model, *_) in DOCUMENT_TYPES.items()}
+
+
+def result_url(doc_type, object_id):
+    url_name, kwarg = DOCUMENT_TYPES[doc_type][3], DOCUMENT_TYPES[doc_type][4]
+    if kwarg:
+        return reverse(url_name, kwargs={kwarg: object_id})
+    return reverse(url_name)
+
+
+def is_searchable(doc_type, obj):
+    return all(getattr(obj, field) == value for field, value in DOCUMENT_TYPES[doc_type][2].items())
+
+
+def tokenize(query):
+    """Split user input into plain word tokens (drops FTS operators and punctuation)."""
+    return re.findall(r'\w+', query.lower())[:10]
+
+
+def render_highlight(text):
+    return escape(text).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+# -------------------------
+# BACKENDS
+# -------------------------
+class BaseSearchBackend:
+    def index(self, doc_type, rows):
+        """Insert or replace rows of (object_id, title, body)."""
+        raise NotImplementedError
+
+    def remove(self, doc_type, object_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"DELETE FROM {TABLE} WHERE doc_type = %s AND object_id = %s",
+                [(doc_type, object_id) for object_id in object_ids],
+            )
+
+    def clear(self, doc_type):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE} WHERE doc_type = %s", [doc_type])
+
+    def search(self, query, doc_types=None, limit=20, offset=0):
+        """Return ranked hits as dicts: doc_type, object_id, title, snippet, score."""
+        raise NotImplementedError
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """
+    FTS5 with porter stemming, bm25 ranking (title weighted 10x) and snippet().
+
+    FTS5 cannot index the doc_type / object_id columns, so every row gets a
+    rowid derived from both; updates and deletes then hit the rowid b-tree
+    instead of scanning the whole index.
+    """
+    DOC_TYPE_CODES = {'blog': 1, 'faq': 2, 'exercise': 3, 'service': 4}
+
+    def rowid(self, doc_type, object_id):
+        return int(object_id) * 8 + self.DOC_TYPE_CODES[doc_type]
+
+    def remove(self, doc_type, object_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"DELETE FROM {TABLE} WHERE rowid = %s",
+                [(self.rowid(doc_type, object_id),) for object_id in object_ids],
+            )
+
+    def clear(self, doc_type):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE} WHERE rowid %% 8 = %s", [self.DOC_TYPE_CODES[doc_type]])
+
+    def index(self, doc_type, rows):
+        rows = list(rows)
+        self.remove(doc_type, [row[0] for row in rows])
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {TABLE} (rowid, doc_type, object_id, title, body) VALUES (%s, %s, %s, %s, %s)",
+                [(self.rowid(doc_type, object_id), doc_type, object_id, title, body)
+                 for object_id, title, body in rows],
+            )
+
+    def search(self, query, doc_types=None, limit=20, offset=0):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        # Every token must match; the last one as a prefix for type-as-you-go
+        match = ' '.join(f'"{token}"' for token in tokens[:-1])
+        match = f'{match} "{tokens[-1]}"*'.strip()
+
+        sql = (
+            f"SELECT doc_type, object_id, "
+            f"highlight({TABLE}, 2, %s, %s), "
+            f"snippet({TABLE}, 3, %s, %s, '…', 16), "
+            f"bm25({TABLE}, 0, 0, 10.0, 1.0) AS score "
+            f"FROM {TABLE} WHERE {TABLE} MATCH %s"
+        )
+        params = [MARK_START, MARK_END, MARK_START, MARK_END, match]
+        if doc_types:
+            sql += f" AND doc_type IN ({', '.join(['%s'] * len(doc_types))})"
+            params += list(doc_types)
+        sql += " ORDER BY score LIMIT %s OFFSET %s"
+        params += [limit, offset]
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [
+                # bm25 is lower-is-better; flip it so higher score = better match
+                {'doc_type': row[0], 'object_id': int(row[1]), 'title': row[2], 'snippet': row[3], 'score': -row[4]}
+                for row in cursor.fetchall()
+            ]
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """Weighted tsvector column (generated, GIN indexed), ts_rank_cd and ts_headline."""
+
+    def index(self, doc_type, rows):
+        rows = list(rows)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {TABLE} (doc_type, object_id, title, body) VALUES (%s, %s, %s, %s) "
+                f"ON CONFLICT (doc_type, object_id) DO UPDATE SET title = EXCLUDED.title, body = EXCLUDED.body",
+                [(doc_type, object_id, title, body) for object_id, title, body in rows],
+            )
+
+    def search(self, query, doc_types=None, limit=20, offset=0):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        tsquery = ' & '.join(f"{token}:*" if i == len(tokens) - 1 else token for i, token in enumerate(tokens))
+        options = f"StartSel={MARK_START}, StopSel={MARK_END}, MaxWords=30, MinWords=10"
+
+        sql = (
+            f"SELECT doc_type, object_id, "
+            f"ts_headline('english', title, q, %s), "
+            f"ts_headline('english', body, q, %s), "
+            f"ts_rank_cd(document, q) AS score "
+            f"FROM {TABLE}, to_tsquery('english', %s) q WHERE document @@ q"
+        )
+        params = [options + ', HighlightAll=true', options, tsquery]
+        if doc_types:
+            sql += " AND doc_type = ANY(%s)"
+            params.append(list(doc_types))
+        sql += " ORDER BY score DESC LIMIT %s OFFSET %s"
+        params += [limit, offset]
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [
+                {'doc_type': row[0], 'object_id': row[1], 'title': row[2], 'snippet': row[3], 'score': row[4]}
+                for row in cursor.fetchall()
+            ]
+
+
+class ModelSearchBackend(BaseSearchBackend):
+    """
+    No index: every token must appear (icontains) in one of the document's
+    fields, title matches rank first. Slow on big tables, but it works on
+    any database.
+    """
+    # doc_type: (title field, body fields)
+    FIELDS = {
+        'blog': ('title', ('content', 'category', 'tags')),
+        'faq': ('question', ('answer', 'category')),
+        'exercise': ('name', ('description', 'focus_area', 'difficulty_level')),
+        'service': ('name', ('description', 'required_equipment')),
+    }
+    SNIPPET_CHARS = 160
+
+    def index(self, doc_type, rows):
+        pass
+
+    def remove(self, doc_type, object_ids):
+        pass
+
+    def clear(self, doc_type):
+        pass
+
+    def search(self, query, doc_types=None, limit=20, offset=0):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        hits = []
+        for doc_type in doc_types or DOCUMENT_TYPES:
+            model, _, filters = DOCUMENT_TYPES[doc_type][:3]
+            title, body = self.FIELDS[doc_type]
+            queryset = model.objects.filter(**filters)
+            for token in tokens:
+                queryset = queryset.filter(Q(*(Q(**{f'{field}__icontains': token}) for field in (title, *body)),
+                                             _connector=Q.OR))
+            for row in queryset.values('pk', title, body[0])[:offset + limit]:
+                text = row[title].lower()
+                hits.append({
+                    'doc_type': doc_type, 'object_id': row['pk'], 'title': row[title],
+                    'snippet': (row[body[0]] or '')[:self.SNIPPET_CHARS],
+                    'score': sum(token in text for token in tokens),
+                })
+        hits.sort(key=lambda hit: -hit['score'])
+        return hits[offset:offset + limit]
+
+
+VENDOR_BACKENDS = {
+    'sqlite': 'base.search.SQLiteFTSBackend',
+    'postgresql': 'base.search.PostgresSearchBackend',
+}
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'SEARCH_BACKEND', 'auto')
+        if path == 'auto':
+            path = VENDOR_BACKENDS.get(connection.vendor, 'base.search.ModelSearchBackend')
+        _backend = import_string(path)()
+    return _backend
+
+
+def search(query, doc_types=None, limit=20, offset=0):
+    """Run a search and attach rendered highlights and result URLs to every hit."""
+    hits = get_backend().search(query, doc_types=doc_types, limit=limit, offset=offset)
+    for hit in hits:
+        hit['title_html'] = render_highlight(hit.pop('title'))
+        hit['snippet_html'] = render_highlight(hit.pop('snippet'))
+        hit['url'] = result_url(hit['doc_type'], hit['object_id'])
+    return hits
+
+
+# -------------------------
+# INDEXING
+# -------------------------
+def index_queryset(doc_type, queryset, chunk_size=1000):
+    """Stream a queryset into the index in chunks. Returns the number of rows indexed."""
+    build = DOCUMENT_TYPES[doc_type][1]
+    backend = get_backend()
+    total = 0
+    chunk = []
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        chunk.append((obj.pk, *build(obj)))
+        if len(chunk) >= chunk_size:
+            backend.index(doc_type, chunk)
+            total += len(chunk)
+            chunk = []
+    if chunk:
+        backend.index(doc_type, chunk)
+        total += len(chunk)
+    return total
+
+
+def rebuild(doc_type, chunk_size=1000):
+    """Re-index one document type; searches keep seeing the old rows until it commits."""
+    model, _, filters = DOCUMENT_TYPES[doc_type][:3]
+    with transaction.atomic():
+        get_backend().clear(doc_type)
+        return index_queryset(doc_type, model.objects.filter(**filters).order_by('pk'), chunk_size=chunk_size)
+
+
+def update_index(sender, instance, **kwargs):
+    doc_type = MODEL_DOC_TYPES[sender]
+    if is_searchable(doc_type, instance):
+        get_backend().index(doc_type, [(instance.pk, *DOCUMENT_TYPES[doc_type][1](instance))])
+    else:
+        get_backend().remove(doc_type, [instance.pk])
+
+
+def remove_from_index(sender, instance, **kwargs):
+    get_backend().remove(MODEL_DOC_TYPES[sender], [instance.pk])
+
+
+for _model in MODEL_DOC_TYPES:
+    post_save.connect(update_index, sender=_model, dispatch_uid=f'search_index_{_model.__name__}')
+    post_delete.connect(remove_from_index, sender=_model, dispatch_uid=f'search_remove_{_model.__name__}')
@@ -0,0 +1,224 @@
+"""
+Subscription lifecycle.
+
+A Transaction buys one period of a SubscriptionPlan. start_period() dates it
+to run plan.duration_days from the end of the user's current period (or from
+now), so buying again extends rather than overlaps. Subscription keeps one row
+per user - their latest paid period - and sync() rebuilds those rows from the
+completed transactions whenever one is saved or deleted (deferred inside
+batched_signals()).
+
+sweep() is the periodic job (`manage.py sweep_subscriptions`). It walks active
+rows whose expires_at has passed, oldest first, in keyset batches over the
+(status, expires_at) index. Auto-renewing subscriptions on a plan that is
+still active get a new Transaction for the next period (unless they lapsed
+more than RENEWAL_GRACE_DAYS ago); the rest are marked expired. Renewals are
+created pending - nothing has been charged yet - so they neither reach the
+ledger nor extend the subscription until they are marked completed; until
+then the subscription expires like any other.
+
+entitlement(user) is the check views use: one cache get per call, a single
+indexed query on a miss. Cached entries are dropped whenever the user's row
+changes and never outlive the period they describe.
+"""
+import uuid
+from collections import namedtuple
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q, Subquery
+from django.db.models.signals import post_delete, post_save
+from django.shortcuts import redirect
+from django.utils import timezone
+
+from .batching import current_batch
+from .models import Subscription, Transaction
+
+ENTITLEMENT_KEY = 'subscriptions:entitlement:{}'
+
+Entitlement = namedtuple('Entitlement', 'plan_id plan_name expires_at')
+
+
+def subscription_settings():
+    return {
+        'SWEEP_BATCH_SIZE': 500,
+        'RENEWAL_GRACE_DAYS': 3,
+        'ENTITLEMENT_SECONDS': 300,
+        **getattr(settings, 'SUBSCRIPTIONS', {}),
+    }
+
+
+# -------------------------
+# PERIODS
+# -------------------------
+def start_period(txn, now=None):
+    """Set expires_at on an unsaved (or re-planned) transaction from its plan's duration."""
+    now = now or timezone.now()
+    current_end = (
+        Transaction.objects.filter(user_id=txn.user_id, status=Transaction.COMPLETED, expires_at__gt=now)
+        .exclude(pk=txn.pk).order_by('-expires_at').values_list('expires_at', flat=True).first()
+    )
+    txn.expires_at = (current_end or now) + timedelta(days=txn.plan.duration_days)
+    return txn
+
+
+def sync(user_ids, now=None):
+    """Rebuild the Subscription rows of these users from their latest completed transaction."""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return 0
+    now = now or timezone.now()
+    paid = Transaction.objects.filter(status=Transaction.COMPLETED)
+    latest = paid.filter(user_id=OuterRef('user_id')).order_by('-expires_at', '-id').values('id')[:1]
+    rows = (
+        paid.filter(user_id__in=user_ids, id=Subquery(latest))
+        .values_list('id', 'user_id', 'plan_id', 'plan__duration_days', 'expires_at')
+    )
+    subscriptions = [
+        Subscription(user_id=user_id, plan_id=plan_id, transaction_id=pk,
+                     started_at=expires_at - timedelta(days=days), expires_at=expires_at,
+                     status=Subscription.ACTIVE if expires_at > now else Subscription.EXPIRED)
+        for pk, user_id, plan_id, days, expires_at in rows
+    ]
+    with transaction.atomic():
+        Subscription.objects.bulk_create(
+            subscriptions, batch_size=500, update_conflicts=True, unique_fields=['user'],
+            update_fields=['plan', 'transaction', 'started_at', 'expires_at', 'status', 'updated_at'],
+        )
+        Subscription.objects.filter(user_id__in=user_ids - {s.user_id for s in subscriptions}).delete()
+        transaction.on_commit(lambda: forget(user_ids))
+    return len(subscriptions)
+
+
+def rebuild(batch_size=2000, report=None):
+    """sync() every user with a transaction, in chunks, and drop rows of users without a completed one."""
+    users = Transaction.objects.order_by('user_id').values_list('user_id', flat=True).distinct()
+    synced, chunk = 0, []
+    for user_id in users.iterator(chunk_size=batch_size):
+        chunk.append(user_id)
+        if len(chunk) == batch_size:
+            synced += sync(chunk)
+            chunk = []
+            if report:
+                report(synced)
+    synced += sync(chunk)
+    paid = Transaction.objects.filter(user_id=OuterRef('user_id'), status=Transaction.COMPLETED)
+    Subscription.objects.filter(~Exists(paid)).delete()
+    return synced
+
+
+def set_auto_renew(user_id, auto_renew):
+    return Subscription.objects.filter(user_id=user_id).update(auto_renew=bool(auto_renew))
+
+
+# -------------------------
+# SWEEP
+# -------------------------
+def sweep(now=None, batch_size=None, report=None):
+    """Renew or expire every active subscription that has run out. Returns (renewed, expired)."""
+    options = subscription_settings()
+    now = now or timezone.now()
+    batch_size = batch_size or options['SWEEP_BATCH_SIZE']
+    grace = timedelta(days=options['RENEWAL_GRACE_DAYS'])
+    renewed = expired = 0
+    after = None  # (expires_at, id) keyset cursor
+    while True:
+        due = Subscription.objects.filter(status=Subscription.ACTIVE, expires_at__lte=now)
+        if after:
+            due = due.filter(Q(expires_at__gt=after[0]) | Q(expires_at=after[0], id__gt=after[1]))
+        rows = list(
+            due.order_by('expires_at', 'id').values_list(
+                'id', 'user_id', 'plan_id', 'expires_at', 'auto_renew', 'plan__is_active',
+                'plan__price', 'plan__duration_days', 'transaction__payment_mode',
+            )[:batch_size]
+        )
+        if not rows:
+            return renewed, expired
+        after = (rows[-1][3], rows[-1][0])
+
+        renewals, lapsed = [], []
+        for pk, user_id, plan_id, expires_at, auto_renew, plan_active, price, days, mode in rows:
+            if auto_renew and plan_active and expires_at >= now - grace:
+                renewals.append(Transaction(
+                    user_id=user_id, plan_id=plan_id, amount=price,
+                    payment_mode=mode or Transaction.PAYMENT_MODES[0][0],
+                    transaction_id=f'renew-{uuid.uuid4().hex}', status=Transaction.PENDING,
+                    expires_at=expires_at + timedelta(days=days),
+                ))
+            else:
+                lapsed.append(pk)
+
+        with transaction.atomic():
+            # a purchase since the batch was read moves expires_at past now; leave those rows alone
+            expired += Subscription.objects.filter(
+                id__in=lapsed, status=Subscription.ACTIVE, expires_at__lte=now,
+            ).update(status=Subscription.EXPIRED)
+            if renewals:
+                Transaction.objects.bulk_create(renewals, batch_size=500)  # no signals: sync below
+                sync({txn.user_id for txn in renewals}, now)
+                renewed += len(renewals)
+            transaction.on_commit(lambda users=[row[1] for row in rows]: forget(users))
+        if report:
+            report(renewed, expired)
+
+
+# -------------------------
+# ENTITLEMENT
+# -------------------------
+def forget(user_ids):
+    cache.delete_many([ENTITLEMENT_KEY.format(user_id) for user_id in user_ids])
+
+
+def entitlement(user):
+    """The user's active Entitlement, or None."""
+    user_id = getattr(user, 'pk', user)
+    if not user_id:
+        return None
+    key = ENTITLEMENT_KEY.format(user_id)
+    value = cache.get(key)
+    now = timezone.now()
+    if value is None:
+        row = (
+            Subscription.objects.filter(user_id=user_id, status=Subscription.ACTIVE)
+            .values_list('plan_id', 'plan__plan_name', 'expires_at').first()
+        )
+        value = Entitlement(*row) if row else False
+        timeout = subscription_settings()['ENTITLEMENT_SECONDS']
+        if value:
+            timeout = max(1, min(timeout, int((value.expires_at - now).total_seconds()) + 1))
+        cache.set(key, value, timeout)
+    if not value or value.expires_at <= now:
+        return None
+    return value
+
+
+def subscription_required(view):
+    """View decorator: users without an active subscription are sent to the plan list."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if entitlement(request.user) is None:
+            messages.error(request, "This page needs an active subscription.")
+            return redirect('subscription_list')
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+# -------------------------
+# SIGNALS
+# -------------------------
+def transaction_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    batch = current_batch()
+    if batch is not None:
+        batch.subscribers.add(instance.user_id)
+        return
+    sync([instance.user_id])
+
+
+post_save.connect(transaction_changed, sender=Transaction, dispatch_uid='subscriptions_save')
+post_delete.connect(transaction_changed, sender=Transaction, dispatch_uid='subscriptions_delete')
@@ -0,0 +1,601 @@
+"""
+Deterministic synthetic data for benchmarks and staging.
+
+SEEDERS holds one builder per model, run in dependency order. A model's rows
+are split into fixed-size chunks and each chunk draws from its own Random
+seeded with (seed, model, chunk start), so the same seed and scale always
+produce the same rows whether the chunks run in this process or in a pool of
+worker processes. Everything is written with chunked bulk_create(): profiles
+are built in bulk instead of through the create_profiles signal, and
+feedback, payments and treatment plans are written alongside the
+appointments they belong to.
+
+bulk_create() skips the signals that maintain derived rows, so derive()
+runs once the builders are done: coupon redemptions on a share of the
+payments, subscriptions from the transactions, the ledger (back-dated) and
+revenue rollups from payments and transactions, and route plans for the
+next ROUTE_DAYS days of confirmed visits.
+
+Rows are tagged with `prefix` (usernames, names, descriptions, codes) so
+several datasets can share a database. All users share PASSWORD, hashed once.
+"""
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, time, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+import django
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.db import connections
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import ledger, routing, subscriptions
+from .models import (
+    AnalyticsReport, Appointment, AvailabilityRule, AvailabilitySlot, BlogArticle, ChatMessage, ClinicBranch,
+    CouponRedemption, DiscountCoupon, EmergencyRequest, Exercise, FAQ, Feedback, HomeExerciseReminder,
+    LedgerEntry, LocationCoverage, Notification, PatientProfile, Payment, ProgressTracking, RecoveryPredictor,
+    ReminderRule, RevenueRollup, RoutePlan, Service, Subscription, SubscriptionPlan, SupportTicket,
+    TherapistLeave, TherapistProfile, Transaction, TreatmentPlan, User,
+)
+from .batching import recompute_ratings
+from .recurrence import BATCH_SIZE, bulk_insert
+
+PASSWORD = 'synthetic-pass-123'
+CHUNK_SIZE = 10000
+
+SCALES = {
+    'small': {
+        'patients': 200, 'therapists': 20, 'admins': 2, 'support_staff': 2,
+        'services': 10, 'exercises': 50, 'subscription_plans': 4, 'coupons': 20, 'faqs': 20, 'branches': 5,
+        'predictors': 20, 'slots_per_therapist': 40, 'availability_rules_per_therapist': 1,
+        'coverage_per_therapist': 2, 'leaves': 20, 'notifications': 2000, 'chat_messages': 2000,
+        'support_tickets': 100, 'emergency_requests': 50, 'reminder_rules': 200, 'reminders': 2000,
+        'progress_records': 1000, 'blog_articles': 30, 'transactions': 200, 'analytics_reports': 40,
+        'appointments': 2000,
+    },
+    'medium': {
+        'patients': 2000, 'therapists': 200, 'admins': 5, 'support_staff': 10,
+        'services': 25, 'exercises': 200, 'subscription_plans': 6, 'coupons': 100, 'faqs': 60, 'branches': 20,
+        'predictors': 200, 'slots_per_therapist': 120, 'availability_rules_per_therapist': 2,
+        'coverage_per_therapist': 3, 'leaves': 400, 'notifications': 50000, 'chat_messages': 50000,
+        'support_tickets': 2000, 'emergency_requests': 1000, 'reminder_rules': 2000, 'reminders': 50000,
+        'progress_records': 20000, 'blog_articles': 300, 'transactions': 2000, 'analytics_reports': 1000,
+        'appointments': 50000,
+    },
+    'large': {
+        'patients': 20000, 'therapists': 1000, 'admins': 10, 'support_staff': 50,
+        'services': 50, 'exercises': 500, 'subscription_plans': 8, 'coupons': 500, 'faqs': 150, 'branches': 50,
+        'predictors': 1000, 'slots_per_therapist': 365, 'availability_rules_per_therapist': 2,
+        'coverage_per_therapist': 3, 'leaves': 5000, 'notifications': 1000000, 'chat_messages': 1000000,
+        'support_tickets': 20000, 'emergency_requests': 10000, 'reminder_rules': 20000, 'reminders': 500000,
+        'progress_records': 200000, 'blog_articles': 2000, 'transactions': 20000, 'analytics_reports': 12000,
+        'appointments': 1000000,
+    },
+}
+
+FEEDBACK_RATIO = 0.3          # share of completed appointments that got feedback
+PAYMENT_RATIO = 0.6           # share of appointments that were paid
+TREATMENT_PLAN_RATIO = 0.4    # share of completed / confirmed appointments with a plan
+COUPON_RATIO = 0.05           # share of payments that used a coupon
+ROUTE_DAYS = 7                # days of route plans derived from today
+
+ROLES = (('Patient', 'patients'), ('Therapist', 'therapists'), ('Admin', 'admins'),
+         ('SupportStaff', 'support_staff'))
+
+SERVICE_NAMES = ['Home Physiotherapy', 'Post-Surgery Rehab', 'Sports Injury', 'Back Pain Therapy',
+                 'Neuro Rehab', 'Geriatric Care', 'Pediatric Physio', 'Posture Correction']
+EXERCISE_NAMES = ['Quad Sets', 'Heel Slides', 'Straight Leg Raise', 'Clamshells', 'Bridges', 'Wall Squats',
+                  'Pendulum Swings', 'Chin Tucks', 'Cat-Cow Stretch', 'Calf Raises', 'Bird Dog', 'Step Ups']
+PLAN_NAMES = ['Basic', 'Standard', 'Premium', 'Family']
+SPECIALIZATIONS = ['Orthopedic', 'Neurological', 'Sports', 'Pediatric', 'Geriatric', 'Cardiopulmonary']
+CONDITIONS = ['Knee osteoarthritis', 'Lower back pain', 'Frozen shoulder', 'ACL reconstruction',
+              'Stroke recovery', 'Cervical spondylosis', 'Ankle sprain', 'Plantar fasciitis']
+CITY_CENTRES = {
+    'Mumbai': (19.076, 72.878), 'Delhi': (28.614, 77.209), 'Bengaluru': (12.972, 77.595),
+    'Pune': (18.520, 73.857), 'Hyderabad': (17.385, 78.487), 'Chennai': (13.083, 80.271),
+    'Kolkata': (22.573, 88.364), 'Ahmedabad': (23.023, 72.571),
+}
+CITIES = list(CITY_CENTRES)
+SLOT_TIMES = [time(hour) for hour in range(8, 20)]
+SLOT_DAYS = 60
+
+
+def username(prefix, role, index):
+    return f"{prefix}_{role.lower()}_{index}"
+
+
+def context(prefix):
+    """Ids of the rows later models point at, in a stable (natural key) order."""
+    ctx = {
+        key: list(User.objects.filter(username__startswith=f"{prefix}_{role.lower()}_")
+                  .order_by('username').values_list('id', flat=True))
+        for role, key in ROLES
+    }
+    ctx['services'] = list(
+        Service.objects.filter(description=f"Synthetic service ({prefix})")
+        .order_by('name').values_list('id', 'base_fee')
+    )
+    ctx['exercises'] = list(
+        Exercise.objects.filter(description=f"Synthetic exercise ({prefix})")
+        .order_by('name').values_list('id', 'name')
+    )
+    ctx['plans'] = list(
+        SubscriptionPlan.objects.filter(location=f"Synthetic ({prefix})")
+        .order_by('plan_name').values_list('id', 'price', 'duration_days')
+    )
+    ctx['branches'] = list(
+        ClinicBranch.objects.filter(name__startswith=f"{prefix} ").order_by('name').values_list('id', flat=True)
+    )
+    return ctx
+
+
+def coupon_prefix(prefix):
+    return prefix[:8].upper()
+
+
+def _aware(day, at):
+    return timezone.make_aware(datetime.combine(day, at))
+
+
+# -------------------------
+# BUILDERS
+# Each takes (ctx, rng, start, stop) and yields unsaved rows [start, stop)
+# of its model; _appointments writes its own rows and returns the counts.
+# -------------------------
+def _users(ctx, rng, start, stop):
+    bounds, total = [], 0
+    for role, key in ROLES:
+        bounds.append((total, total + ctx['counts'][key], role))
+        total += ctx['counts'][key]
+    for n in range(start, stop):
+        first, _, role = next(bound for bound in bounds if bound[0] <= n < bound[1])
+        name = username(ctx['prefix'], role, n - first)
+        city = rng.choice(CITIES)
+        lat, lng = CITY_CENTRES[city]
+        user = User(username=name, password=ctx['password'], role=role, email=f"{name}@example.com",
+                    first_name=role, last_name=str(n - first), is_staff=role == 'Admin',
+                    gender=rng.choice(['Male', 'Female', 'Other']),
+                    phone_number=f"9{rng.randrange(10 ** 9):09d}", address=city,
+                    latitude=round(lat + rng.uniform(-0.15, 0.15), 5),
+                    longitude=round(lng + rng.uniform(-0.15, 0.15), 5))
+        if role == 'Patient':
+            user.date_of_birth = ctx['today'] - timedelta(days=rng.randint(18 * 365, 85 * 365))
+        elif role == 'Therapist':
+            user.specialization = rng.choice(SPECIALIZATIONS)
+            user.years_of_experience = rng.randint(1, 30)
+            user.qualification = rng.choice(['BPT', 'MPT', 'DPT'])
+            user.languages_spoken = 'English, Hindi'
+            user.verification_status = rng.random() < 0.9
+        yield user
+
+
+def _patient_profiles(ctx, rng, start, stop):
+    for user_id in ctx['patients'][start:stop]:
+        condition = rng.choice(CONDITIONS)
+        yield PatientProfile(user_id=user_id, medical_history={'conditions': [condition]},
+                             ongoing_conditions=condition,
+                             preferred_time_slots={'morning': rng.random() < 0.5, 'evening': rng.random() < 0.5},
+                             emergency_contact=f"9{rng.randrange(10 ** 9):09d}")
+
+
+def _therapist_profiles(ctx, rng, start, stop):
+    for user_id in ctx['therapists'][start:stop]:
+        yield TherapistProfile(user_id=user_id, bio="Synthetic therapist",
+                               expertise_areas={'areas': rng.sample(SPECIALIZATIONS, 2)},
+                               visiting_radius_km=rng.choice([5, 10, 15, 20]),
+                               consultation_fee=Decimal(rng.randrange(300, 1500, 50)),
+                               branch_id=rng.choice(ctx['branches']) if ctx['branches'] else None)
+
+
+def _services(ctx, rng, start, stop):
+    for i in range(start, stop):
+        yield Service(name=f"{SERVICE_NAMES[i % len(SERVICE_NAMES)]} {i + 1}",
+                      description=f"Synthetic service ({ctx['prefix']})",
+                      duration_minutes=rng.choice([30, 45, 60]), base_fee=Decimal(rng.randrange(400, 2000, 50)))
+
+
+def _exercises(ctx, rng, start, stop):
+    for i in range(start, stop):
+        yield Exercise(name=f"{EXERCISE_NAMES[i % len(EXERCISE_NAMES)]} {i + 1}",
+                       description=f"Synthetic exercise ({ctx['prefix']})",
+                       repetition_count=rng.choice([8, 10, 12, 15]),
+                       difficulty_level=rng.choice(['beginner', 'intermediate', 'advanced']),
+                       focus_area=rng.choice(['Knee', 'Hip', 'Shoulder', 'Spine', 'Ankle', 'Neck']))
+
+
+def _subscription_plans(ctx, rng, start, stop):
+    for i in range(start, stop):
+        yield SubscriptionPlan(plan_name=f"{PLAN_NAMES[i % len(PLAN_NAMES)]} {i + 1}",
+                               price=Decimal(rng.randrange(999, 9999, 100)),
+                               duration_days=rng.choice([30, 90, 180, 365]),
+                               location=f"Synthetic ({ctx['prefix']})")
+
+
+def _coupons(ctx, rng, start, stop):
+    today = ctx['today']
+    for i in range(start, stop):
+        valid_from = today - timedelta(days=rng.randint(0, 90))
+        yield DiscountCoupon(code=f"{coupon_prefix(ctx['prefix'])}{i:05d}", description="Synthetic coupon",
+                             discount_percentage=rng.choice([5, 10, 15, 20, 25]), valid_from=valid_from,
+                             valid_to=valid_from + timedelta(days=rng.randint(30, 180)),
+                             min_amount=Decimal(rng.randrange(0, 1000, 100)), max_usage=rng.choice([1, 10, 100]),
+                             is_active=rng.random() < 0.8)
+
+
+def _faqs(ctx, rng, start, stop):
+    for i in range(start, stop):
+        yield FAQ(question=f"Synthetic question {i + 1} about {rng.choice(SERVICE_NAMES).lower()}?",
+                  answer="Synthetic answer.", category=rng.choice(['Booking', 'Payments', 'Therapy', 'Account']))
+
+
+def _branches(ctx, rng, start, stop):
+    for i in range(start, stop):
+        city = rng.choice(CITIES)
+        yield ClinicBranch(name=f"{ctx['prefix']} {city} {i + 1}", address=f"{i + 1} Main Road, {city}",
+                           contact_number=f"9{rng.randrange(10 ** 9):09d}", location=city,
+                           opening_hours="Mon-Sat: 9AM - 7PM | Sun: Closed")
+
+
+def _predictors(ctx, rng, start, stop):
+    for _ in range(start, stop):
+        yield RecoveryPredictor(patient_id=rng.choice(ctx['patients']), model_version='synthetic',
+                                input_features={'age_years': rng.randint(18, 85)},
+                                predicted_recovery_days=round(rng.uniform(7, 120), 1),
+                                confidence_score=round(rng.uniform(0.5, 0.99), 2))
+
+
+def _availability_rules(ctx, rng, start, stop):
+    per = ctx['counts']['availability_rules_per_therapist']
+    for n in range(start, stop):
+        begin = rng.choice([8, 9, 10, 14])
+        yield AvailabilityRule(therapist_id=ctx['therapists'][n // per], weekdays=rng.choice(['0,1,2,3,4', '0,2,4', '5,6']),
+                               start_date=ctx['today'], start_time=time(begin), end_time=time(begin + 4),
+                               slot_minutes=rng.choice([30, 45, 60]))
+
+
+def _slots(ctx, rng, start, stop):
+    count = min(ctx['counts']['slots_per_therapist'], SLOT_DAYS * len(SLOT_TIMES))
+    for therapist_id in ctx['therapists'][start:stop]:
+        # Distinct (day, time) pairs per therapist, as unique_together requires
+        for n in rng.sample(range(SLOT_DAYS * len(SLOT_TIMES)), count):
+            begin = SLOT_TIMES[n % len(SLOT_TIMES)]
+            yield AvailabilitySlot(therapist_id=therapist_id, date=ctx['today'] + timedelta(days=n // len(SLOT_TIMES)),
+                                   start_time=begin, end_time=time(begin.hour, 45), is_booked=rng.random() < 0.3)
+
+
+def _coverage(ctx, rng, start, stop):
+    per = ctx['counts']['coverage_per_therapist']
+    for n in range(start, stop):
+        city = rng.choice(CITIES)
+        yield LocationCoverage(therapist_id=ctx['therapists'][n // per], service_area_name=f"{city} zone {n % per + 1}",
+                               location=f"{rng.uniform(8, 30):.4f},{rng.uniform(68, 90):.4f}")
+
+
+def _leaves(ctx, rng, start, stop):
+    for _ in range(start, stop):
+        first = ctx['today'] + timedelta(days=rng.randint(-60, 90))
+        approved = rng.random() < 0.6
+        yield TherapistLeave(therapist_id=rng.choice(ctx['therapists']), from_date=first,
+                             to_date=first + timedelta(days=rng.randint(0, 5)), reason="Synthetic leave",
+                             is_approved=approved,
+                             approved_by_id=rng.choice(ctx['admins']) if approved and ctx['admins'] else None)
+
+
+def _notifications(ctx, rng, start, stop):
+    users = ctx['patients'] + ctx['therapists']
+    for n in range(start, stop):
+        category = rng.choice(['Reminder', 'Update', 'Promotion'])
+        yield Notification(user_id=rng.choice(users), title=f"{category} {n + 1}", message="Synthetic notification",
+                           category=category, is_read=rng.random() < 0.7)
+
+
+def _chat_messages(ctx, rng, start, stop):
+    for _ in range(start, stop):
+        pair = [rng.choice(ctx['patients']), rng.choice(ctx['therapists'])]
+        if rng.random() < 0.5:
+            pair.reverse()
+        yield ChatMessage(sender_id=pair[0], receiver_id=pair[1], message_text="Synthetic message")
+
+
+def _support_tickets(ctx, rng, start, stop):
+    for _ in range(start, stop):
+        status = rng.choice(['Open', 'InProgress', 'Closed'])
+        yield SupportTicket(user_id=rng.choice(ctx['patients']), status=status,
+                            issue_category=rng.choice(['Payment', 'Booking', 'Technical', 'Other']),
+                            description="Synthetic ticket",
+                            response_message="Resolved" if status == 'Closed' else None)
+
+
+def _emergency_requests(ctx, rng, start, stop):
+    for _ in range(start, stop):
+        status = rng.choice(['Open', 'InProgress', 'Resolved'])
+        yield EmergencyRequest(patient_id=rng.choice(ctx['patients']), condition_description=rng.choice(CONDITIONS),
+                               status=status,
+                               assigned_therapist_id=None if status == 'Open' else rng.choice(ctx['therapists']),
+                               response_time=None if status == 'Open' else timedelta(minutes=rng.randint(5, 240)))
+
+
+def _reminder_rules(ctx, rng, start, stop):
+    for _ in range(start, stop):
+        yield ReminderRule(patient_id=rng.choice(ctx['patients']), exercise_id=rng.choice(ctx['exercises'])[0],
+                           start_date=ctx['today'], end_date=ctx['today'] + timedelta(weeks=rng.choice([2, 4, 6])),
+                           time_of_day=time(rng.choice([7, 8, 18, 20])),
+                           sent_via=rng.choice(['SMS', 'Email', 'WhatsApp']))
+
+
+def _reminders(ctx, rng, start, stop):
+    for _ in range(start, stop):
+        due = _aware(ctx['today'] + timedelta(days=rng.randint(-30, 30)), time(rng.choice([7, 8, 18, 20])))
+        sent = due.date() < ctx['today']
+        yield HomeExerciseReminder(patient_id=rng.choice(ctx['patients']), exercise_id=rng.choice(ctx['exercises'])[0],
+                                   reminder_time=due, is_completed=sent and rng.random() < 0.6,
+                                   sent_via=rng.choice(['SMS', 'Email', 'WhatsApp']),
+                                   delivery_status='Sent' if sent else 'Pending', sent_at=due if sent else None)
+
+
+def _progress_records(ctx, rng, start, stop):
+    for _ in range(start, stop):
+        yield ProgressTracking(patient_id=rng.choice(ctx['patients']), exercise_id=rng.choice(ctx['exercises'])[0],
+                               completion_percentage=round(rng.uniform(0, 100), 1), feedback_notes="Synthetic")
+
+
+def _blog_articles(ctx, rng, start, stop):
+    for i in range(start, stop):
+        published = rng.random() < 0.8
+        slug = f"{ctx['prefix']}-article-{i + 1}"
+        yield BlogArticle(author_id=rng.choice(ctx['therapists']), title=f"Recovering from {rng.choice(CONDITIONS)} {i + 1}",
+                          slug=slug, content="Synthetic article body. " * 20,
+                          category=rng.choice(['Rehab', 'Fitness', 'Wellness']), tags=slug,
+                          is_published=published, published_at=timezone.now() if published else None)
+
+
+def _transactions(ctx, rng, start, stop):
+    now = timezone.now()
+    for n in range(start, stop):
+        plan_id, price, days = rng.choice(ctx['plans'])
+        yield Transaction(user_id=rng.choice(ctx['patients']), plan_id=plan_id, amount=price,
+                          payment_mode=rng.choice(['UPI', 'Card', 'NetBanking', 'Wallet']),
+                          transaction_id=f"{ctx['prefix']}_{ctx['seed']}_sub_{n}",
+                          expires_at=now + timedelta(days=days - rng.randint(0, days)))
+
+
+def _analytics_reports(ctx, rng, start, stop):
+    for _ in range(start, stop):
+        yield AnalyticsReport(therapist_id=rng.choice(ctx['therapists']), total_sessions=rng.randint(0, 200),
+                              avg_rating=round(rng.uniform(3, 5), 2),
+                              revenue_generated=Decimal(rng.randrange(0, 200000, 500)),
+                              patient_retention_rate=round(rng.uniform(0.2, 0.9), 2),
+                              popular_services=rng.choice(SERVICE_NAMES)[:20])
+
+
+def _appointments(ctx, rng, start, stop):
+    """Appointments plus the feedback, payments and treatment plans that hang off them."""
+    today = ctx['today']
+    paid = []
+    appointments = []
+    for _ in range(start, stop):
+        day = today + timedelta(days=rng.randint(-365, 60))
+        if day < today:
+            status = rng.choices(['Completed', 'Cancelled'], weights=[9, 1])[0]
+        else:
+            status = rng.choice(['Pending', 'Confirmed'])
+        service_id, fee = rng.choice(ctx['services'])
+        is_paid = status != 'Cancelled' and rng.random() < PAYMENT_RATIO
+        paid.append((is_paid, fee))
+        appointments.append(Appointment(
+            patient_id=rng.choice(ctx['patients']), therapist_id=rng.choice(ctx['therapists']), service_id=service_id,
+            scheduled_date=day, scheduled_time=rng.choice(SLOT_TIMES), booking_status=status,
+            payment_status='Completed' if is_paid else 'Pending',
+        ))
+    # The backend returns primary keys from bulk_create, so the children below can point at them
+    Appointment.objects.bulk_create(appointments, batch_size=BATCH_SIZE)
+
+    feedback, payments, plans = [], [], []
+    for appointment, (is_paid, fee) in zip(appointments, paid):
+        status = appointment.booking_status
+        if 'Feedback' in ctx['models'] and status == 'Completed' and rng.random() < FEEDBACK_RATIO:
+            feedback.append(Feedback(patient_id=appointment.patient_id, therapist_id=appointment.therapist_id,
+                                     appointment_id=appointment.pk, comments="Synthetic feedback",
+                                     rating=rng.choices([1, 2, 3, 4, 5], weights=[1, 1, 3, 6, 8])[0]))
+        if 'Payment' in ctx['models'] and is_paid:
+            payments.append(Payment(appointment_id=appointment.pk, amount=fee,
+                                    mode=rng.choice(['Cash', 'UPI', 'Card', 'Wallet']), payment_status='Completed',
+                                    transaction_id=f"{ctx['prefix']}_{ctx['seed']}_{appointment.pk}"))
+        if ('TreatmentPlan' in ctx['models'] and ctx['exercises'] and status in ('Completed', 'Confirmed')
+                and rng.random() < TREATMENT_PLAN_RATIO):
+            names = [name for _, name in rng.sample(ctx['exercises'], min(3, len(ctx['exercises'])))]
+            plans.append(TreatmentPlan(appointment_id=appointment.pk, prescribed_by_id=appointment.therapist_id,
+                                       exercises_list='\n'.join(names), follow_up_required=rng.random() < 0.3,
+                                       status='completed' if status == 'Completed' else 'active'))
+    return {
+        'Appointment': len(appointments),
+        'Feedback': bulk_insert(Feedback, feedback),
+        'Payment': bulk_insert(Payment, payments),
+        'TreatmentPlan': bulk_insert(TreatmentPlan, plans),
+    }
+
+
+# (model, units to generate for the scale, builder), in dependency order
+SEEDERS = [
+    (User, lambda counts: sum(counts[key] for _, key in ROLES), _users),
+    (PatientProfile, lambda counts: counts['patients'], _patient_profiles),
+    (ClinicBranch, lambda counts: counts['branches'], _branches),
+    (TherapistProfile, lambda counts: counts['therapists'], _therapist_profiles),
+    (Service, lambda counts: counts['services'], _services),
+    (Exercise, lambda counts: counts['exercises'], _exercises),
+    (SubscriptionPlan, lambda counts: counts['subscription_plans'], _subscription_plans),
+    (DiscountCoupon, lambda counts: counts['coupons'], _coupons),
+    (FAQ, lambda counts: counts['faqs'], _faqs),
+    (RecoveryPredictor, lambda counts: counts['predictors'], _predictors),
+    (AvailabilityRule, lambda counts: counts['therapists'] * counts['availability_rules_per_therapist'],
+     _availability_rules),
+    (AvailabilitySlot, lambda counts: counts['therapists'], _slots),
+    (LocationCoverage, lambda counts: counts['therapists'] * counts['coverage_per_therapist'], _coverage),
+    (TherapistLeave, lambda counts: counts['leaves'], _leaves),
+    (Notification, lambda counts: counts['notifications'], _notifications),
+    (ChatMessage, lambda counts: counts['chat_messages'], _chat_messages),
+    (SupportTicket, lambda counts: counts['support_tickets'], _support_tickets),
+    (EmergencyRequest, lambda counts: counts['emergency_requests'], _emergency_requests),
+    (ReminderRule, lambda counts: counts['reminder_rules'], _reminder_rules),
+    (HomeExerciseReminder, lambda counts: counts['reminders'], _reminders),
+    (ProgressTracking, lambda counts: counts['progress_records'], _progress_records),
+    (BlogArticle, lambda counts: counts['blog_articles'], _blog_articles),
+    (Transaction, lambda counts: counts['transactions'], _transactions),
+    (AnalyticsReport, lambda counts: counts['analytics_reports'], _analytics_reports),
+    (Appointment, lambda counts: counts['appointments'], _appointments),
+]
+# Written by the Appointment builder rather than on their own
+CHILD_MODELS = (Feedback, Payment, TreatmentPlan)
+# Written by derive() from the rows above, in one pass each
+DERIVED_MODELS = (CouponRedemption, Subscription, LedgerEntry, RevenueRollup, RoutePlan)
+ALL_MODELS = [model for model, _, _ in SEEDERS] + list(CHILD_MODELS) + list(DERIVED_MODELS)
+BENCHMARK_MODELS = [User, PatientProfile, TherapistProfile, Service, AvailabilitySlot, Appointment, Feedback, Payment]
+
+
+# -------------------------
+# RUNNER
+# -------------------------
+_context = {}
+
+
+def _init_worker(ctx):
+    if not apps.ready:
+        django.setup()
+    _context.clear()
+    _context.update(ctx)
+
+
+def _run_chunk(index, start, stop):
+    model, _, build = SEEDERS[index]
+    rng = random.Random(f"{_context['seed']}:{model.__name__}:{start}")
+    rows = build(_context, rng, start, stop)
+    if isinstance(rows, dict):
+        return rows
+    # Slots are sampled per therapist, but may still clash with rows already in the table
+    return {model.__name__: bulk_insert(model, rows, ignore_conflicts=model is AvailabilitySlot)}
+
+
+def _run_chunks(ctx, chunks, workers):
+    if workers <= 1 or len(chunks) <= 1:
+        _init_worker(ctx)
+        for chunk in chunks:
+            yield _run_chunk(*chunk)
+        return
+    # Workers must open their own database connections
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(ctx,)) as pool:
+        for future in as_completed([pool.submit(_run_chunk, *chunk) for chunk in chunks]):
+            yield future.result()
+
+
+def seed_dataset(scale, seed=0, prefix='synthetic', models=None, workers=1, chunk_size=CHUNK_SIZE, today=None,
+                 report=None):
+    """
+    Write one dataset. `scale` is a SCALES key or a dict with the same keys;
+    `models` limits the run to those models (default: all of them).
+    With workers > 1 each model's chunks are spread over a process pool, so
+    the call must not run inside a transaction. `report(model_name, count)`
+    is called as each chunk lands. Returns {model name: rows written}.
+    """
+    counts = SCALES[scale] if isinstance(scale, str) else scale
+    selected = set(models or ALL_MODELS)
+    report = report or (lambda name, count: None)
+    ctx = {
+        'prefix': prefix, 'seed': seed, 'counts': counts, 'today': today or date.today(),
+        'password': make_password(PASSWORD), 'models': {model.__name__ for model in selected},
+    }
+    written = {}
+    for index, (model, units, _) in enumerate(SEEDERS):
+        if model not in selected:
+            continue
+        ctx.update(context(prefix))
+        total = units(counts)
+        chunks = [(index, start, min(start + chunk_size, total)) for start in range(0, total, chunk_size)]
+        for result in _run_chunks(ctx, chunks, workers):
+            for name, count in result.items():
+                written[name] = written.get(name, 0) + count
+                report(name, count)
+    if 'Feedback' in written:
+        # bulk_create skips update_therapist_rating; one set-based UPDATE instead
+        recompute_ratings(context(prefix)['therapists'])
+    for name, count in derive(selected, prefix, seed, ctx['today']).items():
+        written[name] = count
+        report(name, count)
+    return written
+
+
+def _chunks(ids, size=BATCH_SIZE):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def _redeem_coupons(prefix, seed):
+    """
+    Apply an active coupon to COUPON_RATIO of the dataset's payments, as
+    coupons.redeem() would: within each coupon's max_usage and min_amount,
+    discounting the payment. Runs in-process over all payments at once, since
+    usage limits span chunks. Returns the number of redemptions.
+    """
+    coupons = DiscountCoupon.objects.filter(code__startswith=coupon_prefix(prefix), description="Synthetic coupon")
+    active = list(coupons.filter(is_active=True).order_by('code'))
+    if not active:
+        return 0
+    rng = random.Random(f"{seed}:CouponRedemption")
+    left = {coupon.pk: coupon.max_usage - coupon.usage_count for coupon in active}
+    redemptions, discounted = [], []
+    payments = (Payment.objects.filter(transaction_id__startswith=f"{prefix}_{seed}_", coupon_redemption__isnull=True)
+                .order_by('id').values_list('id', 'amount', 'appointment__patient_id'))
+    for pk, amount, patient_id in payments.iterator(chunk_size=BATCH_SIZE):
+        if rng.random() >= COUPON_RATIO:
+            continue
+        coupon = rng.choice(active)
+        if left[coupon.pk] <= 0 or amount < coupon.min_amount:
+            continue
+        discount = (amount * coupon.discount_percentage / 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        left[coupon.pk] -= 1
+        redemptions.append(CouponRedemption(coupon_id=coupon.pk, payment_id=pk, user_id=patient_id,
+                                            original_amount=amount, discount_amount=discount))
+        discounted.append(Payment(pk=pk, amount=amount - discount))
+    written = bulk_insert(CouponRedemption, redemptions)
+    Payment.objects.bulk_update(discounted, ['amount'], batch_size=BATCH_SIZE)
+    used = CouponRedemption.objects.filter(coupon_id=OuterRef('pk')).values('coupon_id').annotate(n=Count('id'))
+    coupons.update(usage_count=Coalesce(Subquery(used.values('n')), 0))
+    return written
+
+
+def derive(models, prefix, seed, today):
+    """
+    Fill in what bulk_create() skipped for the dataset tagged `prefix`: the
+    `models` subset of DERIVED_MODELS, in order, so the ledger sees the
+    discounted payment amounts. Returns {model name: rows derived}.
+    """
+    ids = context(prefix)
+    written = {}
+    if CouponRedemption in models:
+        written['CouponRedemption'] = _redeem_coupons(prefix, seed)
+    if Subscription in models:
+        written['Subscription'] = sum(subscriptions.sync(chunk) for chunk in _chunks(ids['patients']))
+    if LedgerEntry in models:
+        tag = f"{prefix}_{seed}_"
+        payments = Payment.objects.filter(transaction_id__startswith=tag).order_by('id').values_list('id', flat=True)
+        transactions = (Transaction.objects.filter(transaction_id__startswith=f"{tag}sub_")
+                        .order_by('id').values_list('id', flat=True))
+        journals = sum(ledger.sync(payments=chunk, backdate=True, rollup=False) for chunk in _chunks(payments))
+        journals += sum(ledger.sync(transactions=chunk, backdate=True, rollup=False)
+                        for chunk in _chunks(transactions))
+        written['LedgerEntry'] = journals * 2
+    if RevenueRollup in models:
+        written['RevenueRollup'] = ledger.rebuild_rollups()
+    if RoutePlan in models:
+        written['RoutePlan'] = sum(routing.plan_fleet(today + timedelta(days=n), workers=1)
+                                   for n in range(ROUTE_DAYS))
+    return written
+
+
+def generate(scale, seed=0, prefix='synthetic', report=None):
+    """The subset the booking benchmark needs, written in-process (safe inside a transaction)."""
+    return seed_dataset(scale, seed=seed, prefix=prefix, models=BENCHMARK_MODELS, report=report)
@@ -1,3 +1,1305 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    api, autocomplete, batching, cohorts, coupons, ledger, loadtest, metrics, querylog, recovery, recurrence, reminders,
+    routing, schedule, search, subscriptions, synthetic, throttle, timeline, training, views,
+)
+from .batching import batched_signals
+from .forms import AvailabilityRuleForm, PaymentForm, TreatmentPlanForm
+from .models import (
+    FAQ, Appointment, AvailabilityRule, AvailabilitySlot, BlogArticle, CouponRedemption, DiscountCoupon, Exercise,
+    HomeExerciseReminder, LedgerEntry, Notification, PatientProfile, Payment, ProgressTracking, RecoveryPredictor,
+    ReminderRule, RevenueRollup, RoutePlan, Service, Subscription, SubscriptionPlan, TherapistLeave, TherapistProfile,
+    Transaction, TreatmentPlan, User,
+)
+
+
+class FailingChannel(reminders.BaseChannel):
+    """Rejects every reminder and counts the calls."""
+
+    sent = 0
+
+    def send_batch(self, rows):
+        FailingChannel.sent += len(rows)
+        return {row['id']: 'gateway down' for row in rows}
+
+
+# -------------------------
+# REMINDER SCHEDULER
+# -------------------------
+@override_settings(
+    REMINDER_CHANNELS={'SMS': {'BACKEND': 'base.tests.FailingChannel'}},
+    REMINDER_SCHEDULER={'RETRY_SECONDS': 0},
+)
+class ReminderSchedulerTests(TestCase):
+    def setUp(self):
+        reminders._channels.clear()
+        FailingChannel.sent = 0
+        patient = User.objects.create(username='patient', role='Patient')
+        exercise = Exercise.objects.create(name='Squats')
+        self.reminder = HomeExerciseReminder.objects.create(
+            patient=patient, exercise=exercise, sent_via='SMS',
+            reminder_time=timezone.now() - timedelta(minutes=1),
+        )
+
+    def tearDown(self):
+        reminders._channels.clear()
+
+    def deliver(self, max_attempts, runs=10):
+        scheduler = reminders.ReminderScheduler(max_attempts=max_attempts, workers=1)
+        try:
+            for _ in range(runs):
+                scheduler.run_once()
+        finally:
+            scheduler.close()
+        self.reminder.refresh_from_db()
+
+    def test_failed_after_max_attempts_deliveries(self):
+        for max_attempts in (1, 2, 3):
+            with self.subTest(max_attempts=max_attempts):
+                FailingChannel.sent = 0
+                HomeExerciseReminder.objects.filter(pk=self.reminder.pk).update(
+                    delivery_status='Pending', attempts=0, claimed_at=None,
+                )
+                self.deliver(max_attempts)
+                self.assertEqual(FailingChannel.sent, max_attempts)
+                self.assertEqual(self.reminder.attempts, max_attempts)
+                self.assertEqual(self.reminder.delivery_status, 'Failed')
+                self.assertEqual(self.reminder.last_error, 'gateway down')
+
+
+# -------------------------
+# RECURRENCE RULES
+# -------------------------
+class RuleExpansionTests(TestCase):
+    def setUp(self):
+        self.therapist = User.objects.create(username='therapist', role='Therapist')
+        self.monday = date(2030, 1, 7)
+
+    def rule(self, **fields):
+        return AvailabilityRule.objects.create(**{
+            'therapist': self.therapist, 'weekdays': '0,2', 'start_time': time(9), 'end_time': time(12),
+            'slot_minutes': 45, 'start_date': self.monday, **fields,
+        })
+
+    def test_slots_fill_the_window_on_rule_weekdays(self):
+        rule = self.rule()
+        created = recurrence.expand_rule(rule, until=self.monday + timedelta(days=6))
+        slots = AvailabilitySlot.objects.filter(rule=rule).order_by('date', 'start_time')
+        self.assertEqual(created, 8)  # Mon + Wed, 09:00-12:00 in four 45-minute slots
+        self.assertEqual({slot.date.weekday() for slot in slots}, {0, 2})
+        self.assertEqual((slots[0].start_time, slots[3].end_time), (time(9), time(12)))
+
+    def test_expansion_only_adds_the_newly_uncovered_days(self):
+        rule = self.rule()
+        recurrence.expand_rule(rule, until=self.monday + timedelta(days=6))
+        self.assertEqual(recurrence.expand_rule(rule, until=self.monday + timedelta(days=6)), 0)
+        self.assertEqual(recurrence.expand_rule(rule, until=self.monday + timedelta(days=13)), 8)
+        self.assertEqual(AvailabilitySlot.objects.filter(rule=rule).count(), 16)
+        rule.refresh_from_db()
+        self.assertEqual(rule.expanded_until, self.monday + timedelta(days=13))
+
+    def test_approved_leave_days_are_skipped(self):
+        TherapistLeave.objects.create(therapist=self.therapist, from_date=self.monday, to_date=self.monday,
+                                      reason='Leave', is_approved=True)
+        rule = self.rule()
+        self.assertEqual(recurrence.expand_rule(rule, until=self.monday + timedelta(days=6)), 4)
+
+    def test_reminders_one_per_matching_day(self):
+        patient = User.objects.create(username='patient', role='Patient')
+        rule = ReminderRule.objects.create(
+            patient=patient, exercise=Exercise.objects.create(name='Squats'), weekdays='0,1,2,3,4,5,6',
+            time_of_day=time(8), start_date=self.monday, end_date=self.monday + timedelta(days=2),
+        )
+        self.assertEqual(recurrence.expand_rule(rule, until=self.monday + timedelta(days=30)), 3)
+        self.assertEqual(HomeExerciseReminder.objects.filter(rule=rule).count(), 3)
+
+    def test_back_dated_rules_start_today(self):
+        rule = self.rule()
+        today = self.monday + timedelta(days=7)
+        dates = list(recurrence.iter_rule_dates(rule, self.monday + timedelta(days=13), today=today))
+        self.assertEqual(dates, [today, today + timedelta(days=2)])
+
+        patient = User.objects.create(username='patient', role='Patient')
+        rule = ReminderRule.objects.create(patient=patient, exercise=Exercise.objects.create(name='Squats'),
+                                           weekdays='0,1,2,3,4,5,6', time_of_day=time(8),
+                                           start_date=timezone.localdate() - timedelta(days=30))
+        recurrence.expand_rule(rule, until=timezone.localdate() + timedelta(days=2))
+        reminders_made = HomeExerciseReminder.objects.filter(rule=rule)
+        self.assertEqual(reminders_made.count(), 3)
+        self.assertEqual(min(r.reminder_time for r in reminders_made).date(), timezone.localdate())
+
+    def test_created_count_skips_slots_that_already_exist(self):
+        AvailabilitySlot.objects.create(therapist=self.therapist, date=self.monday, start_time=time(9),
+                                        end_time=time(9, 45))
+        rule = self.rule()
+        self.assertEqual(recurrence.expand_rule(rule, until=self.monday + timedelta(days=6)), 7)
+
+    def test_zero_slot_length_is_rejected(self):
+        form = AvailabilityRuleForm(data={
+            'therapist': self.therapist.pk, 'weekdays': ['0'], 'start_time': '09:00', 'end_time': '12:00',
+            'slot_minutes': 0, 'start_date': self.monday.isoformat(), 'is_active': True,
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('slot_minutes', form.errors)
+
+        rule = self.rule(slot_minutes=0)  # bypassing validation must not loop forever
+        with self.assertRaises(ValueError):
+            recurrence.expand_rule(rule, until=self.monday + timedelta(days=6))
+        self.assertFalse(AvailabilitySlot.objects.filter(rule=rule).exists())
+
+
+class RuleViewPermissionTests(TestCase):
+    def setUp(self):
+        service = Service.objects.create(name='Rehab', description='', duration_minutes=45, base_fee=500)
+        self.therapist = User.objects.create(username='therapist', role='Therapist')
+        self.patient = User.objects.create(username='patient', role='Patient')
+        self.stranger = User.objects.create(username='stranger', role='Patient')
+        Appointment.objects.create(patient=self.patient, therapist=self.therapist, service=service,
+                                   scheduled_date=date(2030, 1, 7), scheduled_time=time(9))
+        self.exercise = Exercise.objects.create(name='Squats')
+        self.rule = ReminderRule.objects.create(patient=self.patient, exercise=self.exercise, weekdays='0',
+                                                time_of_day=time(8), start_date=date(2030, 1, 7))
+
+    def client_for(self, user):
+        client = Client()
+        client.force_login(user)
+        return client
+
+    def rule_data(self, patient):
+        return {'patient': patient.pk, 'exercise': self.exercise.pk, 'time_of_day': '08:00', 'weekdays': ['0'],
+                'sent_via': 'WhatsApp', 'start_date': '2030-01-07', 'is_active': 'on'}
+
+    def test_deletes_need_post_and_ownership(self):
+        url = reverse('reminder_rule_delete', args=[self.rule.pk])
+        self.assertEqual(self.client_for(self.patient).get(url).status_code, 405)
+        self.assertEqual(self.client_for(self.stranger).post(url).status_code, 404)
+        self.assertTrue(ReminderRule.objects.filter(pk=self.rule.pk).exists())
+        self.client_for(self.therapist).post(url)
+        self.assertFalse(ReminderRule.objects.filter(pk=self.rule.pk).exists())
+
+        rule = AvailabilityRule.objects.create(therapist=self.therapist, weekdays='0', start_time=time(9),
+                                               end_time=time(12), start_date=date(2030, 1, 7))
+        url = reverse('availability_rule_delete', args=[rule.pk])
+        self.assertEqual(self.client_for(self.therapist).get(url).status_code, 405)
+        self.assertTrue(AvailabilityRule.objects.filter(pk=rule.pk).exists())
+
+    def test_rules_can_only_be_created_for_own_patients(self):
+        url = reverse('reminder_rule_create')
+        response = self.client_for(self.therapist).post(url, self.rule_data(self.stranger))
+        self.assertIn('patient', response.context['form'].errors)
+        self.client_for(self.stranger).post(url, self.rule_data(self.patient))  # patients only get their own
+        self.assertEqual(ReminderRule.objects.get(exercise=self.exercise, patient=self.stranger).weekdays, '0')
+        self.assertEqual(ReminderRule.objects.filter(patient=self.patient).count(), 1)
+
+    def test_list_is_scoped(self):
+        response = self.client_for(self.stranger).get(reverse('reminder_rule_list'))
+        self.assertEqual(list(response.context['rules']), [])
+        response = self.client_for(self.therapist).get(reverse('reminder_rule_list'))
+        self.assertEqual(list(response.context['rules']), [self.rule])
+
+
+# -------------------------
+# SEARCH
+# -------------------------
+class SearchTests(TestCase):
+    def setUp(self):
+        search._backend = None
+        self.addCleanup(setattr, search, '_backend', None)
+        self.press = Exercise.objects.create(name='Shoulder press', description='Overhead press with bands')
+        FAQ.objects.create(question='Do I need equipment?', answer='A resistance band for the shoulder work.',
+                           category='General')
+        author = User.objects.create(username='author', role='Therapist')
+        BlogArticle.objects.create(author=author, title='Shoulder draft', slug='draft', content='Not yet',
+                                   category='Blog', tags='draft', is_published=False)
+
+    def test_index_follows_saves_and_deletes(self):
+        hits = search.search('shoul')  # the last token matches as a prefix
+        self.assertEqual({(hit['doc_type'], hit['object_id']) for hit in hits},
+                         {('exercise', self.press.pk), ('faq', FAQ.objects.get().pk)})
+        self.assertEqual(hits[0]['doc_type'], 'exercise')  # title matches rank first
+        self.assertIn('<mark>Shoulder</mark>', hits[0]['title_html'])
+
+        self.press.name = 'Wall slide'
+        self.press.save()
+        self.assertEqual(search.search('wall', doc_types=['exercise'])[0]['object_id'], self.press.pk)
+        self.press.delete()
+        self.assertEqual([hit['doc_type'] for hit in search.search('shoulder')], ['faq'])
+
+    def test_other_databases_fall_back_to_model_lookups(self):
+        search._backend = None
+        with mock.patch.dict(search.VENDOR_BACKENDS, clear=True):  # a database without full-text support
+            self.assertIsInstance(search.get_backend(), search.ModelSearchBackend)
+            Exercise.objects.create(name='Shoulder shrug')  # the index signal must not touch the FTS table
+            hits = search.search('shoulder')
+        self.assertEqual([hit['doc_type'] for hit in hits], ['exercise', 'exercise', 'faq'])
+        self.assertEqual(search.search('band press', doc_types=['exercise'])[0]['object_id'], self.press.pk)
+
+
+# -------------------------
+# FORM CHOICE SCOPES
+# -------------------------
+class AppointmentChoiceScopeTests(TestCase):
+    def setUp(self):
+        service = Service.objects.create(name='Rehab', description='', duration_minutes=45, base_fee=500)
+        self.therapist = User.objects.create(username='therapist', role='Therapist')
+        self.other_therapist = User.objects.create(username='other_therapist', role='Therapist')
+        self.patient = User.objects.create(username='patient', role='Patient')
+        self.other_patient = User.objects.create(username='other_patient', role='Patient')
+        self.admin = User.objects.create(username='admin', role='Admin')
+        self.mine = Appointment.objects.create(patient=self.patient, therapist=self.therapist, service=service,
+                                               scheduled_date=date(2030, 1, 7), scheduled_time=time(9))
+        self.theirs = Appointment.objects.create(patient=self.other_patient, therapist=self.other_therapist,
+                                                 service=service, scheduled_date=date(2030, 1, 7),
+                                                 scheduled_time=time(10))
+
+    def appointments(self, form_class, user):
+        return set(form_class(user=user).fields['appointment'].queryset)
+
+    def test_payment_form_only_accepts_the_patients_own_appointments(self):
+        self.assertEqual(self.appointments(PaymentForm, self.patient), {self.mine})
+        form = PaymentForm({'appointment': self.theirs.pk, 'amount': '500', 'mode': 'UPI',
+                            'payment_status': 'Pending', 'transaction_id': 'txn-1'}, user=self.patient)
+        self.assertFalse(form.is_valid())
+        self.assertIn('appointment', form.errors)
+
+    def test_treatment_plan_form_scoped_to_the_therapist(self):
+        self.assertEqual(self.appointments(TreatmentPlanForm, self.therapist), {self.mine})
+        self.assertEqual(self.appointments(TreatmentPlanForm, self.admin), {self.mine, self.theirs})
+
+
+# -------------------------
+# BATCHED SIGNALS
+# -------------------------
+class BatchedSignalsTests(TestCase):
+    def test_profiles_created_once_the_block_exits(self):
+        with batched_signals():
+            therapist = User.objects.create(username='therapist', role='Therapist')
+            patient = User.objects.create(username='patient', role='Patient')
+            self.assertFalse(TherapistProfile.objects.exists())
+        self.assertTrue(TherapistProfile.objects.filter(user=therapist).exists())
+        self.assertTrue(PatientProfile.objects.filter(user=patient).exists())
+
+    def test_rows_rolled_back_by_an_inner_atomic_are_skipped(self):
+        with self.assertRaises(RuntimeError):
+            with batched_signals():
+                kept = User.objects.create(username='kept', role='Patient')
+                with transaction.atomic():
+                    User.objects.create(username='rolled_back', role='Patient')
+                    raise RuntimeError('boom')
+        self.assertEqual(list(PatientProfile.objects.values_list('user', flat=True)), [kept.pk])
+
+    def test_a_failing_flush_never_replaces_the_original_error(self):
+        with mock.patch.object(batching, 'create_missing_profiles', side_effect=ValueError('flush failed')):
+            with self.assertLogs('base.batching', 'ERROR'), self.assertRaisesMessage(RuntimeError, 'boom'):
+                with batched_signals():
+                    User.objects.create(username='patient', role='Patient')
+                    raise RuntimeError('boom')
+        self.assertTrue(User.objects.filter(username='patient').exists())
+
+
+# -------------------------
+# CALENDAR SNAPSHOTS
+# -------------------------
+class ScheduleSnapshotTests(TestCase):
+    def setUp(self):
+        self.therapist = User.objects.create(username='therapist', role='Therapist')
+        self.patient = User.objects.create(username='patient', role='Patient')
+        self.service = Service.objects.create(name='Rehab', description='', duration_minutes=45, base_fee=500)
+        self.day = timezone.localdate() + timedelta(days=3)
+        self.next_day = self.day + timedelta(days=1)
+
+    def stored(self):
+        return TherapistProfile.objects.get(user=self.therapist).daily_schedule['days']
+
+    def test_saves_patch_the_snapshot_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            AvailabilitySlot.objects.create(therapist=self.therapist, date=self.day, start_time=time(9),
+                                            end_time=time(9, 45))
+            Appointment.objects.create(patient=self.patient, therapist=self.therapist, service=self.service,
+                                       scheduled_date=self.day, scheduled_time=time(9))
+            TherapistLeave.objects.create(therapist=self.therapist, from_date=self.next_day,
+                                          to_date=self.next_day + timedelta(days=1), reason='Conference',
+                                          is_approved=True)
+        days = self.stored()
+        entry = days[self.day.isoformat()]
+        self.assertEqual(entry['slots'][0][:3], ['09:00', '09:45', False])
+        self.assertEqual(entry['appointments'][0][2:], ['patient', 'Rehab', 'Pending'])
+        self.assertEqual(days[self.next_day.isoformat()]['leave'], {'reason': 'Conference', 'approved': True})
+        self.assertEqual(schedule.get_days(self.therapist.pk, self.day, self.day), {self.day.isoformat(): entry})
+
+    def test_moving_a_row_clears_its_old_day_without_reading_it_back(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(patient=self.patient, therapist=self.therapist, service=self.service,
+                                       scheduled_date=self.day, scheduled_time=time(9))
+        appointment = Appointment.objects.get()
+        appointment.scheduled_date = self.next_day
+        selects = []
+
+        def record(execute, sql, params, many, context):
+            if sql.startswith('SELECT') and 'base_appointment' in sql:
+                selects.append(sql)
+            return execute(sql, params, many, context)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with connection.execute_wrapper(record):
+                appointment.save()
+        self.assertEqual(selects, [])  # the old date came from post_init, not a pre_save query
+        self.assertTrue(callbacks)
+        days = self.stored()
+        self.assertEqual(days[self.day.isoformat()]['appointments'], [])
+        self.assertEqual(len(days[self.next_day.isoformat()]['appointments']), 1)
+
+
+# -------------------------
+# ROUTE PLANNING
+# -------------------------
+class RoutePlanningTests(TestCase):
+    def setUp(self):
+        self.day = date(2030, 1, 7)
+        self.service = Service.objects.create(name='Home visit', description='', duration_minutes=45, base_fee=500)
+        self.therapist = User.objects.create(username='therapist', role='Therapist', latitude=12.97, longitude=77.59)
+
+    def visit(self, name, at, lat, lng):
+        patient = User.objects.create(username=name, role='Patient', latitude=lat, longitude=lng)
+        return Appointment.objects.create(patient=patient, therapist=self.therapist, service=self.service,
+                                          scheduled_date=self.day, scheduled_time=at, booking_status='Confirmed')
+
+    def test_visits_follow_booked_times_and_wait_for_them(self):
+        self.visit('near_late', time(15), 12.98, 77.60)
+        self.visit('far_early', time(10), 13.10, 77.70)
+        plan = routing.plan_day(self.therapist.pk, self.day, save=False)
+        self.assertEqual([stop['patient'] for stop in plan.stops], ['far_early', 'near_late'])
+        self.assertEqual([stop['eta'] for stop in plan.stops], ['10:00', '15:00'])
+        self.assertEqual(plan.stops[0]['wait_minutes'], 0)
+        self.assertGreater(plan.stops[1]['wait_minutes'], 0)
+        self.assertFalse(any(stop['late_minutes'] for stop in plan.stops))
+
+    def test_same_time_bookings_ordered_by_distance(self):
+        self.visit('far', time(10), 13.20, 77.80)
+        self.visit('near', time(10), 12.98, 77.60)
+        plan = routing.plan_day(self.therapist.pk, self.day, save=False)
+        self.assertEqual([stop['patient'] for stop in plan.stops], ['near', 'far'])
+
+    def test_unreachable_booking_is_flagged_late(self):
+        self.visit('first', time(10), 12.98, 77.60)
+        self.visit('next', time(10, 50), 13.40, 78.00)  # ~80 km away, 5 minutes after the first visit ends
+        plan = routing.plan_day(self.therapist.pk, self.day, save=False)
+        self.assertGreater(plan.stops[1]['late_minutes'], 0)
+        self.assertEqual(plan.stops[1]['booked'], '10:50')
+
+    def test_get_previews_without_writing_and_post_stores(self):
+        self.visit('patient', time(10), 12.98, 77.60)
+        client = Client()
+        client.force_login(self.therapist)
+        url = f'/calendar/route/?date={self.day.isoformat()}'
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['plan'].stops), 1)
+        self.assertFalse(RoutePlan.objects.exists())
+
+        self.assertRedirects(client.post(url), url, fetch_redirect_response=False)
+        self.assertEqual(RoutePlan.objects.get().stops[0]['eta'], '10:00')
+
+
+# -------------------------
+# REVENUE LEDGER
+# -------------------------
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.service = Service.objects.create(name='Rehab', description='', duration_minutes=45, base_fee=500)
+        self.therapist = User.objects.create(username='therapist', role='Therapist')
+        patient = User.objects.create(username='patient', role='Patient')
+        self.appointment = Appointment.objects.create(patient=patient, therapist=self.therapist, service=self.service,
+                                                      scheduled_date=date(2030, 1, 7), scheduled_time=time(9))
+
+    def pay(self, amount='500.00', status='Completed', reference='txn-1'):
+        return Payment.objects.create(appointment=self.appointment, amount=Decimal(amount), mode='UPI',
+                                      payment_status=status, transaction_id=reference)
+
+    def revenue(self):
+        return -sum(LedgerEntry.objects.filter(account='revenue').values_list('amount', flat=True))
+
+    def test_journals_balance_and_follow_the_payment(self):
+        payment = self.pay(status='Pending')
+        self.assertEqual(self.revenue(), 0)
+        payment.payment_status = 'Completed'
+        payment.save()
+        self.assertEqual(self.revenue(), Decimal('500.00'))
+        payment.amount = Decimal('450.00')
+        payment.save()
+        self.assertEqual(self.revenue(), Decimal('450.00'))
+        payment.payment_status = 'Refunded'
+        payment.save()
+        self.assertEqual(self.revenue(), 0)
+        self.assertEqual(sum(LedgerEntry.objects.values_list('amount', flat=True)), 0)  # every journal balances
+        self.assertEqual(ledger.sync(payments=[payment.pk]), 0)  # already reconciled
+
+    def test_rollups_match_the_ledger(self):
+        self.pay('500.00', reference='txn-1')
+        self.pay('300.00', reference='txn-2').delete()
+        today = timezone.localdate()
+        self.assertEqual(ledger.revenue(today, today, by='therapist'), [('therapist', Decimal('500.00'), 3)])
+        RevenueRollup.objects.all().delete()
+        ledger.rebuild_rollups()
+        self.assertEqual(ledger.revenue(today, today), [(today, Decimal('500.00'), 3)])
+
+    def test_backfill_dates_revenue_on_the_payment_day(self):
+        paid_on = timezone.make_aware(datetime(2029, 3, 1, 12))
+        Payment.objects.bulk_create([  # no signals, like rows from before the ledger
+            Payment(appointment=self.appointment, amount=Decimal('500.00'), mode='UPI',
+                    payment_status='Completed', transaction_id='old-1'),
+        ])
+        Payment.objects.update(timestamp=paid_on)  # updated_at stays at today, as after migration 0005
+        ledger.backfill()
+        ledger.rebuild_rollups()
+        self.assertEqual(set(LedgerEntry.objects.values_list('date', flat=True)), {date(2029, 3, 1)})
+        self.assertEqual(ledger.revenue(date(2029, 3, 1), date(2029, 3, 1)), [(date(2029, 3, 1), Decimal('500.00'), 1)])
+
+
+# -------------------------
+# COUPONS
+# -------------------------
+class CouponRedemptionTests(TestCase):
+    def setUp(self):
+        service = Service.objects.create(name='Rehab', description='', duration_minutes=45, base_fee=500)
+        therapist = User.objects.create(username='therapist', role='Therapist')
+        self.patient = User.objects.create(username='patient', role='Patient')
+        self.appointment = Appointment.objects.create(patient=self.patient, therapist=therapist, service=service,
+                                                      scheduled_date=date(2030, 1, 7), scheduled_time=time(9))
+        today = timezone.localdate()
+        with self.captureOnCommitCallbacks(execute=True):  # the coupon index is rebuilt after commit
+            self.half = DiscountCoupon.objects.create(code='HALF', description='', discount_percentage=50,
+                                                      valid_from=today, valid_to=today, min_amount=0, max_usage=2)
+            self.free = DiscountCoupon.objects.create(code='FREE', description='', discount_percentage=100,
+                                                      valid_from=today, valid_to=today, min_amount=0, max_usage=5)
+
+    def payment(self, reference):
+        return Payment.objects.create(appointment=self.appointment, amount=Decimal('500.00'), mode='UPI',
+                                      transaction_id=reference)
+
+    def test_usage_limit_is_enforced(self):
+        first = coupons.redeem('half', self.payment('txn-1').pk, self.patient)
+        self.assertEqual((first.original_amount, first.discount_amount), (Decimal('500.00'), Decimal('250.00')))
+        coupons.redeem('HALF', self.payment('txn-2').pk, self.patient)
+        third = self.payment('txn-3')
+        with self.assertRaisesMessage(coupons.CouponError, 'usage limit'):
+            coupons.redeem('HALF', third.pk, self.patient)
+        self.half.refresh_from_db()
+        self.assertEqual(self.half.usage_count, 2)
+        third.refresh_from_db()
+        self.assertEqual(third.amount, Decimal('500.00'))
+
+    def test_one_coupon_per_payment(self):
+        payment = self.payment('txn-1')
+        coupons.redeem('HALF', payment.pk, self.patient)
+        with self.assertRaisesMessage(coupons.CouponError, 'already been applied'):
+            coupons.redeem('HALF', payment.pk, self.patient)
+        self.half.refresh_from_db()
+        self.assertEqual(self.half.usage_count, 1)
+
+    def test_coupon_leaving_nothing_to_charge_gives_its_use_back(self):
+        payment = self.payment('txn-1')
+        with self.assertRaisesMessage(coupons.CouponError, 'at least'):
+            coupons.redeem('FREE', payment.pk, self.patient)
+        self.free.refresh_from_db()
+        payment.refresh_from_db()
+        self.assertEqual((self.free.usage_count, payment.amount), (0, Decimal('500.00')))
+        self.assertFalse(CouponRedemption.objects.exists())
+
+    def test_payment_create_rejects_a_full_discount_without_side_effects(self):
+        client = Client()
+        client.force_login(self.patient)
+        data = {'appointment': self.appointment.pk, 'amount': '500.00', 'mode': 'UPI',
+                'payment_status': 'Pending', 'transaction_id': 'form-1'}
+        with loadtest.fake_payment_gateway():
+            response = client.post('/payments/create/', {**data, 'coupon_code': 'FREE'})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('coupon_code', response.context['form'].errors)
+            self.assertFalse(Payment.objects.exists())
+
+            response = client.post('/payments/create/', {**data, 'coupon_code': 'HALF'})
+            self.assertEqual(response.context['amount'], 25000)  # paise
+        self.assertEqual(Payment.objects.get().amount, Decimal('250.00'))
+        self.free.refresh_from_db()
+        self.half.refresh_from_db()
+        self.assertEqual((self.free.usage_count, self.half.usage_count), (0, 1))
+
+    def test_gateway_failure_gives_the_coupon_use_back(self):
+        client = Client()
+        client.force_login(self.patient)
+        data = {'appointment': self.appointment.pk, 'amount': '500.00', 'mode': 'UPI',
+                'payment_status': 'Pending', 'transaction_id': 'form-1', 'coupon_code': 'HALF'}
+        with loadtest.fake_payment_gateway() as gateway, \
+                mock.patch.object(gateway, 'create', side_effect=ConnectionError('gateway down')):
+            response = client.post('/payments/create/', data)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Payment.objects.exists())
+        self.half.refresh_from_db()
+        self.assertEqual(self.half.usage_count, 0)
+
+    def test_failed_or_abandoned_payments_release_their_coupon(self):
+        failed, abandoned, recent = self.payment('order_1'), self.payment('order_2'), self.payment('order_3')
+        for payment in (failed, abandoned):
+            coupons.redeem('HALF', payment.pk, self.patient)
+        with mock.patch.object(views.client.utility, 'verify_payment_signature', side_effect=ValueError):
+            Client().post('/payments/success/', {'razorpay_order_id': 'order_1', 'razorpay_payment_id': 'pay_1',
+                                                 'razorpay_signature': 'bad'})
+        failed.refresh_from_db()
+        self.assertEqual(failed.amount, Decimal('500.00'))
+        self.assertFalse(CouponRedemption.objects.filter(payment=failed).exists())
+
+        coupons.redeem('HALF', recent.pk, self.patient)
+        Payment.objects.filter(pk=abandoned.pk).update(updated_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(coupons.release_abandoned(timedelta(hours=24)), 1)
+        self.assertEqual(list(CouponRedemption.objects.values_list('payment', flat=True)), [recent.pk])
+        self.half.refresh_from_db()
+        self.assertEqual(self.half.usage_count, 1)
+
+    def test_only_admins_apply_coupons_to_other_peoples_payments(self):
+        payment = self.payment('txn-1')
+        url = f'/payments/{payment.pk}/coupon/'
+        staff = User.objects.create(username='staff', role='SupportStaff', is_staff=True)
+        client = Client()
+        client.force_login(staff)
+        client.post(url, {'code': 'HALF'})
+        self.assertFalse(CouponRedemption.objects.exists())
+        client.force_login(User.objects.create(username='admin', role='Admin'))
+        client.post(url, {'code': 'HALF'})
+        self.assertTrue(CouponRedemption.objects.filter(payment=payment).exists())
+
+
+class CouponIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        coupons._index = None
+        self.today = timezone.localdate()
+        self.coupon('NOW', valid_to=self.today + timedelta(days=3), min_amount=200)
+        self.coupon('LATER', valid_from=self.today + timedelta(days=2), valid_to=self.today + timedelta(days=9))
+        self.coupon('OLD', valid_from=self.today - timedelta(days=9), valid_to=self.today - timedelta(days=1))
+        self.coupon('OFF', is_active=False)
+
+    def coupon(self, code, **fields):
+        fields = {'valid_from': self.today, 'valid_to': self.today, 'min_amount': 0, **fields}
+        with self.captureOnCommitCallbacks(execute=True):
+            return DiscountCoupon.objects.create(code=code, description='', discount_percentage=10, max_usage=5,
+                                                 **fields)
+
+    def test_index_holds_today_coupons_until_the_next_boundary(self):
+        index, expires_on = coupons.build_index(self.today)
+        self.assertEqual(set(index), {'NOW'})
+        self.assertEqual(expires_on, self.today + timedelta(days=2))
+
+    def test_lookups_are_served_from_memory_and_rebuilt_on_change(self):
+        self.assertEqual(coupons.lookup(' now ').code, 'NOW')
+        with self.assertNumQueries(0):
+            self.assertIsNone(coupons.lookup('LATER'))
+            self.assertEqual(coupons.validate('now', Decimal('500.00'))[1], Decimal('50.00'))
+            with self.assertRaisesMessage(coupons.CouponError, 'minimum amount'):
+                coupons.validate('now', Decimal('100.00'))
+
+        self.coupon('NEW')
+        self.assertEqual(coupons.lookup('new').code, 'NEW')
+        with mock.patch('django.utils.timezone.localdate', return_value=self.today + timedelta(days=2)):
+            self.assertEqual(coupons.lookup('later').code, 'LATER')
+
+
+
+# -------------------------
+# SUBSCRIPTIONS
+# -------------------------
+class SubscriptionSweepTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.now = timezone.now()
+        self.later = self.now + timedelta(days=2)
+        self.plan = SubscriptionPlan.objects.create(plan_name='Monthly', price=Decimal('999.00'), duration_days=30)
+        self.renewing = self.subscribe('renewing', auto_renew=True)
+        self.lapsing = self.subscribe('lapsing', auto_renew=False)
+
+    def subscribe(self, username, auto_renew):
+        user = User.objects.create(username=username, role='Patient')
+        Transaction.objects.create(user=user, plan=self.plan, amount=self.plan.price, payment_mode='UPI',
+                                   transaction_id=f'txn-{username}', expires_at=self.now + timedelta(days=1))
+        subscriptions.set_auto_renew(user.pk, auto_renew)
+        return user
+
+    def revenue(self):
+        return -sum(LedgerEntry.objects.filter(account='revenue', source=ledger.SUBSCRIPTION)
+                    .values_list('amount', flat=True))
+
+    def test_sweep_renews_and_expires(self):
+        self.assertEqual(subscriptions.sweep(self.later, batch_size=1), (1, 1))
+        renewal = Transaction.objects.get(transaction_id__startswith='renew-')
+        self.assertEqual((renewal.user, renewal.status), (self.renewing, Transaction.PENDING))
+        self.assertEqual(renewal.expires_at, self.now + timedelta(days=31))
+        # an unpaid renewal does not extend the period, so both subscriptions have run out
+        self.assertEqual(set(Subscription.objects.values_list('status', flat=True)), {Subscription.EXPIRED})
+        self.assertEqual(subscriptions.sweep(self.later), (0, 0))
+        self.assertEqual(Transaction.objects.count(), 3)
+
+    def test_pending_renewal_grants_no_access(self):
+        self.assertEqual(subscriptions.entitlement(self.renewing).expires_at, self.now + timedelta(days=1))
+        with mock.patch('django.utils.timezone.now', return_value=self.later):
+            with self.captureOnCommitCallbacks(execute=True):
+                subscriptions.sweep()
+            self.assertIsNone(subscriptions.entitlement(self.renewing))
+
+            renewal = Transaction.objects.get(transaction_id__startswith='renew-')
+            renewal.status = Transaction.COMPLETED
+            with self.captureOnCommitCallbacks(execute=True):
+                renewal.save()
+            self.assertEqual(subscriptions.entitlement(self.renewing).expires_at, self.now + timedelta(days=31))
+            self.assertIsNone(subscriptions.entitlement(self.lapsing))
+
+    def test_renewals_are_not_revenue_until_completed(self):
+        self.assertEqual(self.revenue(), Decimal('1998.00'))
+        subscriptions.sweep(self.later)
+        renewal = Transaction.objects.get(transaction_id__startswith='renew-')
+        self.assertEqual(renewal.status, Transaction.PENDING)
+        self.assertEqual(self.revenue(), Decimal('1998.00'))
+
+        renewal.status = Transaction.COMPLETED
+        renewal.save()
+        self.assertEqual(self.revenue(), Decimal('2997.00'))
+
+
+# -------------------------
+# REQUEST METRICS
+# -------------------------
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+
+    def test_requests_are_recorded_per_view(self):
+        Exercise.objects.create(name='Squats')
+        client = Client()
+        client.force_login(User.objects.create(username='patient', role='Patient'))
+        for _ in range(2):
+            client.get(reverse('exercise_list'))
+        client.get('/no-such-page/')
+
+        text = metrics.render_prometheus()
+        self.assertIn('physio_responses_total{view="exercise_list",status="200"} 2', text)
+        self.assertIn('physio_request_duration_seconds_count{view="exercise_list"} 2', text)
+        self.assertIn('view="unresolved",status="404"', text)
+        queries = metrics.registry.views['exercise_list']['db_queries']
+        self.assertGreater(queries.sum, 0)
+        self.assertEqual(queries.counts[0], 0)  # no request ran without a query
+
+    @override_settings(METRICS={'ALLOWED_IPS': (), 'TOKEN': 's3cret'})
+    def test_scrape_needs_a_token_staff_or_an_allowed_ip(self):
+        url = reverse('metrics')
+        self.assertEqual(Client().get(url).status_code, 403)  # loopback is not trusted by default
+        self.assertEqual(Client().get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = Client().get(url, HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE physio_request_duration_seconds histogram', response.content.decode())
+        with override_settings(METRICS={'ALLOWED_IPS': ('127.0.0.1',)}):
+            self.assertEqual(Client().get(url).status_code, 200)
+        staff = Client()
+        staff.force_login(User.objects.create(username='staff', role='Admin', is_staff=True))
+        self.assertEqual(staff.get(url).status_code, 200)
+
+
+# -------------------------
+# LOGIN THROTTLE
+# -------------------------
+@override_settings(LOGIN_THROTTLE={'IP_BURST': 5, 'IP_PER_MINUTE': 60, 'USERNAME_BURST': 2, 'USERNAME_PER_MINUTE': 6})
+class ThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def request(self, ip):
+        return RequestFactory().post('/login/', REMOTE_ADDR=ip)
+
+    def test_token_bucket_refills_at_its_rate(self):
+        bucket = throttle.TokenBucket('test', burst=2, per_minute=6)
+        self.assertEqual([bucket.take('a', now=100) for _ in range(3)], [0, 0, 10])
+        self.assertEqual(bucket.take('b', now=100), 0)  # buckets are per ident
+        self.assertEqual(bucket.take('a', now=105), 5)
+        self.assertEqual(bucket.take('a', now=110), 0)
+        bucket.give_back('a', now=110)
+        self.assertEqual(bucket.take('a', now=110), 0)
+
+    def test_username_bucket_is_per_ip(self):
+        attacker, owner = self.request('203.0.113.9'), self.request('198.51.100.7')
+        self.assertEqual([throttle.hit(attacker, 'Priya') for _ in range(2)], [0, 0])
+        self.assertGreater(throttle.hit(attacker, 'priya '), 0)
+        self.assertEqual(throttle.hit(owner, 'priya'), 0)
+
+    def test_rejected_attempt_gives_its_ip_token_back(self):
+        request = self.request('203.0.113.9')
+        for _ in range(2):
+            throttle.hit(request, 'priya')
+        for _ in range(10):
+            self.assertGreater(throttle.hit(request, 'priya'), 0)
+        # 2 of the 5 IP tokens were spent; the rejected attempts took none
+        waits = [throttle.hit(request, f'user{i}') for i in range(4)]
+        self.assertEqual(waits[:3], [0, 0, 0])
+        self.assertGreater(waits[3], 0)
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_registrations_keep_draining_the_ip_bucket(self):
+        client = Client(REMOTE_ADDR='203.0.113.9')
+        statuses = [
+            client.post(reverse('register'), {
+                'username': f'new{i}', 'email': f'new{i}@example.com', 'role': 'Patient',
+                'password1': 'Correct-Horse-9', 'password2': 'Correct-Horse-9',
+            }).status_code
+            for i in range(6)
+        ]
+        self.assertEqual(statuses, [302] * 5 + [429])
+        self.assertEqual(User.objects.filter(username__startswith='new').count(), 5)
+
+    def test_successful_login_refunds_its_tokens(self):
+        request = self.request('203.0.113.9')
+        for _ in range(5):
+            self.assertEqual(throttle.hit(request, 'priya'), 0)
+            throttle.succeeded(request, 'priya')
+
+
+# -------------------------
+# SYNTHETIC DATA
+# -------------------------
+class SeedDatasetTests(TestCase):
+    SCALE = {**{key: min(count, 10) for key, count in synthetic.SCALES['small'].items()}, 'appointments': 400}
+
+    def test_derived_rows_match_their_sources(self):
+        today = timezone.localdate()
+        with mock.patch.object(synthetic, 'COUPON_RATIO', 0.5):
+            written = synthetic.seed_dataset(self.SCALE, prefix='seedtest', today=today)
+
+        paying = set(Transaction.objects.values_list('user_id', flat=True))
+        self.assertEqual(written['Subscription'], len(paying))
+        self.assertEqual(set(Subscription.objects.values_list('user_id', flat=True)), paying)
+
+        revenue = -sum(LedgerEntry.objects.filter(account='revenue').values_list('amount', flat=True))
+        expected = (sum(Payment.objects.values_list('amount', flat=True))
+                    + sum(Transaction.objects.values_list('amount', flat=True)))
+        self.assertEqual(revenue, expected)
+        self.assertEqual(sum(RevenueRollup.objects.values_list('amount', flat=True)), expected)
+
+        self.assertGreater(written['CouponRedemption'], 0)
+        for coupon in DiscountCoupon.objects.all():
+            self.assertEqual(coupon.usage_count, coupon.redemptions.count())
+        for redemption in CouponRedemption.objects.select_related('payment'):
+            self.assertEqual(redemption.payment.amount, redemption.original_amount - redemption.discount_amount)
+
+        visiting = {
+            (therapist_id, day) for therapist_id, day in Appointment.objects.filter(
+                booking_status='Confirmed', scheduled_date__range=(today, today + timedelta(days=6)),
+            ).values_list('therapist_id', 'scheduled_date')
+        }
+        self.assertTrue(visiting)
+        self.assertEqual(set(RoutePlan.objects.values_list('therapist_id', 'date')), visiting)
+
+
+# -------------------------
+# TYPEAHEAD
+# -------------------------
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        autocomplete._indexes.clear()
+        service = Service.objects.create(name='Rehab', description='', duration_minutes=45, base_fee=500)
+        self.therapist = User.objects.create(username='drmehta', first_name='Anil', last_name='Mehta',
+                                             role='Therapist')
+        self.patient = User.objects.create(username='priya', first_name='Priya', last_name='Sharma',
+                                           role='Patient')
+        self.other_patient = User.objects.create(username='pranav', first_name='Pranav', last_name='Shah',
+                                                 role='Patient')
+        self.admin = User.objects.create(username='admin', role='Admin')
+        today = timezone.localdate()
+        self.mine = Appointment.objects.create(patient=self.patient, therapist=self.therapist, service=service,
+                                               scheduled_date=today, scheduled_time=time(9))
+        self.theirs = Appointment.objects.create(patient=self.other_patient, therapist=self.therapist,
+                                                 service=service, scheduled_date=today, scheduled_time=time(10))
+
+    def ids(self, kind, query, user):
+        return [row['id'] for row in autocomplete.lookup(kind, query, user)]
+
+    def test_every_word_must_prefix_match(self):
+        self.assertEqual(self.ids('patient', 'pr', self.admin), [self.other_patient.pk, self.patient.pk])
+        self.assertEqual(self.ids('patient', 'pr sha', self.admin), [self.other_patient.pk, self.patient.pk])
+        self.assertEqual(self.ids('patient', 'sharma pri', self.admin), [self.patient.pk])
+        self.assertEqual(autocomplete.lookup('patient', 'sharma', self.admin),
+                         [{'id': self.patient.pk, 'text': 'Priya Sharma (priya)'}])
+        self.assertEqual(self.ids('patient', '  ', self.admin), [])
+
+    def test_results_are_scoped_to_the_user(self):
+        self.assertEqual(set(self.ids('appointment', 'mehta', self.therapist)), {self.mine.pk, self.theirs.pk})
+        self.assertEqual(self.ids('appointment', 'mehta', self.patient), [self.mine.pk])
+        self.assertEqual(self.ids('patient', 'pr', self.patient), [self.patient.pk])
+
+    def test_saves_rebuild_only_the_affected_indexes(self):
+        self.assertEqual(self.ids('patient', 'rahul', self.admin), [])
+        index = autocomplete.get_index('exercise')
+        rahul = User.objects.create(username='rahul', role='Patient')
+        self.assertEqual(self.ids('patient', 'rahul', self.admin), [rahul.pk])
+        self.assertIs(autocomplete.get_index('exercise'), index)
+
+        patients = autocomplete.get_index('patient')
+        rahul.last_login = timezone.now()
+        rahul.save(update_fields=['last_login'])
+        self.assertIs(autocomplete.get_index('patient'), patients)
+        rahul.is_active = False
+        rahul.save(update_fields=['is_active'])
+        self.assertEqual(self.ids('patient', 'rahul', self.admin), [])
+
+
+# -------------------------
+# QUERY LOG
+# -------------------------
+class QueryLogTests(TestCase):
+    def setUp(self):
+        self.patients = [User.objects.create(username=f'patient{i}', role='Patient') for i in range(4)]
+
+    def run_queries(self, slow_ms, repeat_threshold):
+        log = querylog.RequestQueryLog(RequestFactory().get('/patients/'), slow_ms, repeat_threshold)
+        events = []
+        with mock.patch.object(querylog, 'write_event', events.append):
+            with connection.execute_wrapper(log):
+                for user in self.patients[:3]:
+                    list(Appointment.objects.filter(patient=user))
+            log.flush()
+        return events
+
+    def test_repeated_statements_are_logged_once_with_their_origin(self):
+        events = self.run_queries(slow_ms=60000, repeat_threshold=3)
+        self.assertEqual(len(events), 1)
+        event = events[0]
+        self.assertEqual((event['type'], event['path'], event['count'], event['distinct_params']),
+                         ('repeated', '/patients/', 3, 3))
+        self.assertIn('"base_appointment"', event['sql'])
+        self.assertTrue(event['origin'].startswith('base/tests.py:'))
+        self.assertTrue(event['origin'].endswith(' in run_queries'))
+
+    def test_slow_queries_are_logged_as_they_run(self):
+        events = self.run_queries(slow_ms=0, repeat_threshold=10)
+        self.assertEqual([event['type'] for event in events], ['slow'] * 3)
+
+    def test_in_lists_of_any_length_normalize_alike(self):
+        self.assertEqual(querylog.normalize('SELECT 1 WHERE id IN (%s, %s) AND x IN (%s, %s, %s)'),
+                         'SELECT 1 WHERE id IN (%s, ...) AND x IN (%s, ...)')
+
+    def test_analyze_queries_ranks_statements_by_total_time(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'queries.jsonl')
+            with open(path, 'w', encoding='utf-8') as handle:
+                for event in ({'type': 'slow', 'view': 'a', 'ms': 5, 'sql': 'SELECT 1', 'origin': 'x'},
+                              {'type': 'repeated', 'view': 'b', 'ms': 40, 'count': 12, 'sql': 'SELECT 2'},
+                              {'type': 'slow', 'view': 'c', 'ms': 7, 'sql': 'SELECT 1', 'origin': 'x'}):
+                    handle.write(json.dumps(event) + '\n')
+                handle.write('not json\n')
+            out = StringIO()
+            call_command('analyze_queries', path=path, stdout=out)
+        report = out.getvalue()
+        self.assertIn('3 events from 1 file(s), 2 distinct statements.', report)
+        self.assertLess(report.index('SELECT 2'), report.index('SELECT 1'))
+        self.assertIn('#2 [slow] 12.0 ms total, 2 events, 2 queries, worst 7.0 ms', report)
+
+
+# -------------------------
+# RECOVERY PREDICTIONS
+# -------------------------
+class RecoveryScoringTests(TestCase):
+    CONDITIONS = ['knee pain']
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = override_settings(RECOVERY_MODEL={'DIR': directory.name})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        recovery._models.clear()
+        recovery._predictions.clear()
+
+        # days = 30 + 5 per active plan + 10 for knee pain; mean 0 / scale 1 leave the raw features as they are
+        features = recovery.feature_names(self.CONDITIONS)
+        weights = np.zeros(len(features) + 1)
+        weights[0] = 30
+        weights[1 + features.index('plans_active')] = 5
+        weights[1 + features.index('condition:knee pain')] = 10
+        recovery.save_artifact('v1', {'features': features, 'conditions': self.CONDITIONS, 'r2': 0.8},
+                               weights, np.zeros(len(features)), np.ones(len(features)))
+
+        service = Service.objects.create(name='Rehab', description='', duration_minutes=45, base_fee=500)
+        therapist = User.objects.create(username='therapist', role='Therapist')
+        self.treated = User.objects.create(username='treated', role='Patient')
+        PatientProfile.objects.filter(user=self.treated).update(medical_history={'conditions': 'Knee Pain, Back'})
+        appointment = Appointment.objects.create(patient=self.treated, therapist=therapist, service=service,
+                                                 scheduled_date=date(2030, 1, 7), scheduled_time=time(9))
+        TreatmentPlan.objects.create(appointment=appointment, exercises_list='Squats', prescribed_by=therapist)
+        self.exercising = User.objects.create(username='exercising', role='Patient')
+        ProgressTracking.objects.create(patient=self.exercising, exercise=Exercise.objects.create(name='Squats'),
+                                        completion_percentage=40)
+        self.idle = User.objects.create(username='idle', role='Patient')
+
+    def test_batch_scoring_applies_the_stored_weights(self):
+        model = recovery.load_model()
+        self.assertEqual(model.version, 'v1')
+        ids = [self.treated.pk, self.exercising.pk]
+        with self.assertNumQueries(3):
+            X = recovery.extract(ids, model.conditions)
+        days, confidence = model.predict(X)
+        self.assertEqual(list(days), [45.0, 30.0])
+        # age is unknown for both, so three of the four observed features are present
+        self.assertEqual([round(value, 3) for value in confidence], [0.7, 0.7])
+
+        features = recovery.describe(model.features, X[0])
+        self.assertEqual((features['condition_count'], features['condition:knee pain']), (2, 1))
+        self.assertNotIn('age_years', features)
+
+    def test_missing_values_fall_back_to_the_mean_and_days_are_clipped(self):
+        features = ['age_years', 'plans_active']
+        model = recovery.Model('clip', {'features': features, 'r2': 1.0, 'max_days': 60},
+                               np.array([20.0, 1.0, 10.0]), np.array([40.0, 1.0]), np.array([10.0, 1.0]))
+        days, confidence = model.predict([[np.nan, 1], [60, 1], [40, 9]])
+        self.assertEqual(list(days), [20.0, 22.0, 60.0])
+        self.assertEqual(list(confidence), [0.5, 1.0, 1.0])
+
+    def test_score_all_covers_active_patients_once_a_day(self):
+        self.assertEqual(recovery.score_all(batch_size=1), 2)
+        self.assertEqual(recovery.score_all(), 2)
+        rows = dict(RecoveryPredictor.objects.values_list('patient_id', 'predicted_recovery_days'))
+        self.assertEqual(rows, {self.treated.pk: 45.0, self.exercising.pk: 30.0})
+
+    def test_on_demand_predictions_are_cached(self):
+        first = recovery.predict_patient(self.treated.pk)
+        self.assertEqual((first['model_version'], first['predicted_recovery_days']), ('v1', 45.0))
+        with self.assertNumQueries(0):
+            self.assertIs(recovery.predict_patient(self.treated.pk), first)
+
+
+# -------------------------
+# RECOVERY TRAINING
+# -------------------------
+class RecoveryTrainingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        overrides = override_settings(RECOVERY_MODEL={'DIR': self.directory / 'models'})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        recovery._models.clear()
+
+    def store(self, format, X, y):
+        work = self.directory / format
+        work.mkdir()
+        store = training.open_store(format, work, ['a', 'b'], len(y))
+        for start in range(0, len(y), 16):
+            ids = np.arange(start, min(start + 16, len(y)), dtype=np.int64)
+            store.write(ids, X[ids], y[ids])
+        store.close()
+        return store
+
+    def check_fit(self, format):
+        rng = np.random.default_rng(0)
+        X = rng.normal([50, 3], [15, 2], size=(120, 2))
+        y = 3 + 2 * X[:, 0] - X[:, 1]
+        weights, mean, scale, metrics = training.fit(self.store(format, X, y), batch_size=7, ridge=1e-9)
+        # back from standardized to raw units
+        coef = weights[1:] / scale
+        intercept = weights[0] - (coef * mean).sum()
+        np.testing.assert_allclose([intercept, *coef], [3, 2, -1], atol=1e-6)
+        self.assertEqual((metrics['train_rows'], metrics['holdout_rows']), (108, 12))
+        self.assertAlmostEqual(metrics['r2'], 1.0)
+        self.assertAlmostEqual(metrics['rmse_days'], 0.0)
+
+    def test_fit_recovers_known_weights_from_npy_batches(self):
+        self.check_fit('npy')
+
+    @unittest.skipIf(training.pyarrow is None, "pyarrow is not installed")
+    def test_fit_recovers_known_weights_from_parquet_batches(self):
+        self.check_fit('parquet')
+
+    def test_missing_features_are_imputed_with_the_training_mean(self):
+        X = np.array([[1.0, np.nan], [3.0, 4.0], [np.nan, 8.0], [5.0, 6.0], [7.0, np.nan]])
+        mean, scale = training.column_stats(self.store('npy', X, np.zeros(5)), batch_size=2)
+        np.testing.assert_allclose(mean, [5.0, 6.0])  # id 0 is held out
+        np.testing.assert_allclose(scale, [np.sqrt(8 / 3)] * 2)
+        np.testing.assert_allclose(training._design(X[2:3], mean, scale)[0], [1, 0, 2 / np.sqrt(8 / 3)])
+
+    def test_train_saves_and_activates_a_version(self):
+        service = Service.objects.create(name='Rehab', description='', duration_minutes=45, base_fee=500)
+        therapist = User.objects.create(username='therapist', role='Therapist')
+        for n, days in enumerate((10, 20, 40)):
+            patient = User.objects.create(username=f'patient{n}', role='Patient')
+            for offset, status in ((0, 'active'), (days, 'completed')):
+                appointment = Appointment.objects.create(patient=patient, therapist=therapist, service=service,
+                                                         scheduled_date=date(2030, 1, 1) + timedelta(days=offset),
+                                                         scheduled_time=time(9))
+                TreatmentPlan.objects.create(appointment=appointment, exercises_list='Squats', status=status)
+
+        version, metrics = training.train(version='v-test', format='npy', batch_size=2)
+        self.assertEqual(version, 'v-test')
+        self.assertEqual(metrics['train_rows'] + metrics['holdout_rows'], 3)
+        model = recovery.load_model()
+        self.assertEqual((model.version, model.meta['feature_store']), ('v-test', 'npy'))
+        with self.assertRaises(ValueError):
+            training.train(version='v-test', format='npy')
+
+
+# -------------------------
+# COHORTS
+# -------------------------
+class CohortTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name) / 'appointments'
+
+    def snapshot(self, rows):
+        """rows: (patient, ISO date, status) -> Snapshot with ids 1..n on one therapist and service."""
+        columns = {
+            'id': np.arange(1, len(rows) + 1),
+            'patient': np.array([patient for patient, _, _ in rows]),
+            'therapist': np.ones(len(rows), dtype=np.int64),
+            'service': np.ones(len(rows), dtype=np.int64),
+            'date': np.array([cohorts.day_number(date.fromisoformat(day)) for _, day, _ in rows]),
+            'status': np.array([cohorts.STATUSES.index(status) for _, _, status in rows]),
+        }
+        return cohorts.Snapshot(columns, {})
+
+    def test_retention_curve_on_a_hand_built_snapshot(self):
+        snapshot = self.snapshot([
+            (1, '2030-01-05', 'Completed'), (1, '2030-02-10', 'Completed'),
+            (2, '2030-01-20', 'Completed'), (2, '2030-03-01', 'Completed'),
+            (3, '2030-02-02', 'Completed'), (3, '2030-03-03', 'Cancelled'), (3, '2030-03-30', 'Confirmed'),
+        ])
+        as_of = date(2030, 3, 15)
+        self.assertEqual(cohorts.retention_curve(snapshot, as_of=as_of, months=2), {
+            'cohorts': ['2030-01', '2030-02'],
+            'sizes': [2, 1],
+            # the February cohort cannot be observed two months out yet
+            'rates': [[1.0, 0.5, 0.5], [1.0, 0.0, None]],
+        })
+        self.assertEqual(cohorts.retention_curve(snapshot, as_of=as_of, months=1)['cohorts'], ['2030-02'])
+
+    def test_refresh_patches_updated_rows_and_appends_new_ones(self):
+        service = Service.objects.create(name='Rehab', description='', duration_minutes=45, base_fee=500)
+        therapist = User.objects.create(username='therapist', role='Therapist')
+        patient = User.objects.create(username='patient', role='Patient')
+
+        def book(day):
+            return Appointment.objects.create(patient=patient, therapist=therapist, service=service,
+                                              scheduled_date=day, scheduled_time=time(9), booking_status='Confirmed')
+
+        first, second = book(date(2030, 1, 7)), book(date(2030, 1, 8))
+        self.assertEqual(cohorts.refresh(directory=self.directory), (2, 0, 2))
+        self.assertEqual(cohorts.refresh(directory=self.directory), (0, 0, 2))
+
+        first.booking_status = 'Cancelled'
+        first.save()
+        third = book(date(2030, 1, 9))
+        self.assertEqual(cohorts.refresh(directory=self.directory, batch_size=1), (1, 1, 3))
+        snapshot = cohorts.load(self.directory)
+        self.assertEqual(list(snapshot['id']), [first.pk, second.pk, third.pk])
+        self.assertEqual([cohorts.STATUSES[code] for code in snapshot['status']],
+                         ['Cancelled', 'Confirmed', 'Confirmed'])
+        self.assertEqual(snapshot.watermark, third.pk)
+
+        second.delete()
+        self.assertEqual(cohorts.refresh(directory=self.directory)[2], 3)
+        self.assertEqual(cohorts.refresh(rebuild=True, directory=self.directory), (2, 0, 2))
+
+
+# -------------------------
+# SESSIONS
+# -------------------------
+class PurgeSessionsTests(TestCase):
+    def test_expired_sessions_are_deleted_in_batches(self):
+        now = timezone.now()
+        for n in range(5):
+            Session.objects.create(session_key=f'expired{n}', session_data='', expire_date=now - timedelta(days=1))
+        patient = User.objects.create(username='patient', role='Patient')
+        client = Client()
+        client.force_login(patient)
+
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('purge_sessions', batch_size=2, stdout=out)
+        self.assertIn('Deleted 5 expired session(s)', out.getvalue())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)),
+                         [client.session.session_key])
+        deletes = [query for query in queries.captured_queries if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 3)
+        self.assertEqual(client.get(reverse('api_bootstrap')).status_code, 200)
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cache')
+    def test_engines_without_rows_are_left_alone(self):
+        out = StringIO()
+        call_command('purge_sessions', stdout=out)
+        self.assertIn('keeps no session rows', out.getvalue())
+
+
+# -------------------------
+# PATIENT RECORDS FIXTURE
+# -------------------------
+class PatientRecordsTestCase(TestCase):
+    """Two patients and therapists with appointments, payments and a treatment plan each."""
+
+    def setUp(self):
+        self.service = Service.objects.create(name='Rehab', description='', duration_minutes=45, base_fee=500)
+        self.therapist = User.objects.create(username='therapist', role='Therapist')
+        self.other_therapist = User.objects.create(username='other_therapist', role='Therapist')
+        self.patient = User.objects.create(username='patient', role='Patient')
+        self.other_patient = User.objects.create(username='other_patient', role='Patient')
+        self.admin = User.objects.create(username='admin', role='Admin')
+        # several events share a timestamp so pages have to break ties on (kind, id)
+        self.appointments = [
+            self.book(self.patient, self.therapist, date(2030, 1, 7 + i // 3), time(9)) for i in range(7)
+        ]
+        self.plan = TreatmentPlan.objects.create(appointment=self.appointments[0], exercises_list='Squats',
+                                                 prescribed_by=self.therapist)
+        self.other_plan = TreatmentPlan.objects.create(
+            appointment=self.book(self.other_patient, self.other_therapist, date(2030, 1, 7), time(10)),
+            exercises_list='Lunges', prescribed_by=self.other_therapist,
+        )
+        for i, appointment in enumerate(self.appointments[:4]):
+            Payment.objects.create(appointment=appointment, amount=Decimal('500.00'), mode='UPI',
+                                   payment_status='Completed', transaction_id=f'txn-{i}')
+        Payment.objects.update(timestamp=timezone.make_aware(datetime(2030, 1, 7, 9)))
+
+    def book(self, patient, therapist, day, at):
+        return Appointment.objects.create(patient=patient, therapist=therapist, service=self.service,
+                                          scheduled_date=day, scheduled_time=at)
+
+    def client_for(self, user):
+        client = Client()
+        client.force_login(user)
+        return client
+
+
+# -------------------------
+# JSON API
+# -------------------------
+class ApiTests(PatientRecordsTestCase):
+    def test_list_etag_answers_304_until_the_rows_change(self):
+        client = self.client_for(self.patient)
+        url = reverse('api_list', args=['appointments'])
+        first = client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(len(first.json()['results']), 7)
+        etag = first['ETag']
+
+        repeat = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((repeat.status_code, repeat['ETag'], repeat.content), (304, etag, b''))
+        self.assertEqual(client.get(url + '?fields=id', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        self.book(self.patient, self.therapist, date(2030, 2, 1), time(9))
+        changed = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+    def test_detail_etag_and_scope(self):
+        url = reverse('api_detail', args=['treatment-plans', self.plan.pk])
+        client = self.client_for(self.patient)
+        etag = client.get(url)['ETag']
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client_for(self.other_patient).get(url).status_code, 404)
+
+    def test_bootstrap_reads_only_the_callers_live_rows(self):
+        exercise = Exercise.objects.create(name='Squats')
+        unread = Notification.objects.create(user=self.patient, title='Visit', message='Tomorrow', category='Reminder')
+        Notification.objects.create(user=self.patient, title='Old', message='Read', category='Update', is_read=True)
+        Notification.objects.create(user=self.other_patient, title='Theirs', message='', category='Update')
+        now = timezone.now()
+        upcoming = HomeExerciseReminder.objects.create(patient=self.patient, exercise=exercise,
+                                                       reminder_time=now + timedelta(hours=1))
+        HomeExerciseReminder.objects.create(patient=self.patient, exercise=exercise,
+                                            reminder_time=now - timedelta(hours=1))
+
+        with self.assertNumQueries(len(api.BOOTSTRAP_SECTIONS)):
+            payload = api.bootstrap(self.patient)
+        rows = payload['appointments']
+        self.assertEqual({row['id'] for row in rows}, {appointment.pk for appointment in self.appointments})
+        self.assertEqual([row['scheduled_date'] for row in rows],
+                         sorted((row['scheduled_date'] for row in rows), reverse=True))
+        self.assertEqual([row['id'] for row in payload['treatment_plans']], [self.plan.pk])
+        self.assertEqual([row['id'] for row in payload['notifications']], [unread.pk])
+        self.assertEqual([row['id'] for row in payload['reminders']], [upcoming.pk])
+        self.assertEqual(len(api.bootstrap(self.patient, limit=2)['appointments']), 2)
+
+    def test_bootstrap_endpoint_is_gzipped_json(self):
+        url = reverse('api_bootstrap')
+        self.assertEqual(Client().get(url).status_code, 401)
+        response = self.client_for(self.patient).get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual((response.status_code, response['Content-Encoding']), (200, 'gzip'))
+        payload = json.loads(gzip.decompress(response.content))
+        self.assertEqual(payload['version'], api.API_VERSION)
+        self.assertEqual(len(payload['appointments']), 7)
+
+
+# -------------------------
+# PATIENT TIMELINE
+# -------------------------
+class TimelineTests(PatientRecordsTestCase):
+    def test_timeline_pages_cover_the_stream_once_in_order(self):
+        everything, cursor = timeline.page(self.patient.pk, limit=100)
+        self.assertIsNone(cursor)
+        self.assertEqual(len(everything), 12)  # 7 appointments, 4 payments, 1 plan
+        self.assertEqual([e.key for e in everything], sorted((e.key for e in everything), reverse=True))
+
+        seen, cursor = [], None
+        while True:
+            events, cursor = timeline.page(self.patient.pk, cursor=timeline.decode_cursor(cursor), limit=3)
+            seen += [event.key for event in events]
+            if cursor is None:
+                break
+        self.assertEqual(seen, [event.key for event in everything])
+
+    def test_timeline_api_follows_next_and_checks_access(self):
+        client = self.client_for(self.patient)
+        url = reverse('api_patient_timeline', args=[self.patient.pk]) + '?limit=5&kinds=appointment,payment'
+        ids = []
+        while url:
+            body = client.get(url).json()
+            ids += [(event['kind'], event['id']) for event in body['results']]
+            url = body['next']
+        self.assertEqual(len(ids), 11)
+        self.assertEqual(len(set(ids)), 11)
+
+        response = self.client_for(self.other_patient).get(reverse('api_patient_timeline', args=[self.patient.pk]))
+        self.assertEqual(response.status_code, 403)
+        response = self.client_for(self.patient).get(
+            reverse('api_patient_timeline', args=[self.patient.pk]) + '?cursor=garbage')
+        self.assertEqual(response.status_code, 400)
+
+
+# -------------------------
+# ROLE PERMISSIONS
+# -------------------------
+class TreatmentPlanScopeTests(PatientRecordsTestCase):
+    def test_treatment_plan_list_is_scoped_by_role(self):
+        expected = {
+            self.patient: [self.plan], self.other_patient: [self.other_plan],
+            self.therapist: [self.plan], self.other_therapist: [self.other_plan],
+            self.admin: [self.other_plan, self.plan],
+        }
+        for user, plans in expected.items():
+            with self.subTest(user=user.username):
+                response = self.client_for(user).get(reverse('treatment_plan_list'))
+                self.assertEqual(sorted(response.context['treatment_plans'], key=lambda plan: -plan.pk), plans)
@@ -0,0 +1,127 @@
+"""
+Token-bucket rate limits for the login and registration forms.
+
+Every POST takes one token from the client IP's bucket and, for logins, one
+from the submitted username's bucket for that IP, before the form hashes
+anything. An empty bucket means the request is answered with 429 straight
+away (and the tokens already taken are given back), so a credential-stuffing
+burst never reaches the password hasher. A successful login gives its tokens
+back, so only failures drain the buckets and a shift of therapists logging in
+from one clinic IP is not throttled. Registrations get nothing back: each one
+hashes a new password, so they keep draining the IP bucket. Username buckets are per (username, IP),
+so someone hammering a username from elsewhere cannot lock its owner out.
+
+Bucket state is (tokens, updated_at) in the LOGIN_THROTTLE['CACHE'] cache,
+keyed by a hash of the IP or lowercased username and IP. Updates are locked within a
+process; across processes the get/set can race by a token or two, which is
+fine for a limiter. Use a shared cache (Redis/Memcached) so every worker
+process counts the same attempts.
+"""
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+KEY = 'throttle:{}:{}'
+
+_lock = threading.Lock()
+
+
+def throttle_settings():
+    return {
+        'ENABLED': True,
+        'CACHE': 'default',
+        'IP_BURST': 50,
+        'IP_PER_MINUTE': 30,
+        'USERNAME_BURST': 10,
+        'USERNAME_PER_MINUTE': 5,
+        **getattr(settings, 'LOGIN_THROTTLE', {}),
+    }
+
+
+class TokenBucket:
+    """`burst` tokens, refilled at `per_minute`; state lives in the cache under the bucket name."""
+
+    def __init__(self, name, burst, per_minute, cache_alias='default'):
+        self.name = name
+        self.burst = burst
+        self.rate = per_minute / 60.0
+        self.cache_alias = cache_alias
+
+    def key(self, ident):
+        return KEY.format(self.name, hashlib.sha256(ident.encode()).hexdigest()[:32])
+
+    def _refilled(self, state, now):
+        if state is None:
+            return float(self.burst)
+        tokens, updated_at = state
+        return min(float(self.burst), tokens + (now - updated_at) * self.rate)
+
+    def _store(self, cache, key, tokens, now):
+        # a bucket that refills completely carries no information; let it expire then
+        timeout = math.ceil((self.burst - tokens) / self.rate) + 1 if self.rate else None
+        cache.set(key, (tokens, now), timeout)
+
+    def take(self, ident, now=None):
+        """Take a token. Returns 0 if one was available, else the seconds until there is one."""
+        cache = caches[self.cache_alias]
+        key = self.key(ident)
+        now = time.time() if now is None else now
+        with _lock:
+            tokens = self._refilled(cache.get(key), now)
+            if tokens < 1:
+                return math.ceil((1 - tokens) / self.rate) if self.rate else None
+            self._store(cache, key, tokens - 1, now)
+        return 0
+
+    def give_back(self, ident, now=None):
+        cache = caches[self.cache_alias]
+        key = self.key(ident)
+        now = time.time() if now is None else now
+        with _lock:
+            state = cache.get(key)
+            if state is not None:
+                self._store(cache, key, min(float(self.burst), self._refilled(state, now) + 1), now)
+
+
+def buckets():
+    options = throttle_settings()
+    return (
+        TokenBucket('ip', options['IP_BURST'], options['IP_PER_MINUTE'], options['CACHE']),
+        TokenBucket('username', options['USERNAME_BURST'], options['USERNAME_PER_MINUTE'], options['CACHE']),
+    )
+
+
+def _idents(request, username):
+    ip_bucket, username_bucket = buckets()
+    ip = request.META.get('REMOTE_ADDR') or 'unknown'
+    yield ip_bucket, ip
+    if username:
+        yield username_bucket, f'{username.strip().lower()}|{ip}'
+
+
+def hit(request, username=None):
+    """Count an attempt. Returns 0 if it may go ahead, else the seconds to wait."""
+    if not throttle_settings()['ENABLED']:
+        return 0
+    taken = []
+    for bucket, ident in _idents(request, username):
+        wait = bucket.take(ident)
+        if wait != 0:
+            # a rejected attempt costs nothing, or it would drain the buckets it passed
+            for passed, passed_ident in taken:
+                passed.give_back(passed_ident)
+            return wait or 60
+        taken.append((bucket, ident))
+    return 0
+
+
+def succeeded(request, username=None):
+    """Refund the tokens hit() took for an attempt that turned out legitimate."""
+    if not throttle_settings()['ENABLED']:
+        return
+    for bucket, ident in _idents(request, username):
+        bucket.give_back(ident)
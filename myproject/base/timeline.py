@@ -0,0 +1,196 @@
+"""
+Per-patient timeline: one chronological stream (newest first) of
+appointments, treatment plans, progress updates, feedback, payments,
+emergency requests and exercise reminders.
+
+Each SOURCE is read through its own keyset-paged iterator, ordered by
+(event time, id) descending on an index that starts with the patient, and
+the iterators are combined with heapq.merge(). Only as many rows as the page
+needs are ever fetched from each table, so a patient with years of history
+costs the same as a new one. Pages are continued with an opaque cursor that
+holds the (time, kind, id) of the last event shown.
+"""
+import base64
+import heapq
+import json
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import (
+    Appointment, EmergencyRequest, Feedback, HomeExerciseReminder, Payment, ProgressTracking, TreatmentPlan,
+)
+
+DEFAULT_LIMIT = 30
+MAX_LIMIT = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class Event:
+    __slots__ = ('at', 'kind', 'id', 'data')
+
+    def __init__(self, at, kind, id, data):
+        self.at = at
+        self.kind = kind
+        self.id = id
+        self.data = data
+
+    @property
+    def key(self):
+        return (self.at, self.kind, self.id)
+
+    def as_dict(self):
+        return {'kind': self.kind, 'id': self.id, 'at': self.at, **self.data}
+
+
+def keyset_before(fields, values, inclusive=False):
+    """Q for rows whose (fields...) tuple sorts before `values` in descending order."""
+    last = f"{fields[-1]}__{'lte' if inclusive else 'lt'}"
+    condition = Q(**{last: values[-1]})
+    for field, value in zip(reversed(fields[:-1]), reversed(values[:-1])):
+        condition = Q(**{f'{field}__lt': value}) | (Q(**{field: value}) & condition)
+    return condition
+
+
+class Source:
+    """
+    One model's contribution. `time_fields` is either one datetime column or
+    a (date, time) pair read as local time; `fields` are extra values()
+    paths copied into the event under their short names.
+    """
+
+    def __init__(self, kind, model, patient_path, time_fields, fields):
+        self.kind = kind
+        self.model = model
+        self.patient_path = patient_path
+        self.time_fields = time_fields
+        self.fields = fields
+
+    def event_time(self, row):
+        if len(self.time_fields) == 1:
+            return row[self.time_fields[0]]
+        day, at = (row[field] for field in self.time_fields)
+        return timezone.make_aware(datetime.combine(day, at))
+
+    def time_values(self, moment):
+        if len(self.time_fields) == 1:
+            return (moment,)
+        local = timezone.localtime(moment)
+        return (local.date(), local.time())
+
+    def after_cursor(self, cursor):
+        """Rows that come after `cursor` in the merged (time, kind, id) descending order."""
+        at, kind, pk = cursor
+        values = self.time_values(at)
+        if self.kind == kind:
+            return keyset_before((*self.time_fields, 'id'), (*values, pk))
+        # Ties on time are broken by kind, so a source "below" the cursor kind keeps its equal-time rows
+        return keyset_before(self.time_fields, values, inclusive=self.kind < kind)
+
+    def iterate(self, patient_id, cursor=None, chunk=DEFAULT_LIMIT):
+        """Events for one patient, newest first, fetched `chunk` rows at a time."""
+        queryset = self.model._default_manager.filter(**{self.patient_path: patient_id})
+        ordering = [f'-{field}' for field in (*self.time_fields, 'id')]
+        paths = list(self.fields.values())
+        condition = self.after_cursor(cursor) if cursor else Q()
+        while True:
+            rows = list(
+                queryset.filter(condition).order_by(*ordering)
+                .values('id', *self.time_fields, *paths)[:chunk]
+            )
+            for row in rows:
+                yield Event(self.event_time(row), self.kind, row['id'],
+                            {name: row[path] for name, path in self.fields.items()})
+            if len(rows) < chunk:
+                return
+            last = rows[-1]
+            condition = keyset_before((*self.time_fields, 'id'),
+                                      (*(last[field] for field in self.time_fields), last['id']))
+
+
+SOURCES = [
+    Source('appointment', Appointment, 'patient_id', ('scheduled_date', 'scheduled_time'), {
+        'service': 'service__name', 'therapist': 'therapist__username',
+        'booking_status': 'booking_status', 'payment_status': 'payment_status',
+    }),
+    Source('emergency', EmergencyRequest, 'patient_id', ('requested_at',), {
+        'status': 'status', 'condition': 'condition_description', 'therapist': 'assigned_therapist__username',
+    }),
+    Source('feedback', Feedback, 'patient_id', ('created_at',), {
+        'rating': 'rating', 'comments': 'comments', 'therapist': 'therapist__username',
+        'appointment_id': 'appointment_id',
+    }),
+    Source('payment', Payment, 'appointment__patient_id', ('timestamp',), {
+        'amount': 'amount', 'mode': 'mode', 'payment_status': 'payment_status', 'appointment_id': 'appointment_id',
+    }),
+    Source('progress', ProgressTracking, 'patient_id', ('last_updated',), {
+        'exercise': 'exercise__name', 'completion_percentage': 'completion_percentage',
+        'notes': 'feedback_notes',
+    }),
+    Source('reminder', HomeExerciseReminder, 'patient_id', ('reminder_time',), {
+        'exercise': 'exercise__name', 'is_completed': 'is_completed', 'sent_via': 'sent_via',
+    }),
+    Source('treatment_plan', TreatmentPlan, 'appointment__patient_id', ('created_at',), {
+        'status': 'status', 'prescribed_by': 'prescribed_by__username', 'exercises': 'exercises_list',
+        'follow_up_required': 'follow_up_required', 'appointment_id': 'appointment_id',
+    }),
+]
+KINDS = [source.kind for source in SOURCES]
+
+
+# -------------------------
+# CURSORS
+# -------------------------
+def encode_cursor(event):
+    raw = json.dumps([event.at.isoformat(), event.kind, event.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        at, kind, pk = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        moment = parse_datetime(at)
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor.")
+    if moment is None or kind not in KINDS or not isinstance(pk, int):
+        raise InvalidCursor("Invalid cursor.")
+    return moment, kind, pk
+
+
+def parse_kinds(raw):
+    """?kinds=appointment,payment -> the matching sources (all of them when empty)."""
+    if not raw:
+        return SOURCES
+    wanted = {kind.strip() for kind in raw.split(',') if kind.strip()}
+    return [source for source in SOURCES if source.kind in wanted]
+
+
+def page(patient_id, cursor=None, limit=DEFAULT_LIMIT, sources=SOURCES):
+    """One page of the merged stream: (events, next cursor or None)."""
+    # Each source needs at most limit + 1 rows, so one query per source per page in the common case
+    streams = [source.iterate(patient_id, cursor, chunk=limit + 1) for source in sources]
+    merged = heapq.merge(*streams, key=lambda event: event.key, reverse=True)
+    events = []
+    for event in merged:
+        if len(events) == limit:
+            return events, encode_cursor(events[-1])
+        events.append(event)
+    return events, None
+
+
+def can_view(user, patient):
+    """Patients see their own timeline, therapists their patients', admins and staff everyone's."""
+    if user.is_superuser or user.is_staff or user.role == 'Admin':
+        return True
+    if user.role == 'Patient':
+        return user.pk == patient.pk
+    if user.role == 'Therapist':
+        return Appointment.objects.filter(therapist=user, patient=patient).exists()
+    return False
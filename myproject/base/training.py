@@ -0,0 +1,279 @@
+"""
+Offline training for the recovery model (recovery.py describes the artifact).
+
+1. Labels: every patient with a completed treatment plan. The target is the
+   number of days from the appointment of their first plan to that of their
+   last completed one.
+2. Features: recovery.extract() for those patients, streamed in id order with
+   .iterator() and written batch by batch to an on-disk column store - Parquet
+   when pyarrow is installed, else .npy memmaps - so memory holds one batch
+   however many patients and progress records there are. Training and scoring
+   share the same extractor.
+3. Fit: ridge regression in pure NumPy from two streamed passes over the
+   store (column statistics, then the features x features normal equations),
+   scored on a held-out tenth of patients (id % 10 == 0).
+4. recovery.save_artifact() writes the weights as a new model version; the
+   version string is what RecoveryPredictor.model_version records.
+"""
+import json
+import shutil
+import tempfile
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from . import recovery
+from .models import PatientProfile, TreatmentPlan
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = None
+
+MAX_CONDITIONS = 50     # condition one-hot columns kept, most frequent first
+MIN_CONDITION_COUNT = 5
+HOLDOUT_MODULUS = 10
+
+
+def labels():
+    """(patient id, first plan date, last completed plan date) for labelled patients, by patient id."""
+    return (
+        TreatmentPlan.objects.values('appointment__patient_id')
+        .annotate(first=Min('appointment__scheduled_date'),
+                  done=Max('appointment__scheduled_date', filter=Q(status='completed')))
+        .filter(done__isnull=False)
+        .order_by('appointment__patient_id')
+        .values_list('appointment__patient_id', 'first', 'done')
+    )
+
+
+def condition_vocabulary(batch_size):
+    """Most frequent condition names among labelled patients, streamed."""
+    counts = Counter()
+    labelled = TreatmentPlan.objects.filter(status='completed').values('appointment__patient_id')
+    profiles = PatientProfile.objects.filter(user_id__in=labelled).values_list('medical_history', 'ongoing_conditions')
+    for history, ongoing in profiles.iterator(chunk_size=batch_size):
+        counts.update(recovery.patient_conditions(history, ongoing))
+    return sorted(name for name, n in counts.most_common(MAX_CONDITIONS) if n >= MIN_CONDITION_COUNT)
+
+
+# -------------------------
+# FEATURE STORES
+# -------------------------
+class NpyStore:
+    """Features, targets and patient ids as .npy files written through memmaps."""
+    format = 'npy'
+
+    def __init__(self, directory, columns, capacity):
+        self.directory = Path(directory)
+        self.columns = columns
+        self.rows = 0
+        open_memmap = np.lib.format.open_memmap
+        self._X = open_memmap(self.directory / 'X.npy', mode='w+', dtype=np.float64, shape=(capacity, len(columns)))
+        self._y = open_memmap(self.directory / 'y.npy', mode='w+', dtype=np.float64, shape=(capacity,))
+        self._ids = open_memmap(self.directory / 'ids.npy', mode='w+', dtype=np.int64, shape=(capacity,))
+
+    def write(self, ids, X, y):
+        n = min(len(ids), len(self._y) - self.rows)  # rows labelled after the count are left out
+        self._X[self.rows:self.rows + n] = X[:n]
+        self._y[self.rows:self.rows + n] = y[:n]
+        self._ids[self.rows:self.rows + n] = ids[:n]
+        self.rows += n
+
+    def close(self):
+        for array in (self._X, self._y, self._ids):
+            array.flush()
+        self._X = self._y = self._ids = None
+        (self.directory / 'rows.json').write_text(json.dumps({'rows': self.rows, 'columns': self.columns}))
+
+    def batches(self, size):
+        X = np.load(self.directory / 'X.npy', mmap_mode='r')
+        y = np.load(self.directory / 'y.npy', mmap_mode='r')
+        ids = np.load(self.directory / 'ids.npy', mmap_mode='r')
+        for start in range(0, self.rows, size):
+            stop = min(start + size, self.rows)
+            yield np.asarray(ids[start:stop]), np.asarray(X[start:stop]), np.asarray(y[start:stop])
+
+
+class ParquetStore:
+    """The same data as one Parquet file, one row group per batch."""
+    format = 'parquet'
+
+    def __init__(self, directory, columns, capacity=None):
+        self.path = Path(directory) / 'features.parquet'
+        self.columns = columns
+        self.rows = 0
+        self._schema = pyarrow.schema(
+            [('patient_id', pyarrow.int64()), ('target', pyarrow.float64())]
+            + [(name, pyarrow.float64()) for name in columns]
+        )
+        self._writer = pq.ParquetWriter(self.path, self._schema)
+
+    def write(self, ids, X, y):
+        arrays = [pyarrow.array(ids, pyarrow.int64()), pyarrow.array(y)]
+        arrays += [pyarrow.array(X[:, i], from_pandas=True) for i in range(X.shape[1])]  # NaN -> null
+        self._writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self._schema))
+        self.rows += len(ids)
+
+    def close(self):
+        self._writer.close()
+
+    def batches(self, size):
+        for batch in pq.ParquetFile(self.path).iter_batches(batch_size=size):
+            ids = batch.column(0).to_numpy()
+            y = batch.column(1).to_numpy()
+            X = np.column_stack([
+                batch.column(i + 2).to_numpy(zero_copy_only=False).astype(np.float64) for i in range(len(self.columns))
+            ]) if self.columns else np.empty((len(ids), 0))
+            yield ids, X, y
+
+
+def open_store(format, directory, columns, capacity):
+    if format == 'auto':
+        format = 'parquet' if pyarrow is not None else 'npy'
+    if format == 'parquet':
+        if pyarrow is None:
+            raise ValueError("Parquet output needs pyarrow; install it or use --format npy.")
+        return ParquetStore(directory, columns, capacity)
+    return NpyStore(directory, columns, capacity)
+
+
+def write_features(store, conditions, batch_size, report=None):
+    """Stream labelled patients into `store` one batch at a time."""
+    today = timezone.localdate()
+
+    def flush(batch):
+        ids = np.array([pk for pk, _ in batch], dtype=np.int64)
+        y = np.array([days for _, days in batch], dtype=np.float64)
+        store.write(ids, recovery.extract(ids.tolist(), conditions, today), y)
+        if report:
+            report('features', store.rows)
+
+    batch = []
+    for patient_id, first, done in labels().iterator(chunk_size=batch_size):
+        batch.append((patient_id, max((done - first).days, 1)))
+        if len(batch) == batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    store.close()
+
+
+# -------------------------
+# FIT
+# -------------------------
+def column_stats(store, batch_size):
+    """NaN-aware per-column mean and standard deviation over the training rows."""
+    d = len(store.columns)
+    n, total, squares = np.zeros(d), np.zeros(d), np.zeros(d)
+    for ids, X, _ in store.batches(batch_size):
+        X = X[ids % HOLDOUT_MODULUS != 0]
+        present = ~np.isnan(X)
+        values = np.where(present, X, 0.0)
+        n += present.sum(axis=0)
+        total += values.sum(axis=0)
+        squares += (values ** 2).sum(axis=0)
+    mean = np.divide(total, n, out=np.zeros(d), where=n > 0)
+    variance = np.divide(squares, n, out=np.zeros(d), where=n > 0) - mean ** 2
+    scale = np.sqrt(np.clip(variance, 0, None))
+    scale[scale < 1e-9] = 1.0
+    return mean, scale
+
+
+def _design(X, mean, scale):
+    """Standardized features with NaN imputed to the mean, plus a leading intercept column."""
+    Z = (np.where(np.isnan(X), mean, X) - mean) / scale
+    return np.hstack([np.ones((len(Z), 1)), Z])
+
+
+def fit(store, batch_size, ridge=1.0):
+    """Ridge regression from streamed normal equations. Returns (weights, mean, scale, metrics)."""
+    mean, scale = column_stats(store, batch_size)
+    d = len(store.columns) + 1
+    gram, moment = np.zeros((d, d)), np.zeros(d)
+    targets = []
+    for ids, X, y in store.batches(batch_size):
+        train = ids % HOLDOUT_MODULUS != 0
+        A = _design(X[train], mean, scale)
+        gram += A.T @ A
+        moment += A.T @ y[train]
+        targets.append((y[train].min(initial=np.inf), y[train].max(initial=-np.inf), train.sum()))
+    penalty = ridge * np.eye(d)
+    penalty[0, 0] = 0  # the intercept is not shrunk
+    weights = np.linalg.lstsq(gram + penalty, moment, rcond=None)[0]
+
+    # held-out R^2 (falls back to the training rows when the holdout is empty)
+    holdout = [0, 0.0, 0.0, 0.0]  # n, sum y, sum y^2, residual sum of squares
+    train_fit = [0, 0.0, 0.0, 0.0]
+    for ids, X, y in store.batches(batch_size):
+        residual = y - _design(X, mean, scale) @ weights
+        for stats, rows in ((holdout, ids % HOLDOUT_MODULUS == 0), (train_fit, ids % HOLDOUT_MODULUS != 0)):
+            stats[0] += rows.sum()
+            stats[1] += y[rows].sum()
+            stats[2] += (y[rows] ** 2).sum()
+            stats[3] += (residual[rows] ** 2).sum()
+
+    def r2(n, total, squares, rss):
+        spread = squares - total ** 2 / n if n else 0.0
+        return 1 - rss / spread if spread > 0 else 0.0
+
+    scored = holdout if holdout[0] else train_fit
+    lows, highs, counts = zip(*targets) if targets else ((1.0,), (365.0,), (0,))
+    metrics = {
+        'train_rows': int(sum(counts)),
+        'holdout_rows': int(holdout[0]),
+        'r2': round(float(r2(*scored)), 4),
+        'train_r2': round(float(r2(*train_fit)), 4),
+        'rmse_days': round(float(np.sqrt(scored[3] / scored[0])), 2) if scored[0] else None,
+        'min_days': float(max(min(lows), 1.0)) if sum(counts) else 1.0,
+        'max_days': float(max(highs)) if sum(counts) else 365.0,
+    }
+    return weights, mean, scale, metrics
+
+
+# -------------------------
+# PIPELINE
+# -------------------------
+def default_version():
+    return timezone.now().strftime('recovery-%Y%m%d-%H%M%S')
+
+
+def train(version=None, format='auto', batch_size=None, ridge=1.0, work_dir=None, activate=True, report=None):
+    """
+    Run the whole pipeline and save a new artifact. Returns (version, metrics).
+    The feature store is deleted afterwards unless `work_dir` is given.
+    """
+    version = version or default_version()
+    if not recovery.VERSION_PATTERN.match(version):
+        raise ValueError(f"Invalid model version {version!r}: use up to 50 letters, digits, '.', '_' or '-'.")
+    batch_size = batch_size or recovery.recovery_settings()['BATCH_SIZE']
+    directory = Path(work_dir) if work_dir else Path(tempfile.mkdtemp(prefix='recovery-features-'))
+    directory.mkdir(parents=True, exist_ok=True)
+    try:
+        conditions = condition_vocabulary(batch_size)
+        columns = recovery.feature_names(conditions)
+        capacity = labels().count()
+        if not capacity:
+            raise ValueError("No patients with a completed treatment plan to learn from.")
+        store = open_store(format, directory, columns, capacity)
+        write_features(store, conditions, batch_size, report)
+        weights, mean, scale, metrics = fit(store, batch_size, ridge)
+        meta = {
+            'features': columns,
+            'conditions': conditions,
+            'trained_at': timezone.now().isoformat(),
+            'feature_store': store.format,
+            'ridge': ridge,
+            'target': 'days from first treatment plan to last completed plan',
+            **metrics,
+        }
+        recovery.save_artifact(version, meta, weights, mean, scale, make_latest=activate)
+        return version, metrics
+    finally:
+        if not work_dir:
+            shutil.rmtree(directory, ignore_errors=True)
@@ -14,6 +14,29 @@ urlpatterns = [
     # Dashboard
     # ---------------------------------------
     path('dashboard/', views.dashboard, name='dashboard'),
+    path('calendar/', views.therapist_calendar, name='therapist_calendar'),
+    path('calendar/route/', views.therapist_route, name='therapist_route'),
+    path('patients/<int:patient_id>/timeline/', views.patient_timeline, name='patient_timeline'),
+
+    # ---------------------------------------
+    # Metrics
+    # ---------------------------------------
+    path('metrics', views.metrics_view, name='metrics'),
+
+    # ---------------------------------------
+    # JSON API (v1)
+    # ---------------------------------------
+    path('api/v1/bootstrap/', views.api_bootstrap, name='api_bootstrap'),
+    path('api/v1/patients/<int:patient_id>/timeline/', views.api_patient_timeline, name='api_patient_timeline'),
+    path('api/v1/patients/<int:patient_id>/recovery/', views.api_patient_recovery, name='api_patient_recovery'),
+    path('api/v1/<str:resource>/', views.api_list, name='api_list'),
+    path('api/v1/<str:resource>/<int:pk>/', views.api_detail, name='api_detail'),
+
+    # ---------------------------------------
+    # Search & Autocomplete
+    # ---------------------------------------
+    path('search/', views.search, name='search'),
+    path('autocomplete/<str:kind>/', views.autocomplete, name='autocomplete'),
 
     # ---------------------------------------
     # Service CRUD
@@ -68,6 +91,9 @@ urlpatterns = [
     path('availability/add/', views.availability_slot_create, name='availability_slot_create'),
     path('availability/<int:pk>/edit/', views.availability_slot_update, name='availability_slot_update'),
     path('availability/<int:pk>/delete/', views.availability_slot_delete, name='availability_slot_delete'),
+    path('availability/rules/', views.availability_rule_list, name='availability_rule_list'),
+    path('availability/rules/add/', views.availability_rule_create, name='availability_rule_create'),
+    path('availability/rules/<int:pk>/delete/', views.availability_rule_delete, name='availability_rule_delete'),
 
     # ---------------------------------------
     # Location Coverage
@@ -83,6 +109,7 @@ urlpatterns = [
     path('payments/', views.payment_list, name='payment_list'),
     path('payments/create/', views.payment_create, name='payment_create'),
     path('payments/success/', views.payment_success, name='payment_success'),
+    path('payments/<int:payment_id>/coupon/', views.payment_apply_coupon, name='payment_apply_coupon'),
 
     # ---------------------------------------
     # Discount Coupons
@@ -131,6 +158,9 @@ urlpatterns = [
     path('reminders/create/', views.reminder_create, name='reminder_create'),
     path('reminders/<int:pk>/update/', views.reminder_update, name='reminder_update'),
     path('reminders/<int:pk>/delete/', views.reminder_delete, name='reminder_delete'),
+    path('reminders/rules/', views.reminder_rule_list, name='reminder_rule_list'),
+    path('reminders/rules/create/', views.reminder_rule_create, name='reminder_rule_create'),
+    path('reminders/rules/<int:pk>/delete/', views.reminder_rule_delete, name='reminder_rule_delete'),
 
     # ---------------------------------------
     # Blog Articles
@@ -165,6 +195,7 @@ urlpatterns = [
     path('subscriptions/create/', views.subscription_create, name='subscription_create'),
     path('subscriptions/<int:pk>/edit/', views.subscription_update, name='subscription_update'),
     path('subscriptions/<int:pk>/delete/', views.subscription_delete, name='subscription_delete'),
+    path('subscriptions/mine/', views.my_subscription, name='my_subscription'),
 
     # ---------------------------------------
     # Transactions
@@ -178,6 +209,8 @@ urlpatterns = [
     # Analytics Reports
     # ---------------------------------------
     path('analytics/', views.analytics_list, name='analytics_list'),
+    path('analytics/cohorts/', views.cohort_analytics, name='cohort_analytics'),
+    path('analytics/revenue/', views.revenue_report, name='revenue_report'),
     path('analytics/create/', views.analytics_create, name='analytics_create'),
     path('analytics/<int:pk>/edit/', views.analytics_update, name='analytics_update'),
     path('analytics/<int:pk>/delete/', views.analytics_delete, name='analytics_delete'),
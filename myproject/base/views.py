@@ -3,13 +3,19 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
-from datetime import date
+from datetime import date, timedelta
+from decimal import Decimal
 from django.core.exceptions import ValidationError
 from django.utils.text import slugify
+from django.db import transaction
 from django.db.models import Q
 import razorpay
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_POST
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
 
 
 # # ✅ Razorpay Client
@@ -18,22 +24,246 @@ client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_S
 from .forms import (
     UserRegisterForm, LoginForm, ServiceForm, AppointmentForm,
     ExerciseForm, FeedbackForm, TreatmentPlanForm, NotificationForm, AvailabilitySlotForm, LocationCoverageForm, PaymentForm,
-    DiscountCouponForm, EmergencyRequestForm, ChatMessageForm, SupportTicketForm, TherapistLeaveForm, HomeExerciseReminderForm, BlogArticleForm, FAQForm, ClinicBranchForm, SubscriptionPlanForm, TransactionForm, AnalyticsReportForm, RecoveryPredictorForm
+    DiscountCouponForm, EmergencyRequestForm, ChatMessageForm, SupportTicketForm, TherapistLeaveForm, HomeExerciseReminderForm, BlogArticleForm, FAQForm, ClinicBranchForm, SubscriptionPlanForm, TransactionForm, AnalyticsReportForm, RecoveryPredictorForm,
+    AvailabilityRuleForm, ReminderRuleForm
 )
-from .models import User, Service, Appointment, Feedback, Exercise, TreatmentPlan, Notification, AvailabilitySlot, LocationCoverage, Payment, DiscountCoupon, EmergencyRequest, ChatMessage, SupportTicket, TherapistLeave, HomeExerciseReminder, BlogArticle, FAQ, ClinicBranch, SubscriptionPlan, Transaction, AnalyticsReport, RecoveryPredictor
+from .models import User, Service, Appointment, Feedback, Exercise, TreatmentPlan, Notification, AvailabilitySlot, LocationCoverage, Payment, DiscountCoupon, EmergencyRequest, ChatMessage, SupportTicket, TherapistLeave, HomeExerciseReminder, BlogArticle, FAQ, ClinicBranch, SubscriptionPlan, Subscription, Transaction, AnalyticsReport, RecoveryPredictor, AvailabilityRule, ReminderRule, RoutePlan
+from .recurrence import expand_rule
+from .permissions import ADMIN, PATIENT, THERAPIST, role_required
+from . import search as search_index
+from . import autocomplete as autocomplete_index
+from . import api
+from . import metrics
+from . import timeline
+from . import schedule
+from . import routing
+from . import recovery
+from . import cohorts
+from . import ledger
+from . import coupons
+from . import subscriptions
+from . import permissions
+from . import throttle
 
 
 def home(request):
     return render(request,'home.html')
 
 
+# -------------------------------------
+# SEARCH
+# -------------------------------------
+SEARCH_PAGE_SIZE = 20
+
+
+@login_required
+def search(request):
+    """
+    Unified search over blogs, FAQs, exercises and services.
+    ?q=<text>&type=<blog|faq|exercise|service>&page=<n>&format=json
+    """
+    query = request.GET.get('q', '').strip()
+    doc_types = [t for t in request.GET.getlist('type') if t in search_index.DOCUMENT_TYPES]
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page = 1
+
+    # Fetch one extra hit to know whether there is a next page
+    results = search_index.search(
+        query, doc_types=doc_types, limit=SEARCH_PAGE_SIZE + 1, offset=(page - 1) * SEARCH_PAGE_SIZE
+    ) if query else []
+    has_next = len(results) > SEARCH_PAGE_SIZE
+    results = results[:SEARCH_PAGE_SIZE]
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'query': query, 'page': page, 'has_next': has_next, 'results': results})
+
+    return render(request, 'search/search_results.html', {
+        'query': query,
+        'doc_types': doc_types,
+        'all_doc_types': sorted(search_index.DOCUMENT_TYPES),
+        'results': results,
+        'page': page,
+        'has_next': has_next,
+        'user_role': request.user.role
+    })
+
+
+# -------------------------------------
+# AUTOCOMPLETE (AJAX pickers)
+# -------------------------------------
+@login_required
+def autocomplete(request, kind):
+    """Typeahead suggestions for patient / therapist / exercise / appointment pickers."""
+    if kind not in autocomplete_index.LOADERS:
+        return JsonResponse({'error': 'Unknown picker.'}, status=404)
+    try:
+        limit = min(int(request.GET.get('limit', 10)), 25)
+    except ValueError:
+        limit = 10
+    results = autocomplete_index.lookup(kind, request.GET.get('q', ''), request.user, limit=limit)
+    return JsonResponse({'results': results})
+
+
+# -------------------------------------
+# JSON API (v1)
+# -------------------------------------
+def _api_response(payload, etag):
+    response = JsonResponse(payload)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@api.api_login_required
+def api_list(request, resource):
+    """?fields=a,b&limit=n&cursor=<next>&updated_since=<iso>; honours If-None-Match."""
+    resource = api.get_resource(resource)
+    names = resource.select_fields(request.GET.get('fields'))
+    limit = api.parse_limit(request.GET.get('limit'))
+    cursor = api.parse_cursor(request.GET.get('cursor'))
+    queryset = api.apply_filters(resource, resource.get_queryset(request.user), request.GET)
+
+    etag = api.make_etag(
+        api.API_VERSION, resource.name, request.user.pk, names, limit, cursor,
+        request.GET.get('updated_since'), *api.list_fingerprint(resource, queryset)
+    )
+    if api.etag_matches(request, etag):
+        return api.not_modified(etag)
+
+    results, next_cursor = resource.page(queryset, names, cursor=cursor, limit=limit)
+    next_url = None
+    if next_cursor is not None:
+        params = request.GET.copy()
+        params['cursor'] = next_cursor
+        next_url = f"{request.path}?{params.urlencode()}"
+    return _api_response({'version': api.API_VERSION, 'results': results, 'next': next_url}, etag)
+
+
+@api.api_login_required
+def api_detail(request, resource, pk):
+    resource = api.get_resource(resource)
+    names = resource.select_fields(request.GET.get('fields'))
+    queryset = resource.get_queryset(request.user).filter(pk=pk)
+
+    updated_at = queryset.values_list(resource.updated_field, flat=True).first()
+    if updated_at is None:
+        return JsonResponse({'error': 'Not found.'}, status=404)
+    etag = api.make_etag(api.API_VERSION, resource.name, request.user.pk, names, pk, updated_at)
+    if api.etag_matches(request, etag):
+        return api.not_modified(etag)
+
+    return _api_response({'version': api.API_VERSION, 'result': resource.serialize(queryset, names)[0]}, etag)
+
+
+@gzip_page
+@api.api_login_required
+def api_bootstrap(request):
+    """Appointments, active plans, unread notifications, upcoming reminders and progress in one call."""
+    payload = api.bootstrap(request.user)
+    payload['version'] = api.API_VERSION
+    response = api.FastJsonResponse(payload)
+    response['Cache-Control'] = 'private, no-store'
+    return response
+
+
+@api.api_login_required
+def api_patient_timeline(request, patient_id):
+    """Merged event stream for one patient. ?limit=n&cursor=<next>&kinds=appointment,payment"""
+    patient = get_object_or_404(User, pk=patient_id, role="Patient")
+    if not timeline.can_view(request.user, patient):
+        raise api.ApiError("You don't have access to this timeline.", status=403)
+    try:
+        cursor = timeline.decode_cursor(request.GET.get('cursor'))
+    except timeline.InvalidCursor as exc:
+        raise api.ApiError(str(exc))
+    limit = max(1, min(api.parse_limit(request.GET.get('limit') or timeline.DEFAULT_LIMIT), timeline.MAX_LIMIT))
+
+    events, next_cursor = timeline.page(
+        patient.pk, cursor=cursor, limit=limit, sources=timeline.parse_kinds(request.GET.get('kinds'))
+    )
+    next_url = None
+    if next_cursor is not None:
+        params = request.GET.copy()
+        params['cursor'] = next_cursor
+        next_url = f"{request.path}?{params.urlencode()}"
+    return api.FastJsonResponse({
+        'version': api.API_VERSION,
+        'patient': {'id': patient.pk, 'username': patient.username},
+        'results': [event.as_dict() for event in events],
+        'next': next_url,
+    })
+
+
+@api.api_login_required
+def api_patient_recovery(request, patient_id):
+    """Recovery-time prediction for one patient from the current model (cached briefly per process)."""
+    patient = get_object_or_404(User, pk=patient_id, role="Patient")
+    if not timeline.can_view(request.user, patient):
+        raise api.ApiError("You don't have access to this patient.", status=403)
+    try:
+        prediction = recovery.predict_patient(patient.pk)
+    except recovery.ModelUnavailable as exc:
+        raise api.ApiError(str(exc), status=503)
+    return api.FastJsonResponse({'version': api.API_VERSION, 'result': prediction})
+
+
+# -------------------------------------
+# PATIENT TIMELINE
+# -------------------------------------
+@login_required
+def patient_timeline(request, patient_id):
+    patient = get_object_or_404(User, pk=patient_id, role="Patient")
+    if not timeline.can_view(request.user, patient):
+        messages.error(request, "You don't have permission to view this timeline.")
+        return redirect("dashboard")
+
+    kinds = request.GET.get('kinds', '')
+    try:
+        cursor = timeline.decode_cursor(request.GET.get('cursor'))
+    except timeline.InvalidCursor:
+        cursor = None
+    events, next_cursor = timeline.page(patient.pk, cursor=cursor, sources=timeline.parse_kinds(kinds))
+
+    return render(request, "timeline/patient_timeline.html", {
+        "patient": patient,
+        "events": events,
+        "next_cursor": next_cursor,
+        "kinds": kinds,
+        "all_kinds": timeline.KINDS,
+        "user_role": request.user.role
+    })
+
+
+# -------------------------------------
+# METRICS (Prometheus scrape target)
+# -------------------------------------
+def metrics_view(request):
+    """Per-view request histograms for this process; staff, METRICS['TOKEN'] or METRICS['ALLOWED_IPS'] only."""
+    if not metrics.may_scrape(request):
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 # -------------------------------------
 # USER AUTH VIEWS
 # -------------------------------------
+def too_many_attempts(request, wait, template, form):
+    messages.error(request, f"Too many attempts. Please try again in {wait} seconds.")
+    response = render(request, template, {"form": form}, status=429)
+    response["Retry-After"] = str(wait)
+    return response
+
+
 def register(request):
     if request.method == "POST":
+        wait = throttle.hit(request)
+        if wait:
+            return too_many_attempts(request, wait, "auth/register.html", UserRegisterForm())
         form = UserRegisterForm(request.POST, request.FILES)
         if form.is_valid():
+            # no refund: every account costs a password hash, so registrations keep draining the IP bucket
             user = form.save()
             login(request, user)
             messages.success(request, "Account created successfully!")
@@ -48,9 +278,15 @@ def register(request):
 
 def login_view(request):
     if request.method == "POST":
+        # Rejected before the form runs the password hasher
+        username = request.POST.get("username", "")
+        wait = throttle.hit(request, username)
+        if wait:
+            return too_many_attempts(request, wait, "auth/login.html", LoginForm())
         form = LoginForm(data=request.POST)
         if form.is_valid():
             user = form.get_user()
+            throttle.succeeded(request, username)
             login(request, user)
             
             # Redirect based on user role
@@ -91,7 +327,13 @@ def dashboard(request):
         })
 
     elif request.user.role == "Therapist":
-        appointments = Appointment.objects.filter(therapist=request.user)
+        # Upcoming first; the full schedule lives in the calendar view
+        appointments = (
+            Appointment.objects.filter(therapist=request.user, scheduled_date__gte=timezone.localdate())
+            .exclude(booking_status="Cancelled")
+            .select_related("patient", "service")
+            .order_by("scheduled_date", "scheduled_time")[:20]
+        )
         return render(request, "dashboard/therapist_dashboard.html", {
             "appointments": appointments,
             "user_role": "Therapist"
@@ -112,6 +354,83 @@ def dashboard(request):
         return redirect("logout")
 
 
+# -------------------------------------
+# THERAPIST CALENDAR
+# -------------------------------------
+@login_required
+def therapist_calendar(request):
+    """
+    Day or week view read from the therapist's calendar snapshot.
+    ?view=day|week&date=YYYY-MM-DD (admins: &therapist=<id>), &format=json for the raw entries.
+    """
+    if permissions.has_role(request, THERAPIST):
+        therapist = request.user
+    elif permissions.has_role(request, ADMIN):
+        therapist = get_object_or_404(User, pk=request.GET.get('therapist') or 0, role="Therapist")
+    else:
+        messages.error(request, "Only therapists can view the calendar.")
+        return redirect("dashboard")
+
+    view = 'day' if request.GET.get('view') == 'day' else 'week'
+    try:
+        day = date.fromisoformat(request.GET.get('date', ''))
+    except ValueError:
+        day = timezone.localdate()
+    first = day if view == 'day' else day - timedelta(days=day.weekday())
+    last = first if view == 'day' else first + timedelta(days=6)
+    days = schedule.get_days(therapist.pk, first, last)
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'therapist': therapist.pk, 'view': view, 'days': days})
+
+    step = timedelta(days=1 if view == 'day' else 7)
+    return render(request, "calendar/therapist_calendar.html", {
+        "therapist": therapist,
+        "view": view,
+        "days": schedule.expand(days),
+        "first": first,
+        "last": last,
+        "previous": first - step,
+        "next": first + step,
+        "today": timezone.localdate(),
+        "user_role": request.user.role
+    })
+
+
+@login_required
+def therapist_route(request):
+    """Visit order for one day (?date=YYYY-MM-DD, admins: &therapist=<id>); POST recomputes and stores it."""
+    if permissions.has_role(request, THERAPIST):
+        therapist = request.user
+    elif permissions.has_role(request, ADMIN):
+        therapist = get_object_or_404(User, pk=request.GET.get('therapist') or 0, role="Therapist")
+    else:
+        messages.error(request, "Only therapists can view routes.")
+        return redirect("dashboard")
+
+    try:
+        day = date.fromisoformat(request.GET.get('date', ''))
+    except ValueError:
+        day = timezone.localdate()
+
+    if request.method == "POST":
+        routing.plan_day(therapist.pk, day)
+        messages.success(request, "Route re-planned.")
+        return redirect(request.get_full_path())
+
+    plan = RoutePlan.objects.filter(therapist=therapist, date=day).first()
+    if plan is None:
+        # Preview only; plans are stored by `manage.py plan_routes` or an explicit re-plan
+        plan = routing.plan_day(therapist.pk, day, save=False)
+
+    return render(request, "calendar/therapist_route.html", {
+        "therapist": therapist,
+        "day": day,
+        "plan": plan,
+        "user_role": request.user.role
+    })
+
+
 # -------------------------------------
 # SERVICE CRUD (Role-based access)
 # -------------------------------------
@@ -120,7 +439,7 @@ def service_list(request):
     services = Service.objects.all()
     
     # Determine user permissions
-    can_edit = request.user.role in ["Admin", "Therapist"]
+    can_edit = permissions.has_role(request, permissions.EDITORS)
     
     return render(request, "services/service_list.html", {
         "services": services,
@@ -130,12 +449,9 @@ def service_list(request):
 
 
 @login_required
+@role_required(ADMIN, THERAPIST, redirect_to="service_list",
+               message="You don't have permission to add services.")
 def add_service(request):
-    # Only Admin and Therapist can add services
-    if request.user.role not in ["Admin", "Therapist"]:
-        messages.error(request, "You don't have permission to add services.")
-        return redirect("service_list")
-
     if request.method == "POST":
         form = ServiceForm(request.POST, request.FILES)
         if form.is_valid():
@@ -153,12 +469,9 @@ def add_service(request):
 
 
 @login_required
+@role_required(ADMIN, THERAPIST, redirect_to="service_list",
+               message="You don't have permission to update services.")
 def update_service(request, pk):
-    # Only Admin and Therapist can update services
-    if request.user.role not in ["Admin", "Therapist"]:
-        messages.error(request, "You don't have permission to update services.")
-        return redirect("service_list")
-
     service = get_object_or_404(Service, id=pk)
 
     if request.method == "POST":
@@ -178,12 +491,9 @@ def update_service(request, pk):
 
 
 @login_required
+@role_required(ADMIN, THERAPIST, redirect_to="service_list",
+               message="You don't have permission to delete services.")
 def delete_service(request, pk):
-    # Only Admin and Therapist can delete services
-    if request.user.role not in ["Admin", "Therapist"]:
-        messages.error(request, "You don't have permission to delete services.")
-        return redirect("service_list")
-
     service = get_object_or_404(Service, id=pk)
     service.delete()
     messages.warning(request, "Service deleted!")
@@ -194,11 +504,9 @@ def delete_service(request, pk):
 # APPOINTMENT BOOKING
 # -------------------------------------
 @login_required
+@role_required(PATIENT, redirect_to="dashboard",
+               message="Only patients can book appointments.")
 def book_appointment(request):
-    if request.user.role != "Patient":
-        messages.error(request, "Only patients can book appointments.")
-        return redirect("dashboard")
-
     if request.method == "POST":
         form = AppointmentForm(request.POST)
         if form.is_valid():
@@ -271,15 +579,12 @@ def exercise_detail(request, exercise_id):
     })
 
 @login_required
+@role_required(ADMIN, THERAPIST, redirect_to="exercise_list",
+               message="You don't have permission to create exercises.")
 def exercise_create(request):
     """
     Create new exercise
     """
-    # Only Admin and Therapist can create exercises
-    if request.user.role not in ["Admin", "Therapist"]:
-        messages.error(request, "You don't have permission to create exercises.")
-        return redirect("exercise_list")
-
     if request.method == "POST":
         form = ExerciseForm(request.POST)
         if form.is_valid():
@@ -298,15 +603,12 @@ def exercise_create(request):
     })
 
 @login_required
+@role_required(ADMIN, THERAPIST, redirect_to="exercise_list",
+               message="You don't have permission to update exercises.")
 def exercise_update(request, exercise_id):
     """
     Update existing exercise
     """
-    # Only Admin and Therapist can update exercises
-    if request.user.role not in ["Admin", "Therapist"]:
-        messages.error(request, "You don't have permission to update exercises.")
-        return redirect("exercise_list")
-
     exercise = get_object_or_404(Exercise, id=exercise_id)
     
     if request.method == "POST":
@@ -328,15 +630,12 @@ def exercise_update(request, exercise_id):
     })
 
 @login_required
+@role_required(ADMIN, THERAPIST, redirect_to="exercise_list",
+               message="You don't have permission to delete exercises.")
 def exercise_delete(request, exercise_id):
     """
     Delete exercise
     """
-    # Only Admin and Therapist can delete exercises
-    if request.user.role not in ["Admin", "Therapist"]:
-        messages.error(request, "You don't have permission to delete exercises.")
-        return redirect("exercise_list")
-
     exercise = get_object_or_404(Exercise, id=exercise_id)
 
     if request.method == "POST":
@@ -360,25 +659,13 @@ def treatment_plan_list(request):
     """
     List all treatment plans with role-based access control
     """
-    # Get treatment plans based on user role
-    if request.user.role == 'patient':
-        # Patients can only see their own treatment plans
-        treatment_plans = TreatmentPlan.objects.filter(
-            appointment__patient=request.user
-        ).select_related('appointment', 'prescribed_by', 'appointment__patient', 'appointment__service')
-    elif request.user.role == 'Therapist':
-        # Therapists can see plans they prescribed
-        treatment_plans = TreatmentPlan.objects.filter(
-            prescribed_by=request.user
-        ).select_related('appointment', 'prescribed_by', 'appointment__patient', 'appointment__service')
-    else:  # admin
-        # Admins can see all treatment plans
-        treatment_plans = TreatmentPlan.objects.all().select_related(
-            'appointment', 'prescribed_by', 'appointment__patient', 'appointment__service'
-        )
+    # Patients see their own plans, therapists the plans they prescribed, admins all
+    treatment_plans = permissions.TREATMENT_PLANS.scope(request, TreatmentPlan.objects.select_related(
+        'appointment', 'prescribed_by', 'appointment__patient', 'appointment__service'
+    ))
     
     # Check if user can create new plans (admin or therapist)
-    can_create = request.user.role in ['admin', 'Therapist']
+    can_create = permissions.has_role(request, permissions.EDITORS)
     
     context = {
         'treatment_plans': treatment_plans,
@@ -392,32 +679,27 @@ def treatment_plan_detail(request, pk):
     """
     View treatment plan details
     """
-    treatment_plan = get_object_or_404(TreatmentPlan, pk=pk)
-    
-    # Check permissions
-    if request.user.role == 'patient' and treatment_plan.appointment.patient != request.user:
-        return HttpResponseForbidden("You don't have permission to view this treatment plan.")
-    elif request.user.role == 'Therapist' and treatment_plan.prescribed_by != request.user:
-        return HttpResponseForbidden("You don't have permission to view this treatment plan.")
+    # Plans the user may not see are a 404
+    treatment_plan = permissions.TREATMENT_PLANS.get_object_or_404(
+        request, TreatmentPlan.objects.select_related('appointment__patient', 'prescribed_by'), pk=pk
+    )
     
     context = {
         'treatment_plan': treatment_plan,
+        'can_edit': permissions.has_role(request, permissions.EDITORS),  # the plan is already scoped to its owner
         'title': f'Treatment Plan - {treatment_plan.appointment.patient.get_full_name()}'
     }
     return render(request, 'treatment/treatment_plan_detail.html', context)
 
 @login_required
+@role_required(ADMIN, THERAPIST, redirect_to='treatment_plan_list',
+               message="You don't have permission to create treatment plans.")
 def treatment_plan_create(request):
     """
     Create a new treatment plan
     """
-    # Check permissions - only admin and therapist can create
-    if request.user.role not in ['Admin', 'Therapist']:
-        messages.error(request, "You don't have permission to create treatment plans.")
-        return redirect('treatment_plan_list')
-    
     if request.method == 'POST':
-        form = TreatmentPlanForm(request.POST)
+        form = TreatmentPlanForm(request.POST, user=request.user)
         if form.is_valid():
             treatment_plan = form.save(commit=False)
             
@@ -433,12 +715,12 @@ def treatment_plan_create(request):
             messages.error(request, 'Please correct the errors below.')
     else:
         # Initialize form with filtered appointments
-        form = TreatmentPlanForm()
+        form = TreatmentPlanForm(user=request.user)
         
 
         
         # Auto-set prescribed_by for therapists
-        if request.user.role == 'therapist':
+        if permissions.has_role(request, THERAPIST):
             form.fields['prescribed_by'].initial = request.user
     
     context = {
@@ -448,24 +730,21 @@ def treatment_plan_create(request):
     return render(request, 'treatment/treatment_plan_form.html', context)
 
 @login_required
+@role_required(ADMIN, THERAPIST, redirect_to='treatment_plan_list',
+               message="You don't have permission to create treatment plans.")
 def treatment_plan_create_for_appointment(request, appointment_id):
     """
     Create treatment plan for a specific appointment
     """
-    # Check permissions
-    if request.user.role not in ['Admin', 'Therapist']:
-        messages.error(request, "You don't have permission to create treatment plans.")
-        return redirect('treatment_plan_list')
-    
     appointment = get_object_or_404(Appointment, pk=appointment_id)
     
     # Check if therapist owns this appointment
-    if request.user.role == 'Therapist' and appointment.therapist != request.user:
+    if not permissions.has_role(request, ADMIN) and appointment.therapist != request.user:
         messages.error(request, "You can only create treatment plans for your own appointments.")
         return redirect('treatment_plan_list')
     
     if request.method == 'POST':
-        form = TreatmentPlanForm(request.POST)
+        form = TreatmentPlanForm(request.POST, user=request.user)
         if form.is_valid():
             treatment_plan = form.save(commit=False)
             
@@ -486,10 +765,10 @@ def treatment_plan_create_for_appointment(request, appointment_id):
         }
         
         # Auto-set prescribed_by for therapists
-        if request.user.role == 'Therapist':
+        if permissions.has_role(request, THERAPIST):
             initial_data['prescribed_by'] = request.user
         
-        form = TreatmentPlanForm(initial=initial_data)
+        form = TreatmentPlanForm(initial=initial_data, user=request.user)
         
         # Limit appointment choices to this specific appointment
         form.fields['appointment'].queryset = Appointment.objects.filter(pk=appointment_id)
@@ -502,29 +781,22 @@ def treatment_plan_create_for_appointment(request, appointment_id):
     return render(request, 'treatment/treatment_plan_form.html', context)
 
 @login_required
+@role_required(ADMIN, THERAPIST, redirect_to='treatment_plan_list',
+               message="You don't have permission to update treatment plans.")
 def treatment_plan_update(request, pk):
     """
     Update an existing treatment plan
     """
-    treatment_plan = get_object_or_404(TreatmentPlan, pk=pk)
-    
-    # Check permissions
-    if request.user.role not in ['Admin', 'Therapist']:
-        messages.error(request, "You don't have permission to update treatment plans.")
-        return redirect('treatment_plan_list')
-    
     # Therapists can only update their own treatment plans
-    if request.user.role == 'therapist' and treatment_plan.prescribed_by != request.user:
-        messages.error(request, "You can only update treatment plans you prescribed.")
-        return redirect('treatment_plan_list')
+    treatment_plan = permissions.TREATMENT_PLANS.get_object_or_404(request, TreatmentPlan.objects.all(), pk=pk)
     
     if request.method == 'POST':
-        form = TreatmentPlanForm(request.POST, instance=treatment_plan)
+        form = TreatmentPlanForm(request.POST, instance=treatment_plan, user=request.user)
         if form.is_valid():
             updated_plan = form.save(commit=False)
             
             # Ensure prescribed_by remains the same unless admin changes it
-            if request.user.role == 'Therapist':
+            if not permissions.has_role(request, ADMIN):
                 updated_plan.prescribed_by = request.user
             
             updated_plan.save()
@@ -534,7 +806,7 @@ def treatment_plan_update(request, pk):
         else:
             messages.error(request, 'Please correct the errors below.')
     else:
-        form = TreatmentPlanForm(instance=treatment_plan)
+        form = TreatmentPlanForm(instance=treatment_plan, user=request.user)
         
 
     
@@ -546,21 +818,14 @@ def treatment_plan_update(request, pk):
     return render(request, 'treatment/treatment_plan_form.html', context)
 
 @login_required
+@role_required(ADMIN, THERAPIST, redirect_to='treatment_plan_list',
+               message="You don't have permission to delete treatment plans.")
 def treatment_plan_delete(request, pk):
     """
     Delete a treatment plan
     """
-    treatment_plan = get_object_or_404(TreatmentPlan, pk=pk)
-    
-    # Check permissions
-    if request.user.role not in ['Admin', 'Therapist']:
-        messages.error(request, "You don't have permission to delete treatment plans.")
-        return redirect('treatment_plan_list')
-    
     # Therapists can only delete their own treatment plans
-    if request.user.role == 'Therapist' and treatment_plan.prescribed_by != request.user:
-        messages.error(request, "You can only delete treatment plans you prescribed.")
-        return redirect('treatment_plan_list')
+    treatment_plan = permissions.TREATMENT_PLANS.get_object_or_404(request, TreatmentPlan.objects.all(), pk=pk)
     
     if request.method == 'POST':
         patient_name = treatment_plan.appointment.patient.get_full_name()
@@ -579,12 +844,8 @@ def treatment_plan_delete(request, pk):
 # -------------------------------------
 @login_required
 def notification_list(request):
-    if request.user.role == "Admin":
-        notifications = Notification.objects.all().order_by('-created_at')
-        can_edit = True
-    else:
-        notifications = Notification.objects.filter(user=request.user).order_by('-created_at')
-        can_edit = request.user.role == "Therapist"
+    notifications = permissions.NOTIFICATIONS.scope(request, Notification.objects.order_by('-created_at'))
+    can_edit = permissions.has_role(request, permissions.EDITORS)
     
     return render(request, 'Notifications/notification_list.html', {
         'notifications': notifications,
@@ -594,12 +855,9 @@ def notification_list(request):
 
 
 @login_required
+@role_required(ADMIN, THERAPIST, redirect_to='notification_list',
+               message="You don't have permission to create notifications.")
 def notification_create(request):
-    # Only Admin and Therapist can create notifications
-    if request.user.role not in ["Admin", "Therapist"]:
-        messages.error(request, "You don't have permission to create notifications.")
-        return redirect('notification_list')
-        
     if request.method == 'POST':
         form = NotificationForm(request.POST)
         if form.is_valid():
@@ -616,12 +874,9 @@ def notification_create(request):
 
 
 @login_required
+@role_required(ADMIN, THERAPIST, redirect_to='notification_list',
+               message="You don't have permission to update notifications.")
 def notification_update(request, pk):
-    # Only Admin and Therapist can update notifications
-    if request.user.role not in ["Admin", "Therapist"]:
-        messages.error(request, "You don't have permission to update notifications.")
-        return redirect('notification_list')
-        
     notification = get_object_or_404(Notification, pk=pk)
     if request.method == 'POST':
         form = NotificationForm(request.POST, instance=notification)
@@ -639,12 +894,9 @@ def notification_update(request, pk):
 
 
 @login_required
+@role_required(ADMIN, THERAPIST, redirect_to='notification_list',
+               message="You don't have permission to delete notifications.")
 def notification_delete(request, pk):
-    # Only Admin and Therapist can delete notifications
-    if request.user.role not in ["Admin", "Therapist"]:
-        messages.error(request, "You don't have permission to delete notifications.")
-        return redirect('notification_list')
-        
     notification = get_object_or_404(Notification, pk=pk)
     notification.delete()
     messages.success(request, "Notification deleted successfully.")
@@ -659,15 +911,11 @@ def availability_slot_list(request):
     """
     List availability slots based on user role.
     """
-    if request.user.role == "Admin":
-        slots = AvailabilitySlot.objects.all().order_by('date', 'start_time')
-        can_edit = True
-    elif request.user.role == "Therapist":
-        slots = AvailabilitySlot.objects.filter(therapist=request.user).order_by('date', 'start_time')
-        can_edit = True
-    else:
-        slots = AvailabilitySlot.objects.all().order_by('date', 'start_time')
-        can_edit = False
+    slots = AvailabilitySlot.objects.order_by('date', 'start_time')
+    can_edit = permissions.has_role(request, permissions.EDITORS)
+    if can_edit:
+        # Therapists manage their own slots; everyone else browses all of them
+        slots = permissions.THERAPIST_OWNED.scope(request, slots)
     
     return render(request, 'Availability/availability_slot_list.html', {
         'slots': slots,
@@ -676,20 +924,18 @@ def availability_slot_list(request):
     })
 
 @login_required
+@role_required(ADMIN, THERAPIST, redirect_to='availability_slot_list',
+               message="You don't have permission to create availability slots.")
 def availability_slot_create(request):
     """
     Create a new availability slot (Therapist and Admin only).
     """
-    if request.user.role not in ["Admin", "Therapist"]:
-        messages.error(request, "You don't have permission to create availability slots.")
-        return redirect('availability_slot_list')
-        
     if request.method == 'POST':
         form = AvailabilitySlotForm(request.POST)
         if form.is_valid():
             slot = form.save(commit=False)
             # For therapist users, always set them as the therapist
-            if request.user.role == "Therapist":
+            if permissions.has_role(request, THERAPIST):
                 slot.therapist = request.user
             slot.save()
             messages.success(request, "Availability slot created successfully.")
@@ -700,7 +946,7 @@ def availability_slot_create(request):
         form = AvailabilitySlotForm()
         
         # For therapists, pre-set and disable the therapist field
-        if request.user.role == "Therapist":
+        if permissions.has_role(request, THERAPIST):
             # Make sure the field exists and is accessible
             therapist_field = form.fields.get('therapist')
             if therapist_field:
@@ -716,18 +962,13 @@ def availability_slot_create(request):
     })
 
 @login_required
+@role_required(ADMIN, THERAPIST, redirect_to='availability_slot_list',
+               message="You don't have permission to update availability slots.")
 def availability_slot_update(request, pk):
     """
     Update an existing availability slot (Therapist and Admin only).
     """
-    if request.user.role not in ["Admin", "Therapist"]:
-        messages.error(request, "You don't have permission to update availability slots.")
-        return redirect('availability_slot_list')
-        
-    if request.user.role == "Therapist":
-        slot = get_object_or_404(AvailabilitySlot, pk=pk, therapist=request.user)
-    else:
-        slot = get_object_or_404(AvailabilitySlot, pk=pk)
+    slot = permissions.THERAPIST_OWNED.get_object_or_404(request, AvailabilitySlot.objects.all(), pk=pk)
         
     if request.method == 'POST':
         form = AvailabilitySlotForm(request.POST, instance=slot)
@@ -746,24 +987,81 @@ def availability_slot_update(request, pk):
 
 
 @login_required
+@role_required(ADMIN, THERAPIST, redirect_to='availability_slot_list',
+               message="You don't have permission to delete availability slots.")
 def availability_slot_delete(request, pk):
     """
     Delete an existing availability slot (Therapist and Admin only).
     """
-    if request.user.role not in ["Admin", "Therapist"]:
-        messages.error(request, "You don't have permission to delete availability slots.")
-        return redirect('availability_slot_list')
-        
-    if request.user.role == "Therapist":
-        slot = get_object_or_404(AvailabilitySlot, pk=pk, therapist=request.user)
-    else:
-        slot = get_object_or_404(AvailabilitySlot, pk=pk)
+    slot = permissions.THERAPIST_OWNED.get_object_or_404(request, AvailabilitySlot.objects.all(), pk=pk)
         
     slot.delete()
     messages.success(request, "Availability slot deleted successfully.")
     return redirect('availability_slot_list')
 
 
+# -------------------------------------
+# Recurring Availability Rules
+# -------------------------------------
+@login_required
+@role_required(ADMIN, THERAPIST, redirect_to='availability_slot_list',
+               message="You don't have permission to view availability rules.")
+def availability_rule_list(request):
+    """List recurring availability rules (Therapist: own rules, Admin: all)."""
+    rules = permissions.THERAPIST_OWNED.scope(
+        request, AvailabilityRule.objects.select_related('therapist').order_by('-created_at')
+    )
+
+    return render(request, 'Availability/availability_rule_list.html', {
+        'rules': rules,
+        'user_role': request.user.role
+    })
+
+
+@login_required
+@role_required(ADMIN, THERAPIST, redirect_to='availability_slot_list',
+               message="You don't have permission to create availability rules.")
+def availability_rule_create(request):
+    """Create a recurring availability rule and expand it over the rolling horizon."""
+    if request.method == 'POST':
+        data = request.POST.copy()
+        if permissions.has_role(request, THERAPIST):
+            data['therapist'] = request.user.pk
+        form = AvailabilityRuleForm(data)
+        if form.is_valid():
+            rule = form.save()
+            created = expand_rule(rule) if rule.is_active else 0
+            messages.success(request, f"Availability rule created. {created} slots generated.")
+            return redirect('availability_rule_list')
+        else:
+            messages.error(request, "Please correct the errors below.")
+    else:
+        form = AvailabilityRuleForm(initial={'start_date': timezone.localdate()})
+        if permissions.has_role(request, THERAPIST):
+            form.initial['therapist'] = request.user
+            form.fields['therapist'].disabled = True
+
+    return render(request, 'Availability/availability_rule_form.html', {
+        'form': form,
+        'action': 'Create',
+        'user_role': request.user.role
+    })
+
+
+@login_required
+@require_POST
+@role_required(ADMIN, THERAPIST, redirect_to='availability_slot_list',
+               message="You don't have permission to delete availability rules.")
+def availability_rule_delete(request, pk):
+    """Delete a rule together with its future, unbooked slots."""
+    rule = permissions.THERAPIST_OWNED.get_object_or_404(request, AvailabilityRule.objects.all(), pk=pk)
+
+    rule.slots.filter(date__gte=timezone.localdate(), is_booked=False).delete()
+    rule.delete()
+    messages.success(request, "Availability rule deleted successfully.")
+    return redirect('availability_rule_list')
+
+
 # -------------------------
 # LocationCoverage Views
 # -------------------------
@@ -837,13 +1135,39 @@ def payment_list(request):
         payments = Payment.objects.all()
     else:
         payments = Payment.objects.filter(appointment__therapist=request.user)
+    payments = payments.select_related(
+        'appointment__patient', 'appointment__therapist', 'coupon_redemption__coupon'
+    )
 
     return render(request, 'Payments/payment_list.html', {'payments': payments})
 
+
+@login_required
+def payment_apply_coupon(request, payment_id):
+    """Redeem a coupon code against a pending payment (POST only)."""
+    payment = get_object_or_404(Payment.objects.select_related('appointment'), pk=payment_id)
+    if request.method != 'POST':
+        return redirect('payment_list')
+
+    if not permissions.has_role(request, ADMIN) and request.user.id not in (
+        payment.appointment.therapist_id, payment.appointment.patient_id
+    ):
+        messages.error(request, "Unauthorized: Appointment mismatch.")
+        return redirect('payment_list')
+
+    try:
+        redemption = coupons.redeem(request.POST.get('code'), payment.pk, request.user)
+    except coupons.CouponError as exc:
+        messages.error(request, str(exc))
+    else:
+        messages.success(request, f"Coupon applied: ₹{redemption.discount_amount} off, "
+                                  f"₹{redemption.original_amount - redemption.discount_amount} to pay.")
+    return redirect('payment_list')
+
 @login_required
 def payment_create(request):
     if request.method == 'POST':
-        form = PaymentForm(request.POST)
+        form = PaymentForm(request.POST, user=request.user)
 
         if form.is_valid():
             payment = form.save(commit=False)
@@ -864,12 +1188,33 @@ def payment_create(request):
 
             # --------------------------------------
             # ✅ Safety Check 3: Protect Therapist Data
-            # (Therapist can only access their own appointment)
+            # (Therapist / patient can only pay for their own appointment)
             # --------------------------------------
-            if not request.user.is_staff and payment.appointment.therapist != request.user:
+            if not permissions.has_role(request, ADMIN) and request.user.id not in (
+                payment.appointment.therapist_id, payment.appointment.patient_id
+            ):
                 messages.error(request, "Unauthorized: Appointment mismatch.")
                 return redirect('payment_list')
 
+            # --------------------------------------
+            # ✅ Coupon: the payment is saved first so the redemption can
+            # reference it; a rejected coupon (including one that would leave
+            # less than ₹1 to charge) rolls the payment and the claimed use back
+            # --------------------------------------
+            coupon_code = form.cleaned_data.get('coupon_code')
+            if coupon_code:
+                try:
+                    with transaction.atomic():
+                        payment.payment_status = "Pending"
+                        payment.save()
+                        redemption = coupons.redeem(coupon_code, payment.pk, request.user)
+                except coupons.CouponError as exc:
+                    payment.pk = None
+                    form.add_error('coupon_code', str(exc))
+                    return render(request, 'Payments/payment_form.html', {'form': form})
+                payment.amount = redemption.original_amount - redemption.discount_amount
+                messages.success(request, f"Coupon applied: ₹{redemption.discount_amount} off.")
+
             # --------------------------------------
             # ✅ Razorpay Amount (convert Decimal → int paise)
             # --------------------------------------
@@ -885,16 +1230,26 @@ def payment_create(request):
             appointment_id = str(payment.appointment.id)
 
             # --------------------------------------
-            # ✅ Create Razorpay Order
+            # ✅ Create Razorpay Order (if it fails, a coupon applied above
+            # gets its use back and the half-made payment is removed)
             # --------------------------------------
-            razorpay_order = client.order.create({
-                "amount": amount,
-                "currency": "INR",
-                "payment_capture": 1,
-                "notes": {
-                    "appointment_id": appointment_id
-                }
-            })
+            try:
+                razorpay_order = client.order.create({
+                    "amount": amount,
+                    "currency": "INR",
+                    "payment_capture": 1,
+                    "notes": {
+                        "appointment_id": appointment_id
+                    }
+                })
+            except Exception:
+                if payment.pk:
+                    with transaction.atomic():
+                        coupons.release(payment.pk)
+                        Payment.objects.filter(pk=payment.pk).delete()
+                    payment.pk = None
+                messages.error(request, "Could not reach the payment gateway. Please try again.")
+                return render(request, 'Payments/payment_form.html', {'form': form})
 
             # --------------------------------------
             # ✅ Save Payment Data
@@ -907,16 +1262,16 @@ def payment_create(request):
             # --------------------------------------
             # ✅ Render Razorpay Checkout Page
             # --------------------------------------
-            return render(request, "payment_checkout.html", {
+            return render(request, "Payments/payment_checkout.html", {
                 "payment": payment,
                 "razorpay_order_id": razorpay_order["id"],
                 "razorpay_key": settings.RAZORPAY_KEY_ID,
                 "amount": amount,
-                "callback_url": request.build_absolute_uri("/payment/success/")
+                "callback_url": request.build_absolute_uri(reverse("payment_success"))
             })
 
     else:
-        form = PaymentForm()
+        form = PaymentForm(user=request.user)
 
     return render(request, 'Payments/payment_form.html', {'form': form})
 
@@ -951,6 +1306,7 @@ def payment_success(request):
         except:
             payment.payment_status = "Failed ❌"
             payment.save()
+            coupons.release(payment.pk)  # the discount was never paid for
             messages.error(request, "Payment verification failed!")
 
     return redirect('payment_list')
@@ -967,7 +1323,8 @@ def coupon_list(request):
     """
     show_active = request.GET.get('active') == '1'
     if show_active:
-        coupons = DiscountCoupon.objects.filter(is_active=True)
+        today = timezone.localdate()
+        coupons = DiscountCoupon.objects.filter(is_active=True, valid_from__lte=today, valid_to__gte=today)
     else:
         coupons = DiscountCoupon.objects.all()
     return render(request, 'Coupons/coupon_list.html', {'coupons': coupons})
@@ -1028,9 +1385,9 @@ def coupon_apply(request, pk):
     Checks if coupon is valid today and returns discount percentage.
     """
     coupon = get_object_or_404(DiscountCoupon, pk=pk)
-    today = date.today()
+    active = coupons.lookup(coupon.code)
 
-    if coupon.is_valid():
+    if active is not None and active.id == coupon.pk and coupon.usage_count < coupon.max_usage:
         discount = coupon.discount_percentage
         messages.success(request, f"Coupon applied! Discount: {discount}%")
     else:
@@ -1238,8 +1595,11 @@ def leave_delete(request, pk):
 
 @login_required
 def reminder_list(request):
-    """List all home exercise reminders."""
-    reminders = HomeExerciseReminder.objects.all().order_by('-reminder_time')
+    """List all home exercise reminders (optionally filter by delivery status)."""
+    reminders = HomeExerciseReminder.objects.select_related('patient', 'exercise').order_by('-reminder_time')
+    status_filter = request.GET.get('status')
+    if status_filter:
+        reminders = reminders.filter(delivery_status=status_filter)
     return render(request, 'Reminders/reminder_list.html', {'reminders': reminders})
 
 
@@ -1281,6 +1641,57 @@ def reminder_delete(request, pk):
     return redirect('reminder_list')
 
 
+# ---------------------------------------
+# Recurring Reminder Rules
+# ---------------------------------------
+
+@login_required
+@role_required(ADMIN, THERAPIST, PATIENT, message="You don't have permission to view reminder rules.")
+def reminder_rule_list(request):
+    """List recurring reminder rules (Patient: own, Therapist: their patients', Admin: all)."""
+    rules = permissions.REMINDER_RULES.scope(
+        request, ReminderRule.objects.select_related('patient', 'exercise').order_by('-created_at')
+    )
+    return render(request, 'Reminders/reminder_rule_list.html', {'rules': rules})
+
+
+@login_required
+@role_required(ADMIN, THERAPIST, PATIENT, redirect_to='reminder_rule_list',
+               message="You don't have permission to create reminder rules.")
+def reminder_rule_create(request):
+    """Create a recurring reminder rule and expand it over the rolling horizon."""
+    if request.method == 'POST':
+        data = request.POST.copy()
+        if permissions.has_role(request, PATIENT):
+            data['patient'] = request.user.pk
+        # the patient list is scoped to the user, so other patients fail validation
+        form = ReminderRuleForm(data, user=request.user)
+        if form.is_valid():
+            rule = form.save()
+            created = expand_rule(rule) if rule.is_active else 0
+            messages.success(request, f"Reminder rule created. {created} reminders scheduled.")
+            return redirect('reminder_rule_list')
+    else:
+        form = ReminderRuleForm(initial={'start_date': timezone.localdate()}, user=request.user)
+        if permissions.has_role(request, PATIENT):
+            form.initial['patient'] = request.user
+            form.fields['patient'].disabled = True
+    return render(request, 'Reminders/reminder_rule_form.html', {'form': form})
+
+
+@login_required
+@require_POST
+@role_required(ADMIN, THERAPIST, PATIENT, redirect_to='reminder_rule_list',
+               message="You don't have permission to delete reminder rules.")
+def reminder_rule_delete(request, pk):
+    """Delete a rule together with its reminders that have not been sent yet."""
+    rule = permissions.REMINDER_RULES.get_object_or_404(request, ReminderRule.objects.all(), pk=pk)
+    rule.reminders.filter(delivery_status='Pending').delete()
+    rule.delete()
+    messages.success(request, "Reminder rule deleted successfully.")
+    return redirect('reminder_rule_list')
+
+
 # -------------------------------------
 # BlogArticle Views (Role-based access)
 # -------------------------------------
@@ -1290,7 +1701,7 @@ def blog_list(request):
     blogs = BlogArticle.objects.all().order_by('-published_at', '-id')
     
     # Determine edit permissions
-    can_edit = request.user.role in ["Admin", "Therapist"]
+    can_edit = permissions.has_role(request, permissions.EDITORS)
     
     return render(request, 'Blog/blog_list.html', {
         'blogs': blogs,
@@ -1300,12 +1711,10 @@ def blog_list(request):
 
 
 @login_required
+@role_required(ADMIN, THERAPIST, redirect_to='blog_list',
+               message="You don't have permission to create blog articles.")
 def blog_create(request):
     """Create a new blog article (Admin and Therapist only)."""
-    if request.user.role not in ["Admin", "Therapist"]:
-        messages.error(request, "You don't have permission to create blog articles.")
-        return redirect('blog_list')
-
     if request.method == 'POST':
         form = BlogArticleForm(request.POST, request.FILES)
         if form.is_valid():
@@ -1330,12 +1739,10 @@ def blog_create(request):
 
 
 @login_required
+@role_required(ADMIN, THERAPIST, redirect_to='blog_list',
+               message="You don't have permission to update blog articles.")
 def blog_update(request, pk):
     """Update an existing blog article (Admin and Therapist only)."""
-    if request.user.role not in ["Admin", "Therapist"]:
-        messages.error(request, "You don't have permission to update blog articles.")
-        return redirect('blog_list')
-
     blog = get_object_or_404(BlogArticle, pk=pk)
     if request.method == 'POST':
         form = BlogArticleForm(request.POST, request.FILES, instance=blog)
@@ -1361,12 +1768,10 @@ def blog_update(request, pk):
 
 
 @login_required
+@role_required(ADMIN, THERAPIST, redirect_to='blog_list',
+               message="You don't have permission to delete blog articles.")
 def blog_delete(request, pk):
     """Delete a blog article (Admin and Therapist only)."""
-    if request.user.role not in ["Admin", "Therapist"]:
-        messages.error(request, "You don't have permission to delete blog articles.")
-        return redirect('blog_list')
-
     blog = get_object_or_404(BlogArticle, pk=pk)
     blog.delete()
     messages.success(request, "Blog article deleted successfully.")
@@ -1519,8 +1924,10 @@ def transaction_create(request):
     if request.method == 'POST':
         form = TransactionForm(request.POST)
         if form.is_valid():
-            form.save()
-            messages.success(request, "Transaction created successfully.")
+            txn = subscriptions.start_period(form.save(commit=False))
+            txn.save()
+            subscriptions.set_auto_renew(txn.user_id, form.cleaned_data['auto_renew'])
+            messages.success(request, f"Transaction created successfully. Subscription valid until {txn.expires_at:%d %b %Y}.")
             return redirect('transaction_list')
     else:
         form = TransactionForm()
@@ -1529,16 +1936,38 @@ def transaction_create(request):
 @login_required
 def transaction_update(request, pk):
     transaction = get_object_or_404(Transaction, pk=pk)
+    auto_renew = Subscription.objects.filter(user_id=transaction.user_id).values_list('auto_renew', flat=True).first()
     if request.method == 'POST':
-        form = TransactionForm(request.POST, instance=transaction)
+        form = TransactionForm(request.POST, instance=transaction, initial={'auto_renew': auto_renew})
         if form.is_valid():
-            form.save()
+            txn = form.save(commit=False)
+            if {'user', 'plan'} & set(form.changed_data):
+                subscriptions.start_period(txn)
+            txn.save()
+            subscriptions.set_auto_renew(txn.user_id, form.cleaned_data['auto_renew'])
             messages.success(request, "Transaction updated successfully.")
             return redirect('transaction_list')
     else:
-        form = TransactionForm(instance=transaction)
+        form = TransactionForm(instance=transaction, initial={'auto_renew': auto_renew})
     return render(request, 'transaction/transaction_form.html', {'form': form})
 
+
+@login_required
+def my_subscription(request):
+    """The signed-in user's current subscription; POST toggles auto-renewal."""
+    subscription = Subscription.objects.select_related('plan').filter(user=request.user).first()
+    if request.method == 'POST' and subscription:
+        subscriptions.set_auto_renew(request.user.pk, request.POST.get('auto_renew') == '1')
+        messages.success(request, "Auto-renewal updated.")
+        return redirect('my_subscription')
+
+    return render(request, 'Subscription/my_subscription.html', {
+        'subscription': subscription,
+        'entitlement': subscriptions.entitlement(request.user),
+        'transactions': Transaction.objects.filter(user=request.user).select_related('plan').order_by('-expires_at')[:20],
+        'user_role': request.user.role,
+    })
+
 @login_required
 def transaction_delete(request, pk):
     transaction = get_object_or_404(Transaction, pk=pk)
@@ -1590,13 +2019,76 @@ def analytics_delete(request, pk):
     return redirect('analytics_list')
 
 
+@login_required
+@role_required(ADMIN, redirect_to="dashboard",
+               message="Only admins can view cohort analytics.")
+def cohort_analytics(request):
+    """Retention curve plus per-therapist/service/branch cohort metrics. ?by=service&format=json"""
+    by = request.GET.get('by', 'therapist')
+    if by not in cohorts.DIMENSIONS:
+        by = 'therapist'
+    snapshot = cohorts.load()
+    curve = cohorts.retention_curve(snapshot)
+    groups = cohorts.summary(by, snapshot=snapshot)
+    if request.GET.get('format') == 'json':
+        return api.FastJsonResponse({'snapshot': snapshot.meta, 'by': by, 'retention': curve, 'groups': groups})
+
+    return render(request, "analytics/cohort_analytics.html", {
+        "snapshot": snapshot.meta,
+        "by": by,
+        "dimensions": cohorts.DIMENSIONS,
+        "curve": list(zip(curve['cohorts'], curve['sizes'], curve['rates'])),
+        "offsets": range(len(curve['rates'][0]) if curve['rates'] else 0),
+        "groups": groups,
+        "user_role": request.user.role
+    })
+
+
+@login_required
+@role_required(ADMIN, redirect_to="dashboard",
+               message="Only admins can view revenue reports.")
+def revenue_report(request):
+    """Revenue from the daily ledger rollups. ?from=YYYY-MM-DD&to=YYYY-MM-DD&by=date|therapist|service|mode"""
+    today = timezone.localdate()
+    try:
+        last = date.fromisoformat(request.GET.get('to', ''))
+    except ValueError:
+        last = today
+    try:
+        first = date.fromisoformat(request.GET.get('from', ''))
+    except ValueError:
+        first = last - timedelta(days=29)
+    by = request.GET.get('by', 'date')
+    if by not in ledger.REPORT_GROUPS:
+        by = 'date'
+
+    rows = ledger.revenue(first, last, by)
+    total = sum((amount for _, amount, _ in rows), Decimal('0'))
+    if request.GET.get('format') == 'json':
+        return api.FastJsonResponse({
+            'from': first.isoformat(), 'to': last.isoformat(), 'by': by, 'total': str(total),
+            'results': [{'key': str(key) if key is not None else None, 'amount': str(amount), 'entries': entries}
+                        for key, amount, entries in rows],
+        })
+
+    return render(request, "analytics/revenue_report.html", {
+        "first": first,
+        "last": last,
+        "by": by,
+        "groups": list(ledger.REPORT_GROUPS),
+        "rows": rows,
+        "total": total,
+        "user_role": request.user.role
+    })
+
+
 # ---------------------------------------
 # RecoveryPredictor Views
 # ---------------------------------------
 
 @login_required
 def recovery_list(request):
-    predictions = RecoveryPredictor.objects.all().order_by('-created_at')
+    predictions = RecoveryPredictor.objects.select_related('patient').order_by('-created_at')[:200]
     return render(request, 'recovery/recovery_list.html', {'predictions': predictions})
 
 @login_required
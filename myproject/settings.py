@@ -48,6 +48,8 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 
 MIDDLEWARE = [
+    'base.middleware.MetricsMiddleware',  # ✅ First, so its timings cover the whole stack
+    'base.middleware.QueryLogMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -189,3 +191,198 @@ MESSAGE_TAGS = {
 # Razorpay API Keys
 RAZORPAY_KEY_ID = "Prashanth123"
 RAZORPAY_KEY_SECRET = "Prashu"
+
+# ----------------------------------------------------
+# Home Exercise Reminder Delivery
+# ----------------------------------------------------
+# One backend per HomeExerciseReminder.sent_via value. Swap the console
+# stand-ins for real gateways in production, e.g.
+# {'BACKEND': 'base.reminders.FileChannel', 'OPTIONS': {'path': BASE_DIR / 'sms_outbox.jsonl'}}
+# or {'BACKEND': 'base.reminders.EmailChannel'} to use EMAIL_BACKEND.
+REMINDER_CHANNELS = {
+    'SMS': {'BACKEND': 'base.reminders.ConsoleChannel'},
+    'Email': {'BACKEND': 'base.reminders.ConsoleChannel'},
+    'WhatsApp': {'BACKEND': 'base.reminders.ConsoleChannel'},
+}
+
+REMINDER_SCHEDULER = {
+    'BATCH_SIZE': 1000,             # reminders claimed per transaction
+    'WORKERS': 8,                   # channel dispatch threads
+    'LOOKAHEAD_SECONDS': 300,       # how far ahead the in-memory heap looks
+    'POLL_SECONDS': 5,              # max sleep between database polls
+    'MAX_ATTEMPTS': 3,              # deliveries tried before marking Failed
+    'RETRY_SECONDS': 60,            # wait between attempts
+    'CLAIM_TIMEOUT_SECONDS': 300,   # claims older than this are released
+}
+
+# ----------------------------------------------------
+# Recurring availability / reminder rules
+# ----------------------------------------------------
+# Rules are expanded into concrete rows this many days ahead
+# (run `manage.py expand_recurrence` daily to roll the window forward).
+RECURRENCE_HORIZON_DAYS = 28
+
+# ----------------------------------------------------
+# Full-text search
+# ----------------------------------------------------
+# 'auto' picks SQLite FTS5 or PostgreSQL tsvector from the database vendor.
+# After loading existing data run `manage.py rebuild_search_index`.
+SEARCH_BACKEND = 'auto'
+
+# ----------------------------------------------------
+# Typeahead pickers
+# ----------------------------------------------------
+# Appointment picker only indexes appointments scheduled within this many
+# days back. Index versions live in the default cache; use a shared cache
+# (Redis/Memcached) so every worker process sees invalidations.
+AUTOCOMPLETE_APPOINTMENT_DAYS = 365
+
+# ----------------------------------------------------
+# Request metrics (Prometheus)
+# ----------------------------------------------------
+# Per-view histograms served at /metrics. Counters are per process: with
+# several workers, scrape each one (or aggregate in Prometheus).
+METRICS = {
+    'ENABLED': True,
+    'NAMESPACE': 'physio',
+    # Scrapers allowed without a staff login. Behind a reverse proxy every
+    # request comes from the proxy's address, so keep this empty there and
+    # give the scraper TOKEN instead (sent as "Authorization: Bearer <token>").
+    'ALLOWED_IPS': ('127.0.0.1', '::1') if DEBUG else (),
+    'TOKEN': os.environ.get('METRICS_TOKEN', ''),
+}
+
+# ----------------------------------------------------
+# Slow / repeated query log
+# ----------------------------------------------------
+# JSON lines with the views.py line that issued each query; summarize with
+# `manage.py analyze_queries`. On by default only with DEBUG: every query of
+# every request goes through its execute_wrapper. The stack is only walked
+# once per distinct statement per request.
+QUERY_LOG = {
+    'ENABLED': DEBUG,
+    'SLOW_MS': 200,             # log any single query slower than this
+    'REPEAT_THRESHOLD': 10,     # log statements run this many times in one request
+    'PATH': BASE_DIR / 'logs' / 'queries.jsonl',
+    'MAX_BYTES': 10 * 1024 * 1024,
+    'BACKUP_COUNT': 5,
+}
+
+# ----------------------------------------------------
+# Therapist calendar snapshots
+# ----------------------------------------------------
+# Days kept in TherapistProfile.daily_schedule around today; other dates are
+# built on request. Run `manage.py refresh_schedules` nightly to roll it.
+SCHEDULE_PAST_DAYS = 7
+SCHEDULE_FUTURE_DAYS = 56
+
+# ----------------------------------------------------
+# Home-visit route planning
+# ----------------------------------------------------
+# `manage.py plan_routes` orders tomorrow's confirmed visits for every
+# therapist (run it nightly). Distances are great-circle km times ROAD_FACTOR.
+ROUTING = {
+    'AVERAGE_SPEED_KMH': 25,
+    'ROAD_FACTOR': 1.3,
+    'DAY_START': '09:00',       # first departure from the therapist's own coordinates
+    'GEOCODER': None,           # dotted path to callable(address) -> (lat, lng); default parses "lat,lng"
+}
+
+# ----------------------------------------------------
+# Recovery prediction model
+# ----------------------------------------------------
+# Versioned artifacts live in DIR/<version>/; VERSION None follows DIR/LATEST.
+# `manage.py score_recovery` scores every active patient (run it nightly).
+RECOVERY_MODEL = {
+    'DIR': BASE_DIR / 'ml_models' / 'recovery',
+    'VERSION': None,
+    'ACTIVE_DAYS': 90,          # progress logged this recently (or an active plan) counts as active
+    'BATCH_SIZE': 2000,
+    'CACHE_SIZE': 1024,         # per-process LRU for the on-demand endpoint
+    'CACHE_SECONDS': 300,
+}
+
+# ----------------------------------------------------
+# Cohort analytics
+# ----------------------------------------------------
+# Columnar appointment snapshot used by /analytics/cohorts/. Run
+# `manage.py refresh_cohorts` nightly; it only reads rows added or changed
+# since the previous run.
+COHORTS = {
+    'DIR': BASE_DIR / 'snapshots' / 'appointments',
+    'BATCH_SIZE': 10000,
+    'RETENTION_DAYS': 90,       # a patient counts as retained if they return within this many days
+    'CHURN_DAYS': 90,           # ...and as churned after this long without a visit
+    'CURVE_MONTHS': 12,
+}
+
+# ----------------------------------------------------
+# Subscriptions
+# ----------------------------------------------------
+# `manage.py sweep_subscriptions` renews or expires subscriptions whose period
+# has ended (cron it every few minutes, or run it with --interval).
+SUBSCRIPTIONS = {
+    'SWEEP_BATCH_SIZE': 500,
+    'RENEWAL_GRACE_DAYS': 3,    # auto-renew only subscriptions that lapsed this recently
+    'ENTITLEMENT_SECONDS': 300, # per-user entitlement cache lifetime (never past the period's end)
+}
+
+# ----------------------------------------------------
+# Password hashing profile
+# ----------------------------------------------------
+# Argon2id when argon2-cffi is installed, tuned PBKDF2 otherwise. Hashes made
+# with any hasher below still verify, and are rehashed with the first one on
+# the user's next successful login.
+try:
+    import argon2  # noqa: F401
+    PASSWORD_HASHERS = ['base.hashers.TunedArgon2PasswordHasher']
+except ImportError:
+    PASSWORD_HASHERS = []
+PASSWORD_HASHERS += [
+    'base.hashers.TunedPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+PASSWORD_PROFILE = {
+    'ARGON2_TIME_COST': 2,
+    'ARGON2_MEMORY_COST': 19456,    # KiB per hash; Django's default is 100 MiB
+    'ARGON2_PARALLELISM': 1,
+    'PBKDF2_ITERATIONS': 600000,    # Django 5.2's default is 1,000,000
+}
+
+# ----------------------------------------------------
+# Login / registration rate limits
+# ----------------------------------------------------
+# Token buckets per client IP and per username, checked before any password
+# is hashed. Successful logins refund their tokens. Buckets live in CACHE; use
+# a shared cache (Redis/Memcached) so every worker process sees the same counts.
+LOGIN_THROTTLE = {
+    'ENABLED': True,
+    'CACHE': 'default',
+    'IP_BURST': 50,
+    'IP_PER_MINUTE': 30,
+    'USERNAME_BURST': 10,
+    'USERNAME_PER_MINUTE': 5,
+}
+
+# ----------------------------------------------------
+# Sessions
+# ----------------------------------------------------
+# cached_db serves session reads from the 'sessions' cache and only falls back
+# to django_session on a miss; writes still go to both. LocMemCache is per
+# process, so a logout in one worker would not reach another worker's copy:
+# point 'sessions' at Redis/Memcached whenever more than one process serves
+# requests. `manage.py purge_sessions` deletes expired rows (run it nightly).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sessions',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'sessions'
@@ -0,0 +1,53 @@
+// Typeahead for forms.AutocompleteWidget: fills the hidden input with the picked id.
+document.addEventListener("DOMContentLoaded", function () {
+    document.querySelectorAll(".autocomplete").forEach(function (box) {
+        const url = box.dataset.autocompleteUrl;
+        const hidden = box.querySelector(".autocomplete-value");
+        const input = box.querySelector(".autocomplete-input");
+        const list = box.querySelector(".autocomplete-results");
+        let timer = null;
+        let controller = null;
+
+        function clear() {
+            list.innerHTML = "";
+        }
+
+        input.addEventListener("input", function () {
+            hidden.value = "";
+            clearTimeout(timer);
+            const q = input.value.trim();
+            if (!q) { clear(); return; }
+
+            timer = setTimeout(function () {
+                if (controller) controller.abort();
+                controller = new AbortController();
+                fetch(url + "?q=" + encodeURIComponent(q), {
+                    headers: {"X-Requested-With": "XMLHttpRequest"},
+                    signal: controller.signal
+                })
+                    .then(function (response) { return response.json(); })
+                    .then(function (data) {
+                        clear();
+                        (data.results || []).forEach(function (item) {
+                            const option = document.createElement("button");
+                            option.type = "button";
+                            option.className = "list-group-item list-group-item-action";
+                            option.textContent = item.text;
+                            option.addEventListener("click", function () {
+                                hidden.value = item.id;
+                                input.value = item.text;
+                                clear();
+                            });
+                            list.appendChild(option);
+                        });
+                    })
+                    .catch(function () {});
+            }, 200);
+        });
+
+        input.addEventListener("blur", function () {
+            // Let a click on a suggestion land before hiding the list
+            setTimeout(clear, 200);
+        });
+    });
+});